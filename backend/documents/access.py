@@ -0,0 +1,149 @@
+"""
+Table d'accès aux documents (DocumentAccess).
+
+Un collaborateur voit un document s'il est affecté à son dossier, si le
+document lui est partagé (DocumentPermission) ou s'il l'a lui-même déposé.
+Plutôt que de joindre ces trois relations (avec DISTINCT) à chaque liste, les
+droits sont matérialisés dans une table indexée sur (utilisateur, document),
+mise à jour par les signaux d'affectation, de partage et d'upload.
+
+Les écritures en masse (bulk_create, queryset.update/delete) ne déclenchent
+pas de signaux : la commande `check_document_access` compare la table aux
+relations sources et la répare.
+"""
+from django.apps import apps as django_apps
+from django.db import transaction
+from .models import Case, Document, DocumentAccess, DocumentPermission
+
+ASSIGNED = DocumentAccess.Source.ASSIGNED
+SHARED = DocumentAccess.Source.SHARED
+UPLOADER = DocumentAccess.Source.UPLOADER
+
+
+def visible_document_ids(user):
+    """Sous-requête des identifiants de documents accessibles à `user`."""
+    return DocumentAccess.objects.filter(user=user).values('document_id')
+
+
+def restrict_documents(queryset, user):
+    """
+    Limite un queryset de documents à ceux que `user` peut consulter
+    (mêmes règles que la liste et le téléchargement).
+    """
+    # Restriction client: voir uniquement les documents de ses dossiers
+    if getattr(user, 'role', None) == 'CLIENT':
+        if hasattr(user, 'client_profile'):
+            return queryset.filter(case__client=user.client_profile)
+        return queryset.none()
+
+    # Pour les non-admins (collaborateurs, stagiaires, secrétaires),
+    # on limite aux dossiers auxquels ils sont assignés, documents partagés ou déposés
+    if not user.is_admin and not user.is_avocat:
+        return queryset.filter(id__in=visible_document_ids(user))
+    return queryset
+
+
+def access_entries(user, document):
+    """Origines d'accès de `user` au document : {origine: niveau} en une requête."""
+    return dict(
+        DocumentAccess.objects.filter(user=user, document=document).values_list('source', 'permission_level')
+    )
+
+
+def _insert(rows):
+    DocumentAccess.objects.bulk_create(
+        [
+            DocumentAccess(user_id=user_id, document_id=document_id, source=source, permission_level=level)
+            for user_id, document_id, source, level in rows
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+def sync_document(document):
+    """
+    Recalcule les accès par affectation et par upload d'un document
+    (création, changement de dossier ou d'auteur).
+    """
+    assignees = Case.assigned_to.through.objects.filter(case_id=document.case_id).values_list('user_id', flat=True)
+    rows = [(user_id, document.pk, ASSIGNED, '') for user_id in assignees]
+    if document.uploaded_by_id:
+        rows.append((document.uploaded_by_id, document.pk, UPLOADER, ''))
+    with transaction.atomic():
+        DocumentAccess.objects.filter(document_id=document.pk, source__in=[ASSIGNED, UPLOADER]).delete()
+        _insert(rows)
+
+
+def sync_shares(document_id):
+    """Recalcule les accès par partage d'un document depuis DocumentPermission."""
+    shares = DocumentPermission.objects.filter(document_id=document_id).values_list('user_id', 'permission_level')
+    with transaction.atomic():
+        DocumentAccess.objects.filter(document_id=document_id, source=SHARED).delete()
+        _insert((user_id, document_id, SHARED, level) for user_id, level in shares)
+
+
+def grant_assignment(case_ids, user_ids):
+    """Accès des utilisateurs ajoutés à des dossiers, pour tous les documents de ces dossiers."""
+    document_ids = list(Document.objects.filter(case_id__in=case_ids).values_list('id', flat=True))
+    _insert((user_id, document_id, ASSIGNED, '') for user_id in user_ids for document_id in document_ids)
+
+
+def revoke_assignment(case_ids, user_ids):
+    DocumentAccess.objects.filter(
+        user_id__in=user_ids, document__case_id__in=case_ids, source=ASSIGNED
+    ).delete()
+
+
+def expected_rows(get_model=None):
+    """
+    Ensemble {(utilisateur, document, origine, niveau)} attendu d'après les
+    relations sources. `get_model` permet de passer les modèles historiques.
+    """
+    get_model = get_model or django_apps.get_model
+    Case = get_model('documents', 'Case')
+    Document = get_model('documents', 'Document')
+    DocumentPermission = get_model('documents', 'DocumentPermission')
+
+    rows = set()
+    assigned = Case.assigned_to.through.objects.filter(case__documents__isnull=False)
+    for user_id, document_id in assigned.values_list('user_id', 'case__documents__id').iterator(chunk_size=5000):
+        rows.add((user_id, document_id, ASSIGNED, ''))
+    for user_id, document_id, level in DocumentPermission.objects.values_list('user_id', 'document_id', 'permission_level'):
+        rows.add((user_id, document_id, SHARED, level))
+    uploaded = Document.objects.filter(uploaded_by__isnull=False).values_list('uploaded_by_id', 'id')
+    for user_id, document_id in uploaded.iterator(chunk_size=5000):
+        rows.add((user_id, document_id, UPLOADER, ''))
+    return rows
+
+
+def reconcile_access(get_model=None, dry_run=False):
+    """
+    Compare la table aux relations sources et, sauf `dry_run`, ajoute les
+    lignes manquantes et supprime les lignes en trop.
+    Retourne {'missing': [...], 'extra': [...]} (tuples utilisateur, document, origine, niveau).
+    """
+    get_model = get_model or django_apps.get_model
+    DocumentAccess = get_model('documents', 'DocumentAccess')
+
+    with transaction.atomic():
+        expected = expected_rows(get_model)
+        stored = {}
+        for pk, *row in DocumentAccess.objects.values_list(
+            'id', 'user_id', 'document_id', 'source', 'permission_level'
+        ).iterator(chunk_size=5000):
+            stored[tuple(row)] = pk
+
+        missing = sorted(expected - stored.keys())
+        extra = sorted(stored.keys() - expected)
+        if not dry_run:
+            DocumentAccess.objects.filter(id__in=[stored[row] for row in extra]).delete()
+            DocumentAccess.objects.bulk_create(
+                [
+                    DocumentAccess(user_id=user_id, document_id=document_id, source=source, permission_level=level)
+                    for user_id, document_id, source, level in missing
+                ],
+                batch_size=2000,
+                ignore_conflicts=True,
+            )
+    return {'missing': missing, 'extra': extra}
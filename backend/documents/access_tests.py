@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from documents.access import reconcile_access
+from documents.models import Client as LawClient, Case, Document, DocumentAccess, DocumentPermission
+
+User = get_user_model()
+
+
+class DocumentAccessTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin.access', password='x', role='ADMIN')
+        self.collab = User.objects.create_user(username='collab.access', password='x', role='COLLABORATEUR')
+        law_client = LawClient.objects.create(name='Client accès', created_by=self.admin)
+        self.case = Case.objects.create(
+            client=law_client, title='Dossier A', reference='ACC-1', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        self.other_case = Case.objects.create(
+            client=law_client, title='Dossier B', reference='ACC-2', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        self.document = self.new_document(self.case, 'Pièce A')
+        self.shared = self.new_document(self.other_case, 'Pièce partagée')
+        self.hidden = self.new_document(self.other_case, 'Pièce cachée')
+        self.api = APIClient()
+        self.api.force_authenticate(self.collab)
+
+    def new_document(self, case, title, uploaded_by=None):
+        return Document.objects.create(
+            title=title, case=case, uploaded_by=uploaded_by or self.admin,
+            file=SimpleUploadedFile(f'{title}.pdf', b'%PDF-1.4'),
+        )
+
+    def visible_titles(self):
+        response = self.api.get('/api/documents/documents/')
+        return sorted(row['title'] for row in response.data['results'])
+
+    def assertConsistent(self):
+        self.assertEqual(reconcile_access(dry_run=True), {'missing': [], 'extra': []})
+
+    def test_01_maintained_on_assignment_share_and_upload(self):
+        """Affectation, partage et upload tiennent la table à jour"""
+        self.assertEqual(self.visible_titles(), [])
+
+        self.case.assigned_to.add(self.collab)
+        DocumentPermission.objects.create(document=self.shared, user=self.collab, granted_by=self.admin)
+        self.new_document(self.other_case, 'Mon dépôt', uploaded_by=self.collab)
+        self.assertEqual(self.visible_titles(), ['Mon dépôt', 'Pièce A', 'Pièce partagée'])
+        self.assertConsistent()
+
+        # Nouveau document d'un dossier affecté, retrait via la relation inverse
+        self.new_document(self.case, 'Pièce A2')
+        self.assertIn('Pièce A2', self.visible_titles())
+        self.collab.assigned_cases.clear()
+        DocumentPermission.objects.filter(document=self.shared).delete()
+        self.assertEqual(self.visible_titles(), ['Mon dépôt'])
+        self.assertConsistent()
+
+        # Changement de dossier d'un document
+        self.other_case.assigned_to.add(self.collab)
+        self.document.case = self.other_case
+        self.document.save()
+        self.assertIn('Pièce A', self.visible_titles())
+        self.assertConsistent()
+
+    def test_02_object_check_and_consistency_command(self):
+        """Contrôle d'objet en une lecture ; les écritures sans signaux sont détectées et réparées"""
+        DocumentPermission.objects.create(document=self.shared, user=self.collab, granted_by=self.admin)
+        self.assertEqual(self.api.get(f'/api/documents/documents/{self.shared.id}/').status_code, 200)
+        self.assertEqual(self.api.get(f'/api/documents/documents/{self.hidden.id}/').status_code, 404)
+        self.assertEqual(self.api.patch(f'/api/documents/documents/{self.shared.id}/', {'title': 'x'}).status_code, 403)
+
+        Case.assigned_to.through.objects.bulk_create([Case.assigned_to.through(case=self.case, user=self.collab)])
+        DocumentAccess.objects.filter(source='SHARED').delete()
+        drift = reconcile_access()
+        self.assertEqual(len(drift['missing']), 2)
+        self.assertConsistent()
+        self.assertEqual(self.visible_titles(), ['Pièce A', 'Pièce partagée'])
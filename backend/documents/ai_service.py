@@ -1,58 +1,319 @@
-import google.generativeai as genai
+"""
+Service d'assistance IA (Gemini) pour l'analyse des dossiers.
+
+Le client est partagé par processus (voir `get_ai_service`) : le SDK n'est
+configuré qu'une fois, les modèles sont mis en cache et la connexion vers
+l'API est réutilisée d'une requête à l'autre. Les appels sont bornés par
+worker et pour l'ensemble du cabinet, et les erreurs transitoires sont
+rejouées avec un backoff exponentiel à gigue.
+"""
+from abc import ABC, abstractmethod
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from contextlib import contextmanager
+from .lazy_imports import load
 import logging
 import os
+import random
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-class GeminiService:
-    def __init__(self):
-        self.api_key = settings.GEMINI_API_KEY
-        if not self.api_key:
+
+SYSTEM_INSTRUCTION = """
+Tu es un Avocat Expert au Barreau du Sénégal.
+Ton rôle est d'assister les avocats en analysant les dossiers juridiques avec une extrême précision.
+
+Règles fondamentales :
+1. Tu maîtrises parfaitement le Droit Sénégalais : Code des Obligations Civiles et Commerciales (COCC), Code Pénal, Code de Procédure Pénale, Code du Travail, Code de la Famille, et le Droit OHADA.
+2. Base toujours tes réponses sur les articles de loi sénégalais ou communautaires (OHADA) pertinents. Cite les articles.
+3. Adopte un ton professionnel, confraternel et juridique.
+4. Si le document est un pdf/image, analyse le contenu extrait.
+5. Ne donne pas de conseils génériques, sois spécifique au contexte juridique du Sénégal.
+"""
+
+PROVIDERS = {
+    'gemini': 'documents.ai_service.GeminiTransport',
+    'stub': 'documents.ai_stub.StubTransport',
+    'stub-http': 'documents.ai_stub.HttpStubTransport',
+}
+
+# Marqueurs d'erreurs transitoires (quota, surcharge, panne côté fournisseur)
+RETRYABLE_ERROR_MARKERS = ('429', '500', '503', 'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded')
+
+
+class AIServiceBusy(Exception):
+    """
+    Levée lorsqu'aucun créneau d'appel IA ne s'est libéré à temps.
+    """
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIProvider(ABC):
+    """
+    Interface d'un fournisseur IA (Gemini, bouchon local...).
+
+    Sélectionné par le réglage AI_PROVIDER : un nom court de PROVIDERS
+    ou un chemin d'import vers une classe acceptant `api_key`.
+    """
+
+    @abstractmethod
+    def upload_file(self, file_path, mime_type='application/pdf'):
+        """Envoie un fichier et retourne un objet exposant au moins `name`."""
+
+    @abstractmethod
+    def get_file(self, file_name):
+        """Retourne la référence d'un fichier déjà envoyé."""
+
+    @abstractmethod
+    def send_message(self, model_name, system_instruction, history, message, timeout=None):
+        """Envoie un message dans une conversation et retourne le texte de la réponse."""
+
+    def stream_message(self, model_name, system_instruction, history, message, timeout=None):
+        """Comme send_message, mais produit la réponse morceau par morceau."""
+        yield self.send_message(model_name, system_instruction, history, message, timeout=timeout)
+
+
+class GeminiTransport(AIProvider):
+    """
+    Fournisseur par défaut : SDK google.generativeai.
+    """
+
+    def __init__(self, api_key):
+        if not api_key:
             logger.error("GEMINI_API_KEY not found in settings")
             raise ValueError("GEMINI_API_KEY is not configured")
-        
-        genai.configure(api_key=self.api_key)
-        self.model_name = 'gemini-flash-latest'
-        
+
+        genai = load('genai')
+        self.genai = genai
+
+        # Configuration unique : le client (et son canal) est ensuite réutilisé
+        transport = getattr(settings, 'GEMINI_SDK_TRANSPORT', '') or None
+        genai.configure(api_key=api_key, transport=transport)
+
+        self._models = {}
+        self._models_lock = threading.Lock()
+
+    def get_model(self, model_name, system_instruction=None):
+        """
+        Retourne un GenerativeModel mis en cache pour ce couple (modèle, instruction).
+        """
+        key = (model_name, system_instruction)
+        model = self._models.get(key)
+        if model is None:
+            with self._models_lock:
+                model = self._models.get(key)
+                if model is None:
+                    try:
+                        model = self.genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                    except TypeError:
+                        # Fallback pour les anciens SDK sans system_instruction
+                        model = self.genai.GenerativeModel(model_name)
+                    self._models[key] = model
+        return model
+
+    def upload_file(self, file_path, mime_type='application/pdf'):
+        return self.genai.upload_file(file_path, mime_type=mime_type)
+
+    def get_file(self, file_name):
+        return self.genai.get_file(file_name)
+
+    def send_message(self, model_name, system_instruction, history, message, timeout=None):
+        model = self.get_model(model_name, system_instruction)
+        chat = model.start_chat(history=history)
+        request_options = {'timeout': timeout} if timeout else None
+        response = chat.send_message(message, request_options=request_options)
+        return response.text
+
+    def stream_message(self, model_name, system_instruction, history, message, timeout=None):
+        model = self.get_model(model_name, system_instruction)
+        chat = model.start_chat(history=history)
+        request_options = {'timeout': timeout} if timeout else None
+        for chunk in chat.send_message(message, stream=True, request_options=request_options):
+            if chunk.text:
+                yield chunk.text
+
+
+class CabinetCallLimiter:
+    """
+    Compteur de créneaux partagé par tous les workers du cabinet.
+
+    S'appuie sur le cache Django (Redis en production) ; avec le cache
+    mémoire local, la limite s'applique par processus.
+    """
+    CACHE_KEY = 'ai:inflight:cabinet'
+
+    def __init__(self, limit, ttl):
+        self.limit = limit
+        self.ttl = ttl
+
+    def try_acquire(self):
+        if not self.limit:
+            return True
+        cache.add(self.CACHE_KEY, 0, self.ttl)
+        try:
+            current = cache.incr(self.CACHE_KEY)
+        except ValueError:
+            # Clé expirée entre add() et incr()
+            cache.add(self.CACHE_KEY, 1, self.ttl)
+            current = 1
+        if current > self.limit:
+            self.release()
+            return False
+        return True
+
+    def release(self):
+        if not self.limit:
+            return
+        try:
+            if cache.decr(self.CACHE_KEY) < 0:
+                cache.set(self.CACHE_KEY, 0, self.ttl)
+        except ValueError:
+            pass
+
+
+class GeminiService:
+    """
+    Façade d'accès à l'IA utilisée par les vues.
+
+    Préférer `get_ai_service()` qui renvoie l'instance partagée du processus.
+    """
+
+    def __init__(self, transport=None):
+        self.api_key = settings.GEMINI_API_KEY
+        self.model_name = getattr(settings, 'GEMINI_MODEL_NAME', 'gemini-flash-latest')
+
+        if transport is None:
+            provider = getattr(settings, 'AI_PROVIDER', 'gemini')
+            transport = import_string(PROVIDERS.get(provider, provider))(api_key=self.api_key)
+        self.transport = transport
+
+        self.max_retries = getattr(settings, 'AI_MAX_RETRIES', 3)
+        self.backoff_base = getattr(settings, 'AI_BACKOFF_BASE', 1.0)
+        self.backoff_max = getattr(settings, 'AI_BACKOFF_MAX', 8.0)
+        self.slot_wait_timeout = getattr(settings, 'AI_SLOT_WAIT_TIMEOUT', 10)
+        self.request_timeout = getattr(settings, 'AI_REQUEST_TIMEOUT', 120)
+
+        self._worker_slots = threading.BoundedSemaphore(getattr(settings, 'AI_MAX_CONCURRENT_CALLS_PER_WORKER', 4))
+        self._cabinet_slots = CabinetCallLimiter(
+            getattr(settings, 'AI_MAX_CONCURRENT_CALLS_PER_CABINET', 8),
+            ttl=int(self.request_timeout * 2)
+        )
+
+    @contextmanager
+    def call_slot(self):
+        """
+        Réserve un créneau d'appel (worker puis cabinet) pour la durée du bloc.
+        Lève AIServiceBusy si aucun créneau ne se libère avant AI_SLOT_WAIT_TIMEOUT.
+        """
+        deadline = time.monotonic() + self.slot_wait_timeout
+        if not self._worker_slots.acquire(timeout=self.slot_wait_timeout):
+            raise AIServiceBusy("Trop d'analyses IA en cours sur ce serveur, réessayez dans un instant.")
+        try:
+            while not self._cabinet_slots.try_acquire():
+                if time.monotonic() >= deadline:
+                    raise AIServiceBusy("Trop d'analyses IA en cours pour le cabinet, réessayez dans un instant.")
+                time.sleep(random.uniform(0.05, 0.25))
+            try:
+                yield
+            finally:
+                self._cabinet_slots.release()
+        finally:
+            self._worker_slots.release()
+
+    def backoff_delay(self, attempt):
+        """
+        Backoff exponentiel à gigue complète : uniforme dans [0, min(max, base * 2^n)].
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _call_with_retries(self, label, func, *args, **kwargs):
+        """
+        Exécute un appel IA dans un créneau, en rejouant les erreurs transitoires.
+        Le créneau est libéré pendant l'attente afin de ne pas bloquer les autres appels.
+        """
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                with self.call_slot():
+                    return func(*args, **kwargs)
+            except AIServiceBusy:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"{label} failed (Attempt {attempt+1}/{self.max_retries}): {str(e)}")
+                if not any(marker in str(e) or marker in type(e).__name__ for marker in RETRYABLE_ERROR_MARKERS):
+                    # Erreur définitive (403, 400...)
+                    raise
+                if attempt + 1 < self.max_retries:
+                    time.sleep(self.backoff_delay(attempt))
+
+        logger.error(f"{label} Failed after {self.max_retries} retries: {str(last_error)}")
+        raise last_error
+
     def upload_file(self, file_path, mime_type='application/pdf'):
         """
         Uploads a file to Gemini File API.
         Returns the file object (containing uri and name).
         """
-        try:
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File not found: {file_path}")
-                
-            logger.info(f"Uploading file to Gemini: {file_path}")
-            file = genai.upload_file(file_path, mime_type=mime_type)
-            logger.info(f"File uploaded successfully: {file.uri}")
-            return file
-        except Exception as e:
-            logger.error(f"Error uploading file to Gemini: {str(e)}")
-            raise e
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+
+        logger.info(f"Uploading file to Gemini: {file_path}")
+        file = self._call_with_retries("Gemini upload", self.transport.upload_file, file_path, mime_type=mime_type)
+        logger.info(f"File uploaded successfully: {getattr(file, 'uri', file.name)}")
+        return file
 
     def get_file(self, file_name):
         """
         Retrieves a file by name (e.g. 'files/...')
         """
-        return genai.get_file(file_name)
+        return self.transport.get_file(file_name)
 
-    def generate_content(self, file_uri, prompt):
+    def build_history(self, file_ref, history):
         """
-        Generates content from a file and a prompt.
-        This is for single-turn interactions.
+        Reconstruit l'historique envoyé au modèle, le fichier étant injecté dans le premier tour.
         """
-        model = genai.GenerativeModel(self.model_name)
-        # We can't pass the file object directly if we only have the URI, 
-        # but the python SDK usually wants the file object or we use the file API to get it back?
-        # Actually in recent genericai versions, we can pass [file, prompt].
-        
-        # NOTE: In the Python SDK, you typically pass the uploaded file object returned by upload_file,
-        # or you can look it up by name if you didn't keep the object.
-        # Ideally the caller passes the full file object, but REST APIs are stateless.
-        # We might need to store the 'name' (files/...) on the client or server.
-        pass
+        if not history:
+            # Start new chat with file
+            return [
+                {
+                    "role": "user",
+                    "parts": [file_ref, "Analyse ce document pour moi, Confrère."]
+                },
+                {
+                    "role": "model",
+                    "parts": ["Bien sûr, cher Confrère. J'ai pris connaissance du document. En ma qualité d'expert en droit sénégalais, je suis à votre disposition pour l'analyser."]
+                }
+            ]
+
+        # We inject the file reference in the 'phantom' first turn to provide context
+        internal_history = [
+            {
+                "role": "user",
+                "parts": [file_ref, "Contexte du dossier."]
+            },
+            {
+                "role": "model",
+                "parts": ["Dossier chargé."]
+            }
+        ]
+
+        # Append user history (text only)
+        for turn in history:
+            parts = turn.get('parts', [])
+            if isinstance(parts, str):
+                parts = [parts]
+            internal_history.append({
+                "role": turn['role'],
+                "parts": parts
+            })
+        return internal_history
 
     def chat_with_document(self, file_name, history, message):
         """
@@ -61,96 +322,76 @@ class GeminiService:
         history: List of dicts [{'role': 'user', 'parts': ['...']}, {'role': 'model', 'parts': ['...']}]
         message: The new user message string.
         """
-        import time
-        
-        SYSTEM_INSTRUCTION = """
-        Tu es un Avocat Expert au Barreau du Sénégal. 
-        Ton rôle est d'assister les avocats en analysant les dossiers juridiques avec une extrême précision.
-        
-        Règles fondamentales :
-        1. Tu maîtrises parfaitement le Droit Sénégalais : Code des Obligations Civiles et Commerciales (COCC), Code Pénal, Code de Procédure Pénale, Code du Travail, Code de la Famille, et le Droit OHADA.
-        2. Base toujours tes réponses sur les articles de loi sénégalais ou communautaires (OHADA) pertinents. Cite les articles.
-        3. Adopte un ton professionnel, confraternel et juridique.
-        4. Si le document est un pdf/image, analyse le contenu extrait.
-        5. Ne donne pas de conseils génériques, sois spécifique au contexte juridique du Sénégal.
-        """
-
-        retries = 3
-        last_error = None
-        
-        for attempt in range(retries):
+        def send():
+            file_ref = self.transport.get_file(file_name)
+
+            # Check file state
+            state = getattr(getattr(file_ref, 'state', None), 'name', None)
+            if state == "FAILED":
+                raise ValueError(f"File processing failed on Gemini side: {getattr(file_ref, 'uri', file_name)}")
+
+            return self.transport.send_message(
+                self.model_name,
+                SYSTEM_INSTRUCTION,
+                self.build_history(file_ref, history),
+                message,
+                timeout=self.request_timeout
+            )
+
+        return self._call_with_retries("Gemini Chat", send)
+
+    def stream_chat_with_document(self, file_name, history, message):
+        """
+        Variante en flux de chat_with_document : produit la réponse par morceaux.
+        Les erreurs transitoires ne sont rejouées qu'avant le premier morceau ;
+        le créneau d'appel reste réservé jusqu'à la fin du flux.
+        """
+        for attempt in range(self.max_retries):
+            emitted = False
             try:
-                # Pass system instruction to model constructor if supported by SDK version,
-                # otherwise we inject it in history.
-                # Assuming google-generativeai >= 0.3.0 which supports system_instruction
-                try:
-                   model = genai.GenerativeModel(self.model_name, system_instruction=SYSTEM_INSTRUCTION)
-                except TypeError:
-                   # Fallback for older SDKs
-                   model = genai.GenerativeModel(self.model_name)
-                   # Logic below handles context injection manually if needed, but SDK update recommended.
-                
-                file_ref = genai.get_file(file_name)
-                
-                # Check file state
-                if file_ref.state.name == "FAILED":
-                    raise ValueError(f"File processing failed on Gemini side: {file_ref.uri}")
-                
-                internal_history = []
-                
-                if not history:
-                    # Start new chat with file
-                    # File is added to the first message context
-                    internal_history = [
-                        {
-                            "role": "user",
-                            "parts": [file_ref, "Analyse ce document pour moi, Confrère."]
-                        },
-                        {
-                            "role": "model",
-                            "parts": ["Bien sûr, cher Confrère. J'ai pris connaissance du document. En ma qualité d'expert en droit sénégalais, je suis à votre disposition pour l'analyser."]
-                        }
-                    ]
-                else:
-                    # Reconstruct history
-                    # We inject the file reference in the 'phantom' first turn to provide context
-                    internal_history = [
-                         {
-                            "role": "user",
-                            "parts": [file_ref, "Contexte du dossier."]
-                        },
-                        {
-                            "role": "model",
-                            "parts": ["Dossier chargé."]
-                        }
-                    ]
-                    
-                    # Append user history (text only)
-                    for turn in history:
-                        parts = turn.get('parts', [])
-                        if isinstance(parts, str):
-                            parts = [parts]
-                        
-                        internal_history.append({
-                            "role": turn['role'],
-                            "parts": parts
-                        })
-                
-                logger.debug(f"Starting chat match (Attempt {attempt+1}/{retries})")
-                chat = model.start_chat(history=internal_history)
-                response = chat.send_message(message)
-                return response.text
-                
+                with self.call_slot():
+                    file_ref = self.transport.get_file(file_name)
+                    chunks = self.transport.stream_message(
+                        self.model_name,
+                        SYSTEM_INSTRUCTION,
+                        self.build_history(file_ref, history),
+                        message,
+                        timeout=self.request_timeout
+                    )
+                    for chunk in chunks:
+                        emitted = True
+                        yield chunk
+                return
+            except AIServiceBusy:
+                raise
             except Exception as e:
-                last_error = e
-                logger.warning(f"Gemini Chat verification failed (Attempt {attempt+1}): {str(e)}")
-                if "429" in str(e) or "500" in str(e) or "503" in str(e):
-                    time.sleep(2 * (attempt + 1)) # Backoff
-                    continue
-                else:
-                    # Fatal error (like 403, 400)
-                    raise e
-                    
-        # If loop finishes
-        logger.error(f"Gemini Chat Failed after {retries} retries: {str(last_error)}")
-        raise last_error
+                logger.warning(f"Gemini Stream failed (Attempt {attempt+1}/{self.max_retries}): {str(e)}")
+                retryable = any(marker in str(e) or marker in type(e).__name__ for marker in RETRYABLE_ERROR_MARKERS)
+                if emitted or not retryable or attempt + 1 >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt))
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_ai_service():
+    """
+    Retourne l'instance GeminiService partagée par le processus (créée à la demande).
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = GeminiService()
+    return _service
+
+
+def reset_ai_service():
+    """
+    Oublie l'instance partagée (changement de configuration, tests).
+    """
+    global _service
+    with _service_lock:
+        _service = None
@@ -0,0 +1,136 @@
+from django.test import SimpleTestCase, override_settings
+from django.core.cache import cache
+from unittest import mock
+from documents import ai_service
+from documents.ai_service import GeminiService, AIServiceBusy, get_ai_service, reset_ai_service
+from documents.ai_stub import StubBackend, StubError, StubTransport, HttpStubTransport, make_stub_server
+import tempfile
+import threading
+
+
+class FakeFile:
+    def __init__(self, name):
+        self.name = name
+        self.uri = f"fake://{name}"
+
+
+class FakeTransport(ai_service.AIProvider):
+    """Transport en mémoire : compte les instanciations et rejoue des erreurs programmées."""
+    instances = 0
+
+    def __init__(self, api_key=None, failures=None):
+        FakeTransport.instances += 1
+        self.failures = list(failures or [])
+        self.calls = 0
+
+    def upload_file(self, file_path, mime_type='application/pdf'):
+        return FakeFile('files/fake')
+
+    def get_file(self, file_name):
+        return FakeFile(file_name)
+
+    def send_message(self, model_name, system_instruction, history, message, timeout=None):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return f"echo: {message} ({len(history)} tours)"
+
+
+@override_settings(
+    AI_PROVIDER='documents.ai_service_tests.FakeTransport',
+    AI_BACKOFF_BASE=0.01, AI_BACKOFF_MAX=0.02, AI_SLOT_WAIT_TIMEOUT=0.2,
+)
+class AIServiceTest(SimpleTestCase):
+    def setUp(self):
+        reset_ai_service()
+        cache.clear()
+        FakeTransport.instances = 0
+
+    def tearDown(self):
+        reset_ai_service()
+
+    def test_01_shared_client_is_built_once(self):
+        """Le transport n'est instancié qu'une fois par processus"""
+        for _ in range(5):
+            get_ai_service().chat_with_document('files/x', [], 'Bonjour')
+        self.assertEqual(FakeTransport.instances, 1)
+        self.assertIs(get_ai_service(), get_ai_service())
+
+    def test_02_transient_errors_are_retried(self):
+        """Les 429/503 sont rejoués avec backoff, les erreurs définitives remontent"""
+        transport = FakeTransport(failures=[Exception('429 Resource exhausted'), Exception('503 Unavailable')])
+        service = GeminiService(transport=transport)
+        with mock.patch.object(ai_service.time, 'sleep') as sleep:
+            self.assertTrue(service.chat_with_document('files/x', [], 'Q').startswith('echo: Q'))
+        self.assertEqual(transport.calls, 3)
+        self.assertEqual(sleep.call_count, 2)
+        for call in sleep.call_args_list:
+            self.assertLessEqual(call.args[0], 0.02)
+
+        transport = FakeTransport(failures=[Exception('403 Forbidden')])
+        with self.assertRaises(Exception):
+            GeminiService(transport=transport).chat_with_document('files/x', [], 'Q')
+        self.assertEqual(transport.calls, 1)
+
+    @override_settings(AI_MAX_CONCURRENT_CALLS_PER_WORKER=1)
+    def test_03_concurrency_is_bounded(self):
+        """Un appel refuse de démarrer quand tous les créneaux du worker sont pris"""
+        service = GeminiService(transport=FakeTransport())
+        release = threading.Event()
+        entered = threading.Event()
+
+        def hold_slot():
+            with service.call_slot():
+                entered.set()
+                release.wait(2)
+
+        holder = threading.Thread(target=hold_slot)
+        holder.start()
+        entered.wait(2)
+        try:
+            with self.assertRaises(AIServiceBusy):
+                service.chat_with_document('files/x', [], 'Q')
+        finally:
+            release.set()
+            holder.join()
+        self.assertTrue(service.chat_with_document('files/x', [], 'Q').startswith('echo'))
+
+
+class StubProviderTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_01_stub_is_deterministic(self):
+        """Le bouchon répond de façon déterministe et respecte les erreurs forcées"""
+        backend = StubBackend(latency_ms=0, jitter_ms=0)
+        service = GeminiService(transport=StubTransport(backend=backend))
+        first = service.chat_with_document('files/x', [], 'Quel délai ?')
+        self.assertEqual(first, service.chat_with_document('files/x', [], 'Quel délai ?'))
+        self.assertEqual(''.join(service.stream_chat_with_document('files/x', [], 'Quel délai ?')), first)
+
+        with override_settings(AI_MAX_RETRIES=1), self.assertRaisesMessage(StubError, '429'):
+            GeminiService(transport=StubTransport(backend=backend)).chat_with_document('files/x', [], '[429]')
+
+    def test_02_http_stub_round_trip(self):
+        """Le transport HTTP dialogue avec le serveur bouchon, flux compris"""
+        server = make_stub_server(port=0, backend=StubBackend(latency_ms=0, jitter_ms=0))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            transport = HttpStubTransport(base_url=f"http://127.0.0.1:{server.server_address[1]}")
+            service = GeminiService(transport=transport)
+            with tempfile.NamedTemporaryFile(suffix='.pdf') as f:
+                f.write(b'%PDF-1.4 test')
+                f.flush()
+                uploaded = service.upload_file(f.name)
+            self.assertTrue(uploaded.name.startswith('files/stub-'))
+
+            answer = service.chat_with_document(uploaded.name, [], 'Bonjour')
+            self.assertIn('Bonjour', answer)
+            self.assertEqual(''.join(service.stream_chat_with_document(uploaded.name, [], 'Bonjour')), answer)
+
+            with mock.patch.object(ai_service.time, 'sleep'), self.assertRaisesMessage(StubError, '503'):
+                service.chat_with_document(uploaded.name, [], 'Erreur [503]')
+        finally:
+            server.shutdown()
+            server.server_close()
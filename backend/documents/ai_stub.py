@@ -0,0 +1,307 @@
+"""
+Fournisseur IA de substitution pour les tests et les bancs de charge hors-ligne.
+
+`StubBackend` produit des réponses déterministes (dérivées du message) et
+simule la latence, le streaming et les erreurs 429/503 du fournisseur réel.
+Il est exposé de deux façons :
+- dans le processus, via `StubTransport` (AI_PROVIDER='stub') ;
+- derrière un petit serveur HTTP (commande `ai_stub_server`) interrogé par
+  `HttpStubTransport` (AI_PROVIDER='stub-http'), ce qui reproduit l'attente
+  réseau d'un worker gunicorn sans dépendre de l'API Gemini.
+"""
+from django.conf import settings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from .ai_service import AIProvider
+import hashlib
+import http.client
+import json
+import os
+import random
+import threading
+import time
+
+
+class StubError(Exception):
+    """
+    Erreur simulée ; le code HTTP figure dans le message pour être reconnu par les retries.
+    """
+
+    def __init__(self, status, message=''):
+        super().__init__(f"{status} {message or 'Erreur simulée'}")
+        self.status = status
+
+
+class StubFile:
+    """
+    Référence de fichier compatible avec celle du SDK (name, uri, state.name).
+    """
+
+    def __init__(self, name, state='ACTIVE'):
+        self.name = name
+        self.uri = f"stub://{name}"
+        self.state = SimpleNamespace(name=state)
+
+
+class StubBackend:
+    """
+    Moteur de réponses simulées, partagé par le transport local et le serveur HTTP.
+
+    Un message contenant « [429] » ou « [503] » déclenche toujours l'erreur
+    correspondante ; sinon les erreurs sont tirées selon les taux configurés
+    avec un générateur pseudo-aléatoire initialisé par `seed`.
+    """
+
+    def __init__(self, latency_ms=800, jitter_ms=200, error_rate_429=0.0, error_rate_503=0.0, seed=42, sleep=time.sleep):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate_429 = error_rate_429
+        self.error_rate_503 = error_rate_503
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            latency_ms=getattr(settings, 'AI_STUB_LATENCY_MS', 800),
+            jitter_ms=getattr(settings, 'AI_STUB_JITTER_MS', 200),
+            error_rate_429=getattr(settings, 'AI_STUB_ERROR_RATE_429', 0.0),
+            error_rate_503=getattr(settings, 'AI_STUB_ERROR_RATE_503', 0.0),
+            seed=getattr(settings, 'AI_STUB_SEED', 42),
+        )
+
+    def _draw(self):
+        with self._lock:
+            return self._random.random(), self._random.uniform(-1, 1)
+
+    def _latency(self, jitter_draw):
+        return max(0, self.latency_ms + self.jitter_ms * jitter_draw) / 1000.0
+
+    def _check_error(self, message, error_draw):
+        if '[429]' in message:
+            raise StubError(429, 'Resource exhausted (simulé)')
+        if '[503]' in message:
+            raise StubError(503, 'Service unavailable (simulé)')
+        if error_draw < self.error_rate_429:
+            raise StubError(429, 'Resource exhausted (simulé)')
+        if error_draw < self.error_rate_429 + self.error_rate_503:
+            raise StubError(503, 'Service unavailable (simulé)')
+
+    def upload(self, file_name, size):
+        digest = hashlib.sha1(f"{file_name}:{size}".encode('utf-8')).hexdigest()[:12]
+        return StubFile(f"files/stub-{digest}")
+
+    def reply(self, history_len, message):
+        """
+        Réponse déterministe : même message et même historique, même texte.
+        """
+        digest = hashlib.sha256(f"{history_len}:{message}".encode('utf-8')).hexdigest()[:8]
+        return (
+            f"Cher Confrère, réponse simulée n°{digest} ({history_len} tours d'historique). "
+            f"Votre question portait sur : « {message[:200]} ». "
+            "Voir notamment les articles pertinents du COCC et de l'Acte uniforme OHADA."
+        )
+
+    def chat(self, history_len, message):
+        error_draw, jitter_draw = self._draw()
+        self.sleep(self._latency(jitter_draw))
+        self._check_error(message, error_draw)
+        return self.reply(history_len, message)
+
+    def stream(self, history_len, message, chunk_count=8):
+        """
+        Produit la réponse en `chunk_count` morceaux, la latence étant répartie entre eux.
+        """
+        error_draw, jitter_draw = self._draw()
+        latency = self._latency(jitter_draw)
+        # Premier octet après un quart de la latence, comme un vrai modèle
+        self.sleep(latency / 4)
+        self._check_error(message, error_draw)
+
+        text = self.reply(history_len, message)
+        size = max(1, -(-len(text) // chunk_count))
+        for start in range(0, len(text), size):
+            yield text[start:start + size]
+            self.sleep(latency * 3 / 4 / chunk_count)
+
+
+class StubTransport(AIProvider):
+    """
+    Fournisseur bouchon exécuté dans le processus (aucun réseau).
+    """
+
+    def __init__(self, api_key=None, backend=None):
+        self.backend = backend or StubBackend.from_settings()
+
+    def upload_file(self, file_path, mime_type='application/pdf'):
+        return self.backend.upload(os.path.basename(file_path), os.path.getsize(file_path))
+
+    def get_file(self, file_name):
+        return StubFile(file_name)
+
+    def send_message(self, model_name, system_instruction, history, message, timeout=None):
+        return self.backend.chat(len(history), message)
+
+    def stream_message(self, model_name, system_instruction, history, message, timeout=None):
+        yield from self.backend.stream(len(history), message)
+
+
+class HttpStubTransport(AIProvider):
+    """
+    Fournisseur qui interroge le serveur bouchon (AI_STUB_URL).
+
+    Une connexion HTTP/1.1 persistante est conservée par thread.
+    """
+
+    def __init__(self, api_key=None, base_url=None):
+        parts = urlsplit(base_url or getattr(settings, 'AI_STUB_URL', 'http://127.0.0.1:8765'))
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = getattr(settings, 'AI_REQUEST_TIMEOUT', 120)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, path, body=None, headers=None):
+        """
+        Envoie une requête ; en cas de connexion fermée par le serveur, une seconde tentative est faite.
+        """
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                if response.status >= 400:
+                    detail = response.read().decode('utf-8', errors='ignore')
+                    raise StubError(response.status, detail)
+                return response
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+                if hasattr(body, 'seek'):
+                    body.seek(0)
+
+    def upload_file(self, file_path, mime_type='application/pdf'):
+        with open(file_path, 'rb') as f:
+            response = self._request('POST', '/v1/files', body=f, headers={
+                'Content-Type': mime_type,
+                'Content-Length': str(os.path.getsize(file_path)),
+                'X-File-Name': os.path.basename(file_path),
+            })
+            data = json.loads(response.read())
+        return StubFile(data['name'], data.get('state', 'ACTIVE'))
+
+    def get_file(self, file_name):
+        data = json.loads(self._request('GET', f'/v1/{file_name}').read())
+        return StubFile(data['name'], data.get('state', 'ACTIVE'))
+
+    def _chat_body(self, history, message, stream):
+        return json.dumps({'history_len': len(history), 'message': message, 'stream': stream}).encode('utf-8')
+
+    def send_message(self, model_name, system_instruction, history, message, timeout=None):
+        response = self._request('POST', '/v1/chat', body=self._chat_body(history, message, False),
+                                 headers={'Content-Type': 'application/json'})
+        return json.loads(response.read())['text']
+
+    def stream_message(self, model_name, system_instruction, history, message, timeout=None):
+        response = self._request('POST', '/v1/chat', body=self._chat_body(history, message, True),
+                                 headers={'Content-Type': 'application/json'})
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            yield chunk.decode('utf-8', errors='ignore')
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes du serveur bouchon :
+    - POST /v1/files          corps brut du fichier, en-tête X-File-Name
+    - GET  /v1/files/<nom>    état du fichier
+    - POST /v1/chat           {history_len, message, stream}
+    """
+    protocol_version = 'HTTP/1.1'
+    backend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self, sink=None):
+        remaining = int(self.headers.get('Content-Length', 0))
+        data = b''
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            if sink is None:
+                data += chunk
+        return data
+
+    def do_GET(self):
+        if self.path.startswith('/v1/files/'):
+            return self._send_json(200, {'name': self.path[len('/v1/'):], 'state': 'ACTIVE'})
+        self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path == '/v1/files':
+            size = int(self.headers.get('Content-Length', 0))
+            self._read_body(sink=True)
+            stub_file = self.backend.upload(self.headers.get('X-File-Name', 'upload.pdf'), size)
+            return self._send_json(200, {'name': stub_file.name, 'state': 'ACTIVE'})
+
+        if self.path == '/v1/chat':
+            payload = json.loads(self._read_body() or b'{}')
+            history_len = int(payload.get('history_len', 0))
+            message = payload.get('message', '')
+            try:
+                if not payload.get('stream'):
+                    return self._send_json(200, {'text': self.backend.chat(history_len, message)})
+
+                chunks = self.backend.stream(history_len, message)
+                first = next(chunks, '')
+            except StubError as e:
+                return self._send_json(e.status, {'error': str(e)})
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in [first, *chunks]:
+                data = chunk.encode('utf-8')
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+                    self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        self._send_json(404, {'error': 'not found'})
+
+
+def make_stub_server(host='127.0.0.1', port=8765, backend=None):
+    """
+    Construit (sans le démarrer) un serveur bouchon multi-thread.
+    """
+    handler = type('BoundStubRequestHandler', (StubRequestHandler,), {
+        'backend': backend or StubBackend.from_settings()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
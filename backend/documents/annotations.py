@@ -0,0 +1,27 @@
+"""
+Expressions d'annotation partagées par les ViewSets.
+
+Les compteurs affichés dans les listes (dossiers d'un client, documents d'un
+dossier, reports d'une audience...) sont calculés par la requête de liste
+elle-même plutôt qu'un `.count()` par ligne dans le sérialiseur.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def subquery_count(model, field):
+    """
+    Nombre de lignes de `model` dont `field` pointe vers la ligne courante.
+
+    Sous-requête corrélée plutôt que Count() sur une jointure : le résultat
+    reste exact quand la requête principale est déjà filtrée sur une autre
+    relation multiple (ex. dossiers filtrés par avocat assigné).
+    """
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
@@ -0,0 +1,45 @@
+import os
+from django.test import TestCase
+from documents.benchmarking import ROLES, seed_bulk_data, seed_role_users, measure_endpoints
+from documents.rollups import reconcile
+from documents.access import reconcile_access
+
+# Volume de données : assez de lignes par liste pour qu'un N+1 se voie au
+# nombre de requêtes (~200 documents, 50 dossiers) ; API_BUDGET_SCALE pour plus
+SEED_SCALE = int(os.environ.get('API_BUDGET_SCALE', 200))
+
+# Plafond de requêtes SQL par route, indépendant du volume
+DEFAULT_QUERY_BUDGET = 6
+QUERY_BUDGETS = {
+    # Consultation journalisée : insertion d'audit en mode synchrone (défaut)
+    'document-detail': 10,
+}
+
+# Plafond de latence médiane par route (ms) : vérifié seulement si API_TIME_BUDGET_MS
+# est défini, sur une machine dédiée (sinon `manage.py benchmark_api --max-ms`)
+TIME_BUDGET_MS = float(os.environ.get('API_TIME_BUDGET_MS', 0)) or None
+
+
+class ApiBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_bulk_data(scale=SEED_SCALE, prefix='budget')
+        reconcile()
+        cls.users = seed_role_users(prefix='budget')
+        reconcile_access()
+
+    def test_01_every_endpoint_per_role(self):
+        """Chaque route GET respecte son plafond de requêtes (et de latence si demandé), pour chaque rôle"""
+        for role in ROLES:
+            for result in measure_endpoints(self.users[role], repeat=3):
+                with self.subTest(role=role, route=result['route']):
+                    self.assertLess(result['status'], 500)
+                    self.assertLessEqual(result['queries'], QUERY_BUDGETS.get(result['route'], DEFAULT_QUERY_BUDGET))
+                    if TIME_BUDGET_MS:
+                        self.assertLessEqual(result['median_ms'], TIME_BUDGET_MS)
+
+    def test_02_client_sees_only_own_cases(self):
+        """Le rôle CLIENT est bien restreint à ses propres dossiers sur les listes mesurées"""
+        results = {r['route']: r for r in measure_endpoints(self.users['CLIENT'], repeat=1)}
+        self.assertEqual(results['case-list']['status'], 200)
+        self.assertEqual(results['user-list']['status'], 403)
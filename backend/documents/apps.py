@@ -2,9 +2,16 @@
 Configuration de l'application documents.
 """
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'documents'
     verbose_name = 'Gestion Documentaire'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .partitions import ensure_partitions_after_migrate
+
+        post_migrate.connect(ensure_partitions_after_migrate, sender=self, dispatch_uid='audit_partitions')
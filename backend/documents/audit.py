@@ -0,0 +1,230 @@
+"""
+Écriture différée et groupée du journal d'audit.
+
+`log_action` ne fait plus d'INSERT sur le chemin de la requête : l'entrée est
+mise en file (mémoire du processus ou liste Redis partagée) puis écrite par
+lots (`bulk_create`) par un fil d'arrière-plan, toutes les
+`AUDIT_FLUSH_INTERVAL` secondes ou dès `AUDIT_BATCH_SIZE` entrées.
+
+Garanties :
+- vidage de la file à l'arrêt du processus (atexit, arrêt gracieux de gunicorn) ;
+- écriture synchrone si le mode est `sync`, si la file mémoire est pleine ou
+  si le fil d'écriture n'a pas pu démarrer ;
+- un lot en échec est remis en file et retenté au passage suivant.
+
+Les compteurs de cumul (audit:total, audit:security) sont mis à jour par
+le vidage lui-même, une fois par lot. Une écriture synchrone ne les touche
+pas (le verrou de ces deux lignes sérialiserait toutes les requêtes) :
+`reconcile_stats` les recale.
+Les références devenues orphelines entre la mise en file et l'écriture
+(document supprimé juste après sa journalisation) sont mises à NULL,
+comme le ferait on_delete=SET_NULL.
+"""
+from collections import deque
+from datetime import datetime
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from .models import AuditLog, Case, Client, Document
+from . import rollups
+import atexit
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENTRY_FIELDS = ('user_id', 'action', 'document_id', 'case_id', 'client_id', 'details', 'ip_address', 'user_agent', 'timestamp')
+REDIS_QUEUE_KEY = 'audit:queue'
+
+
+def write_entry(entry):
+    """Écriture immédiate d'une entrée (mode sync, file pleine) : INSERT seul, compteurs laissés à la réconciliation."""
+    AuditLog.objects.create(**entry)
+
+
+def write_entries(entries):
+    """
+    Écrit un lot d'entrées (dicts ENTRY_FIELDS) et met à jour les compteurs de cumul.
+    Retourne le nombre de lignes insérées.
+    """
+    if not entries:
+        return 0
+    logs = [AuditLog(**entry) for entry in entries]
+
+    # Références supprimées depuis la mise en file : SET_NULL
+    for field, model in (('user_id', get_user_model()), ('document_id', Document), ('case_id', Case), ('client_id', Client)):
+        ids = {getattr(log, field) for log in logs} - {None}
+        if not ids:
+            continue
+        existing = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        for log in logs:
+            if getattr(log, field) not in existing:
+                setattr(log, field, None)
+
+    with transaction.atomic():
+        AuditLog.objects.bulk_create(logs, batch_size=settings.AUDIT_BATCH_SIZE)
+        rollups.apply_deltas(rollups.audit_deltas([log.action for log in logs]))
+    return len(logs)
+
+
+class MemoryQueue:
+    """File en mémoire du processus, bornée à AUDIT_BUFFER_MAX entrées."""
+
+    def __init__(self):
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def push(self, entry):
+        with self._lock:
+            if len(self._items) >= settings.AUDIT_BUFFER_MAX:
+                return False
+            self._items.append(entry)
+            return True
+
+    def pop_batch(self, size):
+        with self._lock:
+            return [self._items.popleft() for _ in range(min(size, len(self._items)))]
+
+    def requeue(self, entries):
+        with self._lock:
+            self._items.extendleft(reversed(entries))
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RedisQueue:
+    """
+    File partagée dans Redis : les entrées survivent à l'arrêt brutal d'un
+    worker et sont écrites par n'importe quel processus.
+    """
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _encode(entry):
+        return json.dumps({**entry, 'timestamp': entry['timestamp'].isoformat()})
+
+    @staticmethod
+    def _decode(raw):
+        entry = json.loads(raw)
+        entry['timestamp'] = datetime.fromisoformat(entry['timestamp'])
+        return entry
+
+    def push(self, entry):
+        self._redis.rpush(REDIS_QUEUE_KEY, self._encode(entry))
+        return True
+
+    def pop_batch(self, size):
+        return [self._decode(raw) for raw in self._redis.lpop(REDIS_QUEUE_KEY, size) or []]
+
+    def requeue(self, entries):
+        if entries:
+            self._redis.lpush(REDIS_QUEUE_KEY, *[self._encode(entry) for entry in reversed(entries)])
+
+    def __len__(self):
+        return self._redis.llen(REDIS_QUEUE_KEY)
+
+
+class AuditWriter:
+    """
+    File d'attente + fil d'écriture périodique. Une instance par processus.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        if settings.AUDIT_FLUSH_INTERVAL <= 0 or self._stopped:
+            return False  # Vidage manuel uniquement (tests, commandes)
+        try:
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+        except RuntimeError:
+            logger.exception("Impossible de démarrer le fil d'écriture du journal d'audit")
+            self._thread = None
+            return False
+        return True
+
+    def record(self, entry):
+        if not self.queue.push(entry):
+            # File pleine : écriture synchrone plutôt que perte de traces
+            write_entry(entry)
+            return
+        if settings.AUDIT_FLUSH_INTERVAL > 0 and not self._ensure_thread():
+            self.flush()
+        elif len(self.queue) >= settings.AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+
+    def flush(self):
+        """Écrit tout ce qui est en file ; retourne le nombre de lignes écrites."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self.queue.pop_batch(settings.AUDIT_BATCH_SIZE)
+                if not batch:
+                    return written
+                try:
+                    written += write_entries(batch)
+                except Exception:
+                    self.queue.requeue(batch)
+                    raise
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Échec d'écriture du journal d'audit, nouvel essai au prochain passage")
+            finally:
+                close_old_connections()
+
+    def shutdown(self):
+        self._stopped = True
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Journal d'audit non vidé à l'arrêt (%s entrée(s) en file)", len(self.queue))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Écrivain du processus, selon AUDIT_BUFFER (None en mode synchrone)."""
+    global _writer
+    if settings.AUDIT_BUFFER == 'sync':
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                queue = RedisQueue(settings.AUDIT_REDIS_URL) if settings.AUDIT_BUFFER == 'redis' else MemoryQueue()
+                _writer = AuditWriter(queue)
+                atexit.register(_writer.shutdown)
+    return _writer
+
+
+def record(entry):
+    writer = get_writer()
+    if writer is None:
+        write_entry(entry)
+    else:
+        writer.record(entry)
+
+
+def flush():
+    writer = get_writer()
+    return writer.flush() if writer else 0
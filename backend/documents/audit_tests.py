@@ -0,0 +1,192 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import csv
+import gzip
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from rest_framework.test import APIClient
+from documents import audit, partitions
+from documents.models import Client as LawClient, Case, Document, AuditLog
+from documents.rollups import get_counters, reconcile
+from documents.utils import log_action
+
+User = get_user_model()
+
+
+@override_settings(AUDIT_BUFFER='memory', AUDIT_FLUSH_INTERVAL=0, AUDIT_BATCH_SIZE=2)
+class BufferedAuditLogTest(TestCase):
+    def setUp(self):
+        audit._writer = None
+        self.user = User.objects.create_user(username='admin.audit', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client audit', created_by=self.user)
+        self.case = Case.objects.create(
+            client=law_client, title='Dossier', reference='AUD-1', opened_date=timezone.now().date(), created_by=self.user
+        )
+        self.document = Document.objects.create(
+            title='Pièce', case=self.case, uploaded_by=self.user, file=SimpleUploadedFile('piece.pdf', b'%PDF-1.4'),
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def tearDown(self):
+        audit._writer = None
+
+    def test_01_deferred_batched_write(self):
+        """Aucun INSERT d'audit pendant la requête ; écriture groupée au vidage, compteurs à jour"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get(f'/api/documents/documents/{self.document.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'INSERT INTO "documents_auditlog"' in q['sql']])
+        self.assertFalse(AuditLog.objects.exists())
+
+        queued_at = timezone.now()
+        log_action(self.user, 'DELETE', case=self.case, details='suppression')
+        log_action(self.user, 'VIEW', document=self.document)
+        self.assertEqual(audit.flush(), 3)
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertLessEqual(AuditLog.objects.get(action='DELETE').timestamp, queued_at + timedelta(seconds=1))
+        self.assertEqual(get_counters(['audit:security'])['audit:security'], 1)
+        self.assertEqual(reconcile(dry_run=True), {})
+
+    def test_02_dangling_references_and_full_buffer(self):
+        """Références supprimées mises à NULL ; écriture synchrone quand la file est pleine"""
+        log_action(self.user, 'DELETE', document=self.document)
+        Document.objects.filter(pk=self.document.pk).delete()
+        audit.flush()
+        self.assertIsNone(AuditLog.objects.get().document_id)
+
+        with override_settings(AUDIT_BUFFER_MAX=1):
+            log_action(self.user, 'VIEW', case=self.case)
+            log_action(self.user, 'VIEW', case=self.case)
+            self.assertEqual(AuditLog.objects.count(), 2)
+            self.assertEqual(audit.flush(), 1)
+        # L'écriture synchrone n'a pas touché aux compteurs
+        self.assertEqual(reconcile(dry_run=True), {'audit:total': (2, 3)})
+
+
+class AuditPartitionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin.partitions', password='x', role='ADMIN')
+        self.now = datetime.now(dt_timezone.utc)
+
+    def test_01_create_route_and_archive(self):
+        """Une ligne hors partition va dans la partition par défaut puis rejoint son mois ; archivage puis purge"""
+        old = datetime(2023, 3, 15, 9, tzinfo=dt_timezone.utc)
+        audit.write_entries([
+            {'user_id': self.user.id, 'action': action, 'timestamp': old} for action in ('DELETE', 'VIEW')
+        ])
+        self.assertTrue(partitions.create_partition(old))
+        self.assertFalse(partitions.create_partition(old))
+        self.assertIn(partitions.month_start(old), partitions.list_partitions())
+        self.assertEqual(AuditLog.objects.filter(timestamp__year=2023).count(), 2)
+        self.assertEqual(reconcile(dry_run=True), {})
+
+        with tempfile.TemporaryDirectory() as directory:
+            archived = partitions.archive_partitions(retention_months=24, directory=directory, now=self.now)
+            self.assertEqual([(month, rows) for month, _, rows in archived], [(partitions.month_start(old), 2)])
+            with gzip.open(archived[0][1], 'rt') as stream:
+                self.assertEqual(sorted(row['action'] for row in csv.DictReader(stream)), ['DELETE', 'VIEW'])
+
+        self.assertNotIn(partitions.month_start(old), partitions.list_partitions())
+        self.assertFalse(AuditLog.objects.filter(timestamp__year=2023).exists())
+        self.assertEqual(reconcile(dry_run=True), {})
+
+    def test_02_list_prunes_by_period(self):
+        """Les bornes date_from/date_to filtrent sur timestamp et limitent les partitions lues"""
+        AuditLog.objects.create(user=self.user, action='VIEW', timestamp=timezone.now() - timedelta(days=400))
+        AuditLog.objects.create(user=self.user, action='VIEW')
+        api = APIClient()
+        api.force_authenticate(self.user)
+        today = timezone.localdate().isoformat()
+        response = api.get('/api/documents/audit/', {'date_from': today, 'date_to': today})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(api.get('/api/documents/audit/', {'date_from': 'hier'}).status_code, 400)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'EXPLAIN SELECT * FROM documents_auditlog WHERE "timestamp" >= %s AND "timestamp" < %s',
+                [self.now, self.now + timedelta(days=1)],
+            )
+            plan = ' '.join(row[0] for row in cursor.fetchall())
+        self.assertIn(partitions.partition_name(self.now), plan)
+        self.assertNotIn('documents_auditlog_default', plan)
+
+
+class AuditExportTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin.export', password='x', role='ADMIN')
+        self.collab = User.objects.create_user(username='collab.export', password='x', role='COLLABORATEUR')
+        self.law_client = LawClient.objects.create(name='Client export', created_by=self.admin)
+        self.case = Case.objects.create(
+            client=self.law_client, title='Dossier', reference='EXP-1', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        start = timezone.now() - timedelta(days=30)
+        for n in range(7):
+            AuditLog.objects.create(
+                user=self.collab, action='VIEW', case=self.case, client=self.law_client,
+                details='=HYPERLINK("x")' if n == 0 else f'consultation {n}', timestamp=start + timedelta(days=n)
+            )
+        AuditLog.objects.create(user=self.admin, action='UPDATE', details='autre client')
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_01_streaming_export(self):
+        """Export CSV/JSONL en flux, filtré par client et période, sans injection de formule"""
+        response = self.api.get('/api/documents/audit/export/', {'client': self.law_client.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(rows[0]['details'], '\'=HYPERLINK("x")')
+        self.assertEqual({row['case_reference'] for row in rows}, {'EXP-1'})
+
+        since = (timezone.localdate() - timedelta(days=26)).isoformat()
+        response = self.api.get('/api/documents/audit/export/', {'output': 'jsonl', 'user': self.collab.id, 'date_from': since})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([line['details'] for line in lines], [f'consultation {n}' for n in range(4, 7)])
+        self.assertEqual(self.api.get('/api/documents/audit/export/', {'output': 'xml'}).status_code, 400)
+
+        # Un collaborateur n'exporte que ses propres entrées
+        self.api.force_authenticate(self.collab)
+        response = self.api.get('/api/documents/audit/export/', {'output': 'jsonl'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 7)
+
+    def test_03_client_export_includes_downloads(self):
+        """Les téléchargements et consultations de documents figurent dans l'export d'un client"""
+        document = Document.objects.create(
+            title='Pièce', case=self.case, uploaded_by=self.admin, file=SimpleUploadedFile('piece.pdf', b'%PDF-1.4'),
+        )
+        other_client = LawClient.objects.create(name='Autre client', created_by=self.admin)
+        self.assertEqual(self.api.get(f'/api/documents/documents/{document.id}/download/').status_code, 200)
+        self.assertEqual(self.api.get(f'/api/documents/documents/{document.id}/').status_code, 200)
+        # Entrée antérieure au correctif : client retrouvé par le document
+        AuditLog.objects.create(user=self.admin, action='DOWNLOAD', document=document, details='ancien téléchargement')
+
+        response = self.api.get('/api/documents/audit/export/', {'client': self.law_client.id, 'output': 'jsonl'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lines), 7 + 3)
+        self.assertEqual(
+            [line['details'] for line in lines[7:]],
+            ['Document téléchargé: Pièce', 'Document consulté: Pièce', 'ancien téléchargement'],
+        )
+        response = self.api.get('/api/documents/audit/export/', {'client': other_client.id, 'output': 'jsonl'})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_02_keyset_pagination(self):
+        """La liste se parcourt par curseur, sans COUNT ni OFFSET, sans doublon ni trou"""
+        seen, url = [], '/api/documents/audit/?page_size=3'
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.api.get(url)
+            sql = ' '.join(q['sql'] for q in ctx.captured_queries if 'documents_auditlog' in q['sql'])
+            self.assertNotIn('COUNT(', sql)
+            self.assertNotIn('OFFSET', sql)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, list(AuditLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True)))
@@ -0,0 +1,276 @@
+"""
+Outils de mesure de performance : peuplement massif de la base et chronométrage.
+
+`seed_bulk_data` crée rapidement (bulk_create, sans signaux ni OCR) un cabinet
+synthétique de plusieurs milliers de lignes ; `measure` exécute un appel et
+relève le nombre de requêtes SQL et la latence. `seed_role_users` et
+`measure_endpoints` parcourent toutes les routes GET de l'API pour un rôle donné.
+"""
+from datetime import datetime, time as day_time, timedelta
+from importlib import import_module
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .models import Client, Case, Document, AuditLog, Tag, Deadline, Decision, AgendaEvent
+import random
+import statistics
+import time
+
+User = get_user_model()
+
+CATEGORIES = [choice for choice, _ in Case.CaseCategory.choices]
+AUDIT_ACTIONS = [choice for choice, _ in AuditLog.ActionType.choices]
+CHAMBRES = [choice for choice, _ in AgendaEvent.TypeChambre.choices]
+ROLES = ('ADMIN', 'AVOCAT', 'COLLABORATEUR', 'CLIENT')
+
+# Modules d'URLs dont les routeurs sont parcourus par `iter_endpoints`
+API_URLCONFS = ('documents.urls', 'users.urls', 'cabinet.urls')
+
+# Vues hors routeur, en lecture
+EXTRA_GET_ROUTES = ('cabinet-public', 'cabinet-settings')
+
+# Routes exclues : appel au fournisseur d'IA, lecture de fichiers absents des données générées,
+# export en flux (les requêtes ont lieu pendant la lecture de la réponse)
+SKIPPED_ROUTES = {'case-chat-init', 'document-download', 'audit-export', 'case-export'}
+
+# Paramètres obligatoires de certaines actions
+ROUTE_PARAMS = {
+    'document-search': {'q': 'pièce'},
+    'agenda-historique-dossier': {'dossier_numero': 'RG-1'},
+}
+
+
+def seed_bulk_data(scale=1000, prefix='bench', seed=42, batch_size=2000):
+    """
+    Peuple la base avec environ `scale` documents et les données associées :
+    scale/10 clients, scale/4 dossiers, scale/2 échéances, scale/10 décisions,
+    scale/5 audiences, 5 x scale entrées d'audit. Retourne le nombre de lignes
+    créées par modèle.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    author, _ = User.objects.get_or_create(
+        username=f'{prefix}_admin', defaults={'role': 'ADMIN', 'email': f'{prefix}_admin@example.com'}
+    )
+
+    Tag.objects.bulk_create(
+        [Tag(name=f'{prefix}-tag-{i}') for i in range(20)], batch_size=batch_size, ignore_conflicts=True
+    )
+    tags = list(Tag.objects.filter(name__startswith=f'{prefix}-tag-'))
+
+    clients = Client.objects.bulk_create([
+        Client(
+            name=f'{prefix} client {i}',
+            client_type=rng.choice(['PARTICULIER', 'ENTREPRISE']),
+            created_by=author,
+        )
+        for i in range(max(1, scale // 10))
+    ], batch_size=batch_size)
+
+    cases = Case.objects.bulk_create([
+        Case(
+            title=f'{prefix} dossier {i}',
+            reference=f'{prefix.upper()}-{i:06d}',
+            client=rng.choice(clients),
+            opened_date=(now - timedelta(days=rng.randint(0, 1500))).date(),
+            category=rng.choice(CATEGORIES),
+            created_by=author,
+        )
+        for i in range(max(1, scale // 4))
+    ], batch_size=batch_size)
+
+    Case.tags.through.objects.bulk_create([
+        Case.tags.through(case_id=case.id, tag_id=tag.id)
+        for case in cases
+        for tag in rng.sample(tags, 2)
+    ], batch_size=batch_size)
+
+    documents = Document.objects.bulk_create([
+        Document(
+            title=f'{prefix} pièce {i}',
+            case=rng.choice(cases),
+            file=f'{prefix}/piece_{i}.pdf',
+            file_name=f'piece_{i}.pdf',
+            file_size=rng.randint(10 * 1024, 5 * 1024 * 1024),
+            file_extension='pdf',
+            ocr_processed=rng.random() < 0.7,
+            uploaded_by=author,
+        )
+        for i in range(scale)
+    ], batch_size=batch_size)
+
+    deadlines = Deadline.objects.bulk_create([
+        Deadline(
+            case=rng.choice(cases),
+            title=f'{prefix} échéance {i}',
+            deadline_type=rng.choice(['AUDIENCE', 'AUTRE']),
+            due_date=now + timedelta(days=rng.randint(-200, 200)),
+            is_completed=rng.random() < 0.4,
+            created_by=author,
+        )
+        for i in range(scale // 2)
+    ], batch_size=batch_size)
+
+    decisions = Decision.objects.bulk_create([
+        Decision(case=rng.choice(cases), decision_type=rng.choice(['INSTANCE', 'APPEL', 'POURVOI']), created_by=author)
+        for _ in range(scale // 10)
+    ], batch_size=batch_size)
+
+    agenda_events = []
+    for i in range(scale // 5):
+        # bulk_create n'appelle pas save() : year et start_datetime sont calculés ici
+        date_audience = (now + timedelta(days=rng.randint(-300, 300))).date()
+        heure_audience = day_time(rng.choice([8, 9, 10, 14]), 0)
+        case = rng.choice(cases)
+        agenda_events.append(AgendaEvent(
+            title=f'{prefix} audience {i}',
+            type_chambre=rng.choice(CHAMBRES),
+            dossier_numero=f'RG-{i % 50}',
+            date_audience=date_audience,
+            heure_audience=heure_audience,
+            start_datetime=timezone.make_aware(datetime.combine(date_audience, heure_audience)),
+            year=date_audience.year,
+            statut=rng.choice(['PREVU', 'PREVU', 'REPORTE', 'TERMINE']),
+            case=case,
+            created_by=author,
+        ))
+    agenda_events = AgendaEvent.objects.bulk_create(agenda_events, batch_size=batch_size)
+
+    audit_logs = AuditLog.objects.bulk_create([
+        AuditLog(
+            user=author,
+            action=rng.choice(AUDIT_ACTIONS),
+            document=rng.choice(documents),
+            details=f'{prefix} action {i}',
+        )
+        for i in range(scale * 5)
+    ], batch_size=batch_size)
+
+    return {
+        'clients': len(clients),
+        'cases': len(cases),
+        'documents': len(documents),
+        'deadlines': len(deadlines),
+        'decisions': len(decisions),
+        'agenda_events': len(agenda_events),
+        'audit_logs': len(audit_logs),
+        'tags': len(tags),
+    }
+
+
+def measure(func, repeat=10):
+    """
+    Appelle `func` `repeat` fois ; retourne les requêtes SQL du premier appel
+    et les latences (ms) médiane, p95 et maximale.
+    """
+    durations = []
+    queries = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            func()
+            durations.append((time.perf_counter() - started) * 1000)
+        if queries is None:
+            queries = len(captured)
+
+    durations.sort()
+    return {
+        'queries': queries,
+        'median_ms': statistics.median(durations),
+        'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        'max_ms': durations[-1],
+    }
+
+
+def seed_role_users(prefix='bench', assigned_cases=25):
+    """
+    Crée (ou retrouve) un utilisateur par rôle. Le collaborateur est assigné à
+    quelques dossiers ; le compte CLIENT est rattaché au client qui en a le plus.
+    Retourne {rôle: utilisateur}.
+    """
+    users = {}
+    for role in ROLES:
+        users[role], _ = User.objects.get_or_create(
+            username=f'{prefix}_{role.lower()}',
+            defaults={'role': role, 'email': f'{prefix}_{role.lower()}@example.com'},
+        )
+
+    cases = Case.objects.filter(reference__startswith=f'{prefix.upper()}-').order_by('id')
+    Case.assigned_to.through.objects.bulk_create([
+        Case.assigned_to.through(case_id=case_id, user_id=users['COLLABORATEUR'].id)
+        for case_id in cases.values_list('id', flat=True)[:assigned_cases]
+    ], ignore_conflicts=True)
+
+    if not Client.objects.filter(user=users['CLIENT']).exists():
+        client = (
+            Client.objects.filter(name__startswith=f'{prefix} client', user__isnull=True)
+            .annotate(case_total=Count('cases')).order_by('-case_total').first()
+        )
+        if client:
+            client.user = users['CLIENT']
+            client.save(update_fields=['user'])
+    return users
+
+
+def iter_endpoints():
+    """
+    Routes GET de l'API : liste, détail et actions en lecture de chaque ViewSet
+    enregistré, puis vues hors routeur. Produit (nom de route, basename, clé
+    primaire exposée, détail ?).
+    """
+    for urlconf in API_URLCONFS:
+        for _, viewset, basename in import_module(urlconf).router.registry:
+            queryset = getattr(viewset, 'queryset', None)
+            pk_field = queryset.model._meta.pk.name if queryset is not None else 'id'
+            if hasattr(viewset, 'list'):
+                yield f'{basename}-list', basename, pk_field, False
+            if hasattr(viewset, 'retrieve'):
+                yield f'{basename}-detail', basename, pk_field, True
+            for extra in viewset.get_extra_actions():
+                if 'get' in extra.mapping:
+                    yield f'{basename}-{extra.url_name}', basename, pk_field, extra.detail
+    for name in EXTRA_GET_ROUTES:
+        yield name, None, 'id', False
+
+
+def measure_endpoints(user, repeat=3):
+    """
+    Appelle chaque route GET au nom de `user` et retourne une ligne par route :
+    statut HTTP, requêtes SQL du premier appel et latences (cf. `measure`).
+    Le détail est demandé pour le premier objet visible dans la liste du rôle.
+    Un appel de chauffe précède la mesure : les effets de bord ponctuels
+    (remplissage des caches) ne faussent pas le régime établi.
+    """
+    api = APIClient()
+    api.force_authenticate(user)
+    first_ids = {}
+    results = []
+    for name, basename, pk_field, detail in iter_endpoints():
+        if name in SKIPPED_ROUTES:
+            continue
+        kwargs = {}
+        if detail:
+            if not first_ids.get(basename):
+                continue  # Aucun objet visible pour ce rôle
+            kwargs = {'pk': first_ids[basename]}
+        try:
+            url = reverse(name, kwargs=kwargs)
+        except NoReverseMatch:
+            continue
+        params = ROUTE_PARAMS.get(name, {})
+
+        api.get(url, params)
+        responses = []
+        timing = measure(lambda: responses.append(api.get(url, params)), repeat=repeat)
+        response = responses[0]
+        if name == f'{basename}-list' and response.status_code == 200:
+            data = response.data
+            rows = data.get('results', []) if isinstance(data, dict) else data
+            first_ids[basename] = rows[0][pk_field] if rows else None
+        results.append({'route': name, 'url': url, 'status': response.status_code, **timing})
+    return results
@@ -0,0 +1,342 @@
+"""
+Stockage des fichiers par contenu (SHA-256), avec comptage de références.
+
+Les fichiers des documents, de leurs pages et de leurs versions sont rangés
+sous MEDIA_ROOT/blobs/ab/cd/<sha256>.<ext> : un contenu identique (page 1
+d'un document mono-fichier, annexe commune à plusieurs dossiers, ré-upload)
+n'est écrit qu'une fois. L'extension est conservée (l'OCR et la rotation
+s'appuient dessus) ; le nom d'origine reste dans `file_name`.
+
+- `ContentAddressedStorage` calcule l'empreinte pendant l'écriture dans un
+  fichier temporaire, puis le renomme en blob (ou le supprime si le blob
+  existe déjà). Un blob n'est jamais modifié en place ;
+- la table Blob compte les lignes (Document, DocumentPage, DocumentVersion,
+  VersionChunk) qui référencent chaque blob, tenue à jour par les signaux (signals.py) ;
+- `collect_garbage` supprime les blobs qui ne sont plus référencés depuis
+  BLOB_GC_GRACE_HOURS, après vérification dans les tables : un fichier écrit
+  mais pas encore enregistré (transaction en cours) n'est pas supprimé ;
+- l'écriture et la suppression d'un blob se font sous le verrou de sa ligne
+  Blob (`claim`) : un doublon ne peut pas réutiliser un fichier que le
+  ramasse-miettes est en train de supprimer.
+
+Avec FILE_ENCRYPTION_AT_REST, les nouveaux blobs sont chiffrés (encryption.py) ;
+le nom reste l'empreinte du contenu en clair, ce qui préserve la déduplication.
+Le numéro de clé du fichier écrit est enregistré dans Blob.key_id.
+`open()` déchiffre à la volée ; `path()` désigne le fichier chiffré : les
+lecteurs qui ont besoin d'un chemin passent par `encryption.plain_path`.
+
+Les fichiers antérieurs (documents/client_x/...) restent lisibles ;
+`manage.py blobstore --import-legacy` les convertit.
+"""
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from . import encryption
+import hashlib
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = 'blobs/'
+TMP_DIR = 'blobs/tmp'
+BLOB_MODELS = (
+    ('documents', 'Document'), ('documents', 'DocumentPage'), ('documents', 'DocumentVersion'),
+    ('documents', 'VersionChunk'),
+)
+BATCH_SIZE = 500
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX) and not name.startswith(TMP_DIR + '/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage dont le nom de fichier est l'empreinte du contenu.
+    Le nom proposé par `upload_to` ne sert qu'à en conserver l'extension.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom définitif dépend du contenu : voir _save
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        digest = hashlib.sha256()
+        tmp_dir = self.path(TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        encrypt = settings.FILE_ENCRYPTION_AT_REST
+        if hasattr(content, 'temporary_file_path') and not encrypt:
+            # Déjà sur disque (upload volumineux, upload découpé) : lu pour l'empreinte, puis déplacé
+            source, owned = content.temporary_file_path(), False
+            with open(source, 'rb') as stream:
+                for block in iter(lambda: stream.read(1024 * 1024), b''):
+                    digest.update(block)
+        else:
+            # Empreinte du contenu en clair, chiffrement éventuel, en une seule lecture
+            handle, source = tempfile.mkstemp(dir=tmp_dir)
+            owned = True
+            with os.fdopen(handle, 'wb') as stream:
+                target = encryption.EncryptingWriter(stream) if encrypt else stream
+                for chunk in content.chunks():
+                    target.write(chunk)
+                    digest.update(chunk)
+                if encrypt:
+                    target.close()
+
+        name = blob_name(digest.hexdigest(), extension)
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        key_id = encryption.current_key_id() if encrypt else encryption.PLAINTEXT_KEY_ID
+        with transaction.atomic():
+            stored_key_id = claim(name, key_id)
+            if os.path.exists(full_path):
+                # Doublon : rien à écrire ; la date rafraîchie protège le blob du ramasse-miettes
+                os.utime(full_path)
+                if owned:
+                    os.remove(source)
+                # Ligne créée à l'instant pour un fichier déjà présent (orphelin) : clé lue dans son en-tête
+                key_id = encryption.key_id_of(full_path)
+            else:
+                if owned:
+                    os.replace(source, full_path)
+                else:
+                    file_move_safe(source, full_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+            if stored_key_id != key_id:
+                django_apps.get_model('documents', 'Blob').objects.filter(name=name).update(key_id=key_id)
+        return name
+
+    def _open(self, name, mode='rb'):
+        if mode != 'rb':
+            return super()._open(name, mode)
+        # Déchiffré à la volée si le blob est chiffré
+        return File(encryption.open_plain(self.path(name)), name)
+
+    def size(self, name):
+        """Taille du contenu en clair."""
+        return encryption.plaintext_size(self.path(name))
+
+
+blob_storage = ContentAddressedStorage()
+
+
+# ---------------------------------------------------------------------------
+# Comptage des références
+# ---------------------------------------------------------------------------
+
+def apply_refcount_deltas(deltas):
+    """
+    Ajoute les deltas aux compteurs des blobs (création à la volée), en une requête.
+    Noms triés : deux transactions concurrentes verrouillent dans le même ordre.
+    """
+    items = sorted((name, amount) for name, amount in deltas.items() if amount and is_blob(name))
+    if not items:
+        return
+    placeholders = ', '.join(['(%s, %s, NOW())'] * len(items))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO documents_blob (name, refcount, updated_at) VALUES {placeholders} "
+            "ON CONFLICT (name) DO UPDATE SET refcount = documents_blob.refcount + EXCLUDED.refcount, "
+            "updated_at = EXCLUDED.updated_at",
+            [value for item in items for value in item],
+        )
+
+
+def claim(name, key_id=None):
+    """
+    Verrouille la ligne Blob de `name` (créée au besoin, sans référence, avec la clé `key_id`)
+    et rafraîchit sa date, jusqu'à la fin de la transaction. À appeler avant d'écrire ou de
+    réutiliser le fichier : le ramasse-miettes, qui supprime sous ce verrou, est soit attendu
+    (le fichier est alors réécrit), soit écarté par la date rafraîchie.
+    Retourne le numéro de clé enregistré.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO documents_blob (name, refcount, key_id, updated_at) VALUES (%s, 0, %s, NOW()) "
+            "ON CONFLICT (name) DO UPDATE SET updated_at = EXCLUDED.updated_at RETURNING key_id",
+            [name, key_id],
+        )
+        return cursor.fetchone()[0]
+
+
+def referenced_names(names=None, get_model=None):
+    """Nombre de références par blob, compté dans les tables (toutes ou restreint à `names`)."""
+    get_model = get_model or django_apps.get_model
+    counts = Counter()
+    if names is not None and not names:
+        return counts
+    for app_label, model_name in BLOB_MODELS:
+        queryset = get_model(app_label, model_name).objects.filter(file__startswith=BLOB_PREFIX)
+        if names is not None:
+            queryset = queryset.filter(file__in=names)
+        for name, count in queryset.order_by().values_list('file').annotate(n=Count('pk')):
+            counts[name] += count
+    return counts
+
+
+def recount(get_model=None):
+    """Recalcule tous les compteurs à partir des tables ; retourne le nombre de compteurs corrigés."""
+    Blob = (get_model or django_apps.get_model)('documents', 'Blob')
+    actual = referenced_names(get_model=get_model)
+    stored = dict(Blob.objects.values_list('name', 'refcount'))
+    fixed = 0
+    with transaction.atomic():
+        for name in set(actual) | set(stored):
+            if actual.get(name, 0) != stored.get(name):
+                Blob.objects.update_or_create(name=name, defaults={'refcount': actual.get(name, 0)})
+                fixed += 1
+    return fixed
+
+
+# ---------------------------------------------------------------------------
+# Ramasse-miettes
+# ---------------------------------------------------------------------------
+
+def _older_than(path, cutoff):
+    try:
+        return os.path.getmtime(path) < cutoff.timestamp()
+    except FileNotFoundError:
+        return True
+
+
+def _adopt(files):
+    """
+    Crée les lignes Blob (sans référence, datées du fichier) des fichiers [(nom, date)]
+    qui n'en ont pas : leur suppression passe alors par le même verrou que les autres blobs.
+    """
+    if not files:
+        return
+    placeholders = ', '.join(['(%s, 0, %s)'] * len(files))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO documents_blob (name, refcount, updated_at) VALUES {placeholders} "
+            "ON CONFLICT (name) DO NOTHING",
+            [value for item in files for value in item],
+        )
+
+
+def collect_garbage(grace_hours=None, dry_run=False, now=None):
+    """
+    Supprime les blobs sans référence depuis plus de `grace_hours`, les fichiers
+    de blob sans compteur (écrits puis jamais enregistrés) et les fichiers
+    temporaires abandonnés. Retourne la liste des noms supprimés.
+    """
+    from .models import Blob
+
+    grace_hours = settings.BLOB_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    cutoff = (now or timezone.now()) - timedelta(hours=grace_hours)
+    removed = []
+
+    # Fichiers temporaires abandonnés, et fichiers de blob présents sur disque sans ligne Blob
+    root = blob_storage.path(BLOB_PREFIX.rstrip('/'))
+    orphans = []
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+            if not _older_than(path, cutoff):
+                continue
+            name = os.path.relpath(path, blob_storage.location).replace(os.sep, '/')
+            if is_blob(name):
+                orphans.append((name, datetime.fromtimestamp(os.path.getmtime(path), dt_timezone.utc)))
+                continue
+            if not dry_run:
+                blob_storage.delete(name)
+            removed.append(name)
+    for start in range(0, len(orphans), BATCH_SIZE):
+        batch = orphans[start:start + BATCH_SIZE]
+        known = set(Blob.objects.filter(name__in=[name for name, _ in batch]).values_list('name', flat=True))
+        unknown = [(name, mtime) for name, mtime in batch if name not in known]
+        if dry_run:
+            used = referenced_names([name for name, _ in unknown])
+            removed.extend(name for name, _ in unknown if name not in used)
+        else:
+            # Adoptés plutôt que supprimés ici : un upload concurrent du même contenu pose le verrou de la ligne
+            _adopt(unknown)
+
+    candidates = list(
+        Blob.objects.filter(refcount__lte=0, updated_at__lt=cutoff).values_list('name', flat=True)
+    )
+    for start in range(0, len(candidates), BATCH_SIZE):
+        batch = candidates[start:start + BATCH_SIZE]
+        with transaction.atomic():
+            # Une ligne verrouillée par `claim` est sautée ; sinon la date est revérifiée sous le verrou
+            locked = list(
+                Blob.objects.select_for_update(skip_locked=True)
+                .filter(name__in=batch, refcount__lte=0, updated_at__lt=cutoff)
+                .values_list('name', flat=True)
+            )
+            # Filet de sécurité : une référence posée sans signal (update en masse) sauve le blob
+            still_used = referenced_names(locked)
+            for name, count in still_used.items():
+                logger.warning("Blob %s encore référencé %s fois : compteur corrigé", name, count)
+                Blob.objects.filter(name=name).update(refcount=count)
+            doomed = [
+                name for name in locked
+                if name not in still_used and _older_than(blob_storage.path(name), cutoff)
+            ]
+            if not dry_run:
+                for name in doomed:
+                    blob_storage.delete(name)
+                Blob.objects.filter(name__in=doomed).delete()
+            removed.extend(doomed)
+    return removed
+
+
+# ---------------------------------------------------------------------------
+# Reprise des fichiers antérieurs
+# ---------------------------------------------------------------------------
+
+def import_legacy(dry_run=False):
+    """
+    Range les fichiers antérieurs dans le stockage par contenu et met à jour
+    les lignes qui les référencent. Les anciens fichiers sont supprimés une fois
+    qu'aucune ligne ne les référence plus. Retourne (lignes converties, fichiers supprimés).
+    """
+    converted, legacy = 0, {}
+    for app_label, model_name in BLOB_MODELS:
+        model = django_apps.get_model(app_label, model_name)
+        rows = model.objects.exclude(file='').exclude(file__startswith=BLOB_PREFIX).values_list('pk', 'file')
+        for pk, old_name in rows.iterator(chunk_size=BATCH_SIZE):
+            if old_name not in legacy:
+                if not blob_storage.exists(old_name):
+                    logger.warning("Fichier introuvable, non converti : %s", old_name)
+                    continue
+                if dry_run:
+                    legacy[old_name] = None
+                else:
+                    with blob_storage.open(old_name, 'rb') as source:
+                        legacy[old_name] = blob_storage.save(old_name, File(source, name=old_name))
+            if not dry_run:
+                # update() : pas de signal, les compteurs sont recalculés ensuite
+                model.objects.filter(pk=pk).update(file=legacy[old_name])
+            converted += 1
+
+    deleted = 0
+    if not dry_run:
+        recount()
+        for old_name in legacy:
+            if not any(
+                django_apps.get_model(app_label, model_name).objects.filter(file=old_name).exists()
+                for app_label, model_name in BLOB_MODELS
+            ):
+                blob_storage.delete(old_name)
+                deleted += 1
+    return converted, deleted
@@ -0,0 +1,176 @@
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Document, DocumentPage, DocumentVersion, Blob
+from documents import blobstore
+from PIL import Image
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+User = get_user_model()
+
+LATER = timezone.now() + timedelta(days=2)
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 2), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class BlobStoreTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='avocat.blob', password='x', role='AVOCAT')
+        law_client = LawClient.objects.create(name='Client blob', created_by=self.user)
+        self.cases = [
+            Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.user)
+            for _ in range(2)
+        ]
+
+    def add_document(self, case, content, name='annexe.pdf'):
+        document = Document.objects.create(
+            case=case, title=name, file=SimpleUploadedFile(name, content), uploaded_by=self.user
+        )
+        DocumentPage.objects.create(document=document, file=document.file, page_number=1)
+        return document
+
+    def refcount(self, name):
+        return Blob.objects.filter(name=name).values_list('refcount', flat=True).first()
+
+    def blob_files(self):
+        root = os.path.join(self.media, 'blobs')
+        return sorted(
+            name for directory, _, files in os.walk(root) if not directory.endswith('tmp') for name in files
+        )
+
+    def test_01_identical_content_stored_once(self):
+        """Un contenu partagé par deux dossiers n'est écrit qu'une fois ; supprimé quand plus personne ne le référence"""
+        first = self.add_document(self.cases[0], b'%PDF-1.4 annexe commune')
+        second = self.add_document(self.cases[1], b'%PDF-1.4 annexe commune', name='copie.pdf')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual((first.file_name, second.file_name), ('annexe.pdf', 'copie.pdf'))
+        self.assertTrue(first.file.name.startswith('blobs/') and first.file.name.endswith('.pdf'))
+        self.assertEqual(len(self.blob_files()), 1)
+        self.assertEqual(self.refcount(first.file.name), 4)  # 2 documents + leur page 1
+
+        DocumentVersion.objects.create(
+            document=second, version_number=1, file=SimpleUploadedFile('v1.pdf', b'%PDF-1.4 annexe commune'),
+            file_name='v1.pdf', file_size=23
+        )
+        self.assertEqual(self.refcount(first.file.name), 5)
+
+        first.delete()
+        self.assertEqual(self.refcount(second.file.name), 3)
+        self.assertEqual(blobstore.collect_garbage(now=LATER), [])
+        second.delete()
+        self.assertEqual(self.refcount(second.file.name), 0)
+
+        self.assertEqual(blobstore.collect_garbage(), [])  # Délai de grâce
+        self.assertEqual(blobstore.collect_garbage(now=LATER), [second.file.name])
+        self.assertEqual(self.blob_files(), [])
+        self.assertFalse(Blob.objects.exists())
+
+    def test_02_garbage_collector_checks_references(self):
+        """Un compteur faux ne fait pas supprimer un fichier utilisé ; un fichier orphelin est supprimé"""
+        document = self.add_document(self.cases[0], b'%PDF-1.4 piece')
+        Blob.objects.update(refcount=0)
+        self.assertEqual(blobstore.collect_garbage(now=LATER), [])
+        self.assertEqual(self.refcount(document.file.name), 2)
+
+        orphan = blobstore.blob_storage.save('perdu.pdf', SimpleUploadedFile('perdu.pdf', b'jamais enregistre'))
+        self.assertEqual(blobstore.collect_garbage(), [])
+        self.assertEqual(blobstore.collect_garbage(now=LATER), [orphan])
+        self.assertTrue(blobstore.blob_storage.exists(document.file.name))
+
+    def test_03_import_legacy_files(self):
+        """Les fichiers antérieurs sont convertis, dédupliqués, puis supprimés"""
+        legacy = FileSystemStorage()
+        names = [
+            legacy.save(f'documents/client_1/case_{n}/scan.pdf', SimpleUploadedFile('scan.pdf', b'%PDF-1.4 scan'))
+            for n in range(2)
+        ]
+        documents = [self.add_document(case, b'tmp') for case in self.cases]
+        for document, name in zip(documents, names):
+            Document.objects.filter(pk=document.pk).update(file=name)
+            DocumentPage.objects.filter(document=document).update(file=name)
+
+        self.assertEqual(blobstore.import_legacy(), (4, 2))
+        blob = Document.objects.get(pk=documents[0].pk).file.name
+        self.assertEqual(set(Document.objects.values_list('file', flat=True)), {blob})
+        self.assertEqual(self.refcount(blob), 4)
+        self.assertFalse(any(legacy.exists(name) for name in names))
+
+    def test_04_rotation_does_not_alter_shared_file(self):
+        """Pivoter l'image d'un document crée un nouveau fichier ; le document qui partage l'original est intact"""
+        first = self.add_document(self.cases[0], png('red'), name='scan.png')
+        second = self.add_document(self.cases[1], png('red'), name='scan.png')
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user(username='admin.blob', password='x', role='ADMIN'))
+
+        with mock.patch('documents.ocr.process_document_ocr'):
+            response = api.post(f'/api/documents/documents/{first.pk}/rotate-image/', {'angle': 90}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        first.refresh_from_db()
+        self.assertNotEqual(first.file.name, second.file.name)
+        self.assertEqual(first.pages.get().file.name, first.file.name)
+        with first.file.open('rb') as rotated:
+            self.assertEqual(Image.open(rotated).size, (2, 4))
+        with second.file.open('rb') as original:
+            self.assertEqual(Image.open(original).size, (4, 2))
+        self.assertEqual((self.refcount(first.file.name), self.refcount(second.file.name)), (2, 2))
+
+
+class GarbageCollectorRaceTest(TransactionTestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_01_duplicate_upload_during_collection(self):
+        """Un doublon écrit pendant la suppression du blob attend le ramasse-miettes puis réécrit le fichier"""
+        content = SimpleUploadedFile('annexe.pdf', b'%PDF-1.4 annexe supprimee puis renvoyee')
+        name = blobstore.blob_storage.save('annexe.pdf', content)
+        checked = threading.Event()
+        older_than = blobstore._older_than
+
+        def slow_check(path, cutoff):
+            result = older_than(path, cutoff)
+            if connection.in_atomic_block:
+                # Date revérifiée sous le verrou, fichier pas encore supprimé : le doublon arrive à ce moment
+                checked.set()
+                time.sleep(0.5)
+            return result
+
+        def collect():
+            try:
+                with mock.patch('documents.blobstore._older_than', slow_check):
+                    blobstore.collect_garbage(now=LATER)
+            finally:
+                connection.close()
+
+        collector = threading.Thread(target=collect)
+        collector.start()
+        self.assertTrue(checked.wait(5))
+        content.seek(0)
+        self.assertEqual(blobstore.blob_storage.save('annexe.pdf', content), name)
+        collector.join()
+        self.assertTrue(blobstore.blob_storage.exists(name))
+        self.assertTrue(Blob.objects.filter(name=name).exists())
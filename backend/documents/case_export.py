@@ -0,0 +1,187 @@
+"""
+Export d'un dossier complet en archive ZIP, produite à la volée.
+
+zipfile écrit dans un tampon (_ZipStream) vidé au fil de la
+StreamingHttpResponse : ni fichier temporaire, ni archive en mémoire ; la
+mémoire consommée est bornée par quelques blocs, quelle que soit la taille
+du dossier. Le flux n'étant pas positionnable, zipfile place la taille et le
+CRC de chaque entrée après ses données (descripteur) et passe en ZIP64 au besoin.
+
+Contenu de l'archive :
+    <référence>/documents/<id>_<nom>          fichier de chaque document
+    <référence>/pages/<id>/<n>.<ext>          pages des documents multi-pages
+    <référence>/versions/<id>_v<n>_<nom>      dernière version de chaque document
+    <référence>/ocr/<id>_<nom>.txt            texte OCR (option ?ocr=1)
+    <référence>/manifest.json                 inventaire (tailles, SHA-256), écrit en dernier
+"""
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models.fields.files import FieldFile
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
+from . import encryption, version_store
+import hashlib
+import json
+import logging
+import os
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK = 64 * 1024
+# Morceaux envoyés au client : assez gros pour limiter les appels, assez petits pour un flux régulier
+CHUNK_SIZE = 256 * 1024
+# Pièces souvent déjà compressées (PDF, JPEG) : compression rapide
+COMPRESS_LEVEL = 1
+
+
+class _ZipStream:
+    """Pseudo-fichier en écriture seule : zipfile y écrit, le générateur le vide."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self, minimum=0):
+        """Contenu accumulé s'il atteint `minimum` octets (b'' sinon), puis tampon vidé."""
+        if not self._buffer or len(self._buffer) < minimum:
+            return b''
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def safe_name(name, fallback):
+    try:
+        return get_valid_filename(name)
+    except SuspiciousFileOperation:
+        return fallback
+
+
+def archive_root(case):
+    return safe_name(case.reference or '', f'dossier_{case.pk}')
+
+
+def document_files(document):
+    """(type, chemin relatif, FieldFile ou version, infos) des fichiers d'un document à archiver."""
+    stem = f'{document.pk}_{safe_name(document.file_name, "document")}'
+    if document.file:
+        yield 'document', f'documents/{stem}', document.file, {}
+    if document.is_multi_page:
+        for page in document.pages.all():
+            # Document mono-fichier : la page 1 est le même fichier
+            if page.file and page.file.name != document.file.name:
+                extension = os.path.splitext(page.file.name)[1].lower()
+                yield 'page', f'pages/{document.pk}/{page.page_number:03d}{extension}', page.file, {
+                    'page_number': page.page_number,
+                }
+    latest = next(iter(document.versions.all()), None)  # Préchargées par numéro décroissant
+    if latest:
+        name = safe_name(latest.file_name, 'version')
+        yield 'version', f'versions/{document.pk}_v{latest.version_number}_{name}', latest, {
+            'version_number': latest.version_number,
+        }
+
+
+def _open_source(source):
+    """(fichier ouvert en clair, taille) d'un FieldFile ou d'une version (reconstituée si découpée)."""
+    if isinstance(source, FieldFile):
+        path = source.path
+        return encryption.open_plain(path), encryption.plaintext_size(path)
+    return version_store.open_version(source)
+
+
+def _write_file(archive, stream, arcname, source):
+    """Copie un fichier dans l'archive par blocs ; retourne sa taille et son empreinte (None s'il manque)."""
+    try:
+        source, size = _open_source(source)
+    except (FileNotFoundError, ValueError):
+        logger.warning("Fichier manquant, absent de l'export : %s", arcname)
+        return None
+
+    digest = hashlib.sha256()
+    with source, archive.open(arcname, 'w', force_zip64=size * 1.05 > zipfile.ZIP64_LIMIT) as target:
+        for block in iter(lambda: source.read(READ_BLOCK), b''):
+            target.write(block)
+            digest.update(block)
+            data = stream.take(CHUNK_SIZE)
+            if data:
+                yield data
+    return {'size': size, 'sha256': digest.hexdigest()}
+
+
+def _write_text(archive, arcname, text):
+    data = text.encode('utf-8')
+    archive.writestr(arcname, data)
+    return {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+
+def iter_archive(case, documents, include_ocr=False, exported_by=None):
+    """Morceaux successifs de l'archive ZIP du dossier."""
+    root = archive_root(case)
+    stream = _ZipStream()
+    manifest = {
+        'case': {
+            'id': case.pk,
+            'reference': case.reference,
+            'title': case.title,
+            'client': case.client.name,
+        },
+        'exported_at': timezone.now().isoformat(),
+        'exported_by': exported_by.get_username() if exported_by else None,
+        'documents': [],
+    }
+
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as archive:
+        for document in documents:
+            entry = {
+                'id': document.pk,
+                'title': document.title,
+                'document_type': document.document_type,
+                'file_name': document.file_name,
+                'created_at': document.created_at.isoformat(),
+                'files': [],
+                'missing': [],
+            }
+            for kind, path, source, details in document_files(document):
+                written = yield from _write_file(archive, stream, f'{root}/{path}', source)
+                if written is None:
+                    entry['missing'].append({'type': kind, 'path': path, **details})
+                else:
+                    entry['files'].append({'type': kind, 'path': path, **details, **written})
+
+            if include_ocr and document.ocr_text:
+                path = f'ocr/{document.pk}_{safe_name(os.path.splitext(document.file_name)[0], "document")}.txt'
+                written = _write_text(archive, f'{root}/{path}', document.ocr_text)
+                entry['files'].append({'type': 'ocr', 'path': path, **written})
+
+            manifest['documents'].append(entry)
+            data = stream.take(CHUNK_SIZE)
+            if data:
+                yield data
+
+        archive.writestr(f'{root}/manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    # Répertoire central, écrit à la fermeture
+    data = stream.take()
+    if data:
+        yield data
+
+
+def export_response(case, documents, include_ocr=False, exported_by=None):
+    # Réponse sans durée bornée : servie par des workers gthread (gunicorn.conf.py),
+    # dont le `timeout` ne coupe pas un flux en cours, contrairement aux workers synchrones
+    response = StreamingHttpResponse(
+        iter_archive(case, documents, include_ocr, exported_by), content_type='application/zip'
+    )
+    response['Content-Disposition'] = content_disposition_header(True, f'{archive_root(case)}.zip')
+    # Envoyé au fil de l'eau, sans mise en tampon par nginx
+    response['X-Accel-Buffering'] = 'no'
+    return response
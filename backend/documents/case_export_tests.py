@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Document, DocumentPage, DocumentPermission, DocumentVersion
+from documents import case_export
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import zipfile
+
+User = get_user_model()
+
+# Peu compressible : l'archive dépasse plusieurs morceaux
+ACTE = b''.join(hashlib.sha256(bytes([n])).digest() for n in range(256))
+
+
+class CaseExportTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username='admin.export', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client export', created_by=self.admin)
+        self.case = Case.objects.create(
+            client=law_client, reference='EXP-1', title='Export', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        other_case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.admin)
+
+        self.acte = self.new_document(self.case, 'Acte', 'acte.pdf', ACTE, ocr_text='Texte de l\'acte')
+        DocumentPage.objects.create(document=self.acte, file=self.acte.file, page_number=1)
+        DocumentVersion.objects.create(
+            document=self.acte, version_number=1, file=SimpleUploadedFile('v1.pdf', b'ancienne'), file_name='v1.pdf', file_size=8
+        )
+        DocumentVersion.objects.create(
+            document=self.acte, version_number=2, file=SimpleUploadedFile('searchable_acte.pdf', b'recherchable'),
+            file_name='searchable_acte.pdf', file_size=12
+        )
+        self.scan = self.new_document(self.case, 'Scan', 'scan.jpg', b'page un', is_multi_page=True)
+        DocumentPage.objects.create(document=self.scan, file=self.scan.file, page_number=1)
+        DocumentPage.objects.create(document=self.scan, file=SimpleUploadedFile('p2.jpg', b'page deux'), page_number=2)
+        self.new_document(other_case, 'Autre dossier', 'autre.pdf', b'hors dossier')
+
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+        self.url = f'/api/documents/cases/{self.case.pk}/export/'
+
+    def new_document(self, case, title, name, content, **fields):
+        return Document.objects.create(
+            case=case, title=title, file=SimpleUploadedFile(name, content), uploaded_by=self.admin, **fields
+        )
+
+    def export(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        chunks = list(response.streaming_content)
+        return response, chunks, zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+
+    def test_01_archive_content_and_manifest(self):
+        """Fichiers, pages, dernière version et OCR ; manifeste avec empreintes ; flux découpé"""
+        with mock.patch.object(case_export, 'CHUNK_SIZE', 256):
+            response, chunks, archive = self.export(self.url + '?ocr=1')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('EXP-1.zip', response['Content-Disposition'])
+        self.assertGreater(len(chunks), 2)
+
+        acte, scan = self.acte.pk, self.scan.pk
+        self.assertEqual(sorted(archive.namelist()), sorted([
+            f'EXP-1/documents/{acte}_acte.pdf',
+            f'EXP-1/versions/{acte}_v2_searchable_acte.pdf',
+            f'EXP-1/ocr/{acte}_acte.txt',
+            f'EXP-1/documents/{scan}_scan.jpg',
+            f'EXP-1/pages/{scan}/002.jpg',
+            'EXP-1/manifest.json',
+        ]))
+        self.assertEqual(archive.read(f'EXP-1/documents/{acte}_acte.pdf'), ACTE)
+        self.assertEqual(archive.read(f'EXP-1/pages/{scan}/002.jpg'), b'page deux')
+        self.assertEqual(archive.read(f'EXP-1/ocr/{acte}_acte.txt').decode(), 'Texte de l\'acte')
+        self.assertIsNone(archive.testzip())
+
+        manifest = json.loads(archive.read('EXP-1/manifest.json'))
+        self.assertEqual(manifest['case']['reference'], 'EXP-1')
+        self.assertEqual([entry['title'] for entry in manifest['documents']], ['Acte', 'Scan'])
+        files = {item['path']: item for item in manifest['documents'][0]['files']}
+        self.assertEqual(
+            files[f'versions/{acte}_v2_searchable_acte.pdf']['sha256'], hashlib.sha256(b'recherchable').hexdigest()
+        )
+
+    def test_02_only_downloadable_documents(self):
+        """Un collaborateur n'exporte que les documents qu'il peut télécharger"""
+        collab = User.objects.create_user(username='collab.export', password='x', role='COLLABORATEUR')
+        DocumentPermission.objects.create(document=self.scan, user=collab, granted_by=self.admin)
+        self.api.force_authenticate(collab)
+
+        _, _, archive = self.export(self.url)
+        manifest = json.loads(archive.read('EXP-1/manifest.json'))
+        self.assertEqual([entry['title'] for entry in manifest['documents']], ['Scan'])
+        self.assertNotIn(f'EXP-1/documents/{self.acte.pk}_acte.pdf', archive.namelist())
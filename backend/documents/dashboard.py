@@ -0,0 +1,173 @@
+"""
+Statistiques du tableau de bord.
+
+Les statistiques globales sont lues dans la table de cumul (voir rollups.py) ;
+les calculs restants sont regroupés dans une seule requête SQL (une sous-requête
+scalaire par table). Le résultat est mis en cache quelques secondes et invalidé
+par les signaux d'écriture (voir signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Value
+from django.db.models.functions import JSONObject
+from django.utils import timezone
+import json
+import time
+from .models import Case, Document, AuditLog, Tag, Deadline
+from .rollups import get_counters
+
+CACHE_VERSION_KEY = 'dashboard_stats:version'
+
+CATEGORIES = ['CIVIL', 'COMMERCIAL', 'SOCIAL', 'PENAL', 'CORRECTIONNEL', 'TI_FAMILLE']
+CIVIL_CATEGORIES = ['CIVIL', 'COMMERCIAL', 'SOCIAL', 'TI_FAMILLE']
+PENAL_CATEGORIES = ['PENAL', 'CORRECTIONNEL']
+
+
+def table_stats(queryset, **aggregates):
+    """
+    Sous-requête d'agrégats sur une table, renvoyant un seul objet JSON.
+    Sans GROUP BY, elle renvoie toujours exactement une ligne, même sur une table vide.
+    """
+    return (
+        queryset.order_by()
+        .annotate(_one=Value(1))
+        .values('_one')
+        .annotate(stats=JSONObject(**aggregates))
+        .values('stats')
+    )
+
+
+def run_single_query(**subqueries):
+    """
+    Exécute les sous-requêtes dans un unique SELECT et retourne {alias: objet JSON}.
+    """
+    parts, params = [], []
+    for alias, queryset in subqueries.items():
+        sql, sql_params = queryset.query.sql_with_params()
+        parts.append(f"({sql}) AS {connection.ops.quote_name(alias)}")
+        params.extend(sql_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(parts), params)
+        row = cursor.fetchone()
+    # Selon le pilote, le JSON arrive déjà décodé ou sous forme de texte
+    return {
+        alias: json.loads(value) if isinstance(value, str) else (value or {})
+        for alias, value in zip(subqueries, row)
+    }
+
+
+def compute_global_stats():
+    """
+    Statistiques globales du cabinet.
+
+    Les compteurs viennent de la table de cumul (rollups) ; seuls les chiffres
+    dépendant de l'heure courante (échéances dépassées, audit du jour) sont
+    calculés à la volée, dans une seule requête appuyée sur des index.
+    """
+    now = timezone.now()
+    start_of_day = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    counters = get_counters([
+        'clients:active', 'clients:active:PARTICULIER', 'clients:active:ENTREPRISE',
+        'cases:total', *[f'cases:category:{category}' for category in CATEGORIES],
+        'documents:total', 'documents:ocr', 'documents:heavy_size',
+        'audit:total', 'audit:security',
+        'deadlines:total', 'deadlines:open',
+        'audiences:total', 'audiences:open', 'audiences:completed',
+        'decisions:total', 'tags:total',
+    ])
+    live = run_single_query(
+        deadlines=table_stats(
+            Deadline.objects.filter(is_completed=False, due_date__lt=now), overdue=Count('id')
+        ),
+        audit=table_stats(
+            AuditLog.objects.filter(timestamp__gte=start_of_day), today=Count('id')
+        ),
+    )
+
+    categories = {category: counters[f'cases:category:{category}'] for category in CATEGORIES}
+    overdue = live['deadlines']['overdue']
+    return {
+        'clients': counters['clients:active'],
+        'particulier_clients': counters['clients:active:PARTICULIER'],
+        'entreprise_clients': counters['clients:active:ENTREPRISE'],
+        'cases': counters['cases:total'],
+        'categories': categories,
+        'civil_cases': sum(categories[c] for c in CIVIL_CATEGORIES),  # Compatibilité descendante
+        'penal_cases': sum(categories[c] for c in PENAL_CATEGORIES),  # Compatibilité descendante
+        'documents': counters['documents:total'],
+        'ocr_documents': counters['documents:ocr'],
+        'heavy_documents_size': counters['documents:heavy_size'],
+
+        'total_audit_logs': counters['audit:total'],
+        'today_audit_logs': live['audit']['today'],
+        'security_audit_logs': counters['audit:security'],
+
+        'deadlines_stats': {
+            'total': counters['deadlines:total'],
+            'overdue': overdue,
+            'upcoming': counters['deadlines:open'] - overdue,
+        },
+        'audiences_stats': {
+            'total': counters['audiences:total'],
+            'upcoming': counters['audiences:open'],
+            'completed': counters['audiences:completed'],
+        },
+        'total_decisions': counters['decisions:total'],
+
+        'deadlines': counters['deadlines:open'],  # Compatibilité
+        'tags': counters['tags:total'],
+    }
+
+
+def compute_client_stats(client_id):
+    """
+    Statistiques restreintes à un client (une requête SQL).
+    """
+    data = run_single_query(
+        cases=table_stats(Case.objects.filter(client_id=client_id), total=Count('id')),
+        documents=table_stats(Document.objects.filter(case__client_id=client_id), total=Count('id')),
+        deadlines=table_stats(
+            Deadline.objects.filter(case__client_id=client_id, is_completed=False), total=Count('id')
+        ),
+        tags=table_stats(Tag.objects.filter(cases__client_id=client_id), total=Count('id', distinct=True)),
+    )
+    return {
+        'clients': 1,
+        'cases': data['cases']['total'],
+        'documents': data['documents']['total'],
+        'deadlines': data['deadlines']['total'],
+        'tags': data['tags']['total'],
+    }
+
+
+def _cache_key(scope):
+    # La version est incrémentée à chaque invalidation : toutes les clés deviennent caduques
+    version = cache.get_or_set(CACHE_VERSION_KEY, int(time.time()), None)
+    return f"dashboard_stats:{version}:{scope}"
+
+
+def get_dashboard_stats(client_id=None):
+    """
+    Retourne les statistiques (globales ou d'un client) depuis le cache, ou les calcule.
+    """
+    scope = f"client:{client_id}" if client_id else 'global'
+    key = _cache_key(scope)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_client_stats(client_id) if client_id else compute_global_stats()
+        cache.set(key, stats, getattr(settings, 'DASHBOARD_STATS_CACHE_TTL', 30))
+    return stats
+
+
+def invalidate_dashboard_stats():
+    """
+    Invalide toutes les statistiques en cache (appelé après chaque écriture pertinente).
+    """
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        # Clé absente (cache vidé) : repartir d'une version qui ne peut pas être déjà utilisée
+        cache.set(CACHE_VERSION_KEY, int(time.time()), None)
@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from datetime import timedelta
+from documents.dashboard import get_dashboard_stats, compute_global_stats
+from documents.models import Client as LawClient, Case, Document, Deadline, Tag
+
+User = get_user_model()
+
+
+class DashboardStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='admin.stats', password='x', role='ADMIN')
+        self.law_client = LawClient.objects.create(name='Société X', client_type='ENTREPRISE', created_by=self.user)
+        LawClient.objects.create(name='Sans dossier', client_type='PARTICULIER', created_by=self.user)
+        self.case = Case.objects.create(
+            client=self.law_client, title='Affaire X', reference='T-1', category='PENAL',
+            opened_date=timezone.now().date(), created_by=self.user
+        )
+        self.case.tags.add(Tag.objects.create(name='Urgent'))
+        Document.objects.create(
+            title='Pièce', case=self.case, uploaded_by=self.user,
+            file=SimpleUploadedFile('p.pdf', b'x' * (200 * 1024)),
+        )
+        Deadline.objects.create(
+            case=self.case, title='Audience', deadline_type='AUDIENCE',
+            due_date=timezone.now() - timedelta(days=1), created_by=self.user
+        )
+
+    def test_01_read_from_counters(self):
+        """Statistiques globales : compteurs de cumul + une requête pour les chiffres horaires"""
+        with self.assertNumQueries(2):
+            stats = compute_global_stats()
+        self.assertEqual(stats['clients'], 1)
+        self.assertEqual(stats['entreprise_clients'], 1)
+        self.assertEqual(stats['categories']['PENAL'], 1)
+        self.assertEqual(stats['penal_cases'], 1)
+        self.assertEqual(stats['heavy_documents_size'], 200 * 1024)
+        self.assertEqual(stats['deadlines_stats']['overdue'], 1)
+        self.assertEqual(stats['audiences_stats']['upcoming'], 1)
+        self.assertEqual(stats['tags'], 1)
+
+    def test_02_cache_and_invalidation(self):
+        """Le cache est servi sans requête et invalidé par une écriture validée"""
+        self.assertEqual(get_dashboard_stats()['cases'], 1)
+        with self.assertNumQueries(0):
+            get_dashboard_stats()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Case.objects.create(
+                client=self.law_client, title='Affaire Y', reference='T-2', category='CIVIL',
+                opened_date=timezone.now().date(), created_by=self.user
+            )
+        self.assertEqual(get_dashboard_stats()['cases'], 2)
+
+    def test_03_client_scope(self):
+        """Un client ne voit que ses propres compteurs"""
+        stats = get_dashboard_stats(client_id=self.law_client.id)
+        self.assertEqual(stats, {'clients': 1, 'cases': 1, 'documents': 1, 'deadlines': 1, 'tags': 1})
@@ -0,0 +1,95 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Document, DocumentPage, AuditLog
+import shutil
+import tempfile
+
+User = get_user_model()
+
+CONTENT = b'%PDF-1.4\n' + b'0123456789' * 100  # 1009 octets
+
+
+class DocumentDownloadTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media, MEDIA_ACCEL_REDIRECT='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username='admin.download', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client téléchargement', created_by=self.admin)
+        case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.admin)
+        self.document = Document.objects.create(
+            case=case, title='Acte', file=SimpleUploadedFile('acte.pdf', CONTENT), uploaded_by=self.admin
+        )
+        self.url = f'/api/documents/documents/{self.document.pk}/download/'
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def downloads_logged(self):
+        return AuditLog.objects.filter(action='DOWNLOAD', document=self.document).count()
+
+    def test_01_ranges_and_conditional_requests(self):
+        """Plages d'octets, revalidation (304) et If-Range ; un seul accès journalisé"""
+        response = self.api.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="acte.pdf"', response['Content-Disposition'])
+        etag = response['ETag']
+
+        self.assertEqual(self.api.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.api.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+        response = self.api.get(self.url + '?inline=1', HTTP_RANGE='bytes=0-8')
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 0-8/1009'))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4\n')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        response = self.api.get(self.url, HTTP_RANGE='bytes=-4', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, b''.join(response.streaming_content)), (206, b'6789'))
+        self.assertEqual(self.api.get(self.url, HTTP_RANGE='bytes=2000-').status_code, 416)
+
+        # Fichier modifié depuis : le fichier entier est renvoyé
+        response = self.api.get(self.url, HTTP_RANGE='bytes=9-', HTTP_IF_RANGE='"autre"')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.downloads_logged(), 3)  # Complets et plages commençant à 0
+
+    def test_02_transfer_delegated_to_nginx(self):
+        """Avec MEDIA_ACCEL_REDIRECT, Django n'envoie que les en-têtes ; les droits sont vérifiés avant"""
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.api.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.file.name)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+
+            outsider = User.objects.create_user(username='collab.download', password='x', role='COLLABORATEUR')
+            self.api.force_authenticate(outsider)
+            response = self.api.get(self.url)
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn('X-Accel-Redirect', response)
+
+    def test_03_file_urls_go_through_the_api(self):
+        """Les URL de fichiers exposées par l'API passent par les téléchargements contrôlés, jamais par /media/"""
+        page = DocumentPage.objects.create(document=self.document, file=self.document.file, page_number=1)
+        data = self.api.get(f'/api/documents/documents/{self.document.pk}/').data
+        self.assertTrue(data['file_url'].endswith(self.url + '?inline=1'))
+        page_url = data['pages'][0]['file_url']
+        self.assertTrue(page_url.endswith(f'/documents/{self.document.pk}/pages/{page.pk}/download/?inline=1'))
+        self.assertNotIn('/media/', data['file_url'] + page_url)
+
+        response = self.api.get(page_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertIn('inline; filename="acte_p1.pdf"', response['Content-Disposition'])
+
+        outsider = User.objects.create_user(username='collab.page', password='x', role='COLLABORATEUR')
+        self.api.force_authenticate(outsider)
+        self.assertEqual(self.api.get(page_url).status_code, 404)
@@ -1,10 +1,39 @@
 """
 Utilitaires pour le chiffrement des fichiers avec AES-256.
+
+- `FileEncryption` (Fernet) : petits contenus, chiffrés en mémoire (textes) ;
+- format segmenté AES-256-GCM pour les fichiers stockés, lu et écrit en flux :
+
+    en-tête (28 octets) : b'LDENC1' | id de clé (uint16) | taille de segment (uint32) | sel (16 octets)
+    segments            : AES-GCM(segment en clair) + étiquette de 16 octets
+
+  Chaque fichier a sa propre clé, dérivée (HKDF-SHA256) de la clé maîtresse
+  et du sel ; le nonce est le numéro du segment. L'en-tête et un indicateur
+  « dernier segment » sont authentifiés avec chaque segment : un segment
+  altéré ou déplacé, un fichier tronqué sont détectés à la lecture.
+
+  Le segment n commence à une position connue : une plage d'octets se
+  déchiffre sans lire le reste du fichier (requêtes Range), et la mémoire
+  consommée est bornée par un segment, à l'écriture comme à la lecture.
+
+  Les clés maîtresses sont numérotées (ENCRYPTION_KEY = n° 1, ENCRYPTION_KEYS) ;
+  chaque fichier porte dans son en-tête le numéro de la sienne, ce qui permet
+  de changer de clé sans tout rechiffrer d'un coup (key_rotation.py).
 """
+from contextlib import contextmanager
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from django.conf import settings
 import base64
 import hashlib
+import io
+import os
+import shutil
+import struct
+import tempfile
 
 
 class FileEncryption:
@@ -70,3 +99,210 @@ class FileEncryption:
         encrypted = base64.b64decode(encrypted_text.encode('utf-8'))
         decrypted = self.cipher.decrypt(encrypted)
         return decrypted.decode('utf-8')
+
+
+# ---------------------------------------------------------------------------
+# Fichiers chiffrés par segments (AES-256-GCM)
+# ---------------------------------------------------------------------------
+
+MAGIC = b'LDENC1'
+HEADER = struct.Struct('>6sHI16s')
+TAG_SIZE = 16
+KEY_INFO = b'legaldoc-file-encryption-v1'
+# Numéro de clé conventionnel d'un fichier stocké en clair
+PLAINTEXT_KEY_ID = 0
+
+
+class EncryptionError(Exception):
+    """Fichier chiffré illisible : clé inconnue, contenu altéré ou tronqué."""
+
+
+def key_ring():
+    """Clés maîtresses par numéro."""
+    return {1: settings.ENCRYPTION_KEY, **settings.ENCRYPTION_KEYS}
+
+
+def current_key_id():
+    """Numéro de la clé des nouveaux fichiers."""
+    return settings.ENCRYPTION_KEY_ID
+
+
+def master_key(key_id):
+    try:
+        return key_ring()[key_id]
+    except KeyError:
+        raise EncryptionError(f"Clé de chiffrement inconnue : {key_id}")
+
+
+def _file_cipher(key_id, salt):
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=KEY_INFO).derive(master_key(key_id))
+    return AESGCM(key)
+
+
+def _nonce(index):
+    return index.to_bytes(12, 'big')
+
+
+def _aad(header, final):
+    return header + (b'\x01' if final else b'\x00')
+
+
+class EncryptingWriter:
+    """
+    Chiffre au fil de l'eau ce qui est écrit, vers `target` (fichier binaire
+    ouvert en écriture). `close()` écrit le dernier segment.
+    """
+
+    def __init__(self, target, key_id=None, segment_size=None):
+        self.target = target
+        key_id = current_key_id() if key_id is None else key_id
+        self.segment_size = segment_size or settings.FILE_ENCRYPTION_SEGMENT_SIZE
+        salt = os.urandom(16)
+        self.header = HEADER.pack(MAGIC, key_id, self.segment_size, salt)
+        self.cipher = _file_cipher(key_id, salt)
+        self.buffer = bytearray()
+        self.index = 0
+        target.write(self.header)
+
+    def write(self, data):
+        self.buffer += data
+        # Un segment plein reste en attente : on ne sait qu'à la fermeture lequel est le dernier
+        while len(self.buffer) > self.segment_size:
+            self._emit(bytes(self.buffer[:self.segment_size]), final=False)
+            del self.buffer[:self.segment_size]
+        return len(data)
+
+    def close(self):
+        self._emit(bytes(self.buffer), final=True)
+        self.buffer.clear()
+
+    def _emit(self, chunk, final):
+        self.target.write(self.cipher.encrypt(_nonce(self.index), chunk, _aad(self.header, final)))
+        self.index += 1
+
+
+class DecryptingReader(io.RawIOBase):
+    """
+    Vue en clair, positionnable, d'un fichier chiffré (fichier binaire ouvert).
+    Un seul segment déchiffré est gardé en mémoire.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.header = raw.read(HEADER.size)
+        if len(self.header) != HEADER.size:
+            raise EncryptionError("En-tête de fichier chiffré incomplet.")
+        magic, self.key_id, self.segment_size, salt = HEADER.unpack(self.header)
+        if magic != MAGIC or not self.segment_size:
+            raise EncryptionError("Ce fichier n'est pas au format chiffré attendu.")
+        self.cipher = _file_cipher(self.key_id, salt)
+
+        body = raw.seek(0, io.SEEK_END) - HEADER.size
+        stored = self.segment_size + TAG_SIZE
+        self.segments = max(-(-body // stored), 1)
+        self.size = body - self.segments * TAG_SIZE
+        if self.size < 0:
+            raise EncryptionError("Fichier chiffré tronqué.")
+        self.position = 0
+        self._cached_index, self._cached = None, b''
+        if self.size == 0:
+            self._segment(0)  # Vérifie qu'il s'agit bien d'un fichier vide, et non tronqué
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _segment(self, index):
+        if index != self._cached_index:
+            stored = self.segment_size + TAG_SIZE
+            self.raw.seek(HEADER.size + index * stored)
+            data = self.raw.read(stored)
+            try:
+                self._cached = self.cipher.decrypt(
+                    _nonce(index), data, _aad(self.header, index == self.segments - 1)
+                )
+            except InvalidTag:
+                raise EncryptionError(f"Segment {index} altéré ou fichier tronqué.")
+            self._cached_index = index
+        return self._cached
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        index, offset = divmod(self.position, self.segment_size)
+        chunk = self._segment(index)[offset:offset + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Position négative.")
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def is_encrypted(path):
+    with open(path, 'rb') as source:
+        return source.read(len(MAGIC)) == MAGIC
+
+
+def key_id_of(path):
+    """Numéro de la clé d'un fichier, lu dans son en-tête ; PLAINTEXT_KEY_ID s'il est en clair."""
+    with open(path, 'rb') as source:
+        header = source.read(HEADER.size)
+    if not header.startswith(MAGIC) or len(header) != HEADER.size:
+        return PLAINTEXT_KEY_ID
+    return HEADER.unpack(header)[1]
+
+
+def open_plain(path):
+    """Fichier ouvert en lecture binaire, déchiffré à la volée s'il est chiffré."""
+    raw = open(path, 'rb')
+    try:
+        encrypted = raw.read(len(MAGIC)) == MAGIC
+        raw.seek(0)
+        if not encrypted:
+            return raw
+        reader = DecryptingReader(raw)
+    except Exception:
+        raw.close()
+        raise
+    return io.BufferedReader(reader, buffer_size=reader.segment_size)
+
+
+def plaintext_size(path):
+    with open_plain(path) as source:
+        return source.seek(0, io.SEEK_END)
+
+
+@contextmanager
+def plain_path(path):
+    """
+    Chemin d'un fichier en clair, pour les bibliothèques qui lisent un chemin
+    (OCR, rendu PDF) : le fichier lui-même s'il n'est pas chiffré, sinon une
+    copie déchiffrée temporaire (droits 0600), supprimée en sortie.
+    """
+    if not is_encrypted(path):
+        yield path
+        return
+    handle, copy_path = tempfile.mkstemp(suffix=os.path.splitext(path)[1])
+    try:
+        with os.fdopen(handle, 'wb') as copy, open_plain(path) as source:
+            shutil.copyfileobj(source, copy, settings.FILE_ENCRYPTION_SEGMENT_SIZE)
+        yield copy_path
+    finally:
+        os.remove(copy_path)
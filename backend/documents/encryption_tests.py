@@ -0,0 +1,120 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from documents.models import Blob, Client as LawClient, Case, Document
+from documents import encryption
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+User = get_user_model()
+
+# 1000 octets distincts : chaque plage a un contenu vérifiable
+CONTENT = b''.join(hashlib.sha256(bytes([n])).digest() for n in range(32))[:1000]
+
+
+def encrypt(data, segment_size=64):
+    buffer = io.BytesIO()
+    writer = encryption.EncryptingWriter(buffer, segment_size=segment_size)
+    # Écritures de tailles irrégulières, à cheval sur les segments
+    for start in range(0, len(data), 37):
+        writer.write(data[start:start + 37])
+    writer.close()
+    return buffer.getvalue()
+
+
+class SegmentedEncryptionTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, data):
+        path = os.path.join(self.directory, 'acte.pdf')
+        with open(path, 'wb') as target:
+            target.write(data)
+        return path
+
+    def test_01_round_trip_and_random_access(self):
+        """Contenu restitué à l'identique, y compris vide ou multiple exact d'un segment ; lecture à une position"""
+        for data in (b'', CONTENT[:64], CONTENT[:128], CONTENT):
+            path = self.write(encrypt(data))
+            self.assertTrue(encryption.is_encrypted(path))
+            self.assertEqual(encryption.plaintext_size(path), len(data))
+            with encryption.open_plain(path) as source:
+                self.assertEqual(source.read(), data)
+
+        path = self.write(encrypt(CONTENT))
+        self.assertNotIn(CONTENT[100:164], open(path, 'rb').read())
+        with encryption.open_plain(path) as source:
+            source.seek(500)
+            self.assertEqual(source.read(150), CONTENT[500:650])
+        with encryption.plain_path(path) as plain:
+            self.assertEqual(open(plain, 'rb').read(), CONTENT)
+            self.assertTrue(plain.endswith('.pdf'))
+        self.assertFalse(os.path.exists(plain))
+
+    def test_02_tampered_or_truncated_file_rejected(self):
+        """Octet modifié, segment final retiré ou fichier vidé : lecture refusée"""
+        encrypted = encrypt(CONTENT)
+        tampered = bytearray(encrypted)
+        tampered[encryption.HEADER.size + 200] ^= 1
+        segment = 64 + encryption.TAG_SIZE
+        without_last = encrypted[:encryption.HEADER.size + (len(CONTENT) // 64) * segment]
+        for data in (bytes(tampered), without_last, encrypted[:encryption.HEADER.size]):
+            with self.assertRaises(encryption.EncryptionError):
+                with encryption.open_plain(self.write(data)) as source:
+                    source.read()
+
+
+@override_settings(FILE_ENCRYPTION_AT_REST=True, FILE_ENCRYPTION_SEGMENT_SIZE=64, MEDIA_ACCEL_REDIRECT='/protected-media/')
+class EncryptedStorageTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username='admin.chiffrement', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client chiffré', created_by=self.admin)
+        self.case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.admin)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def new_document(self, name):
+        return Document.objects.create(
+            case=self.case, title=name, file=SimpleUploadedFile(name, CONTENT), uploaded_by=self.admin
+        )
+
+    def test_01_stored_encrypted_and_deduplicated(self):
+        """Fichier chiffré sur disque, nommé d'après le contenu en clair ; doublon partagé"""
+        first, second = self.new_document('acte.pdf'), self.new_document('copie.pdf')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertIn(hashlib.sha256(CONTENT).hexdigest(), first.file.name)
+        self.assertEqual(Blob.objects.get(name=first.file.name).refcount, 2)
+
+        raw = open(first.file.path, 'rb').read()
+        self.assertTrue(raw.startswith(encryption.MAGIC))
+        self.assertNotIn(CONTENT[:64], raw)
+        self.assertEqual(first.file.size, len(CONTENT))
+        with first.file.open('rb') as source:
+            self.assertEqual(source.read(), CONTENT)
+
+    def test_02_download_decrypted_by_django(self):
+        """Téléchargement déchiffré (entier ou plage) par Django, pas par nginx"""
+        document = self.new_document('acte.pdf')
+        url = f'/api/documents/documents/{document.pk}/download/'
+
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+
+        response = self.api.get(url, HTTP_RANGE='bytes=100-299')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-299/{len(CONTENT)}')
+        self.assertEqual(b''.join(response.streaming_content), CONTENT[100:300])
@@ -0,0 +1,154 @@
+"""
+Envoi des fichiers des documents après contrôle d'accès.
+
+Django vérifie les droits (get_object du ViewSet) puis :
+- si MEDIA_ACCEL_REDIRECT est défini (production derrière nginx), répond par
+  un en-tête X-Accel-Redirect vers une location `internal` : nginx transfère
+  le fichier lui-même (sendfile, requêtes Range) sans occuper de worker gunicorn ;
+- sinon (développement, tests), répond lui-même, avec prise en charge d'une
+  plage d'octets (Range / If-Range) pour les lecteurs PDF.
+
+Dans les deux cas, les requêtes conditionnelles (If-None-Match,
+If-Modified-Since) sont traitées ici, avant tout accès au contenu. L'ETag suit
+le format de nginx (mtime et taille en hexadécimal) : le navigateur obtient
+le même validateur quel que soit le serveur qui a envoyé le fichier.
+
+Les fichiers chiffrés (encryption.py) sont toujours envoyés par Django, qui
+les déchiffre au fil de l'envoi : une plage ne déchiffre que les segments
+qu'elle recouvre.
+"""
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from urllib.parse import quote
+from . import encryption
+import mimetypes
+import os
+import re
+
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_validators(path):
+    """(etag, last_modified) d'un fichier sur disque, au format de nginx."""
+    stat = os.stat(path)
+    mtime = int(stat.st_mtime)
+    return quote_etag(f'{mtime:x}-{stat.st_size:x}'), mtime, stat.st_size
+
+
+def parse_range(header, size):
+    """
+    Plage « bytes=debut-fin » -> (debut, fin inclusive), None pour servir le
+    fichier entier (absente, multiple ou illisible), ValueError si hors du fichier.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        raise ValueError(header)
+    return first, last
+
+
+def range_applies(request, etag, last_modified):
+    """If-Range : la plage n'est servie que si le fichier n'a pas changé depuis."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def requested_range_start(request):
+    """Début de la plage demandée (0 sans en-tête Range) : sert à ne journaliser qu'une fois un téléchargement."""
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+    if not match or not match.group(1):
+        return 0
+    return int(match.group(1))
+
+
+def _read_range(opener, start, length):
+    with opener() as source:
+        source.seek(start)
+        while length > 0:
+            block = source.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_file(request, field_file, filename, as_attachment=True):
+    """
+    Réponse HTTP pour `field_file` (FieldFile d'un document, d'une page ou
+    d'une version), déjà autorisé par l'appelant. Lève FileNotFoundError si le
+    fichier est absent du disque.
+    """
+    path = field_file.path
+    etag, last_modified, size = file_validators(path)
+    encrypted = encryption.is_encrypted(path)
+    if encrypted:
+        size = encryption.plaintext_size(path)
+    return serve_content(
+        request, lambda: encryption.open_plain(path), size, etag, last_modified, filename, as_attachment,
+        # nginx ne sait pas déchiffrer
+        accel_name=None if encrypted else field_file.name,
+    )
+
+
+def serve_content(request, opener, size, etag, last_modified, filename, as_attachment=True, accel_name=None):
+    """
+    Réponse HTTP pour un contenu de `size` octets : `opener()` l'ouvre en
+    lecture (positionnable). `accel_name` (chemin sous MEDIA_ROOT) permet de
+    déléguer l'envoi à nginx.
+    """
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    def with_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        # Privé : le contenu dépend des droits de l'utilisateur ; revalidé à chaque consultation
+        response['Cache-Control'] = 'private, no-cache'
+        response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return with_headers(not_modified)
+
+    accel_prefix = settings.MEDIA_ACCEL_REDIRECT
+    if accel_prefix and accel_name:
+        # nginx sert le fichier : Range et If-Range sont traités de son côté
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(accel_prefix.rstrip('/') + '/' + accel_name)
+        return with_headers(response)
+
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size) if range_applies(
+            request, etag, last_modified) else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(opener(), content_type=content_type)
+        return with_headers(response)
+
+    start, end = byte_range
+    response = StreamingHttpResponse(_read_range(opener, start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return with_headers(response)
@@ -0,0 +1,176 @@
+"""
+Rechiffrement des fichiers stockés avec la clé courante (ENCRYPTION_KEY_ID).
+
+Après l'ajout d'une clé (ENCRYPTION_KEYS) ou l'activation de
+FILE_ENCRYPTION_AT_REST, les nouveaux fichiers utilisent la clé courante et
+les anciens restent lisibles avec la leur : `rotate` les rechiffre ensuite par
+lots, sans interrompre l'application.
+
+- Reprise : le numéro de clé de chaque blob est tenu dans Blob.key_id (relevé
+  à l'écriture du fichier, mis à jour à chaque rechiffrement) ;
+  une exécution interrompue (ou limitée par `max_seconds`) reprend avec les
+  blobs dont la clé n'est pas encore la clé courante ;
+- débit : `workers` fichiers traités en parallèle au plus, et `bytes_per_second`
+  plafonne la lecture cumulée, pour ne pas saturer les disques ;
+- sûreté : la copie rechiffrée est écrite à part (blobs/tmp), son contenu en
+  clair est comparé à l'empreinte du nom du blob, puis elle remplace l'original
+  par un renommage atomique, sous verrou de la ligne Blob (le ramasse-miettes
+  ignore les lignes verrouillées). Une lecture en cours garde l'ancien fichier.
+
+Les anciennes clés doivent rester déclarées jusqu'à ce que `pending()` soit nul.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.db import transaction
+from django.db.models import Count, Q
+from . import encryption
+from .blobstore import TMP_DIR, blob_storage
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+READ_BLOCK = 1024 * 1024
+
+
+class Throttle:
+    """Plafond de débit partagé entre les threads (octets par seconde, 0 = illimité)."""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.next_slot, now)
+            self.next_slot = start + amount / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def _pending_filter(key_id):
+    return Q(key_id__isnull=True) | ~Q(key_id=key_id)
+
+
+def pending(key_id=None):
+    """Nombre de blobs dont la clé n'est pas (ou pas encore connue pour être) la clé courante."""
+    from .models import Blob
+    key_id = encryption.current_key_id() if key_id is None else key_id
+    return Blob.objects.filter(_pending_filter(key_id)).count()
+
+
+def status():
+    """Nombre de blobs par numéro de clé (0 : en clair, None : pas encore relevé)."""
+    from .models import Blob
+    rows = Blob.objects.order_by('key_id').values_list('key_id').annotate(n=Count('pk'))
+    return dict(rows)
+
+
+def _reencrypt(name, key_id, throttle):
+    """
+    Copie rechiffrée d'un blob dans blobs/tmp.
+    Retourne (chemin de la copie, taille lue) ; (None, 0) si le blob a déjà cette clé.
+    """
+    path = blob_storage.path(name)
+    if encryption.key_id_of(path) == key_id:
+        return None, 0
+
+    tmp_dir = blob_storage.path(TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    digest, size = hashlib.sha256(), 0
+    try:
+        with os.fdopen(handle, 'wb') as target, encryption.open_plain(path) as source:
+            writer = encryption.EncryptingWriter(target, key_id=key_id)
+            for block in iter(lambda: source.read(READ_BLOCK), b''):
+                throttle.consume(len(block))
+                writer.write(block)
+                digest.update(block)
+                size += len(block)
+            writer.close()
+        expected = os.path.basename(name).split('.')[0]
+        if digest.hexdigest() != expected:
+            raise encryption.EncryptionError(f"Empreinte différente du nom du blob : {name}")
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, size
+
+
+def _replace(name, tmp_path, key_id):
+    """Remplace le blob par sa copie rechiffrée, s'il existe encore ; retourne True si remplacé."""
+    from .models import Blob
+    with transaction.atomic():
+        # Verrou court : le ramasse-miettes ne supprime pas le blob pendant le renommage
+        locked = Blob.objects.select_for_update().filter(name=name).exists()
+        path = blob_storage.path(name)
+        if not locked or not os.path.exists(path):
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+        Blob.objects.filter(name=name).update(key_id=key_id)
+    return True
+
+
+def rotate(key_id=None, batch_size=BATCH_SIZE, workers=1, bytes_per_second=0, max_seconds=None, progress=None):
+    """
+    Rechiffre avec la clé `key_id` (par défaut la clé courante) les blobs qui
+    n'en relèvent pas. `progress(stats)` est appelé après chaque lot.
+    Retourne les compteurs : rotated, current, missing, failed, bytes, remaining.
+    """
+    from .models import Blob
+
+    key_id = encryption.current_key_id() if key_id is None else key_id
+    encryption.master_key(key_id)  # Clé déclarée, sinon EncryptionError avant tout traitement
+    throttle = Throttle(bytes_per_second)
+    stats = {'rotated': 0, 'current': 0, 'missing': 0, 'failed': 0, 'bytes': 0,
+             'remaining': pending(key_id)}
+    started = time.monotonic()
+    last_name = ''
+
+    def process(name):
+        try:
+            return name, _reencrypt(name, key_id, throttle), None
+        except FileNotFoundError:
+            return name, None, 'missing'
+        except Exception as e:
+            logger.error("Rechiffrement impossible pour %s : %s", name, e)
+            return name, None, 'failed'
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        while max_seconds is None or time.monotonic() - started < max_seconds:
+            # Parcours par nom : un blob en échec n'est pas repris dans la même exécution
+            names = list(
+                Blob.objects.filter(_pending_filter(key_id), name__gt=last_name)
+                .order_by('name').values_list('name', flat=True)[:batch_size]
+            )
+            if not names:
+                break
+            last_name = names[-1]
+            already_current = []
+            for name, result, error in pool.map(process, names):
+                if error:
+                    stats[error] += 1
+                    continue
+                tmp_path, size = result
+                stats['bytes'] += size
+                if tmp_path is None:
+                    already_current.append(name)
+                    stats['current'] += 1
+                elif _replace(name, tmp_path, key_id):
+                    stats['rotated'] += 1
+                    stats['remaining'] -= 1
+            if already_current:
+                Blob.objects.filter(name__in=already_current).update(key_id=key_id)
+                stats['remaining'] -= len(already_current)
+            if progress:
+                progress(dict(stats, elapsed=time.monotonic() - started))
+    return stats
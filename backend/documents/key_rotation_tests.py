@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+from documents.models import Client as LawClient, Case, Document
+from documents import encryption, key_rotation
+import io
+import os
+import shutil
+import tempfile
+
+User = get_user_model()
+
+NEW_KEYS = {2: b'nouvelle-cle-de-chiffrement-n2!'}
+
+
+@override_settings(FILE_ENCRYPTION_SEGMENT_SIZE=64)
+class KeyRotationTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username='admin.rotation', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client rotation', created_by=self.admin)
+        self.case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.admin)
+
+    def new_document(self, name, content):
+        return Document.objects.create(
+            case=self.case, title=name, file=SimpleUploadedFile(name, content), uploaded_by=self.admin
+        )
+
+    def key_ids(self, documents):
+        return [encryption.key_id_of(document.file.path) for document in documents]
+
+    def test_01_interrupted_rotation_resumes(self):
+        """Fichiers en clair et sous l'ancienne clé rechiffrés par lots ; reprise après interruption"""
+        documents = [self.new_document('clair.pdf', b'stocke en clair ' * 10)]
+        with override_settings(FILE_ENCRYPTION_AT_REST=True):
+            documents.append(self.new_document('cle1.pdf', b'chiffre avec la cle 1 ' * 10))
+        self.assertEqual(self.key_ids(documents), [encryption.PLAINTEXT_KEY_ID, 1])
+
+        with override_settings(FILE_ENCRYPTION_AT_REST=True, ENCRYPTION_KEYS=NEW_KEYS, ENCRYPTION_KEY_ID=2):
+            documents.append(self.new_document('cle2.pdf', b'deja sous la nouvelle cle ' * 10))
+            contents = [document.file.open('rb').read() for document in documents]
+            # Clé relevée à l'écriture : seuls les deux premiers fichiers sont à rechiffrer
+            self.assertEqual(key_rotation.status(), {encryption.PLAINTEXT_KEY_ID: 1, 1: 1, 2: 1})
+            self.assertEqual(key_rotation.pending(), 2)
+
+            def interrupt(stats):
+                raise KeyboardInterrupt
+            with self.assertRaises(KeyboardInterrupt):
+                key_rotation.rotate(batch_size=1, progress=interrupt)
+            self.assertEqual(key_rotation.pending(), 1)
+
+            output = io.StringIO()
+            call_command('rotate_encryption_keys', '--workers', '2', stdout=output)
+            self.assertIn('0 restant(s)', output.getvalue())
+            self.assertEqual(key_rotation.pending(), 0)
+            self.assertEqual(self.key_ids(documents), [2, 2, 2])
+            self.assertEqual([document.file.open('rb').read() for document in documents], contents)
+            self.assertEqual(key_rotation.status(), {2: 3})
+            self.assertEqual(os.listdir(os.path.join(self.media, 'blobs', 'tmp')), [])
+
+        # Ancienne clé retirée : les fichiers rechiffrés restent lisibles
+        with override_settings(ENCRYPTION_KEY=b'autre-cle', ENCRYPTION_KEYS=NEW_KEYS, ENCRYPTION_KEY_ID=2):
+            self.assertEqual(documents[1].file.open('rb').read(), contents[1])
+
+    def test_02_corrupted_or_missing_files_left_untouched(self):
+        """Contenu différent de l'empreinte ou fichier absent : compté, original conservé, repris plus tard"""
+        corrupted = self.new_document('altere.pdf', b'contenu original')
+        missing = self.new_document('absent.pdf', b'fichier supprime')
+        with open(corrupted.file.path, 'wb') as target:
+            target.write(b'contenu altere')
+        os.remove(missing.file.path)
+
+        with override_settings(FILE_ENCRYPTION_AT_REST=True):
+            stats = key_rotation.rotate()
+        self.assertEqual((stats['rotated'], stats['failed'], stats['missing'], stats['remaining']), (0, 1, 1, 2))
+        self.assertEqual(open(corrupted.file.path, 'rb').read(), b'contenu altere')
+        self.assertEqual(key_rotation.status(), {encryption.PLAINTEXT_KEY_ID: 2})
+
+    def test_03_throughput_capped(self):
+        """Débit cumulé plafonné : à 1 Mo/s, les 2e et 3e Mo attendent 1 puis 2 s"""
+        throttle = key_rotation.Throttle(1024 * 1024)
+        with mock.patch.object(key_rotation.time, 'sleep') as sleep:
+            for _ in range(3):
+                throttle.consume(1024 * 1024)
+        self.assertAlmostEqual(sum(call.args[0] for call in sleep.call_args_list), 3, delta=0.1)
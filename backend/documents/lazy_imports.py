@@ -0,0 +1,92 @@
+"""
+Registre des dépendances lourdes chargées à la demande.
+
+Les piles OCR (pytesseract, PyPDF2, python-docx, Pillow), PDF (PyMuPDF),
+IA (google-generativeai) et 2FA (qrcode) ne sont importées qu'au premier usage :
+un worker qui ne sert que du JSON ne paie ni leur temps d'import ni leur mémoire.
+
+Usage :
+    pytesseract = lazy('pytesseract')   # proxy, import au premier attribut lu
+    genai = load('genai')               # import immédiat
+"""
+import importlib
+import sys
+import threading
+
+
+# Alias -> chemin d'import réel
+HEAVY_MODULES = {
+    'pytesseract': 'pytesseract',
+    'PyPDF2': 'PyPDF2',
+    'docx': 'docx',
+    'PIL.Image': 'PIL.Image',
+    'PIL.ImageOps': 'PIL.ImageOps',
+    'fitz': 'fitz',
+    'genai': 'google.generativeai',
+    'qrcode': 'qrcode',
+}
+
+_lock = threading.Lock()
+_proxies = {}
+
+
+class LazyModule:
+    """
+    Proxy de module : l'import réel a lieu au premier accès à un attribut.
+    """
+
+    def __init__(self, alias):
+        self.__dict__['_alias'] = alias
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = load(self.__dict__['_alias'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        state = 'chargé' if self.__dict__['_module'] is not None else 'non chargé'
+        return f"<LazyModule {self.__dict__['_alias']} ({state})>"
+
+
+def load(alias):
+    """
+    Importe (une seule fois) le module enregistré sous `alias` et le retourne.
+    """
+    if alias not in HEAVY_MODULES:
+        raise KeyError(f"Module lourd non enregistré : {alias}")
+    path = HEAVY_MODULES[alias]
+    module = sys.modules.get(path)
+    if module is None:
+        # Verrou : deux threads (OCR en arrière-plan + requête) peuvent importer en même temps
+        with _lock:
+            module = importlib.import_module(path)
+    return module
+
+
+def lazy(alias):
+    """
+    Retourne le proxy partagé du module enregistré sous `alias`.
+    """
+    if alias not in HEAVY_MODULES:
+        raise KeyError(f"Module lourd non enregistré : {alias}")
+    with _lock:
+        proxy = _proxies.get(alias)
+        if proxy is None:
+            proxy = _proxies[alias] = LazyModule(alias)
+    return proxy
+
+
+def is_loaded(alias):
+    """
+    Indique si le module enregistré sous `alias` a déjà été importé dans le processus.
+    """
+    return HEAVY_MODULES[alias] in sys.modules
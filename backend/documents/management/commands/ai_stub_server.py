@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from documents.ai_stub import StubBackend, make_stub_server
+
+
+class Command(BaseCommand):
+    help = "Démarre le serveur IA bouchon (réponses simulées, latence et erreurs 429/503 configurables)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=int, default=settings.AI_STUB_LATENCY_MS)
+        parser.add_argument('--jitter-ms', type=int, default=settings.AI_STUB_JITTER_MS)
+        parser.add_argument('--error-rate-429', type=float, default=settings.AI_STUB_ERROR_RATE_429)
+        parser.add_argument('--error-rate-503', type=float, default=settings.AI_STUB_ERROR_RATE_503)
+        parser.add_argument('--seed', type=int, default=settings.AI_STUB_SEED)
+
+    def handle(self, *args, **options):
+        backend = StubBackend(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate_429=options['error_rate_429'],
+            error_rate_503=options['error_rate_503'],
+            seed=options['seed'],
+        )
+        server = make_stub_server(options['host'], options['port'], backend)
+        self.stdout.write(self.style.SUCCESS(
+            f"Serveur IA bouchon sur http://{options['host']}:{options['port']} "
+            f"(latence {backend.latency_ms}±{backend.jitter_ms} ms, "
+            f"429 {backend.error_rate_429:.0%}, 503 {backend.error_rate_503:.0%})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as TestClient, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from documents.ai_service import reset_ai_service
+from documents.models import Case
+
+User = get_user_model()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la tenue en charge du chat IA : sessions concurrentes chat_init + chat_message. "
+        "À utiliser avec le fournisseur bouchon (AI_PROVIDER=stub ou stub-http)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', type=int, required=True, help="ID du dossier à interroger")
+        parser.add_argument('--user', help="Nom d'utilisateur (défaut : premier administrateur)")
+        parser.add_argument('--sessions', type=int, default=20, help="Nombre de sessions de chat")
+        parser.add_argument('--messages', type=int, default=5, help="Messages par session")
+        parser.add_argument('--concurrency', type=int, default=8, help="Sessions simultanées")
+        parser.add_argument('--stream', action='store_true', help="Utiliser la réponse en flux")
+        parser.add_argument('--url', help="URL d'un serveur lancé (ex. http://127.0.0.1:8000) ; sinon appels en processus")
+        parser.add_argument('--token', help="Jeton JWT à utiliser avec --url")
+        parser.add_argument('--provider', help="Fournisseur IA en mode processus (stub, stub-http, gemini...)")
+
+    def handle(self, *args, **options):
+        if not Case.objects.filter(pk=options['case']).exists():
+            raise CommandError(f"Dossier {options['case']} introuvable.")
+
+        token = options['token'] or self.make_token(options['user'])
+        self.base_path = f"/api/documents/cases/{options['case']}"
+        self.options = options
+        self.token = token
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        self.lock = threading.Lock()
+
+        overrides = {'AI_PROVIDER': options['provider']} if options['provider'] and not options['url'] else {}
+        with override_settings(**overrides):
+            reset_ai_service()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                list(pool.map(self.run_session, range(options['sessions'])))
+            elapsed = time.perf_counter() - started
+            reset_ai_service()
+
+        self.report(elapsed)
+
+    def make_token(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first() or User.objects.filter(role='ADMIN').first()
+        if not user:
+            raise CommandError("Aucun utilisateur trouvé pour générer le jeton.")
+        return str(RefreshToken.for_user(user).access_token)
+
+    def request(self, client, method, path, payload=None):
+        """
+        Exécute une requête et retourne (statut, corps JSON ou texte, durée).
+        """
+        started = time.perf_counter()
+        if client is None:
+            data = json.dumps(payload).encode('utf-8') if payload is not None else None
+            req = urllib.request.Request(
+                self.options['url'].rstrip('/') + path, data=data, method=method,
+                headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'}
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=300) as resp:
+                    status, body = resp.status, resp.read()
+            except urllib.error.HTTPError as e:
+                status, body = e.code, e.read()
+        else:
+            if method == 'GET':
+                resp = client.get(path, secure=True)
+            else:
+                resp = client.post(path, data=payload, content_type='application/json', secure=True)
+            status = resp.status_code
+            body = b''.join(resp.streaming_content) if resp.streaming else resp.content
+        duration = time.perf_counter() - started
+
+        try:
+            body = json.loads(body)
+        except ValueError:
+            body = body.decode('utf-8', errors='ignore')
+        return status, body, duration
+
+    def record(self, label, status, duration):
+        with self.lock:
+            self.statuses[(label, status)] += 1
+            if status < 400:
+                self.latencies[label].append(duration)
+
+    def run_session(self, index):
+        client = None
+        if not self.options['url']:
+            client = TestClient(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        try:
+            status, body, duration = self.request(client, 'GET', f'{self.base_path}/chat_init/')
+            self.record('chat_init', status, duration)
+            if status >= 400:
+                return
+
+            session_id = body['session_id']
+            history = []
+            for turn in range(self.options['messages']):
+                message = f"Session {index}, question {turn} : quels sont les délais applicables ?"
+                status, body, duration = self.request(client, 'POST', f'{self.base_path}/chat_message/', {
+                    'session_id': session_id,
+                    'message': message,
+                    'history': history,
+                    'stream': self.options['stream'],
+                })
+                self.record('chat_message', status, duration)
+                if status >= 400:
+                    continue
+                answer = body if isinstance(body, str) else body.get('response', '')
+                history += [{'role': 'user', 'parts': [message]}, {'role': 'model', 'parts': [answer]}]
+        finally:
+            if client is not None:
+                connection.close()
+
+    def report(self, elapsed):
+        total = sum(self.statuses.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} requêtes en {elapsed:.2f} s ({total / elapsed:.1f} req/s), "
+            f"concurrence {self.options['concurrency']}, fournisseur {self.options['provider'] or settings.AI_PROVIDER}"
+        ))
+        for label in ('chat_init', 'chat_message'):
+            values = self.latencies.get(label, [])
+            self.stdout.write(
+                f"  {label:<13} n={len(values):<5} "
+                f"p50={percentile(values, 50) * 1000:.0f} ms  "
+                f"p95={percentile(values, 95) * 1000:.0f} ms  "
+                f"p99={percentile(values, 99) * 1000:.0f} ms"
+            )
+        for (label, status), count in sorted(self.statuses.items()):
+            self.stdout.write(f"  {label:<13} HTTP {status}: {count}")
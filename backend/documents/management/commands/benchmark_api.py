@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from documents.benchmarking import ROLES, seed_bulk_data, seed_role_users, measure_endpoints
+from documents.rollups import reconcile
+from documents.access import reconcile_access
+
+
+class Command(BaseCommand):
+    help = "Mesure requêtes SQL et latence de chaque route GET de l'API, pour chaque rôle"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Peupler d'abord la base avec N documents (et données associées)")
+        parser.add_argument('--prefix', default='bench', help="Préfixe des données générées")
+        parser.add_argument('--role', action='append', choices=ROLES,
+                            help="Rôle(s) à mesurer (par défaut : tous)")
+        parser.add_argument('--repeat', type=int, default=5, help="Nombre d'appels mesurés par route")
+        parser.add_argument('--max-queries', type=int, default=None,
+                            help="Signaler les routes dépassant ce nombre de requêtes")
+        parser.add_argument('--max-ms', type=float, default=None,
+                            help="Signaler les routes dont la latence médiane dépasse ce plafond (ms)")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Peuplement de la base ({options['seed']} documents)...")
+            counts = seed_bulk_data(scale=options['seed'], prefix=options['prefix'])
+            self.stdout.write(', '.join(f"{model}: {count}" for model, count in counts.items()))
+            # bulk_create ne déclenche pas les signaux : recalcul des compteurs de cumul
+            reconcile()
+
+        users = seed_role_users(prefix=options['prefix'])
+        # Affectations et documents créés en masse : mise à niveau de la table d'accès
+        reconcile_access()
+        max_queries, max_ms = options['max_queries'], options['max_ms']
+        over_budget = 0
+
+        for role in options['role'] or ROLES:
+            self.stdout.write(self.style.SUCCESS(
+                f"\n[{role}] {'route':<30} {'statut':>6} {'requêtes':>9} {'médiane':>10} {'p95':>10}"
+            ))
+            for result in measure_endpoints(users[role], repeat=options['repeat']):
+                line = (
+                    f"{'':<{len(role) + 3}}{result['route']:<30} {result['status']:>6} {result['queries']:>9} "
+                    f"{result['median_ms']:>8.1f}ms {result['p95_ms']:>8.1f}ms"
+                )
+                if (
+                    result['status'] >= 500
+                    or (max_queries is not None and result['queries'] > max_queries)
+                    or (max_ms is not None and result['median_ms'] > max_ms)
+                ):
+                    line = self.style.ERROR(line)
+                    over_budget += 1
+                self.stdout.write(line)
+
+        if over_budget:
+            raise CommandError(f"{over_budget} route(s) hors budget.")
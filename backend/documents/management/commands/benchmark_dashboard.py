@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from documents.benchmarking import seed_bulk_data, measure
+from documents.dashboard import compute_global_stats, compute_client_stats, get_dashboard_stats, invalidate_dashboard_stats
+from documents.models import Client
+from documents.rollups import reconcile
+
+
+class Command(BaseCommand):
+    help = "Mesure le nombre de requêtes et la latence des statistiques du tableau de bord"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Peupler d'abord la base avec N documents (et données associées)")
+        parser.add_argument('--prefix', default='bench', help="Préfixe des données générées")
+        parser.add_argument('--repeat', type=int, default=20, help="Nombre d'appels mesurés par scénario")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.stdout.write(f"Peuplement de la base ({options['seed']} documents)...")
+            counts = seed_bulk_data(scale=options['seed'], prefix=options['prefix'])
+            self.stdout.write(', '.join(f"{model}: {count}" for model, count in counts.items()))
+            # bulk_create ne déclenche pas les signaux : recalcul des compteurs de cumul
+            reconcile()
+
+        client = Client.objects.filter(cases__isnull=False).first()
+
+        def cached_global():
+            return get_dashboard_stats()
+
+        scenarios = [
+            ('global, sans cache', compute_global_stats),
+            ('global, cache chaud', cached_global),
+        ]
+        if client:
+            scenarios.append(('client, sans cache', lambda: compute_client_stats(client.id)))
+
+        invalidate_dashboard_stats()
+        get_dashboard_stats()  # Préchauffe le cache pour le scénario « cache chaud »
+
+        self.stdout.write(self.style.SUCCESS(f"{'Scénario':<22} {'requêtes':>9} {'médiane':>10} {'p95':>10} {'max':>10}"))
+        for label, func in scenarios:
+            result = measure(func, repeat=options['repeat'])
+            self.stdout.write(
+                f"{label:<22} {result['queries']:>9} "
+                f"{result['median_ms']:>8.1f}ms {result['p95_ms']:>8.1f}ms {result['max_ms']:>8.1f}ms"
+            )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from documents import blobstore
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintenance du stockage des fichiers par contenu : suppression des fichiers sans "
+        "référence (par défaut), recalcul des compteurs, conversion des fichiers antérieurs. "
+        "À planifier quotidiennement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--import-legacy', action='store_true', help="Convertir les fichiers stockés avant le stockage par contenu")
+        parser.add_argument('--recount', action='store_true', help="Recalculer les compteurs de références depuis les tables")
+        parser.add_argument('--grace', type=int, default=None, help="Heures sans référence avant suppression (BLOB_GC_GRACE_HOURS)")
+        parser.add_argument('--dry-run', action='store_true', help="Lister sans rien modifier")
+
+    def handle(self, *args, **options):
+        if options['import_legacy']:
+            converted, deleted = blobstore.import_legacy(dry_run=options['dry_run'])
+            self.stdout.write(f"  {converted} fichier(s) converti(s), {deleted} ancien(s) fichier(s) supprimé(s)")
+        if options['recount'] and not options['dry_run']:
+            self.stdout.write(f"  {blobstore.recount()} compteur(s) corrigé(s)")
+
+        removed = blobstore.collect_garbage(grace_hours=options['grace'], dry_run=options['dry_run'])
+        for name in removed:
+            self.stdout.write(f"  {'à supprimer' if options['dry_run'] else 'supprimé'} : {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(removed)} fichier(s) sans référence {'à supprimer' if options['dry_run'] else 'supprimé(s)'}."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from documents.access import reconcile_access
+
+
+class Command(BaseCommand):
+    help = (
+        "Vérifie la table d'accès aux documents (DocumentAccess) contre les affectations, "
+        "partages et uploads. Avec --fix, ajoute les lignes manquantes et supprime les lignes en trop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Corriger les écarts constatés")
+        parser.add_argument('--limit', type=int, default=20, help="Nombre d'écarts détaillés par catégorie")
+
+    def handle(self, *args, **options):
+        result = reconcile_access(dry_run=not options['fix'])
+        if not result['missing'] and not result['extra']:
+            self.stdout.write(self.style.SUCCESS("Table d'accès cohérente, aucun écart."))
+            return
+
+        for label, rows in (('manquant', result['missing']), ('en trop', result['extra'])):
+            for user_id, document_id, source, level in rows[:options['limit']]:
+                self.stdout.write(f"  {label}: utilisateur {user_id} -> document {document_id} ({source} {level})".rstrip())
+            if len(rows) > options['limit']:
+                self.stdout.write(f"  ... {len(rows) - options['limit']} autre(s) {label}")
+
+        total = len(result['missing']) + len(result['extra'])
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"{total} écart(s) corrigé(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{total} écart(s) constaté(s) (relancer avec --fix pour corriger)."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from documents import audit
+
+
+class Command(BaseCommand):
+    help = (
+        "Écrit en base les entrées du journal d'audit en attente. Utile avec AUDIT_BUFFER=redis "
+        "pour vider la file partagée après l'arrêt de tous les workers."
+    )
+
+    def handle(self, *args, **options):
+        written = audit.flush()
+        self.stdout.write(self.style.SUCCESS(f"{written} entrée(s) d'audit écrite(s)."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from documents.dashboard import invalidate_dashboard_stats
+from documents.partitions import archive_partitions, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée les partitions mensuelles à venir du journal d'audit et, avec --archive, exporte "
+        "les mois hors rétention en CSV compressé avant de supprimer leur partition. "
+        "À planifier quotidiennement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None, help="Nombre de mois à créer à l'avance (AUDIT_PARTITIONS_AHEAD)")
+        parser.add_argument('--archive', action='store_true', help="Archiver les partitions hors rétention")
+        parser.add_argument('--retention', type=int, default=None, help="Mois conservés en base (AUDIT_RETENTION_MONTHS)")
+        parser.add_argument('--directory', default=None, help="Répertoire des archives (AUDIT_ARCHIVE_DIR)")
+        parser.add_argument('--dry-run', action='store_true', help="Lister les partitions à archiver sans rien modifier")
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            for name in ensure_partitions(ahead=options['ahead']):
+                self.stdout.write(f"  partition créée : {name}")
+
+        if not options['archive']:
+            self.stdout.write(self.style.SUCCESS("Partitions du journal d'audit à jour."))
+            return
+
+        archived = archive_partitions(
+            retention_months=options['retention'], directory=options['directory'], dry_run=options['dry_run']
+        )
+        for month, path, rows in archived:
+            if options['dry_run']:
+                self.stdout.write(f"  à archiver : {month:%Y-%m}")
+            else:
+                self.stdout.write(f"  {month:%Y-%m} : {rows} ligne(s) -> {path}")
+        if archived and not options['dry_run']:
+            invalidate_dashboard_stats()
+        self.stdout.write(self.style.SUCCESS(f"{len(archived)} partition(s) {'à archiver' if options['dry_run'] else 'archivée(s)'}."))
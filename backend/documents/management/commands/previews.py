@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from documents import previews
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Élague le cache des aperçus sous PREVIEW_CACHE_MAX_MB (aperçus les moins consultés d'abord). "
+        "--generate produit au préalable les aperçus manquants de tous les documents."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', action='store_true', help="Génère les aperçus manquants")
+        parser.add_argument('--max-mb', type=int, default=None, help="Plafond pour cette exécution (Mo)")
+
+    def handle(self, *args, **options):
+        if options['generate']:
+            documents = Document.objects.only('id', 'file').prefetch_related('pages').order_by('id')
+            count = 0
+            for document in documents.iterator(chunk_size=200):
+                previews.generate_for_document(document)
+                count += 1
+            self.stdout.write(f"Aperçus vérifiés pour {count} document(s).")
+
+        max_bytes = options['max_mb'] * 1024 * 1024 if options['max_mb'] is not None else None
+        removed, total = previews.prune(max_bytes)
+        self.stdout.write(self.style.SUCCESS(
+            f"{removed} aperçu(s) supprimé(s) ; cache : {total / (1024 * 1024):.1f} Mo."
+        ))
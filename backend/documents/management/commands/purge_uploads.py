@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from documents import uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les uploads découpés abandonnés (sans nouveau morceau depuis "
+        "UPLOAD_SESSION_TTL_HOURS) et leurs fichiers partiels. Lancé aussi par le planificateur "
+        "(`run_reminders --loop`), au plus une fois par heure."
+    )
+
+    def handle(self, *args, **options):
+        purged = uploads.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"{purged} upload(s) abandonné(s) supprimé(s)."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from documents.dashboard import invalidate_dashboard_stats
+from documents.rollups import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les compteurs statistiques (table de cumul) depuis les tables sources "
+        "et corrige les écarts. À planifier périodiquement (ex. toutes les nuits)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Afficher les écarts sans les corriger")
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options['dry_run'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Compteurs à jour, aucun écart."))
+            return
+
+        for key, (stored, expected) in sorted(drift.items()):
+            self.stdout.write(f"  {key}: {stored} -> {expected}")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} compteur(s) en écart (non corrigés)."))
+        else:
+            invalidate_dashboard_stats()
+            self.stdout.write(self.style.SUCCESS(f"{len(drift)} compteur(s) corrigé(s)."))
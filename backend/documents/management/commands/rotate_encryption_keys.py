@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from documents import encryption, key_rotation
+
+
+class Command(BaseCommand):
+    help = (
+        "Rechiffre par lots, avec la clé ENCRYPTION_KEY_ID, les fichiers stockés en clair ou avec une "
+        "ancienne clé. Reprend où une exécution précédente s'est arrêtée : peut être planifié en heures "
+        "creuses avec --max-minutes. --status affiche l'avancement sans rien modifier."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='store_true', help="Afficher le nombre de fichiers par clé")
+        parser.add_argument('--batch-size', type=int, default=key_rotation.BATCH_SIZE, help="Fichiers par lot")
+        parser.add_argument('--workers', type=int, default=1, help="Fichiers rechiffrés en parallèle")
+        parser.add_argument('--max-mb-per-second', type=float, default=0, help="Débit de lecture maximal (0 = illimité)")
+        parser.add_argument('--max-minutes', type=float, default=None, help="Durée maximale de cette exécution")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            for key_id, count in key_rotation.status().items():
+                label = {None: 'non relevé', encryption.PLAINTEXT_KEY_ID: 'en clair'}.get(key_id, f'clé n° {key_id}')
+                self.stdout.write(f"  {label} : {count} fichier(s)")
+            self.stdout.write(f"{key_rotation.pending()} fichier(s) à rechiffrer (clé courante : n° {encryption.current_key_id()}).")
+            return
+
+        if not settings.FILE_ENCRYPTION_AT_REST:
+            raise CommandError("FILE_ENCRYPTION_AT_REST est désactivé : les nouveaux fichiers ne seraient pas chiffrés.")
+        try:
+            stats = key_rotation.rotate(
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                bytes_per_second=int(options['max_mb_per_second'] * 1024 * 1024),
+                max_seconds=options['max_minutes'] * 60 if options['max_minutes'] is not None else None,
+                progress=self.report,
+            )
+        except encryption.EncryptionError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['rotated']} fichier(s) rechiffré(s), {stats['current']} déjà à jour, "
+            f"{stats['missing']} manquant(s), {stats['failed']} en échec ; {stats['remaining']} restant(s)."
+        ))
+
+    def report(self, stats):
+        done = stats['rotated'] + stats['current']
+        rate = stats['bytes'] / stats['elapsed'] if stats['elapsed'] else 0
+        eta = ''
+        if done and stats['remaining'] > 0:
+            eta = f", fin estimée dans {stats['remaining'] * stats['elapsed'] / done / 60:.0f} min"
+        self.stdout.write(
+            f"  {done} traité(s), {stats['remaining']} restant(s), "
+            f"{stats['bytes'] / (1024 * 1024):.1f} Mo lus ({rate / (1024 * 1024):.1f} Mo/s){eta}"
+        )
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from documents import uploads
+from documents.models import AgendaEvent
+from documents.reminders import dispatch_due_reminders, schedule_agenda_reminders
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Purge des uploads découpés abandonnés (voir purge_uploads) : au plus une fois par heure
+UPLOAD_PURGE_EVERY = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        "Envoie les rappels dus (échéances, audiences). Un passage par défaut ; avec --loop, "
+        "un passage toutes les REMINDER_INTERVAL secondes. Plusieurs instances peuvent tourner "
+        "en parallèle (verrous SKIP LOCKED). Chaque passage purge aussi les uploads découpés "
+        "abandonnés (au plus une fois par heure en boucle)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Tourner en continu")
+        parser.add_argument('--interval', type=int, default=None, help="Secondes entre deux passages (REMINDER_INTERVAL)")
+        parser.add_argument('--plan', action='store_true', help="Planifier d'abord les rappels des audiences à venir (reprise de l'existant)")
+
+    def handle(self, *args, **options):
+        if options['plan']:
+            events = AgendaEvent.objects.filter(statut=AgendaEvent.Statut.PREVU, start_datetime__gt=timezone.now())
+            planned = sum(len(schedule_agenda_reminders(event)) for event in events.iterator(chunk_size=500))
+            self.stdout.write(f"  {planned} rappel(s) d'audience planifié(s)")
+
+        interval = options['interval'] or settings.REMINDER_INTERVAL
+        next_purge = 0
+        while True:
+            try:
+                sent = dispatch_due_reminders()
+                if sent['deadlines'] or sent['agenda'] or not options['loop']:
+                    self.stdout.write(
+                        f"Rappels envoyés : {sent['deadlines']} échéance(s), {sent['agenda']} audience(s)."
+                    )
+                if time.monotonic() >= next_purge:
+                    purged = uploads.purge_expired()
+                    next_purge = time.monotonic() + UPLOAD_PURGE_EVERY
+                    if purged:
+                        self.stdout.write(f"{purged} upload(s) abandonné(s) supprimé(s).")
+            except Exception:
+                if not options['loop']:
+                    raise
+                logger.exception("Échec d'un passage du planificateur de rappels")
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(interval)
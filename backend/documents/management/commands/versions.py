@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from documents import version_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Découpe en fragments partagés les versions de documents au-delà des VERSION_FULL_COPIES plus "
+        "récentes de chaque document. --prune-generated N supprime au préalable les versions générées "
+        "par l'OCR au-delà des N plus récentes. À planifier quotidiennement, avant `blobstore`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-full', type=int, default=None, help="Versions gardées entières par document (VERSION_FULL_COPIES)")
+        parser.add_argument('--prune-generated', type=int, default=None, metavar='N', help="Versions générées conservées par document")
+
+    def handle(self, *args, **options):
+        if options['prune_generated'] is not None:
+            if options['prune_generated'] < 1:
+                raise CommandError("--prune-generated doit conserver au moins une version.")
+            deleted = version_store.prune_generated(options['prune_generated'])
+            self.stdout.write(f"  {deleted} version(s) générée(s) supprimée(s)")
+
+        stats = version_store.pack_versions(keep_full=options['keep_full'])
+        saved = stats['bytes'] - stats['new_bytes']
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['versions']} version(s) découpée(s) en {stats['chunks']} fragment(s), dont "
+            f"{stats['new_chunks']} nouveau(x) ; {saved / (1024 * 1024):.1f} Mo économisé(s) "
+            f"(libérés par `manage.py blobstore`). {stats['failed']} échec(s)."
+        ))
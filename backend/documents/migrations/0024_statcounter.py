@@ -0,0 +1,111 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:12
+
+from collections import Counter
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+# Recopiés de documents/rollups.py, figés : l'historique des migrations ne doit
+# pas dépendre du code vivant. Les compteurs ajoutés ensuite sont recalculés
+# par `reconcile_stats`.
+HEAVY_DOCUMENT_SIZE = 100 * 1024
+SECURITY_ACTIONS = ('DELETE', 'PERMISSION')
+
+
+def expected_counters(apps):
+    Case = apps.get_model('documents', 'Case')
+    Client = apps.get_model('documents', 'Client')
+    Document = apps.get_model('documents', 'Document')
+    Deadline = apps.get_model('documents', 'Deadline')
+    Decision = apps.get_model('documents', 'Decision')
+    Tag = apps.get_model('documents', 'Tag')
+    AgendaEvent = apps.get_model('documents', 'AgendaEvent')
+    AuditLog = apps.get_model('documents', 'AuditLog')
+
+    counters = Counter()
+
+    counters['cases:total'] = Case.objects.count()
+    for field, prefix in (('category', 'cases:category'), ('status', 'cases:status'), ('client_id', 'client')):
+        for row in Case.objects.order_by().values(field).annotate(n=Count('id')):
+            key = f'client:{row[field]}:cases' if field == 'client_id' else f'{prefix}:{row[field]}'
+            counters[key] = row['n']
+
+    active = Client.objects.filter(cases__isnull=False).distinct()
+    counters['clients:active'] = active.count()
+    for row in Client.objects.filter(pk__in=active.values('pk')).order_by().values('client_type').annotate(n=Count('id')):
+        counters[f"clients:active:{row['client_type']}"] = row['n']
+
+    documents = Document.objects.aggregate(
+        total=Count('id'),
+        ocr=Count('id', filter=Q(ocr_processed=True)),
+        heavy_size=Sum('file_size', filter=Q(file_size__gt=HEAVY_DOCUMENT_SIZE)),
+    )
+    counters['documents:total'] = documents['total']
+    counters['documents:ocr'] = documents['ocr']
+    counters['documents:heavy_size'] = documents['heavy_size'] or 0
+
+    deadlines = Deadline.objects.aggregate(
+        total=Count('id'),
+        open=Count('id', filter=Q(is_completed=False)),
+        audiences=Count('id', filter=Q(deadline_type='AUDIENCE')),
+        audiences_open=Count('id', filter=Q(deadline_type='AUDIENCE', is_completed=False)),
+        audiences_completed=Count('id', filter=Q(deadline_type='AUDIENCE', is_completed=True)),
+    )
+    counters['deadlines:total'] = deadlines['total']
+    counters['deadlines:open'] = deadlines['open']
+    counters['audiences:total'] = deadlines['audiences']
+    counters['audiences:open'] = deadlines['audiences_open']
+    counters['audiences:completed'] = deadlines['audiences_completed']
+
+    counters['decisions:total'] = Decision.objects.count()
+    counters['tags:total'] = Tag.objects.count()
+
+    audit = AuditLog.objects.aggregate(
+        total=Count('id'), security=Count('id', filter=Q(action__in=SECURITY_ACTIONS))
+    )
+    counters['audit:total'] = audit['total']
+    counters['audit:security'] = audit['security']
+
+    for row in AgendaEvent.objects.order_by().values('year', 'statut', 'type_chambre').annotate(n=Count('id')):
+        for scope in ('agenda', f"agenda:{row['year']}"):
+            counters[f'{scope}:total'] += row['n']
+            counters[f"{scope}:statut:{row['statut']}"] += row['n']
+            counters[f"{scope}:chambre:{row['type_chambre']}"] += row['n']
+
+    for model, suffix in ((Document, 'documents'), (Case, 'cases')):
+        through = model.tags.through
+        for row in through.objects.order_by().values('tag_id').annotate(n=Count('id')):
+            counters[f"tag:{row['tag_id']}:{suffix}"] = row['n']
+
+    return {key: value for key, value in counters.items() if value}
+
+
+def populate_counters(apps, schema_editor):
+    # Table créée par l'opération précédente, donc vide : simple insertion
+    StatCounter = apps.get_model('documents', 'StatCounter')
+    StatCounter.objects.bulk_create(
+        [StatCounter(key=key, value=value) for key, value in expected_counters(apps).items()], batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0023_alter_case_reference_alter_case_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('key', models.CharField(max_length=120, primary_key=True, serialize=False, verbose_name='Clé')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Valeur')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+            ],
+            options={
+                'verbose_name': 'Compteur statistique',
+                'verbose_name_plural': 'Compteurs statistiques',
+                'ordering': ['key'],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Recopié de documents/access.py, figé : l'historique des migrations ne doit
+# pas dépendre du code vivant. La commande `check_document_access` répare
+# ensuite la table d'après les règles en vigueur.
+ASSIGNED, SHARED, UPLOADER = 'ASSIGNED', 'SHARED', 'UPLOADER'
+
+
+def expected_rows(apps):
+    Case = apps.get_model('documents', 'Case')
+    Document = apps.get_model('documents', 'Document')
+    DocumentPermission = apps.get_model('documents', 'DocumentPermission')
+
+    rows = set()
+    assigned = Case.assigned_to.through.objects.filter(case__documents__isnull=False)
+    for user_id, document_id in assigned.values_list('user_id', 'case__documents__id').iterator(chunk_size=5000):
+        rows.add((user_id, document_id, ASSIGNED, ''))
+    for user_id, document_id, level in DocumentPermission.objects.values_list('user_id', 'document_id', 'permission_level'):
+        rows.add((user_id, document_id, SHARED, level))
+    uploaded = Document.objects.filter(uploaded_by__isnull=False).values_list('uploaded_by_id', 'id')
+    for user_id, document_id in uploaded.iterator(chunk_size=5000):
+        rows.add((user_id, document_id, UPLOADER, ''))
+    return rows
+
+
+def populate_access(apps, schema_editor):
+    # Table créée par l'opération précédente, donc vide : simple insertion
+    DocumentAccess = apps.get_model('documents', 'DocumentAccess')
+    DocumentAccess.objects.bulk_create(
+        [
+            DocumentAccess(user_id=user_id, document_id=document_id, source=source, permission_level=level)
+            for user_id, document_id, source, level in sorted(expected_rows(apps))
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0024_statcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('ASSIGNED', 'Affectation au dossier'), ('SHARED', 'Partage'), ('UPLOADER', "Auteur de l'upload")], max_length=10, verbose_name='Origine')),
+                ('permission_level', models.CharField(blank=True, help_text='Niveau du partage (origine SHARED uniquement)', max_length=10, verbose_name='Niveau de permission')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_entries', to='documents.document', verbose_name='Document')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_access', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Accès document',
+                'verbose_name_plural': 'Accès documents',
+                'unique_together': {('user', 'document', 'source')},
+            },
+        ),
+        migrations.RunPython(populate_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,157 @@
+"""
+Conversion de documents_auditlog en table partitionnée par mois (voir documents/partitions.py).
+
+PostgreSQL impose que la clé de partitionnement figure dans la clé primaire :
+la contrainte devient (id, timestamp), `id` reste unique par construction
+(séquence). Les colonnes, index et clés étrangères gardent les noms générés
+par Django pour que les migrations ultérieures s'appliquent normalement.
+
+Les utilitaires de partitionnement sont recopiés ici, figés : l'historique
+des migrations ne doit pas dépendre du code vivant de documents/partitions.py.
+Les partitions des mois à venir sont ensuite tenues à jour par le récepteur
+post_migrate et la commande `manage_audit_partitions`.
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db import migrations
+
+PARENT = 'documents_auditlog'
+DEFAULT_PARTITION = f'{PARENT}_default'
+OLD = f'{PARENT}_old'
+MONTHS_AHEAD = 2
+
+COLUMNS = 'id, action, details, ip_address, user_agent, "timestamp", user_id, case_id, client_id, document_id'
+
+FIELDS = """
+    action varchar(20) NOT NULL,
+    details text NOT NULL,
+    ip_address inet NULL,
+    user_agent varchar(500) NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    user_id bigint NULL,
+    case_id bigint NULL,
+    client_id bigint NULL,
+    document_id bigint NULL,
+"""
+
+# Index et clés étrangères créés par Django, communs aux deux formes de la table
+INDEXES_AND_KEYS = f"""
+CREATE INDEX documents_a_user_id_481fbb_idx ON {PARENT} (user_id, "timestamp");
+CREATE INDEX documents_a_action_a46f00_idx ON {PARENT} (action);
+CREATE INDEX documents_a_timesta_0c4e02_idx ON {PARENT} ("timestamp");
+CREATE INDEX documents_auditlog_user_id_6c1138ae ON {PARENT} (user_id);
+CREATE INDEX documents_auditlog_case_id_b7d27776 ON {PARENT} (case_id);
+CREATE INDEX documents_auditlog_client_id_9d60fb6c ON {PARENT} (client_id);
+CREATE INDEX documents_auditlog_document_id_54145dfe ON {PARENT} (document_id);
+
+ALTER TABLE {PARENT} ADD CONSTRAINT documents_auditlog_user_id_6c1138ae_fk_users_user_id
+    FOREIGN KEY (user_id) REFERENCES users_user(id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE {PARENT} ADD CONSTRAINT documents_auditlog_case_id_b7d27776_fk_documents_case_id
+    FOREIGN KEY (case_id) REFERENCES documents_case(id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE {PARENT} ADD CONSTRAINT documents_auditlog_client_id_9d60fb6c_fk_documents_client_id
+    FOREIGN KEY (client_id) REFERENCES documents_client(id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE {PARENT} ADD CONSTRAINT documents_auditlog_document_id_54145dfe_fk_documents
+    FOREIGN KEY (document_id) REFERENCES documents_document(id) DEFERRABLE INITIALLY DEFERRED;
+"""
+
+CREATE_PARTITIONED = f"""
+CREATE SEQUENCE {PARENT}_id_seq;
+CREATE TABLE {PARENT} (
+    id bigint NOT NULL DEFAULT nextval('{PARENT}_id_seq'),{FIELDS}
+    CONSTRAINT {PARENT}_pkey PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+ALTER SEQUENCE {PARENT}_id_seq OWNED BY {PARENT}.id;
+{INDEXES_AND_KEYS}
+CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT;
+"""
+
+# Forme d'origine (0026) : clé primaire simple, identifiant IDENTITY
+CREATE_PLAIN = f"""
+CREATE TABLE {PARENT} (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,{FIELDS}
+    CONSTRAINT {PARENT}_pkey PRIMARY KEY (id)
+);
+{INDEXES_AND_KEYS}
+"""
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def create_partition(cursor, month):
+    name = f'{PARENT}_p{month.year:04d}_{month.month:02d}'
+    cursor.execute(
+        f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM (%s) TO (%s)", [month, add_months(month, 1)]
+    )
+
+
+def release_names(cursor):
+    """Renomme la table courante en OLD et libère ses noms (index, contraintes, séquence)."""
+    cursor.execute(f"ALTER TABLE {PARENT} RENAME TO {OLD}")
+    cursor.execute(
+        "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'f')", [OLD]
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'ALTER TABLE {OLD} DROP CONSTRAINT "{name}"')
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", [OLD])
+    for (name,) in cursor.fetchall():
+        cursor.execute(f'DROP INDEX "{name}"')
+
+
+def copy_rows(cursor):
+    cursor.execute(f"INSERT INTO {PARENT} ({COLUMNS}) SELECT {COLUMNS} FROM {OLD}")
+    cursor.execute(f"DROP TABLE {OLD} CASCADE")
+
+
+def partition_auditlog(apps, schema_editor):
+    cursor = schema_editor.connection.cursor()
+
+    release_names(cursor)
+    cursor.execute(f"ALTER TABLE {OLD} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+    cursor.execute(CREATE_PARTITIONED)
+
+    # Partitions de l'historique existant et des prochains mois, créées vides avant la copie
+    cursor.execute(f'SELECT min("timestamp"), max("timestamp"), max(id) FROM {OLD}')
+    oldest, newest, max_id = cursor.fetchone()
+    current = month_start(datetime.now(dt_timezone.utc))
+    month = month_start(oldest) if oldest is not None else current
+    last = max(month_start(newest) if newest is not None else current, add_months(current, MONTHS_AHEAD))
+    while month <= last:
+        create_partition(cursor, month)
+        month = add_months(month, 1)
+
+    copy_rows(cursor)
+    if max_id is not None:
+        cursor.execute(f"SELECT setval('{PARENT}_id_seq', %s)", [max_id])
+
+
+def unpartition_auditlog(apps, schema_editor):
+    """Retour à une table simple : toutes les partitions (et la partition par défaut) y sont recopiées."""
+    cursor = schema_editor.connection.cursor()
+
+    release_names(cursor)
+    cursor.execute(f"ALTER TABLE {OLD} ALTER COLUMN id DROP DEFAULT")
+    cursor.execute(f"ALTER SEQUENCE {PARENT}_id_seq RENAME TO {OLD}_id_seq")
+    cursor.execute(CREATE_PLAIN)
+    copy_rows(cursor)
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{PARENT}', 'id'), coalesce(max(id), 0) + 1, false) FROM {PARENT}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0026_auditlog_timestamp_default'),
+        ('users', '__first__'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_auditlog, unpartition_auditlog),
+    ]
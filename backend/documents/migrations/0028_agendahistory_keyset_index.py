@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0027_partition_auditlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendahistory',
+            index=models.Index(fields=['date_action', 'id'], name='documents_a_date_ac_4edfb6_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0028_agendahistory_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='entity_type',
+            field=models.CharField(choices=[('CASE', 'Dossier'), ('DOCUMENT', 'Document'), ('DEADLINE', 'Échéance'), ('TASK', 'Tâche'), ('AGENDA', 'Agenda'), ('SYSTEM', 'Système')], default='SYSTEM', max_length=20, verbose_name="Type d'entité"),
+        ),
+        migrations.AddIndex(
+            model_name='agendanotification',
+            index=models.Index(condition=models.Q(('statut', 'EN_ATTENTE')), fields=['date_envoi_prevue'], name='agenda_reminder_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deadline',
+            index=models.Index(condition=models.Q(('is_completed', False), ('notification_sent', False)), fields=['due_date'], name='deadline_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:51
+
+from django.db import migrations, models
+import re
+
+# Recopié de documents/references.py, figé : portées « category:<catégorie> »
+# et « parent:<id> ». Les portées de sous-dossiers actuelles (« sub:… »)
+# sont calculées par 0035_reference_counter_sub_scopes.
+FIRST_CASE_NUMBER = 1000
+NUMBER_RE = re.compile(r'\d+')
+
+RESERVE_SQL = (
+    "INSERT INTO documents_referencecounter (scope, value) VALUES (%s, %s) "
+    "ON CONFLICT (scope) DO UPDATE SET value = GREATEST(documents_referencecounter.value, EXCLUDED.value)"
+)
+
+
+def case_number(reference):
+    return max((int(n) for n in NUMBER_RE.findall(str(reference or ''))), default=0)
+
+
+def sub_case_number(reference):
+    if not reference or '.' not in reference:
+        return 0
+    suffix = reference.rsplit('.', 1)[-1]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def seed_counters(apps, schema_editor):
+    Case = apps.get_model('documents', 'Case')
+    highest = {}
+    rows = Case.objects.values_list('category', 'parent_case_id', 'reference').iterator(chunk_size=2000)
+    for category, parent_id, reference in rows:
+        if parent_id:
+            scope, number = f'parent:{parent_id}', sub_case_number(reference)
+        else:
+            scope, number = f'category:{category}', max(case_number(reference), FIRST_CASE_NUMBER)
+        if number > highest.get(scope, 0):
+            highest[scope] = number
+    with schema_editor.connection.cursor() as cursor:
+        for scope, number in highest.items():
+            if number > 0:
+                cursor.execute(RESERVE_SQL, [scope, number])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0029_reminder_scheduler'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceCounter',
+            fields=[
+                ('scope', models.CharField(max_length=60, primary_key=True, serialize=False, verbose_name='Portée')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Dernier numéro')),
+            ],
+            options={
+                'verbose_name': 'Compteur de références',
+                'verbose_name_plural': 'Compteurs de références',
+                'ordering': ['scope'],
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:55
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0030_reference_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255, verbose_name='Titre')),
+                ('description', models.TextField(blank=True, verbose_name='Description')),
+                ('document_type', models.CharField(default='AUTRE', max_length=100, verbose_name='Type de document')),
+                ('is_confidential', models.BooleanField(default=True, verbose_name='Confidentiel')),
+                ('file_name', models.CharField(max_length=255, verbose_name='Nom du fichier')),
+                ('total_size', models.BigIntegerField(verbose_name='Taille totale (octets)')),
+                ('received', models.BigIntegerField(default=0, verbose_name='Octets reçus')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='Empreinte SHA-256 attendue')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Dernier morceau reçu')),
+                ('case', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='documents.case', verbose_name='Dossier')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='Créé par')),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.document', verbose_name='Document créé')),
+            ],
+            options={
+                'verbose_name': 'Upload en cours',
+                'verbose_name_plural': 'Uploads en cours',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['updated_at'], name='documents_u_updated_45f9b7_idx')],
+            },
+        ),
+    ]
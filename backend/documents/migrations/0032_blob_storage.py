@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:00
+
+import documents.blobstore
+import documents.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0031_upload_session'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='file',
+            field=models.FileField(max_length=500, storage=documents.blobstore.ContentAddressedStorage(), upload_to=documents.models.document_upload_path, verbose_name='Fichier'),
+        ),
+        migrations.AlterField(
+            model_name='documentpage',
+            name='file',
+            field=models.FileField(max_length=500, storage=documents.blobstore.ContentAddressedStorage(), upload_to=documents.models.document_page_upload_path, verbose_name='Fichier de la page'),
+        ),
+        migrations.AlterField(
+            model_name='documentversion',
+            name='file',
+            field=models.FileField(max_length=500, storage=documents.blobstore.ContentAddressedStorage(), upload_to='document_versions/', verbose_name='Fichier'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Nom (empreinte)')),
+                ('refcount', models.IntegerField(default=0, verbose_name='Références')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')),
+            ],
+            options={
+                'verbose_name': 'Fichier stocké',
+                'verbose_name_plural': 'Fichiers stockés',
+                'ordering': ['name'],
+                'indexes': [models.Index(condition=models.Q(('refcount__lte', 0)), fields=['updated_at'], name='blob_unreferenced_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0032_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='key_id',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Clé de chiffrement'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:27
+
+import django.db.models.deletion
+import documents.blobstore
+from django.db import migrations, models
+
+
+def mark_generated_versions(apps, schema_editor):
+    # Versions recherchables créées par l'OCR (ocr.process_document_ocr)
+    DocumentVersion = apps.get_model('documents', 'DocumentVersion')
+    DocumentVersion.objects.filter(file_name__startswith='Searchable_Full_').update(is_generated=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0033_blob_key_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='is_generated',
+            field=models.BooleanField(default=False, verbose_name='Générée automatiquement'),
+        ),
+        migrations.CreateModel(
+            name='VersionChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Position')),
+                ('file', models.FileField(max_length=500, storage=documents.blobstore.ContentAddressedStorage(), upload_to='version_chunks/', verbose_name='Fragment')),
+                ('size', models.PositiveIntegerField(verbose_name='Taille')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='documents.documentversion', verbose_name='Version')),
+            ],
+            options={
+                'verbose_name': 'Fragment de version',
+                'verbose_name_plural': 'Fragments de versions',
+                'ordering': ['version', 'position'],
+                'unique_together': {('version', 'position')},
+            },
+        ),
+        migrations.RunPython(mark_generated_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+"""
+Compteurs de sous-dossiers par (référence principale, catégorie) au lieu de
+« parent:<id> » (voir documents/references.py) : les compteurs « sub:… » sont
+calculés depuis les références existantes et les anciens sont supprimés.
+Logique recopiée ici, figée, comme pour toute migration de données.
+"""
+from django.db import migrations, models
+
+RESERVE_SQL = (
+    "INSERT INTO documents_referencecounter (scope, value) VALUES (%s, %s) "
+    "ON CONFLICT (scope) DO UPDATE SET value = GREATEST(documents_referencecounter.value, EXCLUDED.value)"
+)
+
+
+def sub_case_number(reference):
+    if not reference or '.' not in reference:
+        return 0
+    suffix = reference.rsplit('.', 1)[-1]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def reserve_highest(schema_editor, highest):
+    with schema_editor.connection.cursor() as cursor:
+        for scope, number in highest.items():
+            cursor.execute(RESERVE_SQL, [scope, number])
+
+
+def seed_sub_scopes(apps, schema_editor):
+    Case = apps.get_model('documents', 'Case')
+    ReferenceCounter = apps.get_model('documents', 'ReferenceCounter')
+    highest = {}
+    rows = Case.objects.exclude(reference=None).values_list('category', 'reference').iterator(chunk_size=2000)
+    for category, reference in rows:
+        number = sub_case_number(reference)
+        if number:
+            scope = f"sub:{reference.split('.')[0]}:{category}"
+            highest[scope] = max(highest.get(scope, 0), number)
+    ReferenceCounter.objects.filter(scope__startswith='parent:').delete()
+    reserve_highest(schema_editor, highest)
+
+
+def seed_parent_scopes(apps, schema_editor):
+    Case = apps.get_model('documents', 'Case')
+    ReferenceCounter = apps.get_model('documents', 'ReferenceCounter')
+    highest = {}
+    rows = Case.objects.exclude(parent_case_id=None).values_list('parent_case_id', 'reference').iterator(chunk_size=2000)
+    for parent_id, reference in rows:
+        number = sub_case_number(reference)
+        if number:
+            scope = f'parent:{parent_id}'
+            highest[scope] = max(highest.get(scope, 0), number)
+    ReferenceCounter.objects.filter(scope__startswith='sub:').delete()
+    reserve_highest(schema_editor, highest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0034_version_chunks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='referencecounter',
+            name='scope',
+            field=models.CharField(max_length=80, primary_key=True, serialize=False, verbose_name='Portée'),
+        ),
+        migrations.RunPython(seed_sub_scopes, seed_parent_scopes),
+    ]
@@ -1,11 +1,14 @@
 """
 Modèles pour la gestion documentaire: clients, cas, documents, permissions et audit.
 """
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 import os
+import uuid
+from .blobstore import blob_storage
 
 
 class Client(models.Model):
@@ -173,84 +176,33 @@ class Case(models.Model):
     def __str__(self):
         return f"{self.reference} - {self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Numérotation lue en base : une référence, une catégorie ou un parent modifiés font avancer le compteur
+        instance._loaded_numbering = instance._numbering()
+        return instance
+
+    def _numbering(self):
+        return (self.__dict__.get('reference'), self.__dict__.get('category'), self.__dict__.get('parent_case_id'))
+
     def save(self, *args, **kwargs):
         """
-        Surcharge pour générer automatiquement la référence de manière robuste.
-        Format principal : PREFIX1234 (ex: CIV1000)
-        Format sous-dossier : PARENT.X (où X est le prochain numéro libre)
+        Surcharge pour générer automatiquement la référence (voir references.py).
+        Format principal : numéro par catégorie (ex: 1001)
+        Format sous-dossier : PARENT.X (où X est le prochain numéro du dossier principal)
         """
-        if not self.reference:
-            # Préfixes par catégorie
-            prefix_map = {
-                'CIVIL': 'CIV',
-                'COMMERCIAL': 'COM',
-                'SOCIAL': 'SOC',
-                'PENAL': 'PEN',
-                'CORRECTIONNEL': 'COR',
-                'TI_FAMILLE': 'FAM'
-            }
-            prefix = prefix_map.get(self.category, 'CIV')
-
-            if self.parent_case:
-                # Logique Sous-dossier (PARENT.X)
-                base_ref = self.parent_case.reference.split('.')[0]
-                # Rechercher tous les sous-dossiers existants pour trouver le max suffixe
-                sub_cases = Case.objects.filter(parent_case=self.parent_case).values_list('reference', flat=True)
-                
-                max_suffix = 0
-                import re
-                for ref in sub_cases:
-                    if ref and '.' in ref:
-                        try:
-                            suffix = int(ref.split('.')[-1])
-                            if suffix > max_suffix:
-                                max_suffix = suffix
-                        except (ValueError, IndexError):
-                            continue
-                
-                new_ref = f"{base_ref}.{max_suffix + 1}"
-                
-                # Double vérification d'unicité
-                while Case.objects.filter(reference=new_ref).exists():
-                    max_suffix += 1
-                    new_ref = f"{base_ref}.{max_suffix + 1}"
-                
-                self.reference = new_ref
-            else:
-                # Logique Dossier Principal (Numéro simple par catégorie)
-                import re
-                
-                # On recherche les dossiers de la MÊME catégorie
-                category_refs = Case.objects.filter(
-                    category=self.category, 
-                    parent_case__isnull=True
-                ).values_list('reference', flat=True)
-                
-                max_num = 1000 
-                for ref in category_refs:
-                    if not ref: continue
-                    # Extraire le nombre
-                    nums = re.findall(r'\d+', str(ref))
-                    for n in nums:
-                        try:
-                            num = int(n)
-                            if num > max_num:
-                                max_num = num
-                        except ValueError:
-                            continue
-                
-                next_num = max_num + 1
-                new_ref = str(next_num) # Numéro simple sans préfixe
-                
-                # Vérifier l'unicité au sein de la catégorie
-                while Case.objects.filter(category=self.category, reference=new_ref).exists():
-                    next_num += 1
-                    new_ref = str(next_num)
-                
-                self.reference = new_ref
+        from . import references
+
+        generated = not self.reference
+        if generated:
+            self.reference = references.next_reference(self)
+        elif self._numbering() != getattr(self, '_loaded_numbering', None):
+            references.reserve_reference(self)
         
         # Gestion du titre si vide
-        if not self.title:
+        generated_title = not self.title
+        if generated_title:
             self.title = self.reference if self.reference else "Dossier sans intitulé"
         
         # Limiter la longueur du titre
@@ -260,13 +212,36 @@ class Case(models.Model):
         try:
             import logging
             logger = logging.getLogger(__name__)
-            super().save(*args, **kwargs)
+            if generated:
+                self._save_generated_reference(generated_title, *args, **kwargs)
+            else:
+                super().save(*args, **kwargs)
+            self._loaded_numbering = self._numbering()
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f"Erreur sauvegarde dossier {self.reference}: {str(e)}")
             raise e
 
+    def _save_generated_reference(self, generated_title, *args, **kwargs):
+        """
+        Enregistrement avec une référence attribuée automatiquement : si le numéro
+        est déjà pris dans la catégorie (référence que le compteur n'a pas vue),
+        un autre numéro est attribué.
+        """
+        from . import references
+
+        for attempt in range(references.MAX_ALLOCATION_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt + 1 == references.MAX_ALLOCATION_ATTEMPTS or not references.is_taken(self):
+                    raise
+            self.reference = references.next_reference(self)
+            if generated_title:
+                self.title = self.reference
+
 
 def document_upload_path(instance, filename):
     """
@@ -310,6 +285,7 @@ class Document(models.Model):
     )
     file = models.FileField(
         upload_to=document_upload_path,
+        storage=blob_storage,
         max_length=500,
         verbose_name='Fichier'
     )
@@ -362,8 +338,9 @@ class Document(models.Model):
     def save(self, *args, **kwargs):
         """
         Surcharge pour extraire les métadonnées du fichier.
+        Seulement pour un nouveau fichier : une fois stocké, son nom est l'empreinte du contenu.
         """
-        if self.file:
+        if self.file and (not self.file._committed or not self.file_name):
             self.file_name = os.path.basename(self.file.name)
             self.file_size = self.file.size
             self.file_extension = os.path.splitext(self.file.name)[1].lower().replace('.', '')
@@ -389,6 +366,7 @@ class DocumentPage(models.Model):
     )
     file = models.FileField(
         upload_to=document_page_upload_path,
+        storage=blob_storage,
         max_length=500,
         verbose_name='Fichier de la page'
     )
@@ -405,6 +383,55 @@ class DocumentPage(models.Model):
         return f"Page {self.page_number} - {self.document.title}"
 
 
+class UploadSession(models.Model):
+    """
+    Upload découpé en morceaux, reprenable après une coupure (voir documents/uploads.py).
+    Les morceaux sont écrits dans un fichier temporaire ; le document est créé à la fin.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+        verbose_name='Créé par'
+    )
+    case = models.ForeignKey(
+        Case,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions',
+        verbose_name='Dossier'
+    )
+    title = models.CharField(max_length=255, verbose_name='Titre')
+    description = models.TextField(blank=True, verbose_name='Description')
+    document_type = models.CharField(max_length=100, default='AUTRE', verbose_name='Type de document')
+    is_confidential = models.BooleanField(default=True, verbose_name='Confidentiel')
+    file_name = models.CharField(max_length=255, verbose_name='Nom du fichier')
+    total_size = models.BigIntegerField(verbose_name='Taille totale (octets)')
+    received = models.BigIntegerField(default=0, verbose_name='Octets reçus')
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name='Empreinte SHA-256 attendue')
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Document créé'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Date de création')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Dernier morceau reçu')
+
+    class Meta:
+        verbose_name = 'Upload en cours'
+        verbose_name_plural = 'Uploads en cours'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.received}/{self.total_size})"
+
+
 class DocumentPermission(models.Model):
     """
     Permissions granulaires pour l'accès aux documents.
@@ -506,7 +533,7 @@ class AuditLog(models.Model):
     details = models.TextField(blank=True, verbose_name='Détails')
     ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name='Adresse IP')
     user_agent = models.CharField(max_length=500, blank=True, verbose_name='User Agent')
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='Horodatage')
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Horodatage')
     
     class Meta:
         verbose_name = 'Journal d\'Audit'
@@ -611,6 +638,11 @@ class Deadline(models.Model):
             models.Index(fields=['due_date']),
             models.Index(fields=['is_completed']),
             models.Index(fields=['case', 'due_date']),
+            # Planificateur de rappels : échéances encore à rappeler
+            models.Index(
+                fields=['due_date'], name='deadline_reminder_due_idx',
+                condition=models.Q(notification_sent=False, is_completed=False),
+            ),
         ]
     
     def __str__(self):
@@ -643,10 +675,12 @@ class DocumentVersion(models.Model):
         verbose_name='Document'
     )
     version_number = models.IntegerField(verbose_name='Numéro de version')
-    file = models.FileField(upload_to='document_versions/', max_length=500, verbose_name='Fichier')
+    # Vide pour une version découpée en fragments (VersionChunk, voir version_store.py)
+    file = models.FileField(upload_to='document_versions/', storage=blob_storage, max_length=500, verbose_name='Fichier')
     file_name = models.CharField(max_length=255, verbose_name='Nom du fichier')
     file_size = models.BigIntegerField(verbose_name='Taille du fichier')
     comment = models.TextField(blank=True, verbose_name='Commentaire')
+    is_generated = models.BooleanField(default=False, verbose_name='Générée automatiquement')
     uploaded_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -669,6 +703,31 @@ class DocumentVersion(models.Model):
         return f"{self.document.title} - v{self.version_number}"
 
 
+class VersionChunk(models.Model):
+    """
+    Fragment d'une version découpée : la version est la concaténation de ses
+    fragments, par position. Les fragments sont des blobs partagés entre versions.
+    """
+    version = models.ForeignKey(
+        DocumentVersion,
+        on_delete=models.CASCADE,
+        related_name='chunks',
+        verbose_name='Version'
+    )
+    position = models.PositiveIntegerField(verbose_name='Position')
+    file = models.FileField(upload_to='version_chunks/', storage=blob_storage, max_length=500, verbose_name='Fragment')
+    size = models.PositiveIntegerField(verbose_name='Taille')
+
+    class Meta:
+        verbose_name = 'Fragment de version'
+        verbose_name_plural = 'Fragments de versions'
+        ordering = ['version', 'position']
+        unique_together = ['version', 'position']
+
+    def __str__(self):
+        return f"{self.version} #{self.position}"
+
+
 class Notification(models.Model):
     """
     Système de notifications internes pour les utilisateurs.
@@ -684,6 +743,7 @@ class Notification(models.Model):
         DOCUMENT = 'DOCUMENT', 'Document'
         DEADLINE = 'DEADLINE', 'Échéance'
         TASK = 'TASK', 'Tâche'
+        AGENDA = 'AGENDA', 'Agenda'
         SYSTEM = 'SYSTEM', 'Système'
 
     user = models.ForeignKey(
@@ -1166,6 +1226,9 @@ class AgendaHistory(models.Model):
         verbose_name = "Historique d'agenda"
         verbose_name_plural = "Historiques d'agenda"
         ordering = ['-date_action']
+        indexes = [
+            models.Index(fields=['date_action', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.get_type_action_display()} - {self.agenda_entry} - {self.date_action.strftime('%d/%m/%Y %H:%M')}"
@@ -1223,6 +1286,118 @@ class AgendaNotification(models.Model):
         verbose_name_plural = "Notifications d'agenda"
         ordering = ['date_envoi_prevue']
         unique_together = ['agenda_entry', 'utilisateur', 'type_notification']
+        indexes = [
+            # Planificateur de rappels : rappels en attente par date d'envoi
+            models.Index(
+                fields=['date_envoi_prevue'], name='agenda_reminder_due_idx',
+                condition=models.Q(statut='EN_ATTENTE'),
+            ),
+        ]
 
     def __str__(self):
         return f"Rappel {self.get_type_notification_display()} - {self.agenda_entry}"
+
+
+class StatCounter(models.Model):
+    """
+    Compteur agrégé (table de cumul) maintenu au fil des écritures.
+
+    Les clés sont de la forme « cases:category:CIVIL », « tag:12:documents »...
+    Voir documents/rollups.py pour leur liste et leur mise à jour.
+    """
+    key = models.CharField(max_length=120, primary_key=True, verbose_name='Clé')
+    value = models.BigIntegerField(default=0, verbose_name='Valeur')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')
+
+    class Meta:
+        verbose_name = 'Compteur statistique'
+        verbose_name_plural = 'Compteurs statistiques'
+        ordering = ['key']
+
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class ReferenceCounter(models.Model):
+    """
+    Dernier numéro attribué par portée de références de dossiers
+    (« category:CIVIL », « sub:1001:CIVIL »). Voir documents/references.py.
+    """
+    scope = models.CharField(max_length=80, primary_key=True, verbose_name='Portée')
+    value = models.BigIntegerField(default=0, verbose_name='Dernier numéro')
+
+    class Meta:
+        verbose_name = 'Compteur de références'
+        verbose_name_plural = 'Compteurs de références'
+        ordering = ['scope']
+
+    def __str__(self):
+        return f"{self.scope} = {self.value}"
+
+
+class Blob(models.Model):
+    """
+    Fichier stocké par contenu et nombre de lignes qui le référencent.
+    Voir documents/blobstore.py.
+    """
+    name = models.CharField(max_length=255, primary_key=True, verbose_name='Nom (empreinte)')
+    refcount = models.IntegerField(default=0, verbose_name='Références')
+    # Copie du numéro de clé de l'en-tête (0 : en clair ; vide : pas encore relevé),
+    # relevée à l'écriture du fichier (blobstore.py) et tenue par la rotation des clés (key_rotation.py)
+    key_id = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='Clé de chiffrement')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Dernière mise à jour')
+
+    class Meta:
+        verbose_name = 'Fichier stocké'
+        verbose_name_plural = 'Fichiers stockés'
+        ordering = ['name']
+        indexes = [
+            # Candidats du ramasse-miettes
+            models.Index(fields=['updated_at'], condition=models.Q(refcount__lte=0), name='blob_unreferenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class DocumentAccess(models.Model):
+    """
+    Droits de lecture dénormalisés : une ligne par (utilisateur, document, origine).
+
+    Matérialise les trois voies d'accès d'un collaborateur à un document
+    (affectation au dossier, partage, upload) pour que listes et contrôles
+    d'objet se résument à une recherche indexée. Tenue à jour par signaux,
+    voir documents/access.py et la commande `check_document_access`.
+    """
+    class Source(models.TextChoices):
+        ASSIGNED = 'ASSIGNED', 'Affectation au dossier'
+        SHARED = 'SHARED', 'Partage'
+        UPLOADER = 'UPLOADER', 'Auteur de l\'upload'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='document_access',
+        verbose_name='Utilisateur'
+    )
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='access_entries',
+        verbose_name='Document'
+    )
+    source = models.CharField(max_length=10, choices=Source.choices, verbose_name='Origine')
+    permission_level = models.CharField(
+        max_length=10,
+        blank=True,
+        verbose_name='Niveau de permission',
+        help_text='Niveau du partage (origine SHARED uniquement)'
+    )
+
+    class Meta:
+        verbose_name = 'Accès document'
+        verbose_name_plural = 'Accès documents'
+        unique_together = ['user', 'document', 'source']
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.document_id} ({self.source})"
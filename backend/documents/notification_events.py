@@ -0,0 +1,199 @@
+"""
+Notifications poussées en temps réel (Server-Sent Events) et compteur de non-lues.
+
+Au lieu d'interroger la liste des notifications toutes les deux minutes,
+le navigateur ouvre un flux SSE (`/api/events/notifications/`) servi par le
+processus ASGI (`uvicorn legaldoc.asgi:application`) :
+
+- chaque lot de notifications est publié, après validation de la transaction,
+  sur le canal Redis `notifications:user:<id>` de chaque destinataire ; le flux
+  de l'utilisateur relaie ces messages tels quels ;
+- le nombre de non-lues est mis en cache (`notifications:unread:<id>`) :
+  incrémenté à l'envoi, recalculé après une lecture, et republié pour mettre
+  à jour le badge de tous les onglets ouverts.
+
+EventSource ne transmet pas d'en-tête Authorization : le flux est authentifié
+par un jeton signé de courte durée obtenu via `notifications/stream_token/`.
+Sans NOTIFICATIONS_REDIS_URL, rien n'est publié et le flux répond 503 : le
+frontend revient alors à l'interrogation périodique. Il répond aussi 503 s'il
+est atteint par un worker WSGI (gunicorn) : celui-ci mettrait le flux en tampon
+sans rien envoyer et resterait occupé jusqu'à son délai d'expiration.
+"""
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'notifications.stream'
+UNREAD_KEY = 'notifications:unread:{}'
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+def channel_name(user_id):
+    return f'notifications:user:{user_id}'
+
+
+def get_redis():
+    """Client Redis partagé du processus, ou None si la diffusion est désactivée."""
+    global _redis
+    if not settings.NOTIFICATIONS_REDIS_URL:
+        return None
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                import redis
+                _redis = redis.Redis.from_url(settings.NOTIFICATIONS_REDIS_URL)
+    return _redis
+
+
+def publish(user_id, event, data):
+    """Publie un événement sur le canal de l'utilisateur ; une panne Redis n'est que journalisée."""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.publish(channel_name(user_id), json.dumps({'event': event, 'data': data}, default=str))
+    except Exception:
+        logger.warning("Publication de notification impossible (utilisateur %s)", user_id, exc_info=True)
+
+
+# ---------------------------------------------------------------------------
+# Compteur de non-lues
+# ---------------------------------------------------------------------------
+
+def unread_count(user_id):
+    """Nombre de notifications non lues, servi par le cache."""
+    key = UNREAD_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        from .models import Notification
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.set(key, count, settings.NOTIFICATIONS_UNREAD_CACHE_TTL)
+    return count
+
+
+def _increment_unread(user_id, delta):
+    try:
+        cache.incr(UNREAD_KEY.format(user_id), delta)
+    except ValueError:  # Clé absente : sera recalculée à la prochaine lecture
+        pass
+
+
+def _serialize(notification):
+    return {
+        'id': notification.pk,
+        'user': notification.user_id,
+        'level': notification.level,
+        'title': notification.title,
+        'message': notification.message,
+        'is_read': notification.is_read,
+        'entity_type': notification.entity_type,
+        'entity_id': notification.entity_id,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+def notifications_sent(notifications):
+    """
+    À appeler après l'insertion d'un lot : compteurs et diffusion sont différés
+    à la validation de la transaction (rien n'est annoncé en cas de rollback).
+    """
+    if not notifications:
+        return
+    payloads = [(notification.user_id, _serialize(notification)) for notification in notifications]
+
+    def deliver():
+        per_user = {}
+        for user_id, payload in payloads:
+            per_user.setdefault(user_id, []).append(payload)
+        for user_id, items in per_user.items():
+            _increment_unread(user_id, len(items))
+            for payload in items:
+                publish(user_id, 'notification', payload)
+
+    transaction.on_commit(deliver)
+
+
+def read_state_changed(user_id):
+    """Après une lecture / suppression : recalcule le compteur et le diffuse aux onglets ouverts."""
+    def deliver():
+        cache.delete(UNREAD_KEY.format(user_id))
+        if get_redis() is not None:
+            publish(user_id, 'unread', {'count': unread_count(user_id)})
+
+    transaction.on_commit(deliver)
+
+
+# ---------------------------------------------------------------------------
+# Jeton et flux SSE
+# ---------------------------------------------------------------------------
+
+def make_stream_token(user):
+    return signing.dumps({'user': user.pk}, salt=TOKEN_SALT)
+
+
+def read_stream_token(token):
+    """Identifiant de l'utilisateur porté par le jeton, ou None (invalide ou expiré)."""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.NOTIFICATIONS_STREAM_TOKEN_TTL)['user']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+async def _event_stream(user_id):
+    from redis import asyncio as aioredis
+
+    client = aioredis.Redis.from_url(settings.NOTIFICATIONS_REDIS_URL)
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel_name(user_id))
+    try:
+        # Abonné avant la lecture du compteur : aucune notification ne passe entre les deux
+        yield _sse('unread', {'count': await sync_to_async(unread_count)(user_id)})
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=settings.NOTIFICATIONS_HEARTBEAT
+            )
+            if message is None:
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield ': ping\n\n'
+                continue
+            payload = json.loads(message['data'])
+            yield _sse(payload['event'], payload['data'])
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def notification_stream(request):
+    """
+    GET /api/events/notifications/?token=<jeton> : flux SSE des notifications
+    de l'utilisateur. Vue asynchrone, à servir par le processus ASGI.
+    """
+    user_id = read_stream_token(request.GET.get('token', ''))
+    if user_id is None:
+        return JsonResponse({'detail': 'Jeton de flux invalide ou expiré.'}, status=403)
+    if not settings.NOTIFICATIONS_REDIS_URL:
+        return JsonResponse({'detail': 'Notifications temps réel désactivées.'}, status=503)
+    if not isinstance(request, ASGIRequest):
+        # Flux sans fin : un worker WSGI le mettrait en tampon et resterait bloqué
+        return JsonResponse({'detail': 'Flux disponible uniquement via le serveur ASGI.'}, status=503)
+
+    response = StreamingHttpResponse(_event_stream(user_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,207 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import time, timedelta
+import json
+from unittest import mock
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Deadline, Notification, AgendaEvent, AgendaNotification
+from documents.reminders import dispatch_agenda_reminders, dispatch_deadline_reminders
+from documents import notification_events
+from documents.utils import notify_users, send_notification
+from documents.views import DocumentViewSet
+
+User = get_user_model()
+
+
+class NotificationFanOutTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin.notif', password='x', role='ADMIN')
+        self.team = [
+            User.objects.create_user(username=f'collab.notif{n}', password='x', role='COLLABORATEUR') for n in range(8)
+        ]
+        self.law_client = LawClient.objects.create(name='Client notif', created_by=self.admin)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def upload(self, case, title):
+        # L'OCR tourne dans un thread à part : hors mesure
+        with mock.patch.object(DocumentViewSet, '_launch_ocr_background'), CaptureQueriesContext(connection) as ctx:
+            response = self.client_api.post('/api/documents/documents/', {
+                'title': title, 'case': case.id, 'file': SimpleUploadedFile(f'{title}.pdf', b'%PDF-1.4'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(ctx.captured_queries)
+
+    def test_01_constant_queries_per_recipient_count(self):
+        """Un dépôt client coûte le même nombre de requêtes pour 2 ou 8 avocats assignés"""
+        client_user = User.objects.create_user(username='client.notif', password='x', role='CLIENT')
+        self.law_client.user = client_user
+        self.law_client.save()
+        cases = [
+            Case.objects.create(
+                client=self.law_client, title=reference, reference=reference,
+                opened_date=timezone.now().date(), created_by=self.admin
+            )
+            for reference in ('NOT-1', 'NOT-2')
+        ]
+        cases[0].assigned_to.set(self.team[:2])
+        cases[1].assigned_to.set(self.team)
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(client_user)
+
+        self.upload(cases[0], 'Chauffe')  # Cache des rôles, compteurs de cumul
+        self.assertEqual(self.upload(cases[0], 'Pièce 1'), self.upload(cases[1], 'Pièce 2'))
+        self.assertEqual(Notification.objects.filter(entity_type='DOCUMENT').count(), 2 + 2 + 8)
+
+        with self.assertNumQueries(2):
+            notify_users(User.objects.filter(role='COLLABORATEUR'), 'Info', 'Message', exclude=self.team[0])
+        self.assertEqual(Notification.objects.filter(title='Info').count(), 7)
+
+    def test_02_deadline_reminders_scheduled(self):
+        """La liste des échéances est une lecture pure ; le planificateur envoie chaque rappel une fois"""
+        case = Case.objects.create(
+            client=self.law_client, title='Dossier', reference='NOT-3', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        for n, user in enumerate(self.team):
+            Deadline.objects.create(
+                case=case, title=f'Échéance {n}', deadline_type='AUDIENCE',
+                due_date=timezone.now() + timedelta(days=1), created_by=user
+            )
+        with CaptureQueriesContext(connection) as ctx:
+            self.api.get('/api/documents/deadlines/')
+        self.assertFalse([q for q in ctx.captured_queries if not q['sql'].startswith('SELECT')])
+        self.assertFalse(Notification.objects.exists())
+
+        with self.assertNumQueries(5):  # SAVEPOINT, lecture verrouillée, insertion, marquage, RELEASE
+            self.assertEqual(dispatch_deadline_reminders(), 8)
+        self.assertEqual(dispatch_deadline_reminders(), 0)
+        self.assertEqual(Notification.objects.filter(entity_type='DEADLINE').count(), 8)
+        self.assertFalse(Deadline.objects.filter(notification_sent=False).exists())
+
+    def test_03_agenda_reminders(self):
+        """Rappels d'audience planifiés à l'enregistrement, replanifiés si la date change, envoyés une fois"""
+        case = Case.objects.create(
+            client=self.law_client, title='Dossier', reference='NOT-4', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        case.assigned_to.set(self.team[:2])
+        start = timezone.localtime() + timedelta(days=10)
+        event = AgendaEvent.objects.create(
+            title='Audience', date_audience=start.date(), heure_audience=time(9, 0),
+            type_chambre='TI_DAKAR', case=case, created_by=self.admin
+        )
+        self.assertEqual(AgendaNotification.objects.filter(agenda_entry=event).count(), 3 * 4)
+
+        # Planificateur arrêté jusqu'à 2 jours avant : seul le rappel le plus proche part
+        event.refresh_from_db()
+        two_days_before = event.start_datetime - timedelta(days=2)
+        self.assertEqual(dispatch_agenda_reminders(now=two_days_before), 3)
+        self.assertEqual(dispatch_agenda_reminders(now=two_days_before), 0)
+        self.assertEqual(
+            set(Notification.objects.filter(entity_type='AGENDA').values_list('user_id', flat=True)),
+            {self.admin.id, self.team[0].id, self.team[1].id},
+        )
+        self.assertEqual(AgendaNotification.objects.filter(statut='ECHOUEE').count(), 3)
+
+        # Affectations modifiées : les rappels en attente suivent l'équipe du dossier
+        def pending_recipients():
+            return set(AgendaNotification.objects.filter(agenda_entry=event, statut='EN_ATTENTE')
+                       .values_list('utilisateur_id', flat=True))
+        case.assigned_to.remove(self.team[1])
+        self.team[2].assigned_cases.add(case)
+        self.assertEqual(pending_recipients(), {self.admin.id, self.team[0].id, self.team[2].id})
+        case.assigned_to.clear()
+        self.assertEqual(pending_recipients(), {self.admin.id})
+        case.assigned_to.set(self.team[:2])
+        self.assertEqual(pending_recipients(), {self.admin.id, self.team[0].id, self.team[1].id})
+
+        # Nouvelle date : tous les rappels sont replanifiés ; annulation : plus aucun en attente
+        event.date_audience = start.date() + timedelta(days=20)
+        event.save()
+        self.assertEqual(AgendaNotification.objects.filter(agenda_entry=event, statut='EN_ATTENTE').count(), 12)
+        event.statut = 'ANNULE'
+        event.save()
+        self.assertFalse(AgendaNotification.objects.filter(agenda_entry=event, statut='EN_ATTENTE').exists())
+
+
+class NotificationPushTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='push.notif', password='x', role='COLLABORATEUR')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def unread(self):
+        return self.api.get('/api/documents/notifications/unread_count/').data['count']
+
+    def test_01_unread_count_cached(self):
+        """Le compteur est servi par le cache, tenu à jour à l'envoi et recalculé après lecture"""
+        with self.captureOnCommitCallbacks(execute=True):
+            first = send_notification(self.user, 'Un', 'Message')
+        self.assertEqual(self.unread(), 1)
+        with self.assertNumQueries(0):
+            notification_events.unread_count(self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            send_notification(self.user, 'Deux', 'Message')
+        with self.assertNumQueries(0):
+            self.assertEqual(notification_events.unread_count(self.user.pk), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post(f'/api/documents/notifications/{first.id}/mark_as_read/')
+        self.assertEqual(self.unread(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api.post('/api/documents/notifications/mark_all_as_read/')
+        self.assertEqual(self.unread(), 0)
+
+    @override_settings(NOTIFICATIONS_REDIS_URL='redis://redis.test:6379/1')
+    def test_02_published_after_commit(self):
+        """Les notifications et le nouveau compteur sont publiés sur le canal du destinataire, après validation"""
+        redis = mock.Mock()
+        with mock.patch.object(notification_events, 'get_redis', return_value=redis):
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = send_notification(self.user, 'Audience', 'Demain 9h')
+                redis.publish.assert_not_called()
+            channel, payload = redis.publish.call_args.args
+            self.assertEqual(channel, f'notifications:user:{self.user.pk}')
+            self.assertEqual(
+                json.loads(payload),
+                {'event': 'notification', 'data': mock.ANY},
+            )
+            self.assertEqual(json.loads(payload)['data']['id'], notification.id)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.api.post('/api/documents/notifications/mark_all_as_read/')
+            self.assertEqual(json.loads(redis.publish.call_args.args[1]), {'event': 'unread', 'data': {'count': 0}})
+
+    def test_03_stream_token(self):
+        """Le flux SSE exige un jeton signé valide ; sans Redis il renvoie 503 (repli sur l'interrogation)"""
+        token = self.api.get('/api/documents/notifications/stream_token/').data['token']
+        self.assertEqual(notification_events.read_stream_token(token), self.user.pk)
+        self.assertIsNone(notification_events.read_stream_token(token + 'x'))
+
+        self.assertEqual(self.client.get('/api/events/notifications/', {'token': 'faux'}).status_code, 403)
+        with override_settings(NOTIFICATIONS_REDIS_URL=''):
+            self.assertEqual(self.client.get('/api/events/notifications/', {'token': token}).status_code, 503)
+        # Requête WSGI (gunicorn) : refusée plutôt que d'occuper un worker sans fin
+        with override_settings(NOTIFICATIONS_REDIS_URL='redis://localhost:6379/9'):
+            response = self.client.get('/api/events/notifications/', {'token': token})
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+
+    @override_settings(NOTIFICATIONS_REDIS_URL='redis://localhost:6379/9')
+    async def test_04_stream_served_by_asgi(self):
+        """Servi par le processus ASGI, le flux est bien envoyé au fil de l'eau"""
+        async def one_event(user_id):
+            yield notification_events._sse('unread', {'count': 0})
+
+        with mock.patch.object(notification_events, 'read_stream_token', return_value=1), \
+                mock.patch.object(notification_events, '_event_stream', one_event):
+            response = await AsyncClient().get('/api/events/notifications/', {'token': 'jeton'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
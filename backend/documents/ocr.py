@@ -1,17 +1,21 @@
 """
 Utilitaires pour l'extraction de texte par OCR (Optical Character Recognition).
 """
-import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image, ImageOps
-import PyPDF2
 import os
 import tempfile
-import docx
 import io
 from django.conf import settings
+from . import encryption
+from .lazy_imports import lazy
 import logging
 
+# Piles OCR chargées au premier usage (voir lazy_imports)
+pytesseract = lazy('pytesseract')
+Image = lazy('PIL.Image')
+ImageOps = lazy('PIL.ImageOps')
+PyPDF2 = lazy('PyPDF2')
+docx = lazy('docx')
+
 logger = logging.getLogger(__name__)
 
 
@@ -339,8 +343,9 @@ def process_document_ocr(document):
         for page in pages:
             if not page.ocr_text:
                 try:
-                    file_path = page.file.path
-                    text, searchable_pdf_path, error = processor.extract_text_from_file(file_path)
+                    # Fichier chiffré : OCR sur une copie déchiffrée temporaire
+                    with encryption.plain_path(page.file.path) as file_path:
+                        text, searchable_pdf_path, error = processor.extract_text_from_file(file_path)
                     
                     page.ocr_text = text
                     page.save(update_fields=['ocr_text'])
@@ -390,8 +395,12 @@ def process_document_ocr(document):
                             file_name=f"Searchable_Full_{new_filename}",
                             file_size=os.path.getsize(searchable_pdf_path),
                             comment="Version complète avec OCR (PDF Recherchable)",
-                            uploaded_by=document.uploaded_by
+                            uploaded_by=document.uploaded_by,
+                            is_generated=True
                         )
+                    if settings.VERSION_KEEP_GENERATED:
+                        from .version_store import prune_generated
+                        prune_generated(settings.VERSION_KEEP_GENERATED, document=document)
                     
                     logger.info(f"Version recherchable complète créée pour document {document.id}")
                     try:
@@ -0,0 +1,121 @@
+"""
+Classes de pagination spécifiques.
+
+La pagination par défaut (PageNumberPagination, voir REST_FRAMEWORK) lit
+OFFSET + COUNT(*) : chaque page coûte plus cher que la précédente. Pour les
+tables qui ne font que croître, la pagination par curseur (keyset) repart de
+la dernière ligne vue : coût constant quelle que soit la profondeur.
+
+Une vue active ces classes en déclarant `pagination_class` et l'ordre du
+curseur `cursor_ordering` (champ indexé, puis `id` pour départager).
+"""
+from django.conf import settings
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+import json
+
+
+def estimated_count(queryset, threshold=None):
+    """
+    Nombre de lignes du queryset : exact jusqu'à `threshold` (comptage borné
+    par LIMIT), estimé par le planificateur au-delà.
+    Retourne (nombre, estimé ?).
+    """
+    threshold = settings.PAGINATION_EXACT_COUNT_LIMIT if threshold is None else threshold
+    queryset = queryset.order_by()
+    bounded = queryset[:threshold + 1].count()
+    if bounded <= threshold:
+        return bounded, False
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return max(int(plan[0]['Plan']['Plan Rows']), bounded), True
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    @cached_property
+    def _counted(self):
+        return estimated_count(self.object_list)
+
+    @property
+    def count(self):
+        return self._counted[0]
+
+    @property
+    def count_is_estimate(self):
+        return self._counted[1]
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """Pagination par numéro de page dont le total est estimé sur les grandes tables."""
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.page.paginator.count_is_estimate:
+            response.data['count_estimated'] = True
+        return response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Pagination par curseur sur `view.cursor_ordering` (à défaut `self.ordering`) ;
+    l'ordre demandé par ?ordering est ignoré.
+    """
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(getattr(view, 'cursor_ordering', None) or self.ordering)
+
+
+class AgendaHistoryPagination(KeysetPagination):
+    """Journal de l'agenda (action `historique`), du plus récent au plus ancien."""
+    ordering = ('-date_action', '-id')
+
+
+class OptInCursorPagination:
+    """
+    Pagination par numéro de page (total estimé) par défaut, par curseur
+    quand le client le demande : `?pagination=cursor` pour la première page,
+    puis les liens `next`/`previous` (paramètre `cursor`).
+    Les écrans existants, qui lisent `count` et `?page=`, sont inchangés.
+    """
+
+    def __init__(self):
+        self.delegate = None
+
+    @staticmethod
+    def wants_cursor(request):
+        params = request.query_params
+        return 'cursor' in params or params.get('pagination') == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.delegate = KeysetPagination() if self.wants_cursor(request) else EstimatedCountPagination()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return EstimatedCountPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return EstimatedCountPagination().get_schema_operation_parameters(view)
+
+    def get_results(self, data):
+        return data['results']
+
+    def to_html(self):
+        return self.delegate.to_html()
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.delegate, 'display_page_controls', False)
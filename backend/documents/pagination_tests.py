@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import time
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Document, Notification, AgendaEvent, AgendaHistory
+
+User = get_user_model()
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin.pages', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client pages', created_by=self.admin)
+        case = Case.objects.create(
+            client=law_client, title='Dossier', reference='PAG-1', opened_date=timezone.now().date(), created_by=self.admin
+        )
+        for n in range(5):
+            Document.objects.create(
+                title=f'Pièce {n}', case=case, uploaded_by=self.admin, file=SimpleUploadedFile(f'p{n}.pdf', b'%PDF-1.4'),
+            )
+            Notification.objects.create(user=self.admin, title=f'Notification {n}', message='-')
+        event = AgendaEvent.objects.create(
+            title='Audience', date_audience=timezone.now().date(), heure_audience=time(9, 0),
+            type_chambre='TI_DAKAR', created_by=self.admin, dossier_numero='RG-1'
+        )
+        for type_action in ('CREATION', 'MODIFICATION', 'REPORT'):
+            AgendaHistory.objects.create(agenda_entry=event, type_action=type_action, utilisateur=self.admin)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def walk(self, url):
+        """Parcourt toutes les pages par les liens `next` ; aucune requête OFFSET ni COUNT."""
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.api.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+            self.assertNotIn('OFFSET', sql)
+            self.assertNotIn('COUNT(', sql)
+            self.assertNotIn('count', response.data)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_01_opt_in_cursor(self):
+        """?pagination=cursor : parcours complet par curseur, dans l'ordre du curseur"""
+        self.assertEqual(
+            self.walk('/api/documents/documents/?pagination=cursor&page_size=2'),
+            list(Document.objects.order_by('-created_at', '-id').values_list('id', flat=True)),
+        )
+        self.assertEqual(
+            self.walk('/api/documents/notifications/?pagination=cursor&page_size=2'),
+            list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True)),
+        )
+        self.assertEqual(
+            self.walk('/api/documents/agenda/historique/?page_size=2'),
+            list(AgendaHistory.objects.order_by('-date_action', '-id').values_list('id', flat=True)),
+        )
+
+    def test_02_page_numbers_with_estimated_count(self):
+        """Sans opt-in, pagination par page inchangée ; total estimé au-delà du seuil"""
+        response = self.api.get('/api/documents/documents/')
+        self.assertEqual(response.data['count'], 5)
+        self.assertNotIn('count_estimated', response.data)
+
+        with override_settings(PAGINATION_EXACT_COUNT_LIMIT=3):
+            response = self.api.get('/api/documents/documents/')
+        self.assertTrue(response.data['count_estimated'])
+        self.assertGreaterEqual(response.data['count'], 4)
+        self.assertEqual(len(response.data['results']), 5)
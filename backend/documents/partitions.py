@@ -0,0 +1,183 @@
+"""
+Partitionnement mensuel du journal d'audit (PostgreSQL).
+
+`documents_auditlog` est une table partitionnée par plage sur `timestamp` :
+une partition par mois (`documents_auditlog_pAAAA_MM`, bornes en UTC) et une
+partition par défaut qui reçoit les lignes hors de toute plage, pour
+qu'aucune écriture d'audit n'échoue faute de partition.
+
+- `ensure_partitions` crée le mois courant et les `AUDIT_PARTITIONS_AHEAD`
+  mois suivants (appelé après chaque `migrate` et par la commande
+  `manage_audit_partitions`), en y déplaçant les lignes déjà tombées dans la
+  partition par défaut ;
+- `archive_partitions` exporte les mois plus anciens que
+  `AUDIT_RETENTION_MONTHS` dans des fichiers CSV compressés, puis détache et
+  supprime la partition : la purge ne coûte ni DELETE ni VACUUM.
+
+Les filtres sur `timestamp` (bornes constantes ou paramètres) permettent au
+planificateur d'écarter les partitions hors plage.
+"""
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+from django.conf import settings
+from django.db import connection, transaction
+from . import rollups
+import gzip
+import os
+import re
+
+PARENT = 'documents_auditlog'
+DEFAULT_PARTITION = f'{PARENT}_default'
+PARTITION_RE = re.compile(rf'^{PARENT}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    """Premier instant (UTC) du mois de `value` (date ou datetime)."""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{PARENT}_p{month.year:04d}_{month.month:02d}'
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [PARENT]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Mois (datetime UTC) des partitions mensuelles existantes, triés."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            """,
+            [PARENT],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    months = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            months.append(datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc))
+    return sorted(months)
+
+
+def create_partition(month):
+    """
+    Crée la partition du mois, sauf si elle existe. Les lignes de ce mois déjà
+    présentes dans la partition par défaut y sont déplacées avant l'attachement
+    (sinon PostgreSQL refuse d'attacher une plage couverte par la partition par défaut).
+    Retourne True si la partition a été créée.
+    """
+    month = month_start(month)
+    name = partition_name(month)
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        bounds = [month, add_months(month, 1)]
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(PARENT)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {qn(DEFAULT_PARTITION)} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+            )
+            INSERT INTO {qn(name)} SELECT * FROM moved
+            """,
+            bounds,
+        )
+        cursor.execute(f"ALTER TABLE {qn(PARENT)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)", bounds)
+    return True
+
+
+def ensure_partitions(ahead=None, now=None):
+    """Crée les partitions du mois courant et des mois à venir ; retourne les noms créés."""
+    ahead = settings.AUDIT_PARTITIONS_AHEAD if ahead is None else ahead
+    current = month_start(now or datetime.now(dt_timezone.utc))
+    created = []
+    for offset in range(ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def ensure_partitions_after_migrate(sender, using='default', **kwargs):
+    """Récepteur post_migrate : chaque déploiement crée les partitions des mois à venir."""
+    if using == connection.alias and is_partitioned():
+        ensure_partitions()
+
+
+def _copy_to(cursor, sql, stream):
+    raw = cursor.cursor
+    if hasattr(raw, 'copy_expert'):  # psycopg2
+        raw.copy_expert(sql, stream)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            for data in copy:
+                stream.write(data)
+
+
+def archive_partition(month, directory):
+    """
+    Exporte la partition du mois en CSV compressé (gzip) puis la supprime.
+    Le fichier est écrit et synchronisé sur disque avant toute suppression.
+    Retourne (chemin de l'archive, nombre de lignes archivées).
+    """
+    name = partition_name(month)
+    qn = connection.ops.quote_name
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{name}.csv.gz'
+    partial = path.with_suffix('.gz.partial')
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Verrou : aucune écriture dans ce mois pendant l'export
+        cursor.execute(f"LOCK TABLE {qn(name)} IN SHARE MODE")
+        cursor.execute(f"SELECT action, count(*) FROM {qn(name)} GROUP BY action")
+        per_action = dict(cursor.fetchall())
+        with gzip.open(partial, 'wb') as stream:
+            _copy_to(cursor, f'COPY (SELECT * FROM {qn(name)} ORDER BY "timestamp", id) TO STDOUT WITH (FORMAT csv, HEADER)', stream)
+        with open(partial, 'rb') as stream:
+            os.fsync(stream.fileno())
+        os.replace(partial, path)
+
+        cursor.execute(f"ALTER TABLE {qn(PARENT)} DETACH PARTITION {qn(name)}")
+        cursor.execute(f"DROP TABLE {qn(name)}")
+
+        # Les compteurs de cumul reflètent la table vivante
+        rollups.apply_deltas(rollups.audit_deltas(per_action, sign=-1))
+    return path, sum(per_action.values())
+
+
+def archive_partitions(retention_months=None, directory=None, now=None, dry_run=False):
+    """
+    Archive les partitions entièrement antérieures à la fenêtre de rétention.
+    Retourne [(mois, chemin, lignes)] ; en `dry_run`, chemin et lignes valent None.
+    """
+    retention_months = settings.AUDIT_RETENTION_MONTHS if retention_months is None else retention_months
+    directory = directory or settings.AUDIT_ARCHIVE_DIR
+    cutoff = add_months(month_start(now or datetime.now(dt_timezone.utc)), -retention_months)
+    archived = []
+    for month in list_partitions():
+        if month >= cutoff:
+            break
+        if dry_run:
+            archived.append((month, None, None))
+        else:
+            archived.append((month, *archive_partition(month, directory)))
+    return archived
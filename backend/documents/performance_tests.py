@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from datetime import time, timedelta
+from rest_framework.test import APIClient
+from documents.models import (
+    Client as LawClient, Case, Document, DocumentPermission, DocumentVersion, AuditLog, Tag, Deadline,
+    Notification, Diligence, Task, Decision, AgendaEvent
+)
+
+User = get_user_model()
+
+# Nombre maximal de requêtes par page de liste, indépendant du nombre de lignes
+LIST_QUERY_BUDGETS = {
+    '/api/documents/clients/': 2,
+    '/api/documents/cases/': 4,
+    '/api/documents/documents/': 3,
+    '/api/documents/permissions/': 2,
+    '/api/documents/audit/': 1,
+    '/api/documents/tags/': 2,
+    '/api/documents/deadlines/': 3,
+    '/api/documents/versions/': 2,
+    '/api/documents/notifications/': 2,
+    '/api/documents/diligences/': 2,
+    '/api/documents/tasks/': 2,
+    '/api/documents/decisions/': 2,
+    '/api/documents/agenda/': 2,
+}
+
+
+class ListQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin.perf', password='x', role='ADMIN')
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+        self.rows = 0
+
+    def populate(self, count):
+        """
+        Ajoute `count` lignes par ressource, chacune avec ses propres objets liés
+        pour qu'un accès paresseux par ligne se traduise par une requête de plus.
+        """
+        for _ in range(count):
+            self.rows += 1
+            n = self.rows
+            user = User.objects.create_user(username=f'perf{n}', password='x', role='COLLABORATEUR')
+            law_client = LawClient.objects.create(name=f'Client {n}', created_by=user)
+            case = Case.objects.create(
+                client=law_client, title=f'Dossier {n}', reference=f'P-{n}',
+                opened_date=timezone.now().date(), created_by=user
+            )
+            case.assigned_to.add(user)
+            Case.objects.create(
+                client=law_client, title=f'Sous-dossier {n}', reference=f'P-{n}-1', parent_case=case,
+                opened_date=timezone.now().date(), created_by=user
+            )
+            tag = Tag.objects.create(name=f'Tag {n}')
+            case.tags.add(tag)
+            document = Document.objects.create(
+                title=f'Pièce {n}', case=case, uploaded_by=user,
+                file=SimpleUploadedFile(f'piece{n}.pdf', b'%PDF-1.4 perf'),
+            )
+            document.tags.add(tag)
+            DocumentPermission.objects.create(document=document, user=user, granted_by=self.admin)
+            DocumentVersion.objects.create(
+                document=document, version_number=1, file_name=f'v{n}.pdf', file_size=4, uploaded_by=user,
+                file=SimpleUploadedFile(f'v{n}.pdf', b'perf'),
+            )
+            AuditLog.objects.create(user=user, action='VIEW', document=document, case=case, client=law_client)
+            decision = Decision.objects.create(case=case, decision_type='APPEL', created_by=user)
+            Deadline.objects.create(
+                case=case, title=f'Audience {n}', deadline_type='AUDIENCE', decision=decision,
+                # Hors de la fenêtre de rappel : la liste ne doit rien écrire
+                due_date=timezone.now() + timedelta(days=30 + n), created_by=user, completed_by=user
+            )
+            Notification.objects.create(user=self.admin, title=f'Notification {n}', message='...')
+            Diligence.objects.create(title=f'Diligence {n}', case=case, created_by=self.admin)
+            Task.objects.create(title=f'Tâche {n}', assigned_to=user, assigned_by=self.admin, case=case)
+            first = AgendaEvent.objects.create(
+                title=f'Audience {n}', date_audience=timezone.now().date(), heure_audience=time(9, 0),
+                type_chambre='TI_DAKAR', case=case, created_by=user, dossier_numero=f'RG-{n}'
+            )
+            AgendaEvent.objects.create(
+                title=f'Renvoi {n}', date_audience=timezone.now().date() + timedelta(days=7),
+                heure_audience=time(9, 0), type_chambre='TI_DAKAR', case=case, created_by=user,
+                reporte_de=first, dossier_numero=f'RG-{n}'
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertGreater(len(response.data['results']), 0, url)
+        return len(context.captured_queries)
+
+    def test_01_list_endpoints_within_budget(self):
+        """Chaque liste tient son budget de requêtes, quel que soit le nombre de lignes"""
+        self.populate(2)
+        small = {url: self.count_queries(url) for url in LIST_QUERY_BUDGETS}
+        self.populate(8)
+        for url, budget in LIST_QUERY_BUDGETS.items():
+            with self.subTest(url=url):
+                queries = self.count_queries(url)
+                self.assertLessEqual(queries, budget)
+                self.assertEqual(queries, small[url], "le nombre de requêtes croît avec le nombre de lignes")
+
+    def test_02_case_detail_sub_cases(self):
+        """La fiche dossier charge sous-dossiers et décisions sans requête par ligne"""
+        self.populate(1)
+        case = Case.objects.get(reference='P-1')
+        for i in range(5):
+            Case.objects.create(
+                client=case.client, title=f'Annexe {i}', reference=f'P-1-A{i}', parent_case=case,
+                opened_date=timezone.now().date(), created_by=self.admin
+            )
+            Decision.objects.create(case=case, decision_type='APPEL', created_by=self.admin)
+        with CaptureQueriesContext(connection) as context:
+            response = self.api.get(f'/api/documents/cases/{case.id}/')
+        self.assertEqual(len(response.data['sub_cases']), 6)
+        self.assertEqual(response.data['sub_cases'][0]['total_documents'], 0)
+        self.assertEqual(len(response.data['decisions']), 6)
+        self.assertLessEqual(len(context.captured_queries), 7)
@@ -2,6 +2,7 @@
 Permissions personnalisées pour l'API de gestion documentaire.
 """
 from rest_framework import permissions
+from .access import access_entries
 
 
 class IsAdminOrReadOnly(permissions.BasePermission):
@@ -24,7 +25,8 @@ class CanDeleteDocuments(permissions.BasePermission):
     """
     
     def has_permission(self, request, view):
-        if request.method == 'DELETE':
+        # L'abandon d'un upload découpé ne supprime aucun document
+        if request.method == 'DELETE' and getattr(view, 'action', None) != 'upload_chunk':
             return request.user and request.user.is_authenticated and request.user.can_delete_documents
         return True
 
@@ -49,7 +51,7 @@ class HasDocumentPermission(permissions.BasePermission):
             return False
 
         # L'uploader a tous les droits sur son propre document
-        if document.uploaded_by == request.user:
+        if document.uploaded_by_id == request.user.id:
             return True
         
         # Un client peut voir les documents de ses propres dossiers
@@ -57,22 +59,18 @@ class HasDocumentPermission(permissions.BasePermission):
             if document.case.client == request.user.client_profile:
                 return True
 
-        # Vérifier les permissions spécifiques (partage)
-        from .models import DocumentPermission
-        try:
-            perm = DocumentPermission.objects.get(document=document, user=request.user)
-            
-            if request.method in permissions.SAFE_METHODS:
-                return perm.permission_level in ['READ', 'WRITE', 'DELETE', 'ADMIN']
-            elif request.method in ['PUT', 'PATCH']:
-                return perm.permission_level in ['WRITE', 'DELETE', 'ADMIN']
-            elif request.method == 'DELETE':
-                return perm.permission_level in ['DELETE', 'ADMIN']
-            
-        except DocumentPermission.DoesNotExist:
+        # Partage et affectation au dossier : une seule lecture de la table d'accès
+        entries = access_entries(request.user, document)
+        level = entries.get('SHARED')
+        if level is None:
             # Si aucune permission spécifique, vérifier si l'utilisateur est assigné au dossier
-            if document.case.assigned_to.filter(id=request.user.id).exists():
-                return True
-            return False
+            return 'ASSIGNED' in entries
+
+        if request.method in permissions.SAFE_METHODS:
+            return level in ['READ', 'WRITE', 'DELETE', 'ADMIN']
+        elif request.method in ['PUT', 'PATCH']:
+            return level in ['WRITE', 'DELETE', 'ADMIN']
+        elif request.method == 'DELETE':
+            return level in ['DELETE', 'ADMIN']
         
         return False
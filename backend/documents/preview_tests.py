@@ -0,0 +1,131 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Document, DocumentPage
+from documents import encryption, previews
+from PIL import Image
+import fitz
+import io
+import os
+import shutil
+import tempfile
+
+User = get_user_model()
+
+
+def photo(width=2400, height=1200):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'navy').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def pdf(pages):
+    document = fitz.open()
+    for number in range(pages):
+        document.new_page().insert_text((72, 72), f'Page {number + 1}')
+    return document.tobytes()
+
+
+class PreviewTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.delete(previews.CACHE_KEY)
+
+        self.admin = User.objects.create_user(username='admin.preview', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client aperçu', created_by=self.admin)
+        self.case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.admin)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def new_document(self, name, content):
+        document = Document.objects.create(
+            case=self.case, title=name, file=SimpleUploadedFile(name, content), uploaded_by=self.admin
+        )
+        DocumentPage.objects.create(document=document, file=document.file, page_number=1)
+        return document
+
+    def image_size(self, name):
+        with Image.open(os.path.join(self.media, name)) as image:
+            return image.format, image.size
+
+    def test_01_generated_on_upload_and_on_demand(self):
+        """Miniatures à l'upload, servies par l'API après contrôle d'accès ; autres pages d'un PDF générées à la demande"""
+        scan = self.new_document('photo.jpg', photo())
+        acte = self.new_document('acte.pdf', pdf(2))
+        previews.generate_for_document(scan)
+        previews.generate_for_document(acte)
+
+        thumb = previews.preview_name(scan.file.name, 'thumb')
+        self.assertEqual(self.image_size(thumb), ('WEBP', (256, 128)))
+        self.assertEqual(self.image_size(previews.preview_name(acte.file.name, 'page'))[1][1], 1280)
+
+        data = self.api.get(f'/api/documents/documents/{scan.pk}/').data
+        version = os.path.basename(scan.file.name)[:16]
+        self.assertTrue(data['thumbnail_url'].endswith(f'/documents/{scan.pk}/preview/thumb/?v={version}'))
+        page = scan.pages.get()
+        self.assertIn(f'/documents/{scan.pk}/pages/{page.pk}/preview/page/', data['pages'][0]['preview_url'])
+        response = self.api.get(data['pages'][0]['preview_url'])
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+        url = f'/api/documents/documents/{acte.pk}/preview/thumb/'
+        page_two = previews.preview_name(acte.file.name, 'thumb', page=2)
+        self.assertFalse(os.path.exists(os.path.join(self.media, page_two)))
+        # Jamais de rendu pour une requête anonyme ou sans accès au document
+        self.assertEqual(self.client.get(url + '?page=2').status_code, 401)
+        outsider = APIClient()
+        outsider.force_authenticate(User.objects.create_user(username='collab.preview', password='x', role='COLLABORATEUR'))
+        self.assertEqual(outsider.get(url + '?page=2').status_code, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.media, page_two)))
+
+        response = self.api.get(url + '?page=2')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertTrue(os.path.exists(os.path.join(self.media, page_two)))
+        self.assertEqual(self.api.get(url + '?page=3').status_code, 404)
+
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.api.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + previews.preview_name(acte.file.name, 'thumb'))
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+    def test_02_cache_capped_least_recently_used_first(self):
+        """Au-delà du plafond, les aperçus consultés le moins récemment sont supprimés"""
+        names = []
+        for number, (width, height) in enumerate([(800, 600), (900, 600), (1000, 600)]):
+            document = self.new_document(f'scan{number}.jpg', photo(width, height))
+            name = previews.ensure(document.file.name, 'page')
+            os.utime(os.path.join(self.media, name), (1000 + number, 1000 + number))
+            names.append(name)
+
+        sizes = [os.path.getsize(os.path.join(self.media, name)) for name in names]
+        removed, total = previews.prune(max_bytes=int((sizes[1] + sizes[2]) / previews.LOW_WATERMARK) + 1)
+        self.assertEqual(removed, 1)
+        self.assertEqual(
+            [os.path.exists(os.path.join(self.media, name)) for name in names], [False, True, True]
+        )
+        self.assertEqual(cache.get(previews.CACHE_KEY), total)
+
+    def test_03_encrypted_at_rest(self):
+        """Avec le chiffrement au repos, l'aperçu stocké est chiffré et servi déchiffré par Django"""
+        document = self.new_document('scan.jpg', photo())
+        name = previews.ensure(document.file.name, 'page')
+        path = os.path.join(self.media, name)
+        self.assertFalse(encryption.is_encrypted(path))
+
+        url = f'/api/documents/documents/{document.pk}/preview/page/'
+        with override_settings(FILE_ENCRYPTION_AT_REST=True, MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            # Aperçu resté en clair : régénéré chiffré
+            self.assertEqual(previews.ensure(document.file.name, 'page'), name)
+            self.assertTrue(encryption.is_encrypted(path))
+            response = self.api.get(url)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/webp'))
+        self.assertNotIn('X-Accel-Redirect', response)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (1280, 640)))
@@ -0,0 +1,257 @@
+"""
+Miniatures et aperçus de pages (WebP), générés à l'upload et à la demande.
+
+Les fichiers étant stockés par contenu (blobstore.py), l'aperçu est nommé
+d'après le fichier source :
+
+    MEDIA_ROOT/previews/<taille>/ab/<sha256><ext>.p<page>.webp
+
+Un contenu partagé par plusieurs documents n'a donc qu'un aperçu.
+
+- à l'upload, le thread d'arrière-plan (OCR) génère miniature et aperçu de
+  chaque page (`generate_for_document`) ;
+- les aperçus sont servis par l'API (actions `preview` du DocumentViewSet),
+  comme les fichiers : droits vérifiés par Django, puis envoi délégué à nginx
+  (X-Accel-Redirect vers la location `internal`) ou fait par Django. Un aperçu
+  manquant (pas encore généré, ou supprimé par le plafond) n'est généré qu'à
+  ce moment, pour un utilisateur authentifié qui a accès au document ;
+- l'URL porte l'empreinte du fichier source (`?v=`) : elle change avec le
+  contenu, et le navigateur garde l'aperçu en cache privé un an ;
+- le cache est plafonné à PREVIEW_CACHE_MAX_MB : un compteur approximatif
+  déclenche `prune`, qui supprime les aperçus consultés le moins récemment
+  (date d'accès du système de fichiers, mise à jour par relatime au plus une
+  fois par jour, sinon date de création).
+
+Avec FILE_ENCRYPTION_AT_REST, les aperçus sont chiffrés comme les fichiers
+(encryption.py) et déchiffrés par Django à l'envoi, sans nginx ; un aperçu
+resté en clair ou chiffré avec une clé retirée est régénéré. Un fichier
+chiffré est déchiffré dans une copie temporaire le temps du rendu.
+
+Les fichiers antérieurs au stockage par contenu n'ont pas d'aperçu (voir
+`manage.py blobstore --import-legacy`) : l'interface affiche alors le fichier.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import reverse
+from urllib.parse import quote
+from . import encryption
+from .blobstore import blob_storage, is_blob
+from .lazy_imports import lazy
+import io
+import logging
+import os
+import tempfile
+import time
+
+# Chargés au premier aperçu (voir lazy_imports)
+Image = lazy('PIL.Image')
+ImageOps = lazy('PIL.ImageOps')
+fitz = lazy('fitz')
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = 'previews'
+# Plus grand côté, en pixels
+SIZES = {'thumb': 256, 'page': 1280}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+PREVIEWABLE = IMAGE_EXTENSIONS | {'.pdf'}
+MAX_PAGE = 9999
+CACHE_KEY = 'previews:bytes'
+# Après élagage, le cache redescend à 90 % du plafond : pas d'élagage à chaque nouvel aperçu
+LOW_WATERMARK = 0.9
+STALE_TMP_SECONDS = 3600
+
+
+def preview_name(source, size, page=1):
+    """Chemin relatif (sous MEDIA_ROOT) de l'aperçu d'un fichier stocké, None s'il n'en a pas."""
+    if size not in SIZES or not is_blob(source) or os.path.splitext(source)[1].lower() not in PREVIEWABLE:
+        return None
+    base = os.path.basename(source)
+    return f'{PREVIEW_DIR}/{size}/{base[:2]}/{base}.p{page}.webp'
+
+
+def preview_url(request, field_file, size, route, **kwargs):
+    """
+    URL de l'aperçu par l'API (`route` : action de DocumentViewSet), None si le fichier n'en a pas.
+    Le paramètre `v` (début de l'empreinte du fichier) change avec le contenu.
+    """
+    name = preview_name(field_file.name, size) if field_file else None
+    if name and request:
+        url = reverse(route, kwargs={**kwargs, 'size': size})
+        return request.build_absolute_uri(f'{url}?v={os.path.basename(field_file.name)[:16]}')
+    return None
+
+
+def _root():
+    return os.path.join(settings.MEDIA_ROOT, PREVIEW_DIR)
+
+
+def render(path, extension, size, page=1):
+    """Image de la page `page` du fichier, réduite à SIZES[size] ; None si la page n'existe pas."""
+    box = SIZES[size]
+    if extension == '.pdf':
+        with fitz.open(path) as pdf:
+            if page > pdf.page_count:
+                return None
+            pdf_page = pdf[page - 1]
+            zoom = box / max(pdf_page.rect.width, pdf_page.rect.height)
+            pixmap = pdf_page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+    if page != 1:
+        return None
+    with Image.open(path) as image:
+        # JPEG : décodage directement à une résolution réduite (photos de téléphone)
+        image.draft('RGB', (box, box))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((box, box))
+        return image.convert('RGB')
+
+
+def _reusable(path):
+    """Aperçu existant utilisable : chiffré si le chiffrement est actif, avec une clé connue."""
+    key_id = encryption.key_id_of(path)
+    if key_id == encryption.PLAINTEXT_KEY_ID:
+        return not settings.FILE_ENCRYPTION_AT_REST
+    return key_id in encryption.key_ring()
+
+
+def ensure(source, size, page=1):
+    """
+    Chemin relatif de l'aperçu de `source` (nom de blob), généré s'il manque.
+    None si le fichier n'est pas prévisualisable, absent ou illisible.
+    """
+    name = preview_name(source, size, page)
+    if name is None:
+        return None
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        if _reusable(path):
+            return name
+    except FileNotFoundError:
+        pass
+
+    source_path = blob_storage.path(source)
+    if not os.path.exists(source_path):
+        return None
+    try:
+        with encryption.plain_path(source_path) as plain:
+            image = render(plain, os.path.splitext(source)[1].lower(), size, page)
+    except Exception as e:
+        logger.warning(f"Aperçu impossible pour {source} (page {page}): {str(e)}")
+        return None
+    if image is None:
+        return None
+
+    # Écriture atomique : deux générations simultanées produisent le même fichier
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(handle, 'wb') as output:
+        if settings.FILE_ENCRYPTION_AT_REST:
+            buffer = io.BytesIO()
+            image.save(buffer, 'WEBP', quality=settings.PREVIEW_QUALITY)
+            writer = encryption.EncryptingWriter(output)
+            writer.write(buffer.getvalue())
+            writer.close()
+        else:
+            image.save(output, 'WEBP', quality=settings.PREVIEW_QUALITY)
+    os.replace(tmp_path, path)
+    _account(os.path.getsize(path))
+    return name
+
+
+def generate_for_document(document):
+    """Miniatures et aperçus du fichier du document et de ses pages (après l'upload)."""
+    sources = {document.file.name} | {page.file.name for page in document.pages.all()}
+    for source in sources:
+        for size in SIZES:
+            ensure(source, size)
+
+
+# ---------------------------------------------------------------------------
+# Plafond du cache
+# ---------------------------------------------------------------------------
+
+def _max_bytes():
+    return settings.PREVIEW_CACHE_MAX_MB * 1024 * 1024
+
+
+def _account(size):
+    """Ajoute `size` au compteur du cache ; élague au-delà du plafond."""
+    try:
+        total = cache.incr(CACHE_KEY, size)
+    except ValueError:
+        # Compteur absent (cache vidé, redémarrage) : recalculé en parcourant le répertoire
+        prune()
+        return
+    if total > _max_bytes():
+        prune()
+
+
+def prune(max_bytes=None):
+    """
+    Supprime les aperçus les moins récemment consultés jusqu'à repasser sous
+    LOW_WATERMARK du plafond. Retourne (fichiers supprimés, taille restante).
+    """
+    max_bytes = _max_bytes() if max_bytes is None else max_bytes
+    entries, total = [], 0
+    stale = time.time() - STALE_TMP_SECONDS
+    for directory, _, files in os.walk(_root()):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+            try:
+                stat = os.stat(path)
+                if file_name.endswith('.tmp'):
+                    # Génération interrompue
+                    if stat.st_mtime < stale:
+                        os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    if total > max_bytes:
+        target = max_bytes * LOW_WATERMARK
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+    cache.set(CACHE_KEY, total, None)
+    return removed, total
+
+
+# ---------------------------------------------------------------------------
+# Envoi
+# ---------------------------------------------------------------------------
+
+def serve_preview(request, field_file, size, page=1):
+    """
+    Réponse HTTP de l'aperçu de `field_file`, déjà autorisé par l'appelant ;
+    généré s'il manque. Http404 si le fichier n'a pas d'aperçu (ou pas cette page).
+    """
+    if not 1 <= page <= MAX_PAGE:
+        raise Http404
+    name = ensure(field_file.name, size, page) if field_file else None
+    if name is None:
+        raise Http404
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    accel_prefix = settings.MEDIA_ACCEL_REDIRECT
+    if encryption.is_encrypted(path):
+        # nginx ne sait pas déchiffrer : envoi par Django, comme serve_file
+        response = FileResponse(encryption.open_plain(path), content_type='image/webp')
+    elif accel_prefix:
+        response = HttpResponse(content_type='image/webp')
+        response['X-Accel-Redirect'] = quote(accel_prefix.rstrip('/') + '/' + name)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='image/webp')
+    # Privé : servi après contrôle des droits ; l'URL change avec le contenu (voir preview_url)
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
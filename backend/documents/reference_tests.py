@@ -0,0 +1,96 @@
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from documents.models import Client as LawClient, Case, ReferenceCounter
+from documents.references import seed_counters
+
+
+def new_case(client, **fields):
+    return Case.objects.create(client=client, opened_date=timezone.now().date(), **fields)
+
+
+class CaseReferenceTest(TestCase):
+    def setUp(self):
+        self.law_client = LawClient.objects.create(name='Client réf.')
+
+    def test_01_allocation_in_one_query(self):
+        """Numéros par catégorie à partir de 1001, une requête d'attribution quel que soit l'historique"""
+        self.assertEqual(new_case(self.law_client).reference, '1001')
+        self.assertEqual(new_case(self.law_client, category='PENAL').reference, '1001')
+        for _ in range(20):
+            new_case(self.law_client)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(new_case(self.law_client).reference, '1022')
+        counter_queries = [q['sql'] for q in ctx.captured_queries if 'referencecounter' in q['sql']]
+        self.assertEqual(len(counter_queries), 1)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+
+    def test_02_sub_cases_and_manual_references(self):
+        """Sous-dossiers numérotés par parent ; une référence saisie fait avancer le compteur"""
+        parent = new_case(self.law_client)
+        self.assertEqual(new_case(self.law_client, parent_case=parent).reference, '1001.1')
+        self.assertEqual(new_case(self.law_client, parent_case=parent, reference='1001.7').reference, '1001.7')
+        self.assertEqual(new_case(self.law_client, parent_case=parent).reference, '1001.8')
+
+        manual = new_case(self.law_client, reference='CIV2050')
+        self.assertEqual(new_case(self.law_client).reference, '2051')
+        manual.title = 'Renommé'
+        with CaptureQueriesContext(connection) as ctx:
+            manual.save()
+        # Référence inchangée : pas de mise à jour du compteur
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'referencecounter' in q['sql']])
+        manual.reference = '3000'
+        manual.save()
+        self.assertEqual(new_case(self.law_client).reference, '3001')
+
+    def test_03_seed_from_existing_data(self):
+        """La reprise recalcule les compteurs depuis les références existantes, sans les faire reculer"""
+        parent = new_case(self.law_client, reference='1500')
+        new_case(self.law_client, parent_case=parent, reference='1500.4')
+        ReferenceCounter.objects.all().delete()
+        seed_counters()
+        self.assertEqual(
+            dict(ReferenceCounter.objects.values_list('scope', 'value')),
+            {'category:CIVIL': 1500, 'sub:1500:CIVIL': 4},
+        )
+        self.assertEqual(new_case(self.law_client).reference, '1501')
+
+    def test_04_same_number_in_two_categories(self):
+        """Sous-dossiers de « 1001 » civil et pénal : numérotés par catégorie, sans collision"""
+        civil, penal = new_case(self.law_client), new_case(self.law_client, category='PENAL')
+        self.assertEqual((civil.reference, penal.reference), ('1001', '1001'))
+        self.assertEqual(new_case(self.law_client, parent_case=civil).reference, '1001.1')
+        self.assertEqual(new_case(self.law_client, parent_case=penal, category='PENAL').reference, '1001.1')
+        # Sous-dossier civil d'un dossier pénal : même portée que ceux du dossier civil
+        self.assertEqual(new_case(self.law_client, parent_case=penal).reference, '1001.2')
+
+    def test_05_category_change_and_taken_number(self):
+        """Un changement de catégorie fait avancer le compteur ; un numéro déjà pris est sauté"""
+        moved = new_case(self.law_client, reference='1400')
+        moved.category = 'SOCIAL'
+        moved.save()
+        self.assertEqual(new_case(self.law_client, category='SOCIAL').reference, '1401')
+
+        # Référence créée sans passer par Case.save (reprise en masse) : le compteur ne la connaît pas
+        Case.objects.bulk_create([Case(client=self.law_client, reference='1001', category='COMMERCIAL',
+                                       title='Repris', opened_date=timezone.now().date())])
+        created = new_case(self.law_client, category='COMMERCIAL')
+        self.assertEqual((created.reference, created.title), ('1002', '1002'))
+
+
+class ConcurrentCaseReferenceTest(TransactionTestCase):
+    def test_01_concurrent_creations_get_distinct_numbers(self):
+        """Des créations simultanées n'obtiennent jamais le même numéro"""
+        law_client = LawClient.objects.create(name='Client concurrent')
+
+        def create(_):
+            try:
+                return new_case(law_client).reference
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            references = list(pool.map(create, range(24)))
+        self.assertEqual(sorted(references, key=int), [str(n) for n in range(1001, 1025)])
@@ -0,0 +1,126 @@
+"""
+Attribution des références de dossiers (table ReferenceCounter).
+
+Un compteur par portée : « category:CIVIL » pour les dossiers principaux
+(numéros simples à partir de 1001, par catégorie), « sub:1001:CIVIL » pour les
+sous-dossiers (1001.1, 1001.2...). Les portées suivent la contrainte d'unicité
+(référence, catégorie) : deux dossiers principaux « 1001 » de catégories
+différentes ont chacun leurs sous-dossiers « 1001.1 », dans leur catégorie.
+La portée d'une référence se déduit de sa forme (« BASE.N » ou non), que le
+dossier ait un parent ou non. Le numéro suivant est obtenu par un
+unique INSERT ... ON CONFLICT DO UPDATE ... RETURNING : une requête quelle que
+soit la taille de la table, et la ligne du compteur, verrouillée jusqu'à la fin
+de la transaction, empêche deux créations simultanées d'obtenir le même numéro.
+
+Une référence saisie à la main, ou un dossier changé de catégorie ou de
+dossier principal, fait seulement avancer le compteur de sa portée (GREATEST),
+pour que les numéros attribués ensuite ne la rejoignent pas. Si un numéro
+attribué est malgré tout déjà pris (données reprises en masse), Case.save en
+attribue un autre (`is_taken`). Un numéro attribué
+dans une transaction annulée est perdu (trou dans la numérotation), comme avec
+une séquence.
+"""
+from django.apps import apps as django_apps
+from django.db import connection
+import re
+
+FIRST_CASE_NUMBER = 1000
+MAX_ALLOCATION_ATTEMPTS = 5
+NUMBER_RE = re.compile(r'\d+')
+
+ALLOCATE_SQL = (
+    "INSERT INTO documents_referencecounter (scope, value) VALUES (%s, %s) "
+    "ON CONFLICT (scope) DO UPDATE SET value = documents_referencecounter.value + 1 RETURNING value"
+)
+RESERVE_SQL = (
+    "INSERT INTO documents_referencecounter (scope, value) VALUES (%s, %s) "
+    "ON CONFLICT (scope) DO UPDATE SET value = GREATEST(documents_referencecounter.value, EXCLUDED.value)"
+)
+
+
+def category_scope(category):
+    return f'category:{category}'
+
+
+def sub_case_scope(base, category):
+    return f'sub:{base}:{category}'
+
+
+def reference_base(reference):
+    """Partie principale d'une référence (« 1001.3 » -> « 1001 »)."""
+    return str(reference).split('.')[0]
+
+
+def case_number(reference):
+    """Plus grand nombre contenu dans une référence de dossier principal (0 si aucun)."""
+    return max((int(n) for n in NUMBER_RE.findall(str(reference or ''))), default=0)
+
+
+def sub_case_number(reference):
+    """Suffixe numérique d'une référence de sous-dossier (« 1001.3 » -> 3), 0 sinon."""
+    if not reference or '.' not in reference:
+        return 0
+    suffix = reference.rsplit('.', 1)[-1]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def allocate(scope, first):
+    """Réserve et retourne le numéro suivant de la portée (`first` si le compteur n'existe pas)."""
+    with connection.cursor() as cursor:
+        cursor.execute(ALLOCATE_SQL, [scope, first])
+        return cursor.fetchone()[0]
+
+
+def reserve(scope, number):
+    """Fait avancer le compteur jusqu'à `number` au moins."""
+    if number > 0:
+        with connection.cursor() as cursor:
+            cursor.execute(RESERVE_SQL, [scope, number])
+
+
+def scope_of(reference, category):
+    """(portée, numéro) d'une référence existante, selon sa forme."""
+    number = sub_case_number(reference)
+    if number:
+        return sub_case_scope(reference_base(reference), category), number
+    return category_scope(category), case_number(reference)
+
+
+def next_reference(case):
+    """Référence d'un nouveau dossier : « 1001 », ou « 1001.2 » pour un sous-dossier."""
+    if case.parent_case_id:
+        base = reference_base(case.parent_case.reference)
+        return f"{base}.{allocate(sub_case_scope(base, case.category), 1)}"
+    return str(allocate(category_scope(case.category), FIRST_CASE_NUMBER + 1))
+
+
+def reserve_reference(case):
+    """Prend en compte une référence saisie à la main, ou une catégorie modifiée (création ou modification)."""
+    reserve(*scope_of(case.reference, case.category))
+
+
+def is_taken(case):
+    """La référence du dossier est-elle déjà utilisée dans sa catégorie par un autre dossier ?"""
+    from .models import Case
+
+    return Case.objects.filter(reference=case.reference, category=case.category).exclude(pk=case.pk).exists()
+
+
+def seed_counters(get_model=None):
+    """
+    (Re)calcule les compteurs à partir des références existantes (migration,
+    reprise de données). Les compteurs ne reculent jamais.
+    `get_model` : apps.get_model d'une migration (modèles historiques).
+    """
+    Case = (get_model or django_apps.get_model)('documents', 'Case')
+    highest = {}
+    rows = Case.objects.exclude(reference=None).values_list('category', 'reference').iterator(chunk_size=2000)
+    for category, reference in rows:
+        scope, number = scope_of(reference, category)
+        if scope == category_scope(category):
+            number = max(number, FIRST_CASE_NUMBER)
+        if number > highest.get(scope, 0):
+            highest[scope] = number
+    for scope, number in highest.items():
+        reserve(scope, number)
+    return highest
@@ -0,0 +1,189 @@
+"""
+Rappels planifiés : échéances et audiences de l'agenda.
+
+Les rappels ne sont plus calculés à la lecture de la liste des échéances mais
+par un planificateur périodique (`manage.py run_reminders --loop`) :
+
+- les lignes dues sont lues par l'index partiel sur leur date d'envoi et
+  verrouillées avec `SELECT ... FOR UPDATE SKIP LOCKED` : plusieurs
+  planificateurs peuvent tourner sans se bloquer ni traiter deux fois la même
+  ligne ;
+- la notification et le marquage « envoyé » sont validés dans la même
+  transaction : un rappel est délivré une fois et une seule, même si le
+  processus s'arrête entre deux lots.
+
+Les rappels d'audience (AgendaNotification, 7 j / 3 j / 1 j / 2 h avant) sont
+planifiés à l'enregistrement de l'entrée d'agenda, pour son auteur et les
+avocats affectés au dossier lié, puis replanifiés quand les affectations du
+dossier changent (`reschedule_case_reminders`).
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import AgendaEvent, AgendaNotification, Case, Deadline, Notification
+from .utils import send_notifications
+
+REMINDER_OFFSETS = {
+    AgendaNotification.TypeNotification.SEPT_JOURS: timedelta(days=7),
+    AgendaNotification.TypeNotification.TROIS_JOURS: timedelta(days=3),
+    AgendaNotification.TypeNotification.UN_JOUR: timedelta(days=1),
+    AgendaNotification.TypeNotification.DEUX_HEURES: timedelta(hours=2),
+}
+PENDING = AgendaNotification.StatutNotification.EN_ATTENTE
+SENT = AgendaNotification.StatutNotification.ENVOYEE
+SKIPPED = AgendaNotification.StatutNotification.ECHOUEE
+
+
+def aware(value):
+    """start_datetime est calculé en heure locale naïve par AgendaEvent.save()."""
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def schedule_agenda_reminders(event, reset=False):
+    """
+    (Re)planifie les rappels d'une entrée d'agenda. Les rappels en attente sont
+    remplacés ; avec `reset` (date modifiée), les rappels déjà envoyés aussi,
+    pour que la nouvelle date soit annoncée. Seuls les rappels à venir sont créés.
+    """
+    existing = AgendaNotification.objects.filter(agenda_entry=event)
+    (existing if reset else existing.filter(statut=PENDING)).delete()
+    if event.statut != AgendaEvent.Statut.PREVU or event.is_archived:
+        return []
+
+    recipients = {event.created_by_id}
+    if event.case_id:
+        recipients.update(
+            Case.assigned_to.through.objects.filter(case_id=event.case_id).values_list('user_id', flat=True)
+        )
+    recipients.discard(None)
+
+    start, now = aware(event.start_datetime), timezone.now()
+    return AgendaNotification.objects.bulk_create(
+        [
+            AgendaNotification(
+                agenda_entry=event, utilisateur_id=user_id,
+                type_notification=kind, date_envoi_prevue=start - offset,
+            )
+            for user_id in sorted(recipients)
+            for kind, offset in REMINDER_OFFSETS.items()
+            if start - offset > now
+        ],
+        ignore_conflicts=True,  # Rappel de ce type déjà envoyé pour cette date
+    )
+
+
+def reschedule_case_reminders(case_ids):
+    """
+    Replanifie les rappels en attente des audiences à venir des dossiers dont
+    les affectations ont changé : un avocat nouvellement affecté est ajouté,
+    un avocat retiré ne reçoit plus rien. Les rappels déjà envoyés sont conservés.
+    """
+    events = AgendaEvent.objects.filter(
+        case_id__in=case_ids, statut=AgendaEvent.Statut.PREVU, is_archived=False,
+        date_audience__gte=timezone.localdate(),
+    )
+    for event in events:
+        schedule_agenda_reminders(event)
+
+
+def dispatch_deadline_reminders(now=None, batch_size=None):
+    """
+    Notifie l'auteur des échéances à moins de DEADLINE_REMINDER_DAYS jours,
+    non terminées et pas encore rappelées. Retourne le nombre de rappels envoyés.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    horizon = now + timedelta(days=settings.DEADLINE_REMINDER_DAYS)
+    sent = 0
+    while True:
+        with transaction.atomic():
+            deadlines = list(
+                Deadline.objects.select_for_update(skip_locked=True)
+                .filter(is_completed=False, notification_sent=False, created_by__isnull=False, due_date__lte=horizon)
+                .order_by('due_date')
+                .only('id', 'title', 'due_date', 'created_by_id')[:batch_size]
+            )
+            if not deadlines:
+                return sent
+            send_notifications([
+                Notification(
+                    user_id=deadline.created_by_id,
+                    title="Échéance Imminente",
+                    message=f"Rappel: l'échéance '{deadline.title}' est prévue pour le {deadline.due_date.strftime('%d/%m/%Y')}.",
+                    level='WARNING',
+                    entity_type='DEADLINE',
+                    entity_id=deadline.id
+                )
+                for deadline in deadlines
+            ])
+            Deadline.objects.filter(id__in=[deadline.id for deadline in deadlines]).update(notification_sent=True)
+        sent += len(deadlines)
+        if len(deadlines) < batch_size:
+            return sent
+
+
+def _agenda_message(event):
+    start = timezone.localtime(aware(event.start_datetime))
+    message = f"{event.title} le {start:%d/%m/%Y} à {start:%H:%M}"
+    if event.location:
+        message += f" ({event.location})"
+    return message + '.'
+
+
+def dispatch_agenda_reminders(now=None, batch_size=None):
+    """
+    Envoie les rappels d'audience arrivés à échéance. Un rappel n'est pas envoyé
+    (statut ECHOUEE) si l'audience n'est plus prévue, est passée, ou si un rappel
+    plus proche de l'audience est dû en même temps (planificateur resté arrêté).
+    Retourne le nombre de rappels envoyés.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    sent = 0
+    while True:
+        with transaction.atomic():
+            due = list(
+                AgendaNotification.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(statut=PENDING, date_envoi_prevue__lte=now)
+                .select_related('agenda_entry')
+                .order_by('date_envoi_prevue')[:batch_size]
+            )
+            if not due:
+                return sent
+
+            latest = {}
+            for reminder in due:
+                latest[reminder.agenda_entry_id, reminder.utilisateur_id] = reminder
+            deliver = [
+                reminder for reminder in latest.values()
+                if reminder.agenda_entry.statut == AgendaEvent.Statut.PREVU
+                and aware(reminder.agenda_entry.start_datetime) > now
+            ]
+            send_notifications([
+                Notification(
+                    user_id=reminder.utilisateur_id,
+                    title=f"Rappel d'audience ({reminder.get_type_notification_display()})",
+                    message=_agenda_message(reminder.agenda_entry),
+                    level='INFO',
+                    entity_type='AGENDA',
+                    entity_id=reminder.agenda_entry_id
+                )
+                for reminder in deliver
+            ])
+            delivered = {reminder.id for reminder in deliver}
+            AgendaNotification.objects.filter(id__in=delivered).update(statut=SENT, date_envoi_effectif=now)
+            AgendaNotification.objects.filter(
+                id__in=[reminder.id for reminder in due if reminder.id not in delivered]
+            ).update(statut=SKIPPED)
+        sent += len(deliver)
+        if len(due) < batch_size:
+            return sent
+
+
+def dispatch_due_reminders(now=None):
+    """Un passage du planificateur : {'deadlines': n, 'agenda': n}."""
+    return {
+        'deadlines': dispatch_deadline_reminders(now),
+        'agenda': dispatch_agenda_reminders(now),
+    }
@@ -0,0 +1,94 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+from datetime import time, timedelta
+from documents import audit
+from documents.models import Client as LawClient, Case, Document, Deadline, Decision, Tag, AgendaEvent, AuditLog
+from documents.rollups import get_counters, reconcile
+
+User = get_user_model()
+
+
+class RollupCountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup', password='x', role='ADMIN')
+        self.law_client = LawClient.objects.create(name='Client A', client_type='PARTICULIER', created_by=self.user)
+
+    def new_case(self, reference, category='CIVIL'):
+        return Case.objects.create(
+            client=self.law_client, title=reference, reference=reference, category=category,
+            opened_date=timezone.now().date(), created_by=self.user
+        )
+
+    def assertNoDrift(self):
+        self.assertEqual(reconcile(dry_run=True), {})
+
+    def test_01_incremental_updates_match_recount(self):
+        """Les compteurs tenus à jour à l'écriture égalent un recomptage complet"""
+        case = self.new_case('R-1')
+        other = self.new_case('R-2', category='PENAL')
+        urgent, fiscal = Tag.objects.create(name='Urgent'), Tag.objects.create(name='Fiscal')
+        case.tags.add(urgent, fiscal)
+        urgent.cases.add(other)
+
+        document = Document.objects.create(
+            title='Pièce', case=case, uploaded_by=self.user,
+            file=SimpleUploadedFile('piece.pdf', b'x' * (150 * 1024)),
+        )
+        document.tags.add(urgent)
+        deadline = Deadline.objects.create(
+            case=case, title='Audience', deadline_type='AUDIENCE',
+            due_date=timezone.now() + timedelta(days=3), created_by=self.user
+        )
+        Decision.objects.create(case=other, decision_type='APPEL', created_by=self.user)
+        event = AgendaEvent.objects.create(
+            title='Audience', date_audience=timezone.now().date(), heure_audience=time(9, 0),
+            type_chambre='TI_DAKAR', created_by=self.user
+        )
+        audit.write_entries([{'user_id': self.user.id, 'action': 'DELETE', 'details': 'test'}])
+        self.assertNoDrift()
+
+        counters = get_counters(['cases:category:PENAL', 'clients:active:PARTICULIER', 'tag:%d:cases' % urgent.id,
+                                 'documents:heavy_size', 'audiences:open', 'agenda:statut:PREVU', 'audit:security'])
+        self.assertEqual(counters['cases:category:PENAL'], 1)
+        self.assertEqual(counters['clients:active:PARTICULIER'], 1)
+        self.assertEqual(counters['tag:%d:cases' % urgent.id], 2)
+        self.assertEqual(counters['documents:heavy_size'], 150 * 1024)
+        self.assertEqual(counters['audiences:open'], 1)
+        self.assertEqual(counters['agenda:statut:PREVU'], 1)
+        self.assertEqual(counters['audit:security'], 1)
+
+        # Écriture d'audit synchrone : compteurs recalés par la réconciliation seulement
+        AuditLog.objects.create(user=self.user, action='VIEW')
+        self.assertEqual(reconcile(), {'audit:total': (1, 2)})
+        self.assertNoDrift()
+
+        # Mises à jour
+        other.category = 'CIVIL'
+        other.save()
+        deadline.is_completed = True
+        deadline.save()
+        event.statut = 'REPORTE'
+        event.save(update_fields=['statut'])
+        self.law_client.client_type = 'ENTREPRISE'
+        self.law_client.save()
+        case.tags.remove(fiscal)
+        urgent.documents.clear()
+        self.assertNoDrift()
+
+        # Suppressions en cascade
+        case.delete()
+        urgent.delete()
+        self.assertNoDrift()
+        self.law_client.delete()
+        self.assertNoDrift()
+        self.assertEqual(get_counters(['clients:active'])['clients:active'], 0)
+
+    def test_02_reconcile_repairs_bulk_writes(self):
+        """Les écritures en masse sans signaux sont rattrapées par la réconciliation"""
+        self.new_case('R-3')
+        Case.objects.filter(reference='R-3').update(category='SOCIAL')
+        drift = reconcile()
+        self.assertEqual(drift['cases:category:SOCIAL'], (0, 1))
+        self.assertNoDrift()
@@ -0,0 +1,284 @@
+"""
+Compteurs statistiques matérialisés (table StatCounter).
+
+Chaque modèle suivi déclare sa « contribution » : la liste des clés de compteurs
+(et des montants) qu'une ligne représente. À chaque écriture, seule la
+différence entre l'ancienne et la nouvelle contribution est appliquée, par un
+unique INSERT ... ON CONFLICT DO UPDATE. Les lectures du tableau de bord
+coûtent alors une requête par clé primaire, quelle que soit la taille des tables.
+
+Les écritures en masse (bulk_create, queryset.update/delete) ne déclenchent
+pas de signaux : la commande `reconcile_stats` recalcule tout périodiquement.
+
+Le journal d'audit n'est pas suivi ligne par ligne : chaque requête
+incrémenterait les deux mêmes compteurs et tous les workers attendraient le
+verrou de ces lignes. audit:total et audit:security sont mis à jour une fois
+par lot au vidage de la file d'audit (`audit_deltas`), à l'archivage des
+partitions, et recalculés par `reconcile_stats` pour les écritures synchrones.
+"""
+from collections import Counter
+from django.apps import apps as django_apps
+from django.db import connection, transaction
+from django.db.models import CharField, Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+from .models import Client, StatCounter
+
+HEAVY_DOCUMENT_SIZE = 100 * 1024
+SECURITY_ACTIONS = ('DELETE', 'PERMISSION')
+
+
+def _case(case):
+    return [
+        ('cases:total', 1),
+        (f'cases:category:{case.category}', 1),
+        (f'cases:status:{case.status}', 1),
+        (f'client:{case.client_id}:cases', 1),
+    ]
+
+
+def _document(document):
+    keys = [('documents:total', 1)]
+    if document.ocr_processed:
+        keys.append(('documents:ocr', 1))
+    if document.file_size and document.file_size > HEAVY_DOCUMENT_SIZE:
+        keys.append(('documents:heavy_size', document.file_size))
+    return keys
+
+
+def _deadline(deadline):
+    keys = [('deadlines:total', 1)]
+    if not deadline.is_completed:
+        keys.append(('deadlines:open', 1))
+    if deadline.deadline_type == 'AUDIENCE':
+        keys.append(('audiences:total', 1))
+        keys.append(('audiences:completed' if deadline.is_completed else 'audiences:open', 1))
+    return keys
+
+
+def _agenda_event(event):
+    keys = []
+    for scope in ('agenda', f'agenda:{event.year}'):
+        keys += [
+            (f'{scope}:total', 1),
+            (f'{scope}:statut:{event.statut}', 1),
+            (f'{scope}:chambre:{event.type_chambre}', 1),
+        ]
+    return keys
+
+
+def _client(client):
+    # Un client n'est « actif » que s'il a au moins un dossier (compteur client:<id>:cases)
+    if client.pk and get_counters([f'client:{client.pk}:cases']).get(f'client:{client.pk}:cases', 0) > 0:
+        return [('clients:active', 1), (f'clients:active:{client.client_type}', 1)]
+    return []
+
+
+# Modèle -> (fonction de contribution, champs qui la font varier)
+CONTRIBUTIONS = {
+    'Case': (_case, {'category', 'status', 'client', 'client_id'}),
+    'Document': (_document, {'ocr_processed', 'file_size'}),
+    'Deadline': (_deadline, {'is_completed', 'deadline_type'}),
+    'Decision': (lambda decision: [('decisions:total', 1)], set()),
+    'Tag': (lambda tag: [('tags:total', 1)], set()),
+    'AgendaEvent': (_agenda_event, {'statut', 'type_chambre', 'year', 'date_audience'}),
+    'Client': (_client, {'client_type'}),
+}
+
+
+def contribution(instance, sign=1):
+    func, _ = CONTRIBUTIONS[type(instance).__name__]
+    deltas = Counter()
+    for key, amount in func(instance):
+        deltas[key] += sign * amount
+    return deltas
+
+
+def audit_deltas(actions, sign=1):
+    """
+    Deltas des compteurs d'audit pour des entrées du journal ({action: nombre} ou liste d'actions).
+    """
+    per_action = actions if isinstance(actions, dict) else Counter(actions)
+    return Counter({
+        'audit:total': sign * sum(per_action.values()),
+        'audit:security': sign * sum(n for action, n in per_action.items() if action in SECURITY_ACTIONS),
+    })
+
+
+def get_counters(keys):
+    """
+    Lit plusieurs compteurs en une requête ; les clés absentes valent 0.
+    """
+    values = dict(StatCounter.objects.filter(key__in=list(keys)).values_list('key', 'value'))
+    return {key: values.get(key, 0) for key in keys}
+
+
+def get_counters_with_prefix(prefix):
+    return dict(StatCounter.objects.filter(key__startswith=prefix).values_list('key', 'value'))
+
+
+def _upsert(deltas):
+    """
+    Ajoute les deltas aux compteurs (création à la volée) et retourne les nouvelles valeurs.
+    Les clés sont triées pour que deux transactions concurrentes verrouillent dans le même ordre.
+    """
+    items = sorted((key, amount) for key, amount in deltas.items() if amount)
+    if not items:
+        return {}
+    placeholders = ', '.join(['(%s, %s, NOW())'] * len(items))
+    params = [value for item in items for value in item]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO documents_statcounter (key, value, updated_at) VALUES {placeholders} "
+            "ON CONFLICT (key) DO UPDATE SET value = documents_statcounter.value + EXCLUDED.value, "
+            "updated_at = EXCLUDED.updated_at RETURNING key, value",
+            params,
+        )
+        return dict(cursor.fetchall())
+
+
+def apply_deltas(deltas):
+    """
+    Applique les deltas, puis répercute les passages 0 <-> 1 des dossiers par client
+    sur les compteurs de clients actifs.
+    """
+    deltas = Counter({key: amount for key, amount in deltas.items() if amount})
+    if not deltas:
+        return
+    with transaction.atomic():
+        new_values = _upsert(deltas)
+
+        transitions = Counter()
+        for key, value in new_values.items():
+            if not (key.startswith('client:') and key.endswith(':cases')):
+                continue
+            before = value - deltas[key]
+            if (before > 0) == (value > 0):
+                continue
+            client_id = int(key.split(':')[1])
+            client_type = Client.objects.filter(pk=client_id).values_list('client_type', flat=True).first()
+            sign = 1 if value > 0 else -1
+            transitions['clients:active'] += sign
+            if client_type:
+                transitions[f'clients:active:{client_type}'] += sign
+        _upsert(transitions)
+
+
+def tag_usage_deltas(model_name, tag_ids, sign=1):
+    """
+    Deltas d'usage des tags pour des liaisons Document<->Tag ou Case<->Tag.
+    """
+    suffix = 'documents' if model_name == 'Document' else 'cases'
+    deltas = Counter()
+    for tag_id in tag_ids:
+        deltas[f'tag:{tag_id}:{suffix}'] += sign
+    return deltas
+
+
+def tag_usage_counter(suffix):
+    """
+    Expression d'annotation : compteur tag:<id>:<suffix> du tag courant (0 si absent).
+    """
+    key = Concat(Value('tag:'), Cast(OuterRef('pk'), CharField()), Value(f':{suffix}'))
+    return Coalesce(Subquery(StatCounter.objects.filter(key=key).values('value')[:1]), 0)
+
+
+def expected_counters(get_model=None):
+    """
+    Recalcule tous les compteurs depuis les tables sources (utilisé par la réconciliation
+    et la migration initiale). `get_model` permet de passer les modèles historiques.
+    """
+    get_model = get_model or django_apps.get_model
+    Case = get_model('documents', 'Case')
+    Client = get_model('documents', 'Client')
+    Document = get_model('documents', 'Document')
+    Deadline = get_model('documents', 'Deadline')
+    Decision = get_model('documents', 'Decision')
+    Tag = get_model('documents', 'Tag')
+    AgendaEvent = get_model('documents', 'AgendaEvent')
+    AuditLog = get_model('documents', 'AuditLog')
+
+    counters = Counter()
+
+    counters['cases:total'] = Case.objects.count()
+    for field, prefix in (('category', 'cases:category'), ('status', 'cases:status'), ('client_id', 'client')):
+        for row in Case.objects.order_by().values(field).annotate(n=Count('id')):
+            key = f'client:{row[field]}:cases' if field == 'client_id' else f'{prefix}:{row[field]}'
+            counters[key] = row['n']
+
+    active = Client.objects.filter(cases__isnull=False).distinct()
+    counters['clients:active'] = active.count()
+    for row in Client.objects.filter(pk__in=active.values('pk')).order_by().values('client_type').annotate(n=Count('id')):
+        counters[f"clients:active:{row['client_type']}"] = row['n']
+
+    documents = Document.objects.aggregate(
+        total=Count('id'),
+        ocr=Count('id', filter=Q(ocr_processed=True)),
+        heavy_size=Sum('file_size', filter=Q(file_size__gt=HEAVY_DOCUMENT_SIZE)),
+    )
+    counters['documents:total'] = documents['total']
+    counters['documents:ocr'] = documents['ocr']
+    counters['documents:heavy_size'] = documents['heavy_size'] or 0
+
+    deadlines = Deadline.objects.aggregate(
+        total=Count('id'),
+        open=Count('id', filter=Q(is_completed=False)),
+        audiences=Count('id', filter=Q(deadline_type='AUDIENCE')),
+        audiences_open=Count('id', filter=Q(deadline_type='AUDIENCE', is_completed=False)),
+        audiences_completed=Count('id', filter=Q(deadline_type='AUDIENCE', is_completed=True)),
+    )
+    counters['deadlines:total'] = deadlines['total']
+    counters['deadlines:open'] = deadlines['open']
+    counters['audiences:total'] = deadlines['audiences']
+    counters['audiences:open'] = deadlines['audiences_open']
+    counters['audiences:completed'] = deadlines['audiences_completed']
+
+    counters['decisions:total'] = Decision.objects.count()
+    counters['tags:total'] = Tag.objects.count()
+
+    audit = AuditLog.objects.aggregate(
+        total=Count('id'), security=Count('id', filter=Q(action__in=SECURITY_ACTIONS))
+    )
+    counters['audit:total'] = audit['total']
+    counters['audit:security'] = audit['security']
+
+    for row in AgendaEvent.objects.order_by().values('year', 'statut', 'type_chambre').annotate(n=Count('id')):
+        for scope in ('agenda', f"agenda:{row['year']}"):
+            counters[f'{scope}:total'] += row['n']
+            counters[f"{scope}:statut:{row['statut']}"] += row['n']
+            counters[f"{scope}:chambre:{row['type_chambre']}"] += row['n']
+
+    for model, suffix in ((Document, 'documents'), (Case, 'cases')):
+        through = model.tags.through
+        for row in through.objects.order_by().values('tag_id').annotate(n=Count('id')):
+            counters[f"tag:{row['tag_id']}:{suffix}"] = row['n']
+
+    return {key: value for key, value in counters.items() if value}
+
+
+def reconcile(get_model=None, dry_run=False):
+    """
+    Compare les compteurs stockés aux valeurs recalculées et les corrige.
+    La table est verrouillée en écriture pendant le recalcul pour ne perdre
+    aucune mise à jour concurrente. Retourne {clé: (stocké, attendu)} des écarts.
+    """
+    get_model = get_model or django_apps.get_model
+    StatCounter = get_model('documents', 'StatCounter')
+
+    with transaction.atomic():
+        if not dry_run:
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE documents_statcounter IN EXCLUSIVE MODE')
+        expected = expected_counters(get_model)
+        stored = dict(StatCounter.objects.values_list('key', 'value'))
+
+        drift = {
+            key: (stored.get(key, 0), expected.get(key, 0))
+            for key in set(stored) | set(expected)
+            if stored.get(key, 0) != expected.get(key, 0)
+        }
+        if drift and not dry_run:
+            StatCounter.objects.all().delete()
+            StatCounter.objects.bulk_create(
+                [StatCounter(key=key, value=value) for key, value in expected.items()], batch_size=2000
+            )
+    return drift
@@ -2,8 +2,21 @@
 Sérialiseurs pour l'API de gestion documentaire.
 """
 from rest_framework import serializers
-from .models import Client, Case, Document, DocumentPage, DocumentPermission, AuditLog, Tag, Deadline, DocumentVersion, Notification, Diligence, Task, Decision, AgendaEvent, AgendaHistory, AgendaNotification
+from .models import Client, Case, Document, DocumentPage, UploadSession, DocumentPermission, AuditLog, Tag, Deadline, DocumentVersion, Notification, Diligence, Task, Decision, AgendaEvent, AgendaHistory, AgendaNotification
+from django.urls import reverse
+from . import previews
 from users.serializers import UserSerializer
+import os
+
+
+def inline_file_url(request, route, **kwargs):
+    """
+    URL d'affichage d'un fichier par l'API (?inline=1) : les droits sont vérifiés à chaque accès.
+    Les fichiers ne sont jamais exposés par leur chemin sous /media/.
+    """
+    if request is None:
+        return None
+    return request.build_absolute_uri(reverse(route, kwargs=kwargs) + '?inline=1')
 
 
 class ClientSerializer(serializers.ModelSerializer):
@@ -26,6 +39,8 @@ class ClientSerializer(serializers.ModelSerializer):
         return obj.created_by.get_full_name() if obj.created_by else None
     
     def get_total_cases(self, obj):
+        if hasattr(obj, 'total_cases'):
+            return obj.total_cases
         return obj.cases.count()
 
 
@@ -65,6 +80,8 @@ class CaseListSerializer(serializers.ModelSerializer):
         return [user.get_full_name() for user in obj.assigned_to.all()]
     
     def get_total_documents(self, obj):
+        if hasattr(obj, 'total_documents'):
+            return obj.total_documents
         return obj.documents.count()
 
     def get_client_name(self, obj):
@@ -141,18 +158,15 @@ class DocumentVersionSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'document', 'document_title', 'version_number', 'file',
             'file_url', 'file_name', 'file_size', 'comment', 'uploaded_by',
-            'uploaded_by_name', 'uploaded_at'
+            'uploaded_by_name', 'uploaded_at', 'is_generated'
         )
-        read_only_fields = ('id', 'uploaded_by', 'uploaded_at')
+        read_only_fields = ('id', 'uploaded_by', 'uploaded_at', 'is_generated')
     
     def get_uploaded_by_name(self, obj):
         return obj.uploaded_by.get_full_name() if obj.uploaded_by else None
     
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if obj.file and request:
-            return request.build_absolute_uri(obj.file.url)
-        return None
+        return inline_file_url(self.context.get('request'), 'version-download', pk=obj.pk)
 
 
 class DocumentPageSerializer(serializers.ModelSerializer):
@@ -160,16 +174,28 @@ class DocumentPageSerializer(serializers.ModelSerializer):
     Sérialiseur pour les pages de documents.
     """
     file_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    preview_url = serializers.SerializerMethodField()
     
     class Meta:
         model = DocumentPage
-        fields = ('id', 'document', 'file', 'file_url', 'page_number', 'ocr_text', 'created_at')
+        fields = (
+            'id', 'document', 'file', 'file_url', 'thumbnail_url', 'preview_url',
+            'page_number', 'ocr_text', 'created_at'
+        )
     
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if obj.file and request:
-            return request.build_absolute_uri(obj.file.url)
-        return None
+        return inline_file_url(self.context.get('request'), 'document-page-download', pk=obj.document_id, page_id=obj.pk)
+
+    def get_thumbnail_url(self, obj):
+        return previews.preview_url(
+            self.context.get('request'), obj.file, 'thumb', 'document-page-preview', pk=obj.document_id, page_id=obj.pk
+        )
+
+    def get_preview_url(self, obj):
+        return previews.preview_url(
+            self.context.get('request'), obj.file, 'page', 'document-page-preview', pk=obj.document_id, page_id=obj.pk
+        )
 
 
 class DocumentSerializer(serializers.ModelSerializer):
@@ -181,6 +207,7 @@ class DocumentSerializer(serializers.ModelSerializer):
     client_name = serializers.SerializerMethodField()
     uploaded_by_name = serializers.SerializerMethodField()
     file_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
     tags_list = serializers.SlugRelatedField(
         many=True,
         read_only=True,
@@ -194,7 +221,7 @@ class DocumentSerializer(serializers.ModelSerializer):
         model = Document
         fields = (
             'id', 'title', 'description', 'case', 'case_title', 'case_reference', 'client_name',
-            'document_type', 'file', 'file_url', 'file_name', 'file_size',
+            'document_type', 'file', 'file_url', 'thumbnail_url', 'file_name', 'file_size',
             'file_extension', 'ocr_text', 'ocr_processed', 'ocr_error',
             'uploaded_by', 'uploaded_by_name', 'is_confidential', 'tags',
             'tags_list', 'versions', 'is_multi_page', 'pages', 'created_at', 'updated_at'
@@ -208,11 +235,10 @@ class DocumentSerializer(serializers.ModelSerializer):
         return obj.uploaded_by.get_full_name() if obj.uploaded_by else None
     
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if obj.file and request:
-            return request.build_absolute_uri(obj.file.url)
-        return None
+        return inline_file_url(self.context.get('request'), 'document-download', pk=obj.pk)
 
+    def get_thumbnail_url(self, obj):
+        return previews.preview_url(self.context.get('request'), obj.file, 'thumb', 'document-preview', pk=obj.pk)
 
     def get_case_title(self, obj):
         return obj.case.title if obj.case else None
@@ -231,13 +257,34 @@ class DocumentListSerializer(DocumentSerializer):
     class Meta(DocumentSerializer.Meta):
         fields = (
             'id', 'title', 'description', 'case', 'case_title', 'case_reference', 'client_name',
-            'document_type', 'file', 'file_url', 'file_name', 'file_size',
+            'document_type', 'file', 'file_url', 'thumbnail_url', 'file_name', 'file_size',
             'file_extension', 'ocr_processed', 'ocr_error',
             'uploaded_by', 'uploaded_by_name', 'is_confidential', 'tags',
             'tags_list', 'is_multi_page', 'created_at'
         )
 
 
+def check_upload(name, size):
+    """
+    Valide la taille et l'extension d'un fichier déposé.
+    """
+    from django.conf import settings
+
+    # Vérifier la taille
+    if size > settings.MAX_UPLOAD_SIZE:
+        max_size_mb = settings.MAX_UPLOAD_SIZE / (1024 * 1024)
+        raise serializers.ValidationError(
+            f'Le fichier est trop volumineux. Taille maximale: {max_size_mb}MB'
+        )
+
+    # Vérifier l'extension
+    ext = name.split('.')[-1].lower()
+    if ext not in settings.ALLOWED_UPLOAD_EXTENSIONS:
+        raise serializers.ValidationError(
+            f'Type de fichier non autorisé. Extensions autorisées: {", ".join(settings.ALLOWED_UPLOAD_EXTENSIONS)}'
+        )
+
+
 class DocumentUploadSerializer(serializers.ModelSerializer):
     """
     Sérialiseur pour l'upload de documents.
@@ -257,25 +304,55 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         """
         Valide la taille et l'extension du fichier.
         """
-        from django.conf import settings
-        
-        # Vérifier la taille
-        if value.size > settings.MAX_UPLOAD_SIZE:
-            max_size_mb = settings.MAX_UPLOAD_SIZE / (1024 * 1024)
-            raise serializers.ValidationError(
-                f'Le fichier est trop volumineux. Taille maximale: {max_size_mb}MB'
-            )
-        
-        # Vérifier l'extension
-        ext = value.name.split('.')[-1].lower()
-        if ext not in settings.ALLOWED_UPLOAD_EXTENSIONS:
-            raise serializers.ValidationError(
-                f'Type de fichier non autorisé. Extensions autorisées: {", ".join(settings.ALLOWED_UPLOAD_EXTENSIONS)}'
-            )
-        
+        check_upload(value.name, value.size)
         return value
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Sérialiseur des uploads découpés (voir documents/uploads.py).
+    """
+    offset = serializers.IntegerField(source='received', read_only=True)
+    chunk_size = serializers.SerializerMethodField()
+    expires_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = (
+            'id', 'case', 'title', 'description', 'document_type', 'is_confidential',
+            'file_name', 'total_size', 'sha256', 'offset', 'chunk_size', 'expires_at', 'document'
+        )
+        read_only_fields = ('id', 'document')
+        extra_kwargs = {
+            'title': {'required': False, 'allow_blank': True},
+            'description': {'required': False},
+            'document_type': {'required': False},
+            'is_confidential': {'required': False},
+            'sha256': {'required': False},
+        }
+
+    def get_chunk_size(self, obj):
+        from django.conf import settings
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def get_expires_at(self, obj):
+        from .uploads import expires_at
+        return expires_at(obj)
+
+    def validate_sha256(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdefABCDEF' for c in value)):
+            raise serializers.ValidationError('Empreinte SHA-256 attendue en hexadécimal (64 caractères).')
+        return value.lower()
+
+    def validate(self, attrs):
+        if attrs['total_size'] <= 0:
+            raise serializers.ValidationError({'total_size': 'Le fichier est vide.'})
+        check_upload(attrs['file_name'], attrs['total_size'])
+        if not attrs.get('title'):
+            attrs['title'] = os.path.splitext(attrs['file_name'])[0]
+        return attrs
+
+
 class DocumentPermissionSerializer(serializers.ModelSerializer):
     """
     Sérialiseur pour les permissions de documents.
@@ -456,18 +533,15 @@ class DocumentVersionSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'document', 'document_title', 'version_number', 'file',
             'file_url', 'file_name', 'file_size', 'comment', 'uploaded_by',
-            'uploaded_by_name', 'uploaded_at'
+            'uploaded_by_name', 'uploaded_at', 'is_generated'
         )
-        read_only_fields = ('id', 'uploaded_by', 'uploaded_at')
+        read_only_fields = ('id', 'uploaded_by', 'uploaded_at', 'is_generated')
     
     def get_uploaded_by_name(self, obj):
         return obj.uploaded_by.get_full_name() if obj.uploaded_by else None
     
     def get_file_url(self, obj):
-        request = self.context.get('request')
-        if obj.file and request:
-            return request.build_absolute_uri(obj.file.url)
-        return None
+        return inline_file_url(self.context.get('request'), 'version-download', pk=obj.pk)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -572,6 +646,8 @@ class AgendaEventSerializer(serializers.ModelSerializer):
         return obj.created_by.get_full_name() if obj.created_by else None
 
     def get_nb_reports(self, obj):
+        if hasattr(obj, 'nb_reports'):
+            return obj.nb_reports
         return obj.reports_suivants.count()
 
     def get_reporte_de_info(self, obj):
@@ -0,0 +1,245 @@
+"""
+Signaux de l'application documents : compteurs statistiques, cache du tableau
+de bord, table d'accès aux documents, planification des rappels d'agenda et
+références des fichiers stockés par contenu.
+
+Les récepteurs sont branchés modèle par modèle : un récepteur global empêcherait
+Django d'utiliser les suppressions rapides (fast delete) sur les autres modèles.
+"""
+from collections import Counter
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete, m2m_changed
+from .dashboard import invalidate_dashboard_stats
+from .models import (
+    Client, Case, Document, DocumentPage, DocumentVersion, DocumentPermission, Tag, Deadline, Decision,
+    AgendaEvent, StatCounter, VersionChunk
+)
+from . import access, blobstore, reminders, rollups
+
+# Modèles dont l'écriture rend les statistiques du tableau de bord caduques.
+# Le journal d'audit n'en fait pas partie : il est écrit à chaque requête et
+# ses compteurs se contentent de l'expiration courte du cache.
+DASHBOARD_MODELS = (Client, Case, Document, Tag, Deadline, Decision)
+
+# Le journal d'audit est compté par lots (voir rollups.py)
+ROLLUP_MODELS = (Client, Case, Document, Tag, Deadline, Decision, AgendaEvent)
+
+# Modèles dont le champ `file` référence un blob (voir blobstore.py)
+BLOB_MODELS = (Document, DocumentPage, DocumentVersion, VersionChunk)
+
+
+def invalidate_dashboard_on_write(sender, **kwargs):
+    # Après validation : un lecteur concurrent ne doit pas remettre en cache l'état d'avant
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+def remember_previous_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Avant une mise à jour, conserve l'état en base pour calculer la différence de compteurs.
+    """
+    instance._rollup_previous = None
+    instance._rollup_skip = False
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    _, tracked = rollups.CONTRIBUTIONS[sender.__name__]
+    if update_fields is not None and not (set(update_fields) & tracked):
+        instance._rollup_skip = True
+        return
+    instance._rollup_previous = sender.objects.filter(pk=instance.pk).first()
+
+
+def update_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw or getattr(instance, '_rollup_skip', False):
+        return
+    deltas = rollups.contribution(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None and not created:
+        deltas.subtract(rollups.contribution(previous))
+    instance._rollup_previous = None
+    rollups.apply_deltas(deltas)
+
+
+def remember_tags_before_delete(sender, instance, **kwargs):
+    # Les liaisons aux tags sont supprimées sans signal m2m_changed
+    instance._rollup_tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+def update_rollups_on_delete(sender, instance, **kwargs):
+    deltas = rollups.contribution(instance, sign=-1)
+    if sender in (Case, Document):
+        deltas.update(rollups.tag_usage_deltas(sender.__name__, getattr(instance, '_rollup_tag_ids', []), sign=-1))
+    rollups.apply_deltas(deltas)
+
+    # Compteurs propres à l'objet supprimé
+    if sender is Client:
+        StatCounter.objects.filter(key=f'client:{instance.pk}:cases').delete()
+    elif sender is Tag:
+        StatCounter.objects.filter(key__startswith=f'tag:{instance.pk}:').delete()
+
+
+def update_tag_usage(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Tient à jour tag:<id>:documents / tag:<id>:cases lors des ajouts/retraits de tags.
+    """
+    owner_name = 'Document' if sender is Document.tags.through else 'Case'
+    tag_key = f"tag:{instance.pk}:{'documents' if owner_name == 'Document' else 'cases'}"
+
+    if action == 'pre_clear':
+        if reverse:
+            # instance est le tag : on retient le nombre de liaisons supprimées
+            owners = instance.documents if owner_name == 'Document' else instance.cases
+            instance._rollup_cleared = owners.count()
+        else:
+            instance._rollup_cleared = list(instance.tags.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    cleared = getattr(instance, '_rollup_cleared', None)
+    if action == 'post_clear' and reverse:
+        deltas = Counter({tag_key: -(cleared or 0)})
+    elif action == 'post_clear':
+        deltas = rollups.tag_usage_deltas(owner_name, cleared or [], sign=-1)
+    elif reverse:
+        # instance est le tag, pk_set contient les documents/dossiers
+        deltas = Counter({tag_key: (1 if action == 'post_add' else -1) * len(pk_set or ())})
+    else:
+        deltas = rollups.tag_usage_deltas(owner_name, pk_set or (), sign=1 if action == 'post_add' else -1)
+    rollups.apply_deltas(deltas)
+
+
+# Champs d'un document dont dépendent ses accès par affectation et par upload
+DOCUMENT_ACCESS_FIELDS = {'case', 'case_id', 'uploaded_by', 'uploaded_by_id'}
+
+
+def sync_document_access(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (not created and update_fields is not None and not (set(update_fields) & DOCUMENT_ACCESS_FIELDS)):
+        return
+    access.sync_document(instance)
+
+
+def remember_shared_document(sender, instance, raw=False, **kwargs):
+    # Un partage modifié peut changer de document : l'ancien doit aussi être recalculé
+    instance._access_previous_document_id = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._access_previous_document_id = (
+            DocumentPermission.objects.filter(pk=instance.pk).values_list('document_id', flat=True).first()
+        )
+
+
+def sync_share_access(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    document_ids = {instance.document_id, getattr(instance, '_access_previous_document_id', None)} - {None}
+    for document_id in document_ids:
+        access.sync_shares(document_id)
+
+
+def update_assignment_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Affectation d'utilisateurs à des dossiers (dans les deux sens de la relation) :
+    table d'accès et destinataires des rappels d'audience.
+    """
+    if action == 'pre_clear':
+        related = instance.assigned_cases if reverse else instance.assigned_to
+        instance._access_cleared = list(related.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    related_ids = getattr(instance, '_access_cleared', []) if action == 'post_clear' else list(pk_set or ())
+    if not related_ids:
+        return
+    case_ids, user_ids = (related_ids, [instance.pk]) if reverse else ([instance.pk], related_ids)
+    if action == 'post_add':
+        access.grant_assignment(case_ids, user_ids)
+    else:
+        access.revoke_assignment(case_ids, user_ids)
+    reminders.reschedule_case_reminders(case_ids)
+
+
+# Champs d'une entrée d'agenda dont dépendent ses rappels
+AGENDA_REMINDER_FIELDS = ('start_datetime', 'statut', 'case_id', 'created_by_id', 'is_archived')
+
+
+def remember_agenda_schedule(sender, instance, raw=False, **kwargs):
+    instance._reminder_previous = None
+    if not raw and instance.pk and not instance._state.adding:
+        instance._reminder_previous = (
+            AgendaEvent.objects.filter(pk=instance.pk).values_list(*AGENDA_REMINDER_FIELDS).first()
+        )
+
+
+def schedule_agenda_reminders(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_reminder_previous', None)
+    current = tuple(getattr(instance, field) for field in AGENDA_REMINDER_FIELDS)
+    if not created and previous is not None:
+        previous_start = reminders.aware(previous[0])
+        if previous[1:] == current[1:] and previous_start == reminders.aware(current[0]):
+            return
+        reminders.schedule_agenda_reminders(instance, reset=previous_start != reminders.aware(current[0]))
+        return
+    reminders.schedule_agenda_reminders(instance)
+
+
+def _stored_file(instance):
+    value = instance.__dict__.get('file')
+    name = getattr(value, 'name', value)
+    return name if isinstance(name, str) else None
+
+
+def remember_blob(sender, instance, **kwargs):
+    """Nom du fichier tel que chargé : comparé après enregistrement, sans requête."""
+    instance._blob_previous = _stored_file(instance)
+
+
+def update_blob_refcount_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if 'file' not in instance.__dict__ or (update_fields is not None and 'file' not in update_fields):
+        return
+    previous = None if created else instance._blob_previous
+    current = _stored_file(instance)
+    if previous != current:
+        deltas = Counter()
+        if current:
+            deltas[current] += 1
+        if previous:
+            deltas[previous] -= 1
+        blobstore.apply_refcount_deltas(deltas)
+    instance._blob_previous = current
+
+
+def update_blob_refcount_on_delete(sender, instance, **kwargs):
+    if instance._blob_previous:
+        blobstore.apply_refcount_deltas({instance._blob_previous: -1})
+
+
+for model in DASHBOARD_MODELS:
+    post_save.connect(invalidate_dashboard_on_write, sender=model, dispatch_uid=f'dashboard_save_{model.__name__}')
+    post_delete.connect(invalidate_dashboard_on_write, sender=model, dispatch_uid=f'dashboard_delete_{model.__name__}')
+
+for model in ROLLUP_MODELS:
+    pre_save.connect(remember_previous_state, sender=model, dispatch_uid=f'rollup_pre_save_{model.__name__}')
+    post_save.connect(update_rollups_on_save, sender=model, dispatch_uid=f'rollup_save_{model.__name__}')
+    post_delete.connect(update_rollups_on_delete, sender=model, dispatch_uid=f'rollup_delete_{model.__name__}')
+
+for model in (Case, Document):
+    pre_delete.connect(remember_tags_before_delete, sender=model, dispatch_uid=f'rollup_tags_{model.__name__}')
+
+for through in (Document.tags.through, Case.tags.through):
+    m2m_changed.connect(update_tag_usage, sender=through, dispatch_uid=f'rollup_m2m_{through.__name__}')
+    m2m_changed.connect(invalidate_dashboard_on_write, sender=through, dispatch_uid=f'dashboard_m2m_{through.__name__}')
+
+post_save.connect(sync_document_access, sender=Document, dispatch_uid='access_document_save')
+pre_save.connect(remember_shared_document, sender=DocumentPermission, dispatch_uid='access_share_pre_save')
+post_save.connect(sync_share_access, sender=DocumentPermission, dispatch_uid='access_share_save')
+post_delete.connect(sync_share_access, sender=DocumentPermission, dispatch_uid='access_share_delete')
+m2m_changed.connect(update_assignment_access, sender=Case.assigned_to.through, dispatch_uid='access_assignment')
+pre_save.connect(remember_agenda_schedule, sender=AgendaEvent, dispatch_uid='reminders_agenda_pre_save')
+post_save.connect(schedule_agenda_reminders, sender=AgendaEvent, dispatch_uid='reminders_agenda_save')
+
+for model in BLOB_MODELS:
+    post_init.connect(remember_blob, sender=model, dispatch_uid=f'blob_init_{model.__name__}')
+    post_save.connect(update_blob_refcount_on_save, sender=model, dispatch_uid=f'blob_save_{model.__name__}')
+    post_delete.connect(update_blob_refcount_on_delete, sender=model, dispatch_uid=f'blob_delete_{model.__name__}')
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+from documents.lazy_imports import HEAVY_MODULES, LazyModule, lazy
+import json
+import os
+import subprocess
+import sys
+
+# Budget de démarrage d'un worker (django.setup + chargement des URLs), en secondes :
+# vérifié seulement si STARTUP_BUDGET_SECONDS est défini, sur une machine dédiée
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 0)) or None
+
+BOOT_SCRIPT = """
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'legaldoc.settings')
+started = time.perf_counter()
+import django
+django.setup()
+import legaldoc.urls, legaldoc.wsgi
+elapsed = time.perf_counter() - started
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+class StartupBudgetTest(SimpleTestCase):
+    def boot_worker(self):
+        """Démarre un interpréteur neuf comme le ferait un worker gunicorn"""
+        result = subprocess.run(
+            [sys.executable, '-c', BOOT_SCRIPT],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_01_heavy_modules_not_imported_at_boot(self):
+        """Les piles OCR/IA/PDF ne sont pas chargées au démarrage (et le budget de temps est tenu, s'il est fixé)"""
+        boot = self.boot_worker()
+        loaded = [path for path in HEAVY_MODULES.values() if path in boot['modules']]
+        self.assertEqual(loaded, [])
+        if STARTUP_BUDGET_SECONDS:
+            self.assertLess(boot['elapsed'], STARTUP_BUDGET_SECONDS)
+
+    def test_02_lazy_proxy_loads_on_first_use(self):
+        """Le proxy importe le module réel au premier attribut lu"""
+        proxy = lazy('docx')
+        self.assertIsInstance(proxy, LazyModule)
+        self.assertIs(proxy, lazy('docx'))
+        self.assertTrue(callable(proxy.Document))
+        with self.assertRaises(KeyError):
+            lazy('inconnu')
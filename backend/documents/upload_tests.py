@@ -0,0 +1,121 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from rest_framework.test import APIClient
+from documents.models import Client as LawClient, Case, Document, UploadSession
+from documents.views import DocumentViewSet
+from documents import uploads
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+User = get_user_model()
+
+CONTENT = b'%PDF-1.4\n' + bytes(range(256)) * 10  # 2569 octets
+
+
+def checksum(data):
+    return 'sha256 ' + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+class ChunkedUploadTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media, UPLOAD_TEMP_DIR=os.path.join(self.media, 'partial'), UPLOAD_CHUNK_SIZE=1024
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='avocat.upload', password='x', role='AVOCAT')
+        law_client = LawClient.objects.create(name='Client upload', created_by=self.user)
+        self.case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.user)
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def start(self, **fields):
+        response = self.api.post('/api/documents/documents/uploads/', {
+            'case': self.case.id, 'file_name': 'scan.pdf', 'total_size': len(CONTENT), **fields,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return f"/api/documents/documents/uploads/{response.data['id']}/"
+
+    def put(self, url, offset, data, **headers):
+        return self.api.put(url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset), **headers)
+
+    def complete(self, url):
+        with mock.patch.object(DocumentViewSet, '_launch_ocr_background'):
+            return self.api.post(url + 'complete/')
+
+    def test_01_chunked_upload_and_resume(self):
+        """Morceaux vérifiés, reprise à l'offset reçu, document créé à la fin (et une seule fois)"""
+        url = self.start(sha256=hashlib.sha256(CONTENT).hexdigest(), title='Scan')
+        self.assertEqual(self.put(url, 0, CONTENT[:1024], HTTP_UPLOAD_CHECKSUM=checksum(CONTENT[:1024])).data['offset'], 1024)
+
+        # Coupure : le morceau suivant arrive tronqué, puis la reprise repart de l'offset annoncé
+        session = UploadSession.objects.get()
+        with self.assertRaises(uploads.UploadError):
+            uploads.write_chunk(session, 1024, io.BytesIO(CONTENT[1024:1500]), 1024)
+        self.assertEqual(os.path.getsize(uploads.partial_path(session)), 1024)
+        self.assertEqual(self.api.get(url).data['offset'], 1024)
+        self.put(url, 1024, CONTENT[1024:2048])
+        self.assertEqual(self.put(url, 2048, CONTENT[2048:]).data['offset'], len(CONTENT))
+
+        response = self.complete(url)
+        self.assertEqual(response.status_code, 201, response.data)
+        document = Document.objects.get(pk=response.data['id'])
+        self.assertEqual((document.title, document.file_size, document.file_name), ('Scan', len(CONTENT), 'scan.pdf'))
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), CONTENT)
+        self.assertEqual(list(document.pages.values_list('page_number', flat=True)), [1])
+        self.assertFalse(os.listdir(os.path.join(self.media, 'partial')))  # Déplacé, pas copié
+
+        self.assertEqual(self.complete(url).status_code, 200)
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_02_rejected_chunks(self):
+        """Offset inattendu, morceau trop gros ou corrompu, upload incomplet ou altéré"""
+        url = self.start(sha256=hashlib.sha256(b'autre contenu').hexdigest())
+        self.assertEqual(self.put(url, 512, CONTENT[:512]).status_code, 409)
+        self.assertEqual(self.put(url, 0, CONTENT[:2048]).status_code, 413)
+        response = self.put(url, 0, CONTENT[:1024], HTTP_UPLOAD_CHECKSUM=checksum(b'x'))
+        self.assertEqual((response.status_code, response.data['offset']), (400, 0))
+
+        self.put(url, 0, CONTENT[:1024])
+        self.assertEqual(self.complete(url).status_code, 409)
+        self.put(url, 1024, CONTENT[1024:2048])
+        self.put(url, 2048, CONTENT[2048:])
+        self.assertEqual(self.complete(url).status_code, 400)  # Empreinte du fichier entier
+        self.assertFalse(Document.objects.exists())
+
+        response = self.api.post('/api/documents/documents/uploads/', {
+            'case': self.case.id, 'file_name': 'script.exe', 'total_size': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_03_abandoned_uploads_purged(self):
+        """Les sessions inactives et leurs fichiers partiels sont supprimés"""
+        url = self.start()
+        self.put(url, 0, CONTENT[:1024])
+        session = UploadSession.objects.get()
+        self.assertTrue(os.path.exists(uploads.partial_path(session)))
+
+        self.assertEqual(uploads.purge_expired(), 0)
+        self.assertEqual(uploads.purge_expired(now=timezone.now() + timedelta(days=3)), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(uploads.partial_path(session)))
+
+        # Purge faite aussi par le planificateur
+        self.put(self.start(), 0, CONTENT[:1024])
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=3))
+        output = io.StringIO()
+        call_command('run_reminders', stdout=output)
+        self.assertIn('1 upload(s) abandonné(s) supprimé(s)', output.getvalue())
+        self.assertFalse(UploadSession.objects.exists())
@@ -0,0 +1,154 @@
+"""
+Uploads découpés et reprenables pour les gros fichiers (scans volumineux).
+
+Protocole (voir DocumentViewSet) :
+
+1. POST   documents/uploads/                 -> session (id, offset 0, chunk_size)
+2. PUT    documents/uploads/<id>/            corps brut, en-tête Upload-Offset
+   (et facultativement Upload-Checksum: sha256 <base64> du morceau)
+3. GET    documents/uploads/<id>/            -> offset reçu, pour reprendre après une coupure
+4. POST   documents/uploads/<id>/complete/   -> document créé
+
+Chaque morceau est lu par blocs depuis le flux de la requête et écrit
+directement dans le fichier partiel : la mémoire consommée est bornée par
+un bloc, quelle que soit la taille du fichier. Un morceau n'est pris en compte
+(offset avancé) qu'une fois entièrement reçu, vérifié et synchronisé sur disque ;
+un morceau interrompu est tronqué et sera renvoyé depuis le même offset.
+À la fin, le fichier partiel est déplacé (et non copié) dans le stockage.
+
+Les sessions abandonnées sont supprimées par `manage.py purge_uploads`.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+import base64
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK = 64 * 1024
+
+
+class UploadError(Exception):
+    """Morceau refusé ; `status` est le code HTTP à renvoyer."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class AssembledFile(File):
+    """
+    Fichier partiel complet. `temporary_file_path` permet à FileSystemStorage
+    de le déplacer dans MEDIA_ROOT au lieu de le recopier.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def partial_path(session):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{session.pk}.part')
+
+
+def expires_at(session):
+    return session.updated_at + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+
+
+def parse_checksum(header):
+    """En-tête « sha256 <base64> » -> empreinte binaire, None si absent."""
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError("Seul l'algorithme sha256 est accepté pour Upload-Checksum.")
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except ValueError:
+        raise UploadError("Upload-Checksum invalide.")
+
+
+def write_chunk(session, offset, stream, length, checksum=None):
+    """
+    Écrit `length` octets lus dans `stream` à la position `offset` du fichier
+    partiel. La session doit être verrouillée par l'appelant (select_for_update).
+    Retourne le nouvel offset.
+    """
+    if offset != session.received:
+        raise UploadError(f"Offset attendu : {session.received}.", status=409)
+    if length <= 0 or length > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadError(f"Taille de morceau invalide (1 à {settings.UPLOAD_CHUNK_SIZE} octets).", status=413)
+    if offset + length > session.total_size:
+        raise UploadError("Le morceau dépasse la taille annoncée du fichier.", status=413)
+
+    path = partial_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as target:
+        target.seek(offset)
+        target.truncate()  # Restes d'un morceau précédent interrompu
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            target.write(block)
+            digest.update(block)
+            written += len(block)
+
+        if written != length or (checksum is not None and digest.digest() != checksum):
+            target.truncate(offset)
+            if written != length:
+                raise UploadError("Morceau incomplet : renvoyer depuis le même offset.")
+            raise UploadError("Empreinte du morceau incorrecte.")
+
+        target.flush()
+        os.fsync(target.fileno())
+
+    session.received = offset + length
+    session.save(update_fields=['received', 'updated_at'])
+    return session.received
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assembled_file(session):
+    """
+    Fichier complet, prêt à être enregistré dans un FileField. Vérifie la taille
+    et, si elle a été annoncée, l'empreinte SHA-256 du fichier entier.
+    """
+    if session.received != session.total_size:
+        raise UploadError(f"Upload incomplet : {session.received}/{session.total_size} octets reçus.", status=409)
+    path = partial_path(session)
+    if session.sha256 and file_sha256(path) != session.sha256.lower():
+        raise UploadError("Empreinte SHA-256 du fichier incorrecte.")
+    return AssembledFile(open(path, 'rb'), name=session.file_name)
+
+
+def discard(session):
+    """Supprime le fichier partiel d'une session (terminée ou abandonnée)."""
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired(now=None):
+    """Supprime les sessions inactives depuis UPLOAD_SESSION_TTL_HOURS ; retourne leur nombre."""
+    from .models import UploadSession
+
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    expired = list(UploadSession.objects.filter(updated_at__lt=cutoff))
+    for session in expired:
+        discard(session)
+    UploadSession.objects.filter(pk__in=[session.pk for session in expired]).delete()
+    return len(expired)
@@ -1,12 +1,16 @@
 """
 Utilitaires pour créer des entrées dans le journal d'audit.
 """
-from .models import AuditLog
+from django.utils import timezone
+from . import audit
 
 
 def log_action(user, action, document=None, case=None, client=None, details='', request=None):
     """
     Crée une entrée dans le journal d'audit.
+
+    L'écriture est différée et groupée selon AUDIT_BUFFER (voir documents/audit.py) ;
+    l'horodatage est celui de l'action, pas celui de l'écriture.
     
     Args:
         user: L'utilisateur qui effectue l'action
@@ -31,16 +35,54 @@ def log_action(user, action, document=None, case=None, client=None, details='',
         # Extraire le user agent
         user_agent = request.META.get('HTTP_USER_AGENT', '')[:500]
     
-    AuditLog.objects.create(
-        user=user,
-        action=action,
-        document=document,
-        case=case,
-        client=client,
-        details=details,
-        ip_address=ip_address,
-        user_agent=user_agent
-    )
+    audit.record({
+        'user_id': user.pk if user is not None and user.is_authenticated else None,
+        'action': action,
+        'document_id': document.pk if document is not None else None,
+        'case_id': case.pk if case is not None else None,
+        'client_id': client.pk if client is not None else None,
+        'details': details,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'timestamp': timezone.now(),
+    })
+
+
+def send_notifications(notifications):
+    """
+    Insère un lot de notifications (instances non sauvegardées) en une requête.
+    Point de passage unique de toutes les notifications : après validation de la
+    transaction, elles sont poussées aux navigateurs connectés (voir notification_events.py).
+    """
+    from .models import Notification
+    from .notification_events import notifications_sent
+    created = Notification.objects.bulk_create(notifications, batch_size=1000)
+    notifications_sent(created)
+    return created
+
+
+def notify_users(recipients, title, message, level='INFO', entity_type='SYSTEM', entity_id=None, exclude=None):
+    """
+    Envoie la même notification à plusieurs destinataires.
+
+    Args:
+        recipients: QuerySet d'utilisateurs (résolu en une requête) ou itérable d'utilisateurs / d'identifiants
+        exclude: Utilisateur à ne pas notifier (en général l'auteur de l'action)
+        (autres arguments : voir send_notification)
+    """
+    from .models import Notification
+    if hasattr(recipients, 'values_list'):
+        user_ids = list(recipients.values_list('pk', flat=True))
+    else:
+        user_ids = [getattr(recipient, 'pk', recipient) for recipient in recipients]
+    excluded = getattr(exclude, 'pk', exclude)
+    return send_notifications([
+        Notification(
+            user_id=user_id, title=title, message=message,
+            level=level, entity_type=entity_type, entity_id=entity_id
+        )
+        for user_id in dict.fromkeys(user_ids) if user_id != excluded
+    ])
 
 
 def send_notification(user, title, message, level='INFO', entity_type='SYSTEM', entity_id=None):
@@ -56,11 +98,11 @@ def send_notification(user, title, message, level='INFO', entity_type='SYSTEM',
         entity_id: ID de l'entité liée
     """
     from .models import Notification
-    return Notification.objects.create(
+    return send_notifications([Notification(
         user=user,
         title=title,
         message=message,
         level=level,
         entity_type=entity_type,
         entity_id=entity_id
-    )
+    )])[0]
@@ -0,0 +1,290 @@
+"""
+Stockage des versions de documents par fragments partagés.
+
+Deux versions identiques partagent déjà le même blob (blobstore.py). Les
+brouillons successifs d'un même acte diffèrent en revanche de quelques
+pages : chaque version était une copie complète. Les versions anciennes sont
+donc découpées en fragments (VersionChunk), eux-mêmes stockés comme blobs :
+un fragment commun à plusieurs versions n'est stocké qu'une fois.
+
+- Découpage selon le contenu : une coupure est placée après un octet repère
+  (saut de ligne) dont la fenêtre précédente a une empreinte CRC32 multiple
+  de 256. Une insertion ou une suppression ne décale que les fragments
+  voisins ; les suivants retrouvent les mêmes coupures et sont partagés.
+  Seuls les repères sont examinés (recherche en C), ce qui garde le
+  découpage rapide en Python ; tailles bornées entre MIN_CHUNK et MAX_CHUNK ;
+- `pack_versions` (commande `versions`, à planifier) découpe les versions
+  au-delà des VERSION_FULL_COPIES plus récentes de chaque document, qui
+  restent des fichiers entiers (lecture directe, nginx) ;
+- `open_version` reconstitue une version découpée au fil de la lecture,
+  fragment par fragment, avec accès à une position (requêtes Range) ;
+- `prune_generated` supprime les versions générées automatiquement (PDF
+  recherchable produit à chaque OCR) au-delà des plus récentes.
+
+Les fragments passent par le stockage des blobs : comptage de références,
+ramasse-miettes, chiffrement et rotation des clés s'y appliquent.
+"""
+from bisect import bisect_right
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils.http import quote_etag
+from itertools import accumulate
+from . import blobstore, encryption, file_serving
+from .blobstore import BLOB_PREFIX, blob_name, blob_storage
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 256 * 1024
+ANCHOR = b'\n'
+WINDOW = 48
+CUT_MASK = 0xFF
+CHUNK_EXTENSION = '.chunk'
+READ_BLOCK = 1024 * 1024
+
+
+# ---------------------------------------------------------------------------
+# Découpage et reconstitution
+# ---------------------------------------------------------------------------
+
+def _find_cut(buffer):
+    """Fin du premier fragment de `buffer` selon le contenu, None s'il n'y a pas de coupure avant MAX_CHUNK."""
+    limit = min(len(buffer), MAX_CHUNK)
+    position = buffer.find(ANCHOR, MIN_CHUNK, limit)
+    while position != -1:
+        if zlib.crc32(buffer[position - WINDOW:position + 1]) & CUT_MASK == 0:
+            return position + 1
+        position = buffer.find(ANCHOR, position + 1, limit)
+    return None
+
+
+def iter_chunks(stream):
+    """Fragments successifs du contenu de `stream` (fichier binaire) ; mémoire bornée par MAX_CHUNK + READ_BLOCK."""
+    buffer = bytearray()
+    eof = False
+    while True:
+        while not eof and len(buffer) < MAX_CHUNK:
+            block = stream.read(READ_BLOCK)
+            eof = not block
+            buffer += block
+        if not buffer:
+            return
+        cut = _find_cut(buffer) or min(len(buffer), MAX_CHUNK)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+
+class ChunkedReader(io.RawIOBase):
+    """Vue positionnable de la concaténation de fragments [(nom de blob, taille)] ; un fragment en mémoire."""
+
+    def __init__(self, chunks):
+        self.names = [name for name, _ in chunks]
+        self.offsets = list(accumulate((size for _, size in chunks), initial=0))
+        self.size = self.offsets[-1]
+        self.position = 0
+        self._cached_index, self._cached = None, b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _chunk(self, index):
+        if index != self._cached_index:
+            name = self.names[index]
+            with blob_storage.open(name) as source:
+                data = source.read()
+            if hashlib.sha256(data).hexdigest() != os.path.basename(name).split('.')[0]:
+                raise OSError(f"Fragment altéré : {name}")
+            self._cached_index, self._cached = index, data
+        return self._cached
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        index = bisect_right(self.offsets, self.position) - 1
+        offset = self.position - self.offsets[index]
+        chunk = self._chunk(index)[offset:offset + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Position négative.")
+        self.position = offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+def is_packed(version):
+    return not version.file
+
+
+def _reader(version):
+    return ChunkedReader(list(version.chunks.order_by('position').values_list('file', 'size')))
+
+
+def open_version(version):
+    """(fichier ouvert en clair, taille) du contenu d'une version, entière ou découpée."""
+    if is_packed(version):
+        reader = _reader(version)
+        return io.BufferedReader(reader, buffer_size=MAX_CHUNK), reader.size
+    path = version.file.path
+    return encryption.open_plain(path), encryption.plaintext_size(path)
+
+
+@contextmanager
+def plain_path(version):
+    """Chemin d'un fichier en clair de la version (copie temporaire si elle est découpée ou chiffrée)."""
+    if not is_packed(version):
+        with encryption.plain_path(version.file.path) as path:
+            yield path
+        return
+    handle, copy_path = tempfile.mkstemp(suffix=os.path.splitext(version.file_name)[1])
+    try:
+        source, _ = open_version(version)
+        with os.fdopen(handle, 'wb') as copy, source:
+            shutil.copyfileobj(source, copy, READ_BLOCK)
+        yield copy_path
+    finally:
+        os.remove(copy_path)
+
+
+def serve_version(request, version, as_attachment=True):
+    """Téléchargement d'une version ; une version découpée est reconstituée par Django."""
+    if not is_packed(version):
+        return file_serving.serve_file(request, version.file, version.file_name, as_attachment)
+    reader = _reader(version)
+    # Une version ne change jamais : son identifiant suffit comme validateur
+    etag = quote_etag(f'v{version.pk}-{reader.size:x}')
+    return file_serving.serve_content(
+        request, lambda: io.BufferedReader(reader, buffer_size=MAX_CHUNK), reader.size, etag,
+        int(version.uploaded_at.timestamp()), version.file_name, as_attachment,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Découpage des versions anciennes
+# ---------------------------------------------------------------------------
+
+def _store_chunk(data):
+    """Nom du blob du fragment ; True si le fragment est nouveau."""
+    name = blob_name(hashlib.sha256(data).hexdigest(), CHUNK_EXTENSION)
+    path = blob_storage.path(name)
+    with transaction.atomic():
+        # Comme ContentAddressedStorage._save : ligne verrouillée, le ramasse-miettes ne supprime pas
+        # le fragment entre le test d'existence et sa réutilisation
+        blobstore.claim(name)
+        if os.path.exists(path):
+            os.utime(path)
+            return name, False
+        blob_storage.save(name, ContentFile(data))
+    return name, True
+
+
+def pack_version(version):
+    """
+    Découpe une version entière en fragments et libère son fichier.
+    Retourne (fragments, fragments nouveaux, octets nouveaux), None si la version a changé entre-temps.
+    """
+    from .models import DocumentVersion, VersionChunk
+
+    old_name = version.file.name
+    chunks, new_chunks, new_bytes = [], 0, 0
+    digest = hashlib.sha256()
+    with encryption.open_plain(version.file.path) as source:
+        for data in iter_chunks(source):
+            digest.update(data)
+            name, created = _store_chunk(data)
+            chunks.append((name, len(data)))
+            if created:
+                new_chunks += 1
+                new_bytes += len(data)
+    if digest.hexdigest() != os.path.basename(old_name).split('.')[0]:
+        raise OSError(f"Empreinte différente du nom du blob : {old_name}")
+
+    with transaction.atomic():
+        if not DocumentVersion.objects.select_for_update().filter(pk=version.pk, file=old_name).exists():
+            # Supprimée ou déjà découpée : les fragments écrits sans référence iront au ramasse-miettes
+            return None
+        VersionChunk.objects.bulk_create([
+            VersionChunk(version_id=version.pk, position=position, file=name, size=size)
+            for position, (name, size) in enumerate(chunks)
+        ])
+        # bulk_create et update() n'émettent pas de signaux : compteurs mis à jour ici
+        deltas = Counter(name for name, _ in chunks)
+        deltas[old_name] -= 1
+        blobstore.apply_refcount_deltas(deltas)
+        DocumentVersion.objects.filter(pk=version.pk).update(file='')
+    return len(chunks), new_chunks, new_bytes
+
+
+def _ranked(queryset):
+    """Versions numérotées par document, de la plus récente (1) à la plus ancienne."""
+    return queryset.annotate(
+        rank=Window(RowNumber(), partition_by=[F('document_id')], order_by=F('version_number').desc())
+    )
+
+
+def pack_versions(keep_full=None):
+    """
+    Découpe les versions entières au-delà des `keep_full` plus récentes de
+    chaque document. Retourne les compteurs : versions, chunks, new_chunks, new_bytes, bytes.
+    """
+    from .models import DocumentVersion
+
+    keep_full = settings.VERSION_FULL_COPIES if keep_full is None else keep_full
+    stats = Counter()
+    candidates = _ranked(DocumentVersion.objects.filter(file__startswith=BLOB_PREFIX)).filter(rank__gt=keep_full)
+    for version in candidates.order_by('document_id', 'version_number').iterator(chunk_size=100):
+        try:
+            result = pack_version(version)
+        except (OSError, encryption.EncryptionError) as e:
+            logger.error("Découpage impossible de la version %s : %s", version.pk, e)
+            stats['failed'] += 1
+            continue
+        if result is None:
+            continue
+        chunks, new_chunks, new_bytes = result
+        stats['versions'] += 1
+        stats['chunks'] += chunks
+        stats['new_chunks'] += new_chunks
+        stats['new_bytes'] += new_bytes
+        stats['bytes'] += version.file_size
+    return stats
+
+
+def prune_generated(keep, document=None):
+    """
+    Supprime les versions générées automatiquement au-delà des `keep` plus
+    récentes de chaque document (ou du seul `document`). Retourne le nombre de versions supprimées.
+    """
+    from .models import DocumentVersion
+
+    queryset = DocumentVersion.objects.filter(is_generated=True)
+    if document is not None:
+        queryset = queryset.filter(document=document)
+    doomed = list(_ranked(queryset).filter(rank__gt=keep).values_list('pk', flat=True))
+    # delete() par lignes : les signaux décrémentent les compteurs des blobs et des fragments
+    DocumentVersion.objects.filter(pk__in=doomed).delete()
+    return len(doomed)
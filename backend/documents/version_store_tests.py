@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from documents.models import Blob, Client as LawClient, Case, Document, DocumentVersion, VersionChunk
+from documents import blobstore, version_store
+import hashlib
+import io
+import shutil
+import tempfile
+
+User = get_user_model()
+
+
+def pseudo_random(size, seed):
+    """Contenu peu compressible et reproductible (comme les flux d'un PDF)."""
+    blocks, counter = [], 0
+    while sum(map(len, blocks)) < size:
+        blocks.append(hashlib.sha256(f'{seed}-{counter}'.encode()).digest())
+        counter += 1
+    return b''.join(blocks)[:size]
+
+
+DRAFT = pseudo_random(900 * 1024, 'brouillon')
+# Paragraphe inséré au milieu, puis annexe ajoutée à la fin
+REVISED = DRAFT[:400 * 1024] + b'Nouveau paragraphe.\n' * 20 + DRAFT[400 * 1024:]
+FINAL = REVISED + pseudo_random(100 * 1024, 'annexe')
+
+
+class VersionStoreTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(username='admin.versions', password='x', role='ADMIN')
+        law_client = LawClient.objects.create(name='Client versions', created_by=self.admin)
+        case = Case.objects.create(client=law_client, opened_date=timezone.now().date(), created_by=self.admin)
+        self.document = Document.objects.create(
+            case=case, title='Conclusions', file=SimpleUploadedFile('conclusions.pdf', FINAL), uploaded_by=self.admin
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def new_version(self, number, content, **fields):
+        return DocumentVersion.objects.create(
+            document=self.document, version_number=number, file=SimpleUploadedFile('conclusions.pdf', content),
+            file_name=fields.pop('file_name', 'conclusions.pdf'), file_size=len(content), **fields
+        )
+
+    def test_01_chunks_survive_insertion(self):
+        """Coupures selon le contenu : après une insertion, seuls les fragments voisins changent"""
+        draft = list(version_store.iter_chunks(io.BytesIO(DRAFT)))
+        revised = list(version_store.iter_chunks(io.BytesIO(REVISED)))
+        self.assertEqual(b''.join(revised), REVISED)
+        self.assertTrue(all(version_store.MIN_CHUNK < len(chunk) <= version_store.MAX_CHUNK for chunk in draft[:-1]))
+        self.assertGreater(len(draft), 5)
+        self.assertLessEqual(len(set(revised) - set(draft)), 2)
+
+    def test_02_packed_versions_share_chunks_and_download(self):
+        """Versions anciennes découpées, fragments partagés, reconstitution au téléchargement ; compteurs cohérents"""
+        versions = [self.new_version(1, DRAFT), self.new_version(2, REVISED), self.new_version(3, FINAL)]
+        stats = version_store.pack_versions(keep_full=1)
+        self.assertEqual(stats['versions'], 2)
+        # Deux copies complètes auparavant ; la révision n'ajoute que ses fragments modifiés
+        self.assertLess(stats['new_bytes'], len(DRAFT) + len(REVISED) // 2)
+
+        versions = [DocumentVersion.objects.get(pk=version.pk) for version in versions]
+        self.assertEqual([version_store.is_packed(version) for version in versions], [True, True, False])
+        shared = VersionChunk.objects.filter(version=versions[1], file__in=versions[0].chunks.values('file'))
+        self.assertGreater(shared.count(), 3)
+        self.assertEqual(blobstore.recount(), 0)
+
+        url = f'/api/documents/versions/{versions[1].pk}/download/'
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), REVISED)
+        response = self.api.get(url, HTTP_RANGE='bytes=409000-409999', HTTP_IF_RANGE=response['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), REVISED[409000:410000])
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # Suppression : les fragments qui ne sont plus partagés perdent leur dernière référence
+        versions[0].delete()
+        self.assertEqual(blobstore.recount(), 0)
+        self.assertTrue(Blob.objects.filter(refcount=0, name__endswith='.chunk').exists())
+
+    def test_03_prune_generated_versions(self):
+        """Seules les versions générées les plus anciennes sont supprimées"""
+        kept = self.new_version(1, DRAFT)
+        for number in (2, 3, 4):
+            self.new_version(number, FINAL + bytes([number]), file_name='Searchable_Full_conclusions.pdf', is_generated=True)
+
+        call_command('versions', '--prune-generated', '1', '--keep-full', '99', stdout=io.StringIO())
+        self.assertEqual(list(self.document.versions.values_list('version_number', flat=True)), [4, 1])
+        self.assertTrue(DocumentVersion.objects.filter(pk=kept.pk).exists())
+        with self.assertRaises(CommandError):
+            call_command('versions', '--prune-generated', '0', stdout=io.StringIO())
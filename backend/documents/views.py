@@ -8,20 +8,33 @@ from rest_framework.permissions import IsAuthenticated
 from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
 import logging
 import threading
-from django.db import transaction
-from django.db.models import Q, Sum
+from contextlib import ExitStack
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch, Q
 from django.utils import timezone
-from .models import Client, Case, Document, DocumentPermission, AuditLog, Tag, Deadline, DocumentVersion, Notification, Diligence, Task, Decision, AgendaEvent, AgendaHistory, AgendaNotification
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from .models import Client, Case, Document, DocumentPage, DocumentPermission, UploadSession, AuditLog, Tag, Deadline, DocumentVersion, Notification, Diligence, Task, Decision, AgendaEvent, AgendaHistory, AgendaNotification
 from .serializers import (
     ClientSerializer, CaseListSerializer, CaseDetailSerializer,
     DocumentSerializer, DocumentListSerializer, DocumentUploadSerializer, DocumentPermissionSerializer,
     AuditLogSerializer, TagSerializer, DeadlineSerializer, DocumentVersionSerializer,
     NotificationSerializer, DiligenceSerializer, TaskSerializer, DecisionSerializer,
-    AgendaEventSerializer, ReportAgendaSerializer, AgendaHistorySerializer
+    AgendaEventSerializer, ReportAgendaSerializer, AgendaHistorySerializer, UploadSessionSerializer
 )
 from .permissions import IsAdminOrReadOnly, CanDeleteDocuments, HasDocumentPermission
 from .ocr import process_document_ocr
-from .utils import log_action, send_notification
+from .utils import log_action, notify_users, send_notification
+from .ai_service import AIServiceBusy
+from .dashboard import get_dashboard_stats
+from .rollups import get_counters_with_prefix, tag_usage_counter
+from .annotations import subquery_count
+from .access import restrict_documents
+from .pagination import AgendaHistoryPagination, KeysetPagination, OptInCursorPagination
+from . import audit_export, case_export, encryption, file_serving, notification_events, previews, uploads, version_store
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +43,7 @@ class ClientViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les clients.
     """
-    queryset = Client.objects.all().prefetch_related('cases')
+    queryset = Client.objects.select_related('created_by').annotate(total_cases=subquery_count(Case, 'client'))
     serializer_class = ClientSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -98,64 +111,17 @@ class ClientViewSet(viewsets.ModelViewSet):
         Renvoie les statistiques globales pour le dashboard de manière performante.
         """
         is_client = hasattr(request.user, 'role') and request.user.role == 'CLIENT'
-        
+
         if is_client:
             # Stats restreintes pour un client
-            client_id = getattr(request.user, 'client_profile', None)
-            if not client_id:
+            client_profile = getattr(request.user, 'client_profile', None)
+            if not client_profile:
                 return Response({
                     'clients': 0, 'cases': 0, 'documents': 0, 'deadlines': 0, 'tags': 0
                 })
-            
-            client_id = client_id.id
-            return Response({
-                'clients': 1,
-                'cases': Case.objects.filter(client_id=client_id).count(),
-                'documents': Document.objects.filter(case__client_id=client_id).count(),
-                'deadlines': Deadline.objects.filter(case__client_id=client_id, is_completed=False).count(),
-                'tags': Tag.objects.filter(cases__client_id=client_id).distinct().count()
-            })
-        
-        active_clients = Client.objects.filter(cases__isnull=False).distinct()
-        
-        return Response({
-            'clients': active_clients.count(),
-            'particulier_clients': active_clients.filter(client_type='PARTICULIER').count(),
-            'entreprise_clients': active_clients.filter(client_type='ENTREPRISE').count(),
-            'cases': Case.objects.count(),
-            'categories': {
-                'CIVIL': Case.objects.filter(category='CIVIL').count(),
-                'COMMERCIAL': Case.objects.filter(category='COMMERCIAL').count(),
-                'SOCIAL': Case.objects.filter(category='SOCIAL').count(),
-                'PENAL': Case.objects.filter(category='PENAL').count(),
-                'CORRECTIONNEL': Case.objects.filter(category='CORRECTIONNEL').count(),
-                'TI_FAMILLE': Case.objects.filter(category='TI_FAMILLE').count(),
-            },
-            'civil_cases': Case.objects.filter(category__in=['CIVIL', 'COMMERCIAL', 'SOCIAL', 'TI_FAMILLE']).count(), # Compatibilité descendante
-            'penal_cases': Case.objects.filter(category__in=['PENAL', 'CORRECTIONNEL']).count(), # Compatibilité descendante
-            'documents': Document.objects.count(),
-            'ocr_documents': Document.objects.filter(ocr_processed=True).count(),
-            'heavy_documents_size': Document.objects.filter(file_size__gt=100*1024).aggregate(total=Sum('file_size'))['total'] or 0,
-            
-            'total_audit_logs': AuditLog.objects.count(),
-            'today_audit_logs': AuditLog.objects.filter(timestamp__date=timezone.now().date()).count(),
-            'security_audit_logs': AuditLog.objects.filter(action__in=['DELETE', 'PERMISSION']).count(),
-            
-            'deadlines_stats': {
-                'total': Deadline.objects.count(),
-                'overdue': Deadline.objects.filter(is_completed=False, due_date__lt=timezone.now()).count(),
-                'upcoming': Deadline.objects.filter(is_completed=False, due_date__gte=timezone.now()).count(),
-            },
-            'audiences_stats': {
-                'total': Deadline.objects.filter(deadline_type='AUDIENCE').count(),
-                'upcoming': Deadline.objects.filter(deadline_type='AUDIENCE', is_completed=False).count(),
-                'completed': Deadline.objects.filter(deadline_type='AUDIENCE', is_completed=True).count(),
-            },
-            'total_decisions': Decision.objects.count(),
-            
-            'deadlines': Deadline.objects.filter(is_completed=False).count(), # Compatibilité
-            'tags': Tag.objects.count()
-        })
+            return Response(get_dashboard_stats(client_id=client_profile.id))
+
+        return Response(get_dashboard_stats())
 
     @action(detail=False, methods=['get'], url_path='health-check')
     def health_check(self, request):
@@ -208,7 +174,9 @@ class CaseViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les dossiers.
     """
-    queryset = Case.objects.select_related('client', 'created_by').prefetch_related('assigned_to', 'tags')
+    queryset = Case.objects.select_related('client', 'created_by').prefetch_related('assigned_to', 'tags').annotate(
+        total_documents=subquery_count(Document, 'case')
+    )
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['reference', 'title', 'description', 'client__name']
@@ -228,6 +196,15 @@ class CaseViewSet(viewsets.ModelViewSet):
         Filtre les dossiers selon les paramètres.
         """
         queryset = super().get_queryset()
+
+        if self.action == 'retrieve':
+            # Sous-dossiers et décisions affichés dans la fiche détaillée
+            queryset = queryset.select_related('client__created_by').prefetch_related(
+                Prefetch('sub_cases', queryset=Case.objects.select_related('client').prefetch_related('assigned_to').annotate(
+                    total_documents=subquery_count(Document, 'case')
+                )),
+                Prefetch('decisions', queryset=Decision.objects.select_related('created_by')),
+            )
         
         # Filtrer par client
         client_id = self.request.query_params.get('client', None)
@@ -269,16 +246,15 @@ class CaseViewSet(viewsets.ModelViewSet):
         )
         
         # Notification aux utilisateurs assignés
-        for user in case.assigned_to.all():
-            if user != self.request.user:
-                send_notification(
-                    user=user,
-                    title="Nouveau dossier assigné",
-                    message=f"Vous avez été assigné au dossier {case.reference}: {case.title}",
-                    level='SUCCESS',
-                    entity_type='CASE',
-                    entity_id=case.id
-                )
+        notify_users(
+            case.assigned_to.all(),
+            title="Nouveau dossier assigné",
+            message=f"Vous avez été assigné au dossier {case.reference}: {case.title}",
+            level='SUCCESS',
+            entity_type='CASE',
+            entity_id=case.id,
+            exclude=self.request.user
+        )
     
     def perform_update(self, serializer):
         """
@@ -308,6 +284,44 @@ class CaseViewSet(viewsets.ModelViewSet):
         )
         instance.delete()
 
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Archive ZIP du dossier (documents, pages, dernières versions, manifeste),
+        produite en flux. ?ocr=1 ajoute le texte OCR de chaque document.
+        Seuls les documents que l'utilisateur peut télécharger y figurent.
+        """
+        case = self.get_object()
+        include_ocr = request.query_params.get('ocr') in ('1', 'true')
+
+        documents = restrict_documents(Document.objects.filter(case=case), request.user).defer('search_vector')
+        if not include_ocr:
+            documents = documents.defer('ocr_text')
+        documents = documents.prefetch_related(
+            Prefetch('pages', queryset=DocumentPage.objects.only('id', 'document_id', 'file', 'page_number').order_by('page_number')),
+            Prefetch('versions', queryset=DocumentVersion.objects.order_by('-version_number')),
+        ).order_by('created_at', 'id')
+
+        log_action(
+            user=request.user,
+            action='DOWNLOAD',
+            case=case,
+            client=case.client,
+            details=f'Dossier exporté (ZIP): {case.reference}',
+            request=request
+        )
+        return case_export.export_response(
+            case, documents.iterator(chunk_size=100), include_ocr=include_ocr, exported_by=request.user
+        )
+
+    def _ai_busy_response(self, error):
+        """
+        Réponse 503 quand tous les créneaux d'appel IA sont occupés.
+        """
+        response = Response({"detail": str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(error.retry_after)
+        return response
+
     @action(detail=True, methods=['get'])
     def chat_init(self, request, pk=None):
         """
@@ -319,7 +333,7 @@ class CaseViewSet(viewsets.ModelViewSet):
         if not documents.exists():
             return Response({"detail": "Ce dossier ne contient aucun document."}, status=status.HTTP_400_BAD_REQUEST)
         
-        from .ai_service import GeminiService
+        from .ai_service import get_ai_service
         import fitz  # PyMuPDF
         import os
         import docx # python-docx
@@ -328,6 +342,8 @@ class CaseViewSet(viewsets.ModelViewSet):
         try:
             # 1. Fusionner les documents
             merged_doc = fitz.open()
+            # Copies déchiffrées ou reconstituées (versions découpées), supprimées après la fusion
+            copies = ExitStack()
             
             for doc in documents:
                 try:
@@ -335,10 +351,11 @@ class CaseViewSet(viewsets.ModelViewSet):
                     if hasattr(doc, 'versions'):
                         searchable = doc.versions.filter(file_name__icontains='searchable_').order_by('-version_number').first()
                         if searchable:
-                            file_path = searchable.file.path
+                            file_path = copies.enter_context(version_store.plain_path(searchable))
                     
                     if not os.path.exists(file_path):
                         continue
+                    file_path = copies.enter_context(encryption.plain_path(file_path))
                         
                     ext = file_path.lower().split('.')[-1]
                     
@@ -408,6 +425,7 @@ class CaseViewSet(viewsets.ModelViewSet):
                 except Exception as e:
                     logger.warning(f"Impossible de fusionner le document {doc.id}: {str(e)}")
                     continue
+            copies.close()
             
             if merged_doc.page_count == 0:
                 # Fallback: Créer un PDF avec un message d'erreur pour l'IA
@@ -419,7 +437,7 @@ class CaseViewSet(viewsets.ModelViewSet):
                 os.makedirs(os.path.dirname(output_path), exist_ok=True)
                 fallback.save(output_path)
                 fallback.close()
-                uploaded_file = GeminiService().upload_file(output_path)
+                uploaded_file = get_ai_service().upload_file(output_path)
                 return Response({
                     "status": "warning",
                     "session_id": uploaded_file.name,
@@ -435,8 +453,7 @@ class CaseViewSet(viewsets.ModelViewSet):
             merged_doc.close()
             
             # 2. Upload vers Gemini
-            service = GeminiService()
-            uploaded_file = service.upload_file(output_path)
+            uploaded_file = get_ai_service().upload_file(output_path)
             
             return Response({
                 "status": "success",
@@ -445,6 +462,8 @@ class CaseViewSet(viewsets.ModelViewSet):
                 "doc_count": documents.count()
             })
             
+        except AIServiceBusy as e:
+            return self._ai_busy_response(e)
         except Exception as e:
             logger.error(f"Erreur init chat {case.id}: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -453,25 +472,46 @@ class CaseViewSet(viewsets.ModelViewSet):
     def chat_message(self, request, pk=None):
         """
         Envoie un message au chatbot Gemini.
-        Body: { session_id, message, history }
+        Body: { session_id, message, history, stream }
+        Avec stream=true, la réponse est renvoyée en texte brut au fil de l'eau.
         """
         try:
             session_id = request.data.get('session_id')
             message = request.data.get('message')
             history = request.data.get('history', [])
-            
+
             if not session_id or not message:
                 return Response({"detail": "session_id et message requis"}, status=status.HTTP_400_BAD_REQUEST)
-                
-            from .ai_service import GeminiService
-            service = GeminiService()
-            
-            response_text = service.chat_with_document(session_id, history, message)
+
+            from .ai_service import get_ai_service
+
+            if request.data.get('stream'):
+                from django.http import StreamingHttpResponse
+                chunks = get_ai_service().stream_chat_with_document(session_id, history, message)
+                # Premier morceau obtenu avant de répondre : les erreurs (503, quota)
+                # remontent ainsi avec un vrai code HTTP
+                first_chunk = next(chunks, '')
+
+                def body():
+                    yield first_chunk
+                    try:
+                        yield from chunks
+                    except Exception as e:
+                        logger.error(f"Erreur chat stream: {str(e)}")
+
+                response = StreamingHttpResponse(body(), content_type='text/plain; charset=utf-8')
+                response['X-Accel-Buffering'] = 'no'
+                response['Cache-Control'] = 'no-cache'
+                return response
+
+            response_text = get_ai_service().chat_with_document(session_id, history, message)
             
             return Response({
                 "response": response_text
             })
             
+        except AIServiceBusy as e:
+            return self._ai_busy_response(e)
         except Exception as e:
             logger.error(f"Erreur chat message: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -481,12 +521,15 @@ class DocumentViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les documents.
     """
-    queryset = Document.objects.select_related('case', 'case__client', 'uploaded_by').prefetch_related('tags', 'permissions', 'versions', 'pages')
+    queryset = Document.objects.select_related('case', 'case__client', 'uploaded_by').prefetch_related('tags')
     permission_classes = [IsAuthenticated, CanDeleteDocuments, HasDocumentPermission]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description', 'file_name', 'ocr_text']
     ordering_fields = ['title', 'created_at', 'file_size']
     ordering = ['-created_at']
+    # ?pagination=cursor : pages de coût constant, dans l'ordre de dépôt
+    pagination_class = OptInCursorPagination
+    cursor_ordering = ('-created_at', '-id')
     
     def get_serializer_class(self):
         """
@@ -503,6 +546,10 @@ class DocumentViewSet(viewsets.ModelViewSet):
         Filtre les documents selon les paramètres et permissions.
         """
         queryset = super().get_queryset()
+
+        # Pages et versions ne figurent pas dans la liste (DocumentListSerializer)
+        if self.action != 'list':
+            queryset = queryset.prefetch_related('versions', 'pages')
         
         # Filtrer par dossier
         case_id = self.request.query_params.get('case', None)
@@ -519,23 +566,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
         if client_id and str(client_id).isdigit():
             queryset = queryset.filter(case__client_id=client_id)
 
-        # Restriction client: voir uniquement les documents de ses dossiers
-        if hasattr(self.request.user, 'role') and self.request.user.role == 'CLIENT':
-            if hasattr(self.request.user, 'client_profile'):
-                queryset = queryset.filter(case__client=self.request.user.client_profile)
-            else:
-                return queryset.none()
-        
-        # Pour les non-admins (collaborateurs, stagiaires, secrétaires), 
-        # on peut limiter aux dossiers auxquels ils sont assignés ou documents partagés
-        elif not self.request.user.is_admin and not self.request.user.is_avocat:
-            queryset = queryset.filter(
-                Q(case__assigned_to=self.request.user) | 
-                Q(permissions__user=self.request.user) |
-                Q(uploaded_by=self.request.user)
-            ).distinct()
-        
-        return queryset
+        # Clients : leurs dossiers ; collaborateurs : documents affectés, partagés ou déposés
+        # (table d'accès précalculée, cf. access.py)
+        return restrict_documents(queryset, self.request.user)
     
     def perform_create(self, serializer):
         """
@@ -543,11 +576,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
         Supporte désormais l'upload multi-pages via un champ 'files' multiple.
         """
         # Validation client: uploader uniquement dans ses dossiers
-        if hasattr(self.request.user, 'role') and self.request.user.role == 'CLIENT':
-            case = serializer.validated_data.get('case')
-            if not hasattr(self.request.user, 'client_profile') or case.client != self.request.user.client_profile:
-                from rest_framework.exceptions import PermissionDenied
-                raise PermissionDenied("Vous ne pouvez créer des documents que dans vos propres dossiers.")
+        self._check_client_case(serializer.validated_data.get('case'))
 
         # Récupérer les fichiers multiples et l'indicateur multi-pages
         is_multi_page = self.request.data.get('is_multi_page', 'false').lower() == 'true'
@@ -589,6 +618,21 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 page_number=1
             )
         
+        self._document_created(document)
+
+    def _check_client_case(self, case):
+        """
+        Un client ne dépose des documents que dans ses propres dossiers.
+        """
+        if hasattr(self.request.user, 'role') and self.request.user.role == 'CLIENT':
+            if not hasattr(self.request.user, 'client_profile') or case.client != self.request.user.client_profile:
+                from rest_framework.exceptions import PermissionDenied
+                raise PermissionDenied("Vous ne pouvez créer des documents que dans vos propres dossiers.")
+
+    def _document_created(self, document):
+        """
+        Suite commune aux dépôts (formulaire ou upload découpé) : OCR, journal, notifications.
+        """
         self._launch_ocr_background(document.id)
         
         log_action(
@@ -606,15 +650,14 @@ class DocumentViewSet(viewsets.ModelViewSet):
         
         if is_client:
             # Notifier les avocats assignés au dossier
-            for user in document.case.assigned_to.all():
-                send_notification(
-                    user=user,
-                    title="Nouveau document client",
-                    message=f"Le client {self.request.user.get_full_name()} a déposé un document: {document.title}",
-                    level='INFO',
-                    entity_type='DOCUMENT',
-                    entity_id=document.id
-                )
+            notify_users(
+                document.case.assigned_to.all(),
+                title="Nouveau document client",
+                message=f"Le client {self.request.user.get_full_name()} a déposé un document: {document.title}",
+                level='INFO',
+                entity_type='DOCUMENT',
+                entity_id=document.id
+            )
         else:
             # Notifier le client si le dossier lui appartient
             if document.case.client and document.case.client.user:
@@ -627,6 +670,93 @@ class DocumentViewSet(viewsets.ModelViewSet):
                     entity_id=document.id
                 )
 
+    # --- Upload découpé et reprenable (voir documents/uploads.py) ---
+
+    def _upload_sessions(self):
+        return UploadSession.objects.filter(created_by=self.request.user).select_related('case', 'case__client')
+
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request):
+        """
+        Ouvre un upload découpé : métadonnées du document, nom et taille du fichier
+        (et facultativement son empreinte sha256). Retourne l'identifiant de session.
+        """
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self._check_client_case(serializer.validated_data['case'])
+        session = serializer.save(created_by=request.user)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get', 'put', 'delete'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})')
+    def upload_chunk(self, request, upload_id=None):
+        """
+        GET : état de la session (offset à partir duquel reprendre).
+        PUT : morceau suivant, corps brut avec l'en-tête Upload-Offset
+        (et facultativement Upload-Checksum: sha256 <base64>).
+        DELETE : abandon de l'upload.
+        """
+        if request.method == 'GET':
+            return Response(UploadSessionSerializer(get_object_or_404(self._upload_sessions(), pk=upload_id)).data)
+        if request.method == 'DELETE':
+            session = get_object_or_404(self._upload_sessions(), pk=upload_id)
+            uploads.discard(session)
+            session.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'detail': "En-tête Upload-Offset requis."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                # Un seul morceau à la fois par session : un envoi concurrent est refusé
+                session = get_object_or_404(self._upload_sessions().select_for_update(nowait=True), pk=upload_id)
+                if session.document_id:
+                    raise uploads.UploadError("Upload déjà terminé.", status=409)
+                checksum = uploads.parse_checksum(request.META.get('HTTP_UPLOAD_CHECKSUM'))
+                new_offset = uploads.write_chunk(session, offset, request.stream, length, checksum)
+        except DatabaseError:
+            return Response({'detail': "Un morceau est déjà en cours d'envoi."}, status=status.HTTP_409_CONFLICT)
+        except uploads.UploadError as e:
+            return Response({'detail': str(e), 'offset': session.received}, status=e.status)
+        return Response({'offset': new_offset, 'total_size': session.total_size})
+
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})/complete')
+    def complete_upload(self, request, upload_id=None):
+        """
+        Termine l'upload : vérifie taille et empreinte, crée le document (page 1 comprise).
+        Peut être rappelé sans risque : renvoie le document déjà créé.
+        """
+        created = False
+        try:
+            with transaction.atomic():
+                session = get_object_or_404(self._upload_sessions().select_for_update(), pk=upload_id)
+                if session.document_id is None:
+                    with uploads.assembled_file(session) as content:
+                        # Fichier partiel déplacé dans le stockage, sans recopie
+                        document = Document.objects.create(
+                            case=session.case, title=session.title, description=session.description,
+                            document_type=session.document_type, is_confidential=session.is_confidential,
+                            uploaded_by=request.user, file=content
+                        )
+                    uploads.discard(session)  # Contenu déjà stocké : le fichier partiel reste
+                    DocumentPage.objects.create(document=document, file=document.file, page_number=1)
+                    session.document = document
+                    session.save(update_fields=['document', 'updated_at'])
+                    created = True
+        except uploads.UploadError as e:
+            return Response({'detail': str(e), 'offset': session.received}, status=e.status)
+
+        if created:
+            # Après validation : le fil OCR doit voir le document
+            self._document_created(session.document)
+        document = Document.objects.get(pk=session.document_id)
+        return Response(
+            DocumentSerializer(document, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
     def perform_update(self, serializer):
         """
         Log la modification et relance l'OCR si le fichier a changé.
@@ -659,10 +789,22 @@ class DocumentViewSet(viewsets.ModelViewSet):
             action='VIEW',
             document=instance,
             case=instance.case,
+            client=instance.case.client,
             details=f'Document consulté: {instance.title}',
             request=request
         )
-        return super().retrieve(request, *args, **kwargs)
+        # Réutilise l'instance déjà chargée (et ses relations préchargées)
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    def _generate_previews(self, document):
+        """
+        Miniatures et aperçus, avant l'OCR (plus lent) : affichés dès les premières secondes.
+        """
+        try:
+            previews.generate_for_document(document)
+        except Exception as e:
+            logger.error(f"Erreur génération des aperçus pour document {document.id}: {str(e)}")
 
     def _launch_ocr_background(self, doc_id):
         """
@@ -673,6 +815,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 from .models import Document
                 from django.contrib.postgres.search import SearchVector
                 doc = Document.objects.get(pk=document_id)
+                self._generate_previews(doc)
                 process_document_ocr(doc)
                 Document.objects.filter(pk=document_id).update(
                     search_vector=SearchVector('title', 'description', 'ocr_text', 'file_name')
@@ -739,28 +882,35 @@ class DocumentViewSet(viewsets.ModelViewSet):
             return Response({"detail": "L'angle doit être un entier."}, status=status.HTTP_400_BAD_REQUEST)
 
         from PIL import Image
+        from django.core.files.base import ContentFile
+        import io
         import os
-        
-        file_paths = []
-        if document.file and os.path.exists(document.file.path):
-            file_paths.append(document.file.path)
-            
-        for page in document.pages.all():
-            if page.file and os.path.exists(page.file.path) and page.file.path not in file_paths:
-                file_paths.append(page.file.path)
-                
-        rotated = False
-        for path in file_paths:
-            ext = os.path.splitext(path)[1].lower()
-            if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
+
+        # Fichiers stockés par contenu, éventuellement partagés : l'image pivotée est
+        # enregistrée comme un nouveau fichier, l'original n'est jamais modifié.
+        rotated_names = {}
+        for item in [document, *document.pages.all()]:
+            name = item.file.name if item.file else None
+            if not name:
+                continue
+            if name not in rotated_names:
+                ext = os.path.splitext(name)[1].lower()
+                if ext not in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff'] or not item.file.storage.exists(name):
+                    continue
                 try:
-                    img = Image.open(path)
-                    rotated_img = img.rotate(-angle, expand=True) # Pil prend angle inverse (sens horaire vs trigo)
-                    rotated_img.save(path)
-                    rotated = True
+                    with item.file.storage.open(name, 'rb') as source:
+                        img = Image.open(source)
+                        rotated_img = img.rotate(-angle, expand=True) # Pil prend angle inverse (sens horaire vs trigo)
+                        buffer = io.BytesIO()
+                        rotated_img.save(buffer, format=img.format)
+                    rotated_names[name] = item.file.storage.save(name, ContentFile(buffer.getvalue()))
                 except Exception as e:
-                    logger.error(f"Erreur rotation image {path}: {e}")
-                    
+                    logger.error(f"Erreur rotation image {name}: {e}")
+                    continue
+            item.file.name = rotated_names[name]
+            item.save(update_fields=['file'])
+        rotated = bool(rotated_names)
+
         if not rotated:
             return Response({"detail": "Aucune image pivotable trouvée (seules les images JPG, PNG, etc. sont supportées)."}, status=status.HTTP_400_BAD_REQUEST)
             
@@ -822,6 +972,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
             action='UPDATE',
             document=document,
             case=document.case,
+            client=document.case.client,
             details=f'Nouvelle page ajoutée au document: {document.title}',
             request=self.request
         )
@@ -833,6 +984,7 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 from .ocr import process_document_ocr
                 from django.contrib.postgres.search import SearchVector
                 doc = Document.objects.get(pk=doc_id)
+                self._generate_previews(doc)
                 process_document_ocr(doc)
                 Document.objects.filter(pk=doc_id).update(
                     search_vector=SearchVector('title', 'description', 'ocr_text', 'file_name')
@@ -868,34 +1020,89 @@ class DocumentViewSet(viewsets.ModelViewSet):
     def download(self, request, pk=None):
         """
         Télécharge un document et log l'action.
+        Le transfert est délégué à nginx (X-Accel-Redirect) quand il est configuré ;
+        ?inline=1 permet l'affichage dans un lecteur PDF (requêtes Range).
         """
+        from rest_framework.exceptions import NotFound
+
         document = self.get_object()
-        log_action(
-            user=request.user,
-            action='DOWNLOAD',
-            document=document,
-            case=document.case,
-            details=f'Document téléchargé: {document.title}',
-            request=request
-        )
-        
-        from django.http import FileResponse
+        try:
+            response = file_serving.serve_file(
+                request, document.file, document.file_name,
+                as_attachment=request.query_params.get('inline') not in ('1', 'true'),
+            )
+        except (FileNotFoundError, ValueError):
+            logger.error(f"Fichier manquant sur le disque pour le document {document.id}: {document.file.name}")
+            raise NotFound("Le fichier physique est introuvable sur le serveur.")
+
+        # Un lecteur PDF enchaîne les requêtes Range : seul le premier accès est journalisé
+        if response.status_code in (200, 206) and file_serving.requested_range_start(request) == 0:
+            log_action(
+                user=request.user,
+                action='DOWNLOAD',
+                document=document,
+                case=document.case,
+                client=document.case.client,
+                details=f'Document téléchargé: {document.title}',
+                request=request
+            )
+        return response
+
+    @action(detail=True, methods=['GET'], url_path=r'pages/(?P<page_id>\d+)/download', url_name='page-download')
+    def page_download(self, request, pk=None, page_id=None):
+        """
+        Télécharge une page d'un document multi-pages, après contrôle d'accès au document.
+        ?inline=1 permet l'affichage dans le navigateur.
+        """
         import os
         from rest_framework.exceptions import NotFound
-        
+
+        document = self.get_object()
+        page = get_object_or_404(DocumentPage, pk=page_id, document=document)
+        file_name = f'{os.path.splitext(document.file_name)[0]}_p{page.page_number}{os.path.splitext(page.file.name)[1]}'
         try:
-            file_path = document.file.path
-            if not os.path.exists(file_path):
-                logger.error(f"Fichier manquant sur le disque: {file_path}")
-                raise NotFound("Le fichier physique est introuvable sur le serveur.")
-            
-            return FileResponse(document.file.open('rb'), as_attachment=True, filename=document.file_name)
-        except Exception as e:
-            if isinstance(e, NotFound):
-                raise e
-            logger.error(f"Erreur lors de l'ouverture du fichier {document.id}: {str(e)}")
-            return Response({"detail": "Erreur lors de l'accès au fichier."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
+            response = file_serving.serve_file(
+                request, page.file, file_name,
+                as_attachment=request.query_params.get('inline') not in ('1', 'true'),
+            )
+        except (FileNotFoundError, ValueError):
+            logger.error(f"Fichier manquant sur le disque pour la page {page.id}: {page.file.name}")
+            raise NotFound("Le fichier physique est introuvable sur le serveur.")
+
+        if response.status_code in (200, 206) and file_serving.requested_range_start(request) == 0:
+            log_action(
+                user=request.user,
+                action='DOWNLOAD',
+                document=document,
+                case=document.case,
+                client=document.case.client,
+                details=f'Page {page.page_number} téléchargée: {document.title}',
+                request=request
+            )
+        return response
+
+    @action(detail=True, methods=['GET'], url_path=r'preview/(?P<size>thumb|page)')
+    def preview(self, request, pk=None, size=None):
+        """
+        Miniature ou aperçu (WebP) du document, après contrôle d'accès ; généré s'il manque.
+        ?page=N pour une autre page d'un PDF.
+        """
+        document = self.get_object()
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            raise ValidationError({'page': 'Numéro de page invalide.'})
+        return previews.serve_preview(request, document.file, size, page)
+
+    @action(detail=True, methods=['GET'], url_path=r'pages/(?P<page_id>\d+)/preview/(?P<size>thumb|page)', url_name='page-preview')
+    def page_preview(self, request, pk=None, page_id=None, size=None):
+        """
+        Miniature ou aperçu (WebP) d'une page d'un document multi-pages, après contrôle d'accès au document.
+        """
+        document = self.get_object()
+        page = get_object_or_404(DocumentPage, pk=page_id, document=document)
+        return previews.serve_preview(request, page.file, size)
+
     @action(detail=False, methods=['GET'])
     def search(self, request):
         """
@@ -909,7 +1116,8 @@ class DocumentViewSet(viewsets.ModelViewSet):
         # Recherche PostgreSQL full-text
         search_query = SearchQuery(query, config='french')
         
-        documents = Document.objects.annotate(
+        # get_queryset applique les restrictions par rôle et les préchargements
+        documents = self.get_queryset().annotate(
             rank=SearchRank('search_vector', search_query)
         ).filter(
             Q(search_vector=search_query) |
@@ -931,7 +1139,7 @@ class DocumentPermissionViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les permissions de documents.
     """
-    queryset = DocumentPermission.objects.all()
+    queryset = DocumentPermission.objects.select_related('user', 'document__case__client', 'granted_by')
     serializer_class = DocumentPermissionSerializer
     permission_classes = [IsAuthenticated]
     
@@ -960,6 +1168,8 @@ class DocumentPermissionViewSet(viewsets.ModelViewSet):
             user=self.request.user,
             action='PERMISSION',
             document=permission.document,
+            case=permission.document.case,
+            client=permission.document.case.client,
             details=f'Permission {permission.permission_level} accordée à {permission.user.username}',
             request=self.request
         )
@@ -968,12 +1178,13 @@ class DocumentPermissionViewSet(viewsets.ModelViewSet):
 class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet en lecture seule pour les logs d'audit.
+    Liste paginée par curseur (keyset) : coût constant quelle que soit la page.
     """
     queryset = AuditLog.objects.select_related('user', 'document', 'case', 'client').all()
     serializer_class = AuditLogSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.OrderingFilter]
-    ordering = ['-timestamp']
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-timestamp', '-id')
     
     def get_queryset(self):
         """
@@ -1000,9 +1211,55 @@ class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
         document_id = self.request.query_params.get('document', None)
         if document_id:
             queryset = queryset.filter(document_id=document_id)
-        
+
+        # Filtrer par dossier / client
+        case_id = self.request.query_params.get('case', None)
+        if case_id:
+            queryset = queryset.filter(case_id=case_id)
+        client_id = self.request.query_params.get('client', None)
+        if client_id:
+            # Entrées anciennes sans client renseigné : rattachées par leur dossier ou document
+            queryset = queryset.filter(
+                Q(client_id=client_id) | Q(case__client_id=client_id) | Q(document__case__client_id=client_id)
+            )
+
+        # Période (dates incluses) : bornes sur timestamp, seules les partitions mensuelles concernées sont lues
+        date_from = self._param_date('date_from')
+        if date_from:
+            queryset = queryset.filter(timestamp__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+        date_to = self._param_date('date_to')
+        if date_to:
+            queryset = queryset.filter(timestamp__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+
         return queryset
 
+    def _param_date(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({name: 'Date invalide (format AAAA-MM-JJ).'})
+        return parsed
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Export en flux de toutes les entrées filtrées (mêmes paramètres que la liste),
+        du plus ancien au plus récent. `?output=csv` (défaut) ou `?output=jsonl`.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in audit_export.FORMATS:
+            return Response(
+                {'output': f"Format inconnu, valeurs possibles : {', '.join(audit_export.FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.get_queryset().select_related(None)
+        return audit_export.export_response(queryset, output)
+
 
 class TagViewSet(viewsets.ModelViewSet):
     """
@@ -1018,12 +1275,11 @@ class TagViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """
-        Ajoute les compteurs de documents et dossiers.
+        Ajoute les compteurs de documents et dossiers, lus dans la table de cumul.
         """
-        from django.db.models import Count
         return Tag.objects.annotate(
-            document_count=Count('documents', distinct=True),
-            case_count=Count('cases', distinct=True)
+            document_count=tag_usage_counter('documents'),
+            case_count=tag_usage_counter('cases')
         )
 
 
@@ -1031,51 +1287,15 @@ class DeadlineViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les échéances.
     """
-    queryset = Deadline.objects.select_related('case', 'created_by', 'completed_by').all()
+    queryset = Deadline.objects.select_related(
+        'case', 'created_by', 'completed_by', 'decision__case__client', 'decision__created_by'
+    )
     serializer_class = DeadlineSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description', 'case__reference', 'case__title']
     ordering_fields = ['due_date', 'created_at']
     ordering = ['due_date']
-
-    def check_upcoming_deadlines(self):
-        """
-        Vérifie les échéances proches et envoie des notifications.
-        """
-        from datetime import timedelta
-        from django.utils import timezone
-        
-        now = timezone.now()
-        # On vérifie les échéances à moins de 3 jours qui n'ont pas encore été notifiées
-        upcoming = Deadline.objects.filter(
-            is_completed=False,
-            notification_sent=False,
-            due_date__lte=now + timedelta(days=3)
-        )
-        
-        for deadline in upcoming:
-            if deadline.created_by:
-                send_notification(
-                    user=deadline.created_by,
-                    title="Échéance Imminente",
-                    message=f"Rappel: l'échéance '{deadline.title}' est prévue pour le {deadline.due_date.strftime('%d/%m/%Y')}.",
-                    level='WARNING',
-                    entity_type='DEADLINE',
-                    entity_id=deadline.id
-                )
-                deadline.notification_sent = True
-                deadline.save(update_fields=['notification_sent'])
-
-    def list(self, request, *args, **kwargs):
-        """
-        Déclenche la vérification des échéances lors du listing.
-        """
-        try:
-            self.check_upcoming_deadlines()
-        except Exception as e:
-            logger.error(f"Erreur check_upcoming_deadlines: {str(e)}")
-        return super().list(request, *args, **kwargs)
     
     def get_queryset(self):
         """
@@ -1152,7 +1372,7 @@ class DocumentVersionViewSet(viewsets.ModelViewSet):
     """
     ViewSet pour gérer les versions de documents.
     """
-    queryset = DocumentVersion.objects.select_related('document', 'uploaded_by').all()
+    queryset = DocumentVersion.objects.select_related('document__case__client', 'uploaded_by').all()
     serializer_class = DocumentVersionSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
@@ -1194,6 +1414,38 @@ class DocumentVersionViewSet(viewsets.ModelViewSet):
             file_size=file_size
         )
 
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Télécharge une version (reconstituée si elle est découpée en fragments) et log l'action.
+        ?inline=1 permet l'affichage dans un lecteur PDF (requêtes Range).
+        """
+        from rest_framework.exceptions import NotFound
+
+        version = self.get_object()
+        document = version.document
+        if not restrict_documents(Document.objects.filter(pk=document.pk), request.user).exists():
+            raise NotFound()
+        try:
+            response = version_store.serve_version(
+                request, version, as_attachment=request.query_params.get('inline') not in ('1', 'true'),
+            )
+        except (FileNotFoundError, ValueError):
+            logger.error(f"Fichier manquant sur le disque pour la version {version.id}: {version.file.name}")
+            raise NotFound("Le fichier physique est introuvable sur le serveur.")
+
+        if response.status_code in (200, 206) and file_serving.requested_range_start(request) == 0:
+            log_action(
+                user=request.user,
+                action='DOWNLOAD',
+                document=document,
+                case=document.case,
+                client=document.case.client,
+                details=f'Version {version.version_number} téléchargée: {document.title}',
+                request=request
+            )
+        return response
+
 
 class NotificationViewSet(viewsets.ModelViewSet):
     """
@@ -1201,6 +1453,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
     """
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptInCursorPagination
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         """
@@ -1208,6 +1462,14 @@ class NotificationViewSet(viewsets.ModelViewSet):
         """
         return Notification.objects.filter(user=self.request.user)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        notification_events.read_state_changed(self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        notification_events.read_state_changed(self.request.user.pk)
+
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         """
@@ -1216,6 +1478,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
         notification = self.get_object()
         notification.is_read = True
         notification.save()
+        notification_events.read_state_changed(request.user.pk)
         return Response({'status': 'notification marquée comme lue'})
 
     @action(detail=False, methods=['post'])
@@ -1224,8 +1487,28 @@ class NotificationViewSet(viewsets.ModelViewSet):
         Marque toutes les notifications de l'utilisateur comme lues.
         """
         self.get_queryset().filter(is_read=False).update(is_read=True)
+        notification_events.read_state_changed(request.user.pk)
         return Response({'status': 'toutes les notifications marquées comme lues'})
 
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """
+        Nombre de notifications non lues (mis en cache, sans requête en régime établi).
+        """
+        return Response({'count': notification_events.unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['get'])
+    def stream_token(self, request):
+        """
+        Jeton signé de courte durée pour ouvrir le flux SSE /api/events/notifications/
+        (EventSource ne peut pas envoyer l'en-tête Authorization).
+        """
+        return Response({
+            'token': notification_events.make_stream_token(request.user),
+            'expires_in': settings.NOTIFICATIONS_STREAM_TOKEN_TTL,
+            'enabled': bool(settings.NOTIFICATIONS_REDIS_URL),
+        })
+
 
 class DiligenceViewSet(viewsets.ModelViewSet):
     """
@@ -1240,7 +1523,7 @@ class DiligenceViewSet(viewsets.ModelViewSet):
         """
         Retourne seulement les diligences créées par l'utilisateur connecté.
         """
-        queryset = Diligence.objects.filter(created_by=self.request.user).select_related('case')
+        queryset = Diligence.objects.filter(created_by=self.request.user).select_related('case', 'created_by')
         case_id = self.request.query_params.get('case', None)
         if case_id and str(case_id).isdigit():
             queryset = queryset.filter(case_id=case_id)
@@ -1367,6 +1650,9 @@ class AgendaViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         qs = AgendaEvent.objects.select_related('case', 'created_by', 'reporte_de').all()
+        if self.action in ('list', 'retrieve'):
+            # Les agrégats de `stats` n'ont pas besoin du nombre de reports par audience
+            qs = qs.annotate(nb_reports=subquery_count(AgendaEvent, 'reporte_de'))
         year = self.request.query_params.get('year')
         month = self.request.query_params.get('month')
         case_id = self.request.query_params.get('case')
@@ -1561,7 +1847,9 @@ class AgendaViewSet(viewsets.ModelViewSet):
         # Toutes les entrées pour ce dossier
         entries = AgendaEvent.objects.filter(
             dossier_numero=dossier_numero
-        ).select_related('case', 'created_by', 'reporte_de').order_by('date_audience')
+        ).select_related('case', 'created_by', 'reporte_de').annotate(
+            nb_reports=subquery_count(AgendaEvent, 'reporte_de')
+        ).order_by('date_audience')
         # Historique des modifications
         history = AgendaHistory.objects.filter(
             agenda_entry__dossier_numero=dossier_numero
@@ -1573,24 +1861,60 @@ class AgendaViewSet(viewsets.ModelViewSet):
             'history': AgendaHistorySerializer(history, many=True).data,
         })
 
+    @action(detail=False, methods=['get'], pagination_class=AgendaHistoryPagination)
+    def historique(self, request):
+        """
+        Journal des modifications de l'agenda, du plus récent au plus ancien,
+        paginé par curseur. Filtres : dossier_numero, type_action.
+        """
+        history = AgendaHistory.objects.select_related('utilisateur', 'agenda_entry')
+        dossier_numero = request.query_params.get('dossier_numero')
+        if dossier_numero:
+            history = history.filter(agenda_entry__dossier_numero=dossier_numero)
+        type_action = request.query_params.get('type_action')
+        if type_action:
+            history = history.filter(type_action=type_action)
+
+        page = self.paginate_queryset(history)
+        return self.get_paginated_response(AgendaHistorySerializer(page, many=True).data)
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Statistiques de l'agenda pour le dashboard."""
+        params = set(request.query_params) - {'year', 'format'}
         year = request.query_params.get('year')
-        month = request.query_params.get('month')
-        qs = self.get_queryset()
-
-        total = qs.count()
-        par_statut = {}
-        for s in ['PREVU', 'REPORTE', 'TERMINE', 'ANNULE']:
-            par_statut[s] = qs.filter(statut=s).count()
-        par_chambre = {}
-        for entry in qs.values('type_chambre').distinct():
-            chambre = entry['type_chambre']
-            par_chambre[chambre] = qs.filter(type_chambre=chambre).count()
+
+        if not params and (not year or year.isdigit()):
+            # Sans filtre (hors année) : lecture directe des compteurs de cumul
+            scope = f'agenda:{year}' if year else 'agenda'
+            counters = get_counters_with_prefix(f'{scope}:')
+            return Response({
+                'total': counters.get(f'{scope}:total', 0),
+                'par_statut': {
+                    s: counters.get(f'{scope}:statut:{s}', 0) for s in ['PREVU', 'REPORTE', 'TERMINE', 'ANNULE']
+                },
+                'par_chambre': {
+                    key[len(f'{scope}:chambre:'):]: value
+                    for key, value in counters.items()
+                    if key.startswith(f'{scope}:chambre:') and value
+                },
+            })
+
+        # Filtres libres : agrégation conditionnelle sur la sélection
+        from django.db.models import Count
+        qs = self.get_queryset().order_by()
+        totals = qs.aggregate(
+            total=Count('id'),
+            **{s: Count('id', filter=Q(statut=s)) for s in ['PREVU', 'REPORTE', 'TERMINE', 'ANNULE']}
+        )
+        total = totals.pop('total')
+        par_chambre = {
+            entry['type_chambre']: entry['n']
+            for entry in qs.values('type_chambre').annotate(n=Count('id'))
+        }
 
         return Response({
             'total': total,
-            'par_statut': par_statut,
+            'par_statut': totals,
             'par_chambre': par_chambre,
         })
@@ -0,0 +1,17 @@
+"""
+Configuration gunicorn, lue automatiquement depuis le répertoire de l'application.
+
+Workers gthread : le signal de vie du worker est émis par sa boucle principale,
+pas par le thread qui traite la requête. Une réponse longue (export ZIP d'un
+dossier, fichier chiffré déchiffré au fil de l'envoi) n'est donc pas tuée au
+bout de `timeout` secondes, comme elle le serait avec des workers synchrones ;
+`timeout` ne sert plus qu'à relancer un worker bloqué.
+"""
+import os
+
+bind = '0.0.0.0:8000'
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+# Requêtes simultanées par worker (un flux long occupe un thread, pas le worker)
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = 300
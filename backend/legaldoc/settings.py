@@ -91,6 +91,22 @@ DATABASES = {
     }
 }
 
+# Cache partagé (Redis en production, mémoire locale sinon)
+REDIS_CACHE_URL = config('REDIS_CACHE_URL', default='')
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Validation des mots de passe
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -170,14 +186,107 @@ OCR_LANGUAGES = ['fra', 'eng']
 
 # Configuration de chiffrement
 ENCRYPTION_KEY = config('ENCRYPTION_KEY', default='changez-cette-cle-de-32-chars!').encode()
+# Chiffrement des fichiers stockés (AES-256-GCM par segments, documents/encryption.py) :
+# s'applique aux nouveaux fichiers ; les fichiers existants restent lisibles en clair.
+# Choix global, pas par document : le nom d'un blob est l'empreinte du contenu en clair et la
+# déduplication partage un même fichier entre documents confidentiels ou non. Contrepartie :
+# un fichier chiffré est déchiffré et envoyé par Django (worker occupé pendant tout le transfert),
+# MEDIA_ACCEL_REDIRECT ne s'applique plus qu'aux fichiers encore en clair.
+FILE_ENCRYPTION_AT_REST = config('FILE_ENCRYPTION_AT_REST', default=False, cast=bool)
+FILE_ENCRYPTION_SEGMENT_SIZE = config('FILE_ENCRYPTION_SEGMENT_SIZE', default=64 * 1024, cast=int)
+# Rotation des clés : ENCRYPTION_KEY est la clé n° 1 ; les suivantes sont déclarées sous la forme
+# « 2:secret,3:secret ». Les nouveaux fichiers sont chiffrés avec ENCRYPTION_KEY_ID ;
+# `manage.py rotate_encryption_keys` rechiffre les autres. Une clé retirée rend ses fichiers illisibles.
+ENCRYPTION_KEYS = {
+    int(key_id): secret.strip().encode()
+    for key_id, secret in (
+        item.split(':', 1) for item in config('ENCRYPTION_KEYS', default='').split(',') if item.strip()
+    )
+}
+ENCRYPTION_KEY_ID = config('ENCRYPTION_KEY_ID', default=1, cast=int)
 
 # Configuration Gemini AI
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
+GEMINI_MODEL_NAME = config('GEMINI_MODEL_NAME', default='gemini-flash-latest')
+GEMINI_SDK_TRANSPORT = config('GEMINI_SDK_TRANSPORT', default='')  # 'grpc' (défaut SDK) ou 'rest'
+
+# Client IA partagé : fournisseur, concurrence et retries
+# AI_PROVIDER : 'gemini', 'stub' (bouchon local), 'stub-http' (serveur bouchon) ou chemin de classe
+AI_PROVIDER = config('AI_PROVIDER', default='gemini')
+AI_MAX_CONCURRENT_CALLS_PER_WORKER = config('AI_MAX_CONCURRENT_CALLS_PER_WORKER', default=4, cast=int)
+AI_MAX_CONCURRENT_CALLS_PER_CABINET = config('AI_MAX_CONCURRENT_CALLS_PER_CABINET', default=8, cast=int)
+AI_SLOT_WAIT_TIMEOUT = config('AI_SLOT_WAIT_TIMEOUT', default=10, cast=float)  # secondes
+AI_REQUEST_TIMEOUT = config('AI_REQUEST_TIMEOUT', default=120, cast=int)  # secondes
+AI_MAX_RETRIES = config('AI_MAX_RETRIES', default=3, cast=int)
+AI_BACKOFF_BASE = config('AI_BACKOFF_BASE', default=1.0, cast=float)
+AI_BACKOFF_MAX = config('AI_BACKOFF_MAX', default=8.0, cast=float)
+
+# Bouchon IA local (tests de charge hors-ligne, voir documents/ai_stub.py)
+AI_STUB_URL = config('AI_STUB_URL', default='http://127.0.0.1:8765')
+AI_STUB_LATENCY_MS = config('AI_STUB_LATENCY_MS', default=800, cast=int)
+AI_STUB_JITTER_MS = config('AI_STUB_JITTER_MS', default=200, cast=int)
+AI_STUB_ERROR_RATE_429 = config('AI_STUB_ERROR_RATE_429', default=0.0, cast=float)
+AI_STUB_ERROR_RATE_503 = config('AI_STUB_ERROR_RATE_503', default=0.0, cast=float)
+AI_STUB_SEED = config('AI_STUB_SEED', default=42, cast=int)
+
+# Statistiques du tableau de bord : durée de vie du cache (invalidé aussi à chaque écriture)
+DASHBOARD_STATS_CACHE_TTL = config('DASHBOARD_STATS_CACHE_TTL', default=30, cast=int)
+
+# Permissions par rôle : copie par processus, rechargée dès que la version partagée (cache Django)
+# change ; durée de vie maximale si le cache n'est pas partagé (LocMemCache)
+ROLE_PERMISSIONS_CACHE_TTL = config('ROLE_PERMISSIONS_CACHE_TTL', default=60, cast=int)
+
+# Journal d'audit : sync (INSERT immédiat) | memory (file du processus) | redis (file partagée)
+# Défaut sync, volontairement : avec `memory`, un worker tué sans arrêt propre (OOM, SIGKILL)
+# perd jusqu'à AUDIT_FLUSH_INTERVAL secondes de traces, et un fil d'écriture en arrière-plan
+# n'a pas sa place dans les tests. Le déploiement active le mode groupé explicitement
+# (.env.example : memory, ou redis pour une file qui survit aux workers).
+AUDIT_BUFFER = config('AUDIT_BUFFER', default='sync')
+AUDIT_BATCH_SIZE = config('AUDIT_BATCH_SIZE', default=500, cast=int)
+AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=2.0, cast=float)  # secondes, 0 = vidage manuel
+AUDIT_BUFFER_MAX = config('AUDIT_BUFFER_MAX', default=10000, cast=int)  # au-delà : écriture synchrone
+AUDIT_REDIS_URL = config('AUDIT_REDIS_URL', default=REDIS_CACHE_URL)
+# Partitions mensuelles : mois créés à l'avance, rétention en base avant archivage
+AUDIT_PARTITIONS_AHEAD = config('AUDIT_PARTITIONS_AHEAD', default=2, cast=int)
+AUDIT_RETENTION_MONTHS = config('AUDIT_RETENTION_MONTHS', default=24, cast=int)
+AUDIT_ARCHIVE_DIR = config('AUDIT_ARCHIVE_DIR', default=str(BASE_DIR / 'audit_archives'))
+
+# Pagination : au-delà de ce nombre de lignes, le total des listes paginées par page est estimé
+PAGINATION_EXACT_COUNT_LIMIT = config('PAGINATION_EXACT_COUNT_LIMIT', default=10000, cast=int)
+
+# Rappels (échéances, audiences) : planificateur `manage.py run_reminders --loop`
+REMINDER_INTERVAL = config('REMINDER_INTERVAL', default=60, cast=int)  # secondes entre deux passages
+REMINDER_BATCH_SIZE = config('REMINDER_BATCH_SIZE', default=500, cast=int)
+DEADLINE_REMINDER_DAYS = config('DEADLINE_REMINDER_DAYS', default=3, cast=int)
+
+# Notifications temps réel (SSE, voir documents/notification_events.py) ; vide = interrogation périodique
+NOTIFICATIONS_REDIS_URL = config('NOTIFICATIONS_REDIS_URL', default=REDIS_CACHE_URL)
+NOTIFICATIONS_STREAM_TOKEN_TTL = config('NOTIFICATIONS_STREAM_TOKEN_TTL', default=60, cast=int)  # secondes
+NOTIFICATIONS_HEARTBEAT = config('NOTIFICATIONS_HEARTBEAT', default=25, cast=int)  # secondes
+NOTIFICATIONS_UNREAD_CACHE_TTL = config('NOTIFICATIONS_UNREAD_CACHE_TTL', default=300, cast=int)
 
 # Configuration des uploads
 MAX_UPLOAD_SIZE = 1024 * 1024 * 1024  # 1 GB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024 * 1024
-FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024 * 1024
+# Au-delà, un fichier reçu en multipart est écrit sur disque (fichier temporaire) plutôt qu'en mémoire
+FILE_UPLOAD_MAX_MEMORY_SIZE = config('FILE_UPLOAD_MAX_MEMORY_SIZE', default=10 * 1024 * 1024, cast=int)
+# Uploads découpés et reprenables (documents/uploads.py) : taille maximale d'un morceau,
+# répertoire des fichiers partiels (même volume que MEDIA_ROOT), abandon après inactivité
+UPLOAD_CHUNK_SIZE = config('UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+UPLOAD_TEMP_DIR = config('UPLOAD_TEMP_DIR', default=str(MEDIA_ROOT / 'uploads_partial'))
+UPLOAD_SESSION_TTL_HOURS = config('UPLOAD_SESSION_TTL_HOURS', default=48, cast=int)
+# Téléchargements servis par nginx (X-Accel-Redirect) : préfixe de la location `internal`
+# qui expose MEDIA_ROOT (ex. /protected-media/) ; vide = fichiers envoyés par Django
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default='')
+# Fichiers stockés par contenu (documents/blobstore.py) : délai avant suppression d'un fichier sans référence
+BLOB_GC_GRACE_HOURS = config('BLOB_GC_GRACE_HOURS', default=24, cast=int)
+# Versions découpées en fragments partagés (documents/version_store.py) : nombre de versions
+# récentes gardées entières par document ; versions générées par l'OCR conservées (0 = toutes)
+VERSION_FULL_COPIES = config('VERSION_FULL_COPIES', default=1, cast=int)
+VERSION_KEEP_GENERATED = config('VERSION_KEEP_GENERATED', default=0, cast=int)
+# Miniatures et aperçus de pages (documents/previews.py) : qualité WebP, plafond du cache sur disque
+PREVIEW_QUALITY = config('PREVIEW_QUALITY', default=75, cast=int)
+PREVIEW_CACHE_MAX_MB = config('PREVIEW_CACHE_MAX_MB', default=2048, cast=int)
 DATA_UPLOAD_MAX_NUMBER_FILES = 1000
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 15000
 ALLOWED_UPLOAD_EXTENSIONS = [
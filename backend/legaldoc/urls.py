@@ -9,6 +9,7 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from users.views import CustomTokenObtainPairView
 from django.views.generic import RedirectView
+from documents.notification_events import notification_stream
 
 urlpatterns = [
     # Redirection de la racine vers l'admin
@@ -26,6 +27,9 @@ urlpatterns = [
     path('api/documents/', include('documents.urls')),
     path('api/cabinet/', include('cabinet.urls')),
     path('api/debug/status/', include('users.debug_urls')),
+
+    # Flux SSE des notifications (servi par le processus ASGI)
+    path('api/events/notifications/', notification_stream, name='notification-stream'),
     
     # Documentation API
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -3,6 +3,7 @@ Modèles pour la gestion des utilisateurs avec rôles et permissions.
 """
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from .permission_cache import get_role_permissions
 
 
 class User(AbstractUser):
@@ -93,19 +94,8 @@ class User(AbstractUser):
         # Les admins ont toujours tout
         if self.role == self.Role.ADMIN:
             return True
-            
-        try:
-            # Import différé pour éviter l'import circulaire si defini avant
-            # Mais ici RolePermission est défini après, donc on peut le référencer ?
-            # Python lit le fichier de haut en bas, donc RolePermission n'existe pas ENCORE ici.
-            # On doit utiliser 'RolePermission' en string ou le définir avant.
-            # Ou utiliser l'import différé ou simplement s'appuyer sur le fait que la méthode
-            # est appelée à l'exécution, donc RolePermission existera.
-            
-            # Pour être sûr :
-            return RolePermission.objects.get(role=self.role).permissions.get(perm_name, False)
-        except (RolePermission.DoesNotExist, AttributeError):
-            return False
+
+        return bool(get_role_permissions(self.role).get(perm_name, False))
 
     @property
     def can_manage_users(self):
@@ -0,0 +1,70 @@
+"""
+Cache des permissions par rôle (table RolePermission).
+
+La table est minuscule (un enregistrement par rôle) et lue à chaque requête
+par `User.has_perm` : elle est chargée en une requête et conservée en mémoire
+dans chaque processus.
+
+La validité de cette copie repose sur un numéro de version stocké dans le
+cache Django partagé (Redis en production) : toute modification d'un rôle le
+change, et chaque processus recharge la table dès qu'il constate l'écart.
+Un rôle révoqué cesse donc de s'appliquer dans tous les workers à la requête
+suivante, au prix d'une lecture du cache (pas de la base). Avec le cache
+mémoire local, la version est propre au processus : les autres processus
+convergent à l'expiration de `ROLE_PERMISSIONS_CACHE_TTL`.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import threading
+import time
+import uuid
+
+VERSION_CACHE_KEY = 'role_permissions:version'
+
+_lock = threading.Lock()
+# (permissions par rôle, version, échéance monotone) — remplacé d'un bloc
+_snapshot = None
+
+
+def _load():
+    from .models import RolePermission
+
+    return {
+        role: perms if isinstance(perms, dict) else {}
+        for role, perms in RolePermission.objects.values_list('role', 'permissions')
+    }
+
+
+def _shared_version():
+    """Version courante de la table ; une version neuve est posée si la clé a disparu du cache."""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def _current():
+    global _snapshot
+    # Version lue avant la table : un rechargement concurrent d'une modification est refait au prochain appel
+    version = _shared_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot[1] != version or time.monotonic() >= snapshot[2]:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot[1] != version or time.monotonic() >= snapshot[2]:
+                snapshot = (_load(), version, time.monotonic() + settings.ROLE_PERMISSIONS_CACHE_TTL)
+                _snapshot = snapshot
+    return snapshot
+
+
+def get_role_permissions(role):
+    """Permissions {nom: booléen} d'un rôle ({} si le rôle n'est pas configuré)."""
+    return _current()[0].get(role, {})
+
+
+def invalidate():
+    """Change la version partagée : tous les processus rechargent la table à leur prochain appel."""
+    global _snapshot
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+    _snapshot = None
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+from users import permission_cache
+from users.models import User, RolePermission
+
+
+class RolePermissionCacheTest(TestCase):
+    def setUp(self):
+        permission_cache.invalidate()
+        RolePermission.objects.update_or_create(role='COLLABORATEUR', defaults={'permissions': {'can_manage_documents': True}})
+        self.admin = User.objects.create_user(username='admin.roles', password='x', role='ADMIN')
+        self.user = User.objects.create_user(username='collab.roles', password='x', role='COLLABORATEUR')
+
+    def tearDown(self):
+        permission_cache.invalidate()
+
+    def test_01_cached_and_invalidated_on_update(self):
+        """Une seule lecture de la table des rôles, invalidée par une modification via l'API"""
+        self.assertTrue(self.user.can_delete_documents)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.user.can_delete_documents)
+            self.assertFalse(self.user.can_manage_users)
+
+        api = APIClient()
+        api.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = api.put('/api/users/roles/COLLABORATEUR/', {
+                'role': 'COLLABORATEUR', 'permissions': {'can_manage_documents': False}
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.user.can_delete_documents)
+
+    def test_02_change_seen_by_other_processes(self):
+        """Une modification faite par un autre worker (version partagée changée) est prise en compte aussitôt"""
+        self.assertTrue(self.user.can_delete_documents)
+
+        # Autre processus : la table et la version partagée changent, la copie locale reste en place
+        RolePermission.objects.filter(role='COLLABORATEUR').update(permissions={})
+        with self.assertNumQueries(0):
+            self.assertTrue(self.user.can_delete_documents)
+        cache.set(permission_cache.VERSION_CACHE_KEY, 'version-autre-worker', None)
+        with self.assertNumQueries(1):
+            self.assertFalse(self.user.can_delete_documents)
+            self.assertFalse(self.user.can_delete_documents)
@@ -0,0 +1,16 @@
+"""
+Signaux de l'application users : invalidation du cache des permissions par rôle.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from .models import RolePermission
+from . import permission_cache
+
+
+def invalidate_role_permissions(sender, **kwargs):
+    # Après validation : un lecteur concurrent ne doit pas remettre en cache l'état d'avant
+    transaction.on_commit(permission_cache.invalidate)
+
+
+post_save.connect(invalidate_role_permissions, sender=RolePermission, dispatch_uid='role_permissions_save')
+post_delete.connect(invalidate_role_permissions, sender=RolePermission, dispatch_uid='role_permissions_delete')
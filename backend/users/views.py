@@ -21,10 +21,13 @@ from .models import RolePermission
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 import pyotp
-import qrcode
+from documents.lazy_imports import lazy
 import io
 import base64
 
+# Génération des QR codes 2FA chargée au premier usage
+qrcode = lazy('qrcode')
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     """
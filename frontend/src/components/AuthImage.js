@@ -0,0 +1,32 @@
+import React, { useEffect, useState } from 'react';
+import { filesAPI } from '../services/api';
+
+/**
+ * Image servie par l'API (miniature, page) : une balise <img> n'envoie pas le jeton,
+ * l'image est donc chargée par le client API puis affichée par une URL locale.
+ */
+const AuthImage = ({ src, alt, ...props }) => {
+    const [objectURL, setObjectURL] = useState(null);
+
+    useEffect(() => {
+        if (!src) return undefined;
+        let cancelled = false;
+        let url = null;
+        filesAPI.objectURL(src)
+            .then((created) => {
+                url = created;
+                if (cancelled) URL.revokeObjectURL(created);
+                else setObjectURL(created);
+            })
+            .catch((error) => console.error('Erreur chargement image:', error));
+        return () => {
+            cancelled = true;
+            if (url) URL.revokeObjectURL(url);
+            setObjectURL(null);
+        };
+    }, [src]);
+
+    return objectURL ? <img src={objectURL} alt={alt} {...props} /> : null;
+};
+
+export default AuthImage;
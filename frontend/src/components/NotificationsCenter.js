@@ -32,6 +32,7 @@ function NotificationsCenter() {
     const [anchorEl, setAnchorEl] = useState(null);
     const [notifications, setNotifications] = useState([]);
     const [loading, setLoading] = useState(false);
+    const [serverUnread, setServerUnread] = useState(null);
     const prevNotificationsRef = React.useRef([]);
 
     const fetchNotifications = useCallback(async () => {
@@ -55,14 +56,79 @@ function NotificationsCenter() {
         }
     }, [notifications.length, playNotificationSound]);
 
+    // Références stables : le flux SSE n'est pas rouvert à chaque rendu
+    const fetchRef = React.useRef(fetchNotifications);
+    const soundRef = React.useRef(playNotificationSound);
+    fetchRef.current = fetchNotifications;
+    soundRef.current = playNotificationSound;
+
     useEffect(() => {
-        fetchNotifications();
-        // Optionnel : rafraîchir toutes les 2 minutes
-        const interval = setInterval(fetchNotifications, 120000);
-        return () => clearInterval(interval);
-    }, [fetchNotifications]);
+        let source = null;
+        let retryTimer = null;
+        let pollTimer = null;
+        let failures = 0;
+        let opened = false;
+        let cancelled = false;
+
+        // Repli : interrogation toutes les 2 minutes (flux désactivé ou indisponible)
+        const startPolling = () => {
+            if (!pollTimer) pollTimer = setInterval(() => fetchRef.current(), 120000);
+        };
+
+        const connect = async () => {
+            try {
+                const { data } = await notificationsAPI.streamToken();
+                if (cancelled) return;
+                if (!data.enabled || typeof EventSource === 'undefined') {
+                    startPolling();
+                    return;
+                }
+                source = new EventSource(notificationsAPI.streamURL(data.token));
+                source.onopen = () => {
+                    // Reconnexion : rattraper les notifications manquées pendant la coupure
+                    if (opened) fetchRef.current();
+                    opened = true;
+                    failures = 0;
+                };
+                source.addEventListener('unread', (event) => {
+                    setServerUnread(JSON.parse(event.data).count);
+                });
+                source.addEventListener('notification', (event) => {
+                    const notification = JSON.parse(event.data);
+                    prevNotificationsRef.current = [notification, ...prevNotificationsRef.current];
+                    setNotifications(prev => prev.some(n => n.id === notification.id) ? prev : [notification, ...prev]);
+                    setServerUnread(count => (count === null ? count : count + 1));
+                    soundRef.current();
+                });
+                source.onerror = () => {
+                    // Connexion refusée (jeton expiré...) : nouveau jeton, puis repli après 3 échecs
+                    if (source.readyState !== EventSource.CLOSED) return;
+                    source = null;
+                    failures += 1;
+                    if (failures >= 3) {
+                        setServerUnread(null);
+                        startPolling();
+                        return;
+                    }
+                    retryTimer = setTimeout(connect, 5000 * failures);
+                };
+            } catch (error) {
+                startPolling();
+            }
+        };
+
+        fetchRef.current();
+        connect();
+        return () => {
+            cancelled = true;
+            if (source) source.close();
+            clearTimeout(retryTimer);
+            clearInterval(pollTimer);
+        };
+    }, []);
 
-    const unreadCount = notifications.filter(n => !n.is_read).length;
+    // Compteur du serveur quand le flux est actif, sinon calculé sur la liste chargée
+    const unreadCount = serverUnread ?? notifications.filter(n => !n.is_read).length;
 
     const handleClick = (event) => {
         setAnchorEl(event.currentTarget);
@@ -76,6 +142,7 @@ function NotificationsCenter() {
         try {
             await notificationsAPI.markAllRead();
             setNotifications(notifications.map(n => ({ ...n, is_read: true })));
+            setServerUnread(count => (count === null ? count : 0));
         } catch (error) {
             console.error('Error marking all as read:', error);
         }
@@ -88,6 +155,7 @@ function NotificationsCenter() {
                 setNotifications(notifications.map(n =>
                     n.id === notification.id ? { ...n, is_read: true } : n
                 ));
+                setServerUnread(count => (count === null ? count : Math.max(0, count - 1)));
             }
             handleClose();
             // Navigation intelligente
@@ -95,7 +163,7 @@ function NotificationsCenter() {
                 navigate(`/cases`); // On pourrait ajouter des filtres ici
             } else if (notification.entity_type === 'DOCUMENT' && notification.entity_id) {
                 navigate(`/documents`);
-            } else if (notification.entity_type === 'DEADLINE') {
+            } else if (notification.entity_type === 'DEADLINE' || notification.entity_type === 'AGENDA') {
                 navigate('/agenda');
             }
         } catch (error) {
@@ -110,7 +178,8 @@ function NotificationsCenter() {
         switch (entity_type) {
             case 'DOCUMENT': return <DocumentIcon color={color} />;
             case 'CASE': return <FolderIcon color={color} />;
-            case 'DEADLINE': return <HistoryIcon color={color} />;
+            case 'DEADLINE':
+            case 'AGENDA': return <HistoryIcon color={color} />;
             case 'CLIENT': return <PersonIcon color={color} />;
             default: return <NotificationsIcon color="action" />;
         }
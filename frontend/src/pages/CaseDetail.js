@@ -59,7 +59,8 @@ import {
     Circle as CircleIcon,
     ChevronLeft as ChevronLeftIcon,
     ChevronRight as ChevronRightIcon,
-    Close as CloseIcon
+    Close as CloseIcon,
+    Archive as ArchiveIcon
 } from '@mui/icons-material';
 import { casesAPI, documentsAPI, decisionsAPI, agendaAPI } from '../services/api';
 import authService from '../services/authService';
@@ -157,6 +158,28 @@ const CaseDetail = () => {
     const currentUser = authService.getCurrentUser();
     const isAdmin = currentUser?.role === 'ADMIN' || currentUser?.is_staff || false;
 
+    const [exporting, setExporting] = useState(false);
+
+    const handleExport = async () => {
+        try {
+            setExporting(true);
+            const response = await casesAPI.exportZip(id, { ocr: 1 });
+            const url = window.URL.createObjectURL(new Blob([response.data], { type: 'application/zip' }));
+            const link = document.createElement('a');
+            link.href = url;
+            link.setAttribute('download', `${caseData.reference || 'dossier'}.zip`);
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            window.URL.revokeObjectURL(url);
+        } catch (error) {
+            console.error('Erreur export dossier:', error);
+            alert("Erreur lors de l'export du dossier.");
+        } finally {
+            setExporting(false);
+        }
+    };
+
     const loadCaseData = useCallback(async () => {
         try {
             setLoading(true);
@@ -337,6 +360,9 @@ const CaseDetail = () => {
                 </Box>
                 <Box sx={{ display: 'flex', gap: 1 }}>
                     <Button variant="outlined" startIcon={<ArrowBackIcon />} onClick={() => navigate('/cases')}>Retour</Button>
+                    <Button variant="outlined" startIcon={<ArchiveIcon />} onClick={handleExport} disabled={exporting}>
+                        {exporting ? 'Export...' : 'Exporter (ZIP)'}
+                    </Button>
                     <Button variant="contained" startIcon={<EditIcon />} onClick={() => navigate(`/cases?id=${id}&edit=true`)}>Modifier</Button>
                 </Box>
             </Box>
@@ -32,7 +32,7 @@ import {
     Contrast as ContrastIcon,
     Gavel as GavelIcon
 } from '@mui/icons-material';
-import { clientsAPI, casesAPI, documentsAPI, tagsAPI, agendaAPI, decisionsAPI } from '../services/api';
+import { clientsAPI, casesAPI, documentsAPI, tagsAPI, agendaAPI, decisionsAPI, filesAPI } from '../services/api';
 import StatCard from '../components/StatCard';
 import DiligenceManager from '../components/DiligenceManager';
 import { useNotification } from '../context/NotificationContext';
@@ -61,7 +61,14 @@ function Dashboard() {
     const [imageEnhance, setImageEnhance] = useState(false);
     const [wordContent, setWordContent] = useState('');
     const [wordLoading, setWordLoading] = useState(false);
+    // URL locale du fichier chargé par l'API (file_url exige le jeton)
+    const [previewFileUrl, setPreviewFileUrl] = useState('');
 
+    const closePreview = () => {
+        setPreviewDialog(false);
+        if (previewFileUrl) URL.revokeObjectURL(previewFileUrl);
+        setPreviewFileUrl('');
+    };
 
     const handlePreview = async (doc) => {
         setPreviewDoc(doc);
@@ -71,20 +78,21 @@ function Dashboard() {
         setPreviewDialog(true);
 
         const extension = (doc.file_extension || doc.title?.split('.').pop() || '').toLowerCase().replace('.', '');
+        const isWord = extension.includes('doc');
+        if (isWord) setWordLoading(true);
 
-        if (extension.includes('doc')) {
-            try {
-                setWordLoading(true);
-                const response = await fetch(doc.file_url);
-                const arrayBuffer = await response.arrayBuffer();
-                const result = await mammoth.convertToHtml({ arrayBuffer: arrayBuffer });
+        try {
+            const { data } = await filesAPI.fetch(doc.file_url);
+            setPreviewFileUrl(URL.createObjectURL(data));
+            if (isWord) {
+                const result = await mammoth.convertToHtml({ arrayBuffer: await data.arrayBuffer() });
                 setWordContent(result.value);
-            } catch (error) {
-                console.error('Erreur conversion Word:', error);
-                setWordContent('<p style="color: red;">Erreur lors de la lecture du document Word.</p>');
-            } finally {
-                setWordLoading(false);
             }
+        } catch (error) {
+            console.error('Erreur chargement du fichier:', error);
+            if (isWord) setWordContent('<p style="color: red;">Erreur lors de la lecture du document Word.</p>');
+        } finally {
+            setWordLoading(false);
         }
     };
 
@@ -620,7 +628,7 @@ function Dashboard() {
             {/* Modal de prévisualisation */}
             <Dialog
                 open={previewDialog}
-                onClose={() => setPreviewDialog(false)}
+                onClose={closePreview}
                 maxWidth="xl"
                 fullWidth
                 PaperProps={{ sx: { height: '90vh' } }}
@@ -647,7 +655,7 @@ function Dashboard() {
                                 <Box sx={{ mx: 1, borderLeft: '1px solid #ddd' }} />
                             </>
                         )}
-                        <IconButton aria-label="close" onClick={() => setPreviewDialog(false)}>
+                        <IconButton aria-label="close" onClick={closePreview}>
                             <CloseIcon />
                         </IconButton>
                     </Box>
@@ -662,10 +670,10 @@ function Dashboard() {
                         return (
                             <Box sx={{ flex: 1, display: 'flex', justifyContent: 'center', alignItems: imageZoom ? 'flex-start' : 'center', overflow: 'auto', p: 2 }}>
                                 {isPdf ? (
-                                    <iframe src={previewDoc.file_url} width="100%" height="100%" style={{ border: 'none', borderRadius: '8px' }} title="PDF Preview" />
+                                    <iframe src={previewFileUrl} width="100%" height="100%" style={{ border: 'none', borderRadius: '8px' }} title="PDF Preview" />
                                 ) : isImage ? (
                                     <img
-                                        src={previewDoc.file_url}
+                                        src={previewFileUrl}
                                         alt={previewDoc.title}
                                         style={{
                                             maxWidth: imageZoom ? 'none' : '100%',
@@ -693,7 +701,7 @@ function Dashboard() {
                                         <Typography variant="body2" color="text.disabled" sx={{ mb: 3 }}>
                                             Type détecté : {extension.toUpperCase() || 'Inconnu'}
                                         </Typography>
-                                        <Button variant="contained" component="a" href={previewDoc.file_url} download>
+                                        <Button variant="contained" component="a" href={previewFileUrl} download={previewDoc.file_name}>
                                             Télécharger pour voir le fichier
                                         </Button>
                                     </Box>
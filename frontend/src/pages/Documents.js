@@ -55,13 +55,14 @@ import {
     SmartToy as BotIcon
 } from '@mui/icons-material';
 import { useDropzone } from 'react-dropzone';
-import { documentsAPI, casesAPI, clientsAPI } from '../services/api';
+import { documentsAPI, casesAPI, clientsAPI, versionsAPI, filesAPI, uploadInChunks, CHUNKED_UPLOAD_THRESHOLD } from '../services/api';
 import jsPDF from 'jspdf';
 import { Document as DocxDocument, Packer, Paragraph, TextRun, HeadingLevel } from 'docx';
 import { saveAs } from 'file-saver';
 import mammoth from 'mammoth';
 import DeleteConfirmDialog from '../components/DeleteConfirmDialog';
 import StatCard from '../components/StatCard';
+import AuthImage from '../components/AuthImage';
 
 // Version: 1.0.1 (Forced Refresh)
 function Documents() {
@@ -318,6 +319,22 @@ function Documents() {
                 let successCount = 0;
 
                 for (const file of uploadFiles) {
+                    if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+                        // Gros fichier : envoi par morceaux, reprenable après une coupure
+                        try {
+                            await uploadInChunks(file, {
+                                title: uploadFiles.length > 1 ? file.name.split('.')[0] : formData.title,
+                                description: formData.description,
+                                case: formData.case,
+                                document_type: formData.document_type,
+                                is_confidential: formData.is_confidential
+                            });
+                            successCount++;
+                        } catch (err) {
+                            console.error(`Erreur upload ${file.name}:`, err);
+                        }
+                        continue;
+                    }
                     const data = new FormData();
                     data.append('file', file);
                     const title = uploadFiles.length > 1 ? file.name.split('.')[0] : formData.title;
@@ -492,28 +509,39 @@ function Documents() {
         setPreviewDialog(true);
 
         const extension = (doc.file_extension || doc.title?.split('.').pop() || '').toLowerCase().replace('.', '');
+        const isWord = extension.includes('doc');
+        if (isWord) setWordLoading(true);
 
-        // Déterminer l'URL du fichier à prévisualiser
-        // ON GARDE L'ORIGINAL pour l'aperçu visuel (Scan)
-        let previewUrl = doc.file_url;
-
+        // ON GARDE L'ORIGINAL pour l'aperçu visuel (Scan), chargé par l'API (file_url exige le jeton)
         // Note: AskYourPDF utilisera explicitement la version searchable via son propre bouton
-        setPreviewFileUrl(previewUrl);
-
-        // Si c'est un fichier Word, charger et convertir
-        if (extension.includes('doc')) {
-            try {
-                setWordLoading(true);
-                const response = await fetch(previewUrl);
-                const arrayBuffer = await response.arrayBuffer();
-                const result = await mammoth.convertToHtml({ arrayBuffer: arrayBuffer });
+        try {
+            const { data } = await filesAPI.fetch(doc.file_url);
+            setPreviewFileUrl(URL.createObjectURL(data));
+            // Si c'est un fichier Word, convertir
+            if (isWord) {
+                const result = await mammoth.convertToHtml({ arrayBuffer: await data.arrayBuffer() });
                 setWordContent(result.value);
-            } catch (error) {
-                console.error('Erreur conversion Word:', error);
-                setWordContent('<p style="color: red;">Erreur lors de la lecture du document Word.</p>');
-            } finally {
-                setWordLoading(false);
             }
+        } catch (error) {
+            console.error('Erreur chargement du fichier:', error);
+            if (isWord) setWordContent('<p style="color: red;">Erreur lors de la lecture du document Word.</p>');
+        } finally {
+            setWordLoading(false);
+        }
+    };
+
+    const closePreview = () => {
+        setPreviewDialog(false);
+        if (previewFileUrl) URL.revokeObjectURL(previewFileUrl);
+        setPreviewFileUrl('');
+    };
+
+    const openPage = async (page) => {
+        try {
+            window.open(await filesAPI.objectURL(page.file_url), '_blank');
+        } catch (error) {
+            console.error('Erreur chargement page:', error);
+            showNotification("Erreur lors du chargement de la page.", "error");
         }
     };
 
@@ -1084,9 +1112,9 @@ function Documents() {
                                                     transition: '0.2s',
                                                     '&:hover': { transform: 'scale(1.05)', boxShadow: 4 }
                                                 }}
-                                                onClick={() => window.open(p.file_url, '_blank')}
+                                                onClick={() => openPage(p)}
                                             >
-                                                <img src={p.file_url} alt={`P${p.page_number}`} style={{ width: '100%', height: '100%', objectFit: 'cover' }} />
+                                                <AuthImage src={p.thumbnail_url || p.file_url} alt={`P${p.page_number}`} style={{ width: '100%', height: '100%', objectFit: 'cover' }} />
                                             </Card>
                                             <Typography variant="caption" sx={{ fontWeight: 600, mt: 0.5, display: 'block' }}>
                                                 Page {p.page_number}
@@ -1137,12 +1165,20 @@ function Documents() {
                     <Box sx={{ flex: 1 }} />
                     {selectedDoc?.versions?.some(v => v.file_name && v.file_name.toLowerCase().includes('searchable_')) && (
                         <Button
-                            onClick={() => {
+                            onClick={async () => {
                                 const searchableVersion = selectedDoc.versions.find(v =>
                                     v.file_name && v.file_name.toLowerCase().includes('searchable_')
                                 );
                                 if (searchableVersion) {
-                                    window.open(searchableVersion.file_url, '_blank');
+                                    // Les versions anciennes sont reconstituées par l'API : plus d'URL de fichier directe
+                                    try {
+                                        const response = await versionsAPI.download(searchableVersion.id);
+                                        const url = window.URL.createObjectURL(new Blob([response.data], { type: 'application/pdf' }));
+                                        window.open(url, '_blank');
+                                    } catch (error) {
+                                        console.error('Erreur téléchargement version:', error);
+                                        showNotification("Erreur lors du téléchargement.", "error");
+                                    }
                                 }
                             }}
                             startIcon={<DownloadIcon />}
@@ -1162,11 +1198,11 @@ function Documents() {
                 </DialogActions>
             </Dialog>
 
-            <Dialog open={previewDialog} onClose={() => setPreviewDialog(false)} maxWidth="xl" fullWidth PaperProps={{ sx: { height: '90vh' } }}>
+            <Dialog open={previewDialog} onClose={closePreview} maxWidth="xl" fullWidth PaperProps={{ sx: { height: '90vh' } }}>
                 <DialogTitle sx={{ m: 0, p: 2, display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
                     <Box sx={{ display: 'flex', alignItems: 'center', gap: 2 }}>
                         <Typography variant="h6" component="div">{previewDoc?.title}</Typography>
-                        {previewFileUrl.includes('Searchable_') && (
+                        {previewDoc?.file_name?.includes('Searchable_') && (
                             <Chip
                                 label="Version OCR"
                                 color="success"
@@ -1181,7 +1217,7 @@ function Documents() {
                             <><Tooltip title="Zoom arrière"><IconButton onClick={handleZoomOut}><ZoomOutIcon /></IconButton></Tooltip><Tooltip title="Zoom avant"><IconButton onClick={handleZoomIn}><ZoomInIcon /></IconButton></Tooltip><Tooltip title="Réinitialiser"><IconButton onClick={handleResetZoom}><ResetIcon /></IconButton></Tooltip><Tooltip title="Améliorer la lisibilité (Contraste)"><IconButton onClick={toggleEnhance} color={imageEnhance ? "primary" : "default"}><ContrastIcon /></IconButton></Tooltip><Box sx={{ mx: 1, borderLeft: '1px solid #ddd' }} /></>
                         )}
 
-                        <IconButton aria-label="close" onClick={() => setPreviewDialog(false)}><CloseIcon /></IconButton>
+                        <IconButton aria-label="close" onClick={closePreview}><CloseIcon /></IconButton>
                     </Box>
                 </DialogTitle>
                 <DialogContent dividers sx={{ p: 0, bgcolor: (theme) => theme.palette.mode === 'dark' ? 'background.default' : '#f5f5f5', display: 'flex', flexDirection: 'column' }}>
@@ -1225,7 +1261,7 @@ function Documents() {
                                         <Typography variant="body2" color="text.disabled" sx={{ mb: 3 }}>
                                             Type détecté : {extension.toUpperCase() || 'Inconnu'}
                                         </Typography>
-                                        <Button variant="contained" component="a" href={previewFileUrl} download startIcon={<DownloadIcon />}>
+                                        <Button variant="contained" component="a" href={previewFileUrl} download={previewDoc.file_name} startIcon={<DownloadIcon />}>
                                             Télécharger pour voir le fichier
                                         </Button>
                                     </Box>
@@ -20,6 +20,7 @@ export const casesAPI = {
     create: (data) => apiClient.post('/documents/cases/', data),
     update: (id, data) => apiClient.put(`/documents/cases/${id}/`, data),
     delete: (id) => apiClient.delete(`/documents/cases/${id}/`),
+    exportZip: (id, params) => apiClient.get(`/documents/cases/${id}/export/`, { params, responseType: 'blob' }),
     chatInit: (id) => apiClient.get(`/documents/cases/${id}/chat_init/`),
     chatMessage: (id, data) => apiClient.post(`/documents/cases/${id}/chat_message/`, data)
 };
@@ -29,6 +30,16 @@ export const documentsAPI = {
     getAll: (params) => apiClient.get('/documents/documents/', { params }),
     getOne: (id) => apiClient.get(`/documents/documents/${id}/`),
     upload: (formData) => apiClient.post('/documents/documents/', formData),
+    startUpload: (data) => apiClient.post('/documents/documents/uploads/', data),
+    getUpload: (id) => apiClient.get(`/documents/documents/uploads/${id}/`),
+    putChunk: (id, offset, chunk, checksum) => apiClient.put(`/documents/documents/uploads/${id}/`, chunk, {
+        headers: {
+            'Content-Type': 'application/octet-stream',
+            'Upload-Offset': String(offset),
+            ...(checksum ? { 'Upload-Checksum': `sha256 ${checksum}` } : {})
+        }
+    }),
+    completeUpload: (id) => apiClient.post(`/documents/documents/uploads/${id}/complete/`),
     update: (id, formData) => apiClient.patch(`/documents/documents/${id}/`, formData),
     delete: (id) => apiClient.delete(`/documents/documents/${id}/`),
     download: (id) => apiClient.get(`/documents/documents/${id}/download/`, {
@@ -66,7 +77,9 @@ export const usersAPI = {
 
 // API Audit Logs
 export const auditAPI = {
-    getAll: (params) => apiClient.get('/documents/audit/', { params })
+    getAll: (params) => apiClient.get('/documents/audit/', { params }),
+    // params : client, case, user, action, date_from, date_to, output (csv | jsonl)
+    export: (params) => apiClient.get('/documents/audit/export/', { params, responseType: 'blob' })
 };
 
 // API Permissions
@@ -103,7 +116,10 @@ export const versionsAPI = {
     create: (formData) => apiClient.post('/documents/versions/', formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
     }),
-    delete: (id) => apiClient.delete(`/documents/versions/${id}/`)
+    delete: (id) => apiClient.delete(`/documents/versions/${id}/`),
+    download: (id) => apiClient.get(`/documents/versions/${id}/download/`, {
+        responseType: 'blob'
+    })
 };
 
 // API Cabinet
@@ -127,7 +143,11 @@ export const cabinetAPI = {
 export const notificationsAPI = {
     getAll: (params) => apiClient.get('/documents/notifications/', { params }),
     markRead: (id) => apiClient.post(`/documents/notifications/${id}/mark_as_read/`),
-    markAllRead: () => apiClient.post('/documents/notifications/mark_all_as_read/')
+    markAllRead: () => apiClient.post('/documents/notifications/mark_all_as_read/'),
+    unreadCount: () => apiClient.get('/documents/notifications/unread_count/'),
+    // Flux SSE : EventSource n'envoie pas l'en-tête Authorization, d'où le jeton signé dans l'URL
+    streamToken: () => apiClient.get('/documents/notifications/stream_token/'),
+    streamURL: (token) => `${apiClient.defaults.baseURL}/events/notifications/?token=${encodeURIComponent(token)}`
 };
 
 export const diligencesAPI = {
@@ -165,3 +185,79 @@ export const agendaAPI = {
     stats: (params) => apiClient.get('/documents/agenda/stats/', { params }),
 };
 
+// Fichiers des documents (file_url, thumbnail_url) : servis par l'API après contrôle d'accès,
+// donc chargés avec le jeton puis affichés par une URL locale (à libérer avec URL.revokeObjectURL)
+export const filesAPI = {
+    fetch: (url) => apiClient.get(url, { responseType: 'blob' }),
+    objectURL: async (url) => URL.createObjectURL((await filesAPI.fetch(url)).data)
+};
+
+// Au-delà de ce seuil, les fichiers sont envoyés par morceaux (upload reprenable)
+export const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+
+const UPLOAD_STORAGE_PREFIX = 'upload-session:';
+
+// Un même fichier envoyé vers le même dossier reprend sa session (rechargement de la page, coupure)
+const uploadStorageKey = (file, fields) =>
+    `${UPLOAD_STORAGE_PREFIX}${fields.case}:${file.name}:${file.size}:${file.lastModified}`;
+
+// Empreinte « sha256 <base64> » d'un morceau (en-tête Upload-Checksum) ;
+// null hors contexte sécurisé (crypto.subtle indisponible) : le serveur l'accepte alors sans
+async function chunkChecksum(chunk) {
+    if (!window.crypto?.subtle) return null;
+    const digest = new Uint8Array(await window.crypto.subtle.digest('SHA-256', await chunk.arrayBuffer()));
+    return btoa(String.fromCharCode(...digest));
+}
+
+async function resumeOrStartUpload(file, fields, storageKey) {
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+        try {
+            // Déjà terminée (réponse perdue) : complete renverra le document existant
+            const { data } = await documentsAPI.getUpload(savedId);
+            return data;
+        } catch (error) {
+            // Session expirée ou purgée : nouvel upload
+        }
+        localStorage.removeItem(storageKey);
+    }
+    const { data } = await documentsAPI.startUpload({
+        ...fields, file_name: file.name, total_size: file.size
+    });
+    localStorage.setItem(storageKey, data.id);
+    return data;
+}
+
+/**
+ * Upload découpé : un morceau à la fois, chacun accompagné de son empreinte,
+ * reprise à l'offset connu du serveur après une erreur réseau (3 tentatives par morceau).
+ * La session est mémorisée (localStorage) : un nouvel envoi du même fichier,
+ * même après un rechargement de la page, reprend là où le serveur s'est arrêté.
+ * `fields` : case, title, description, document_type, is_confidential.
+ */
+export async function uploadInChunks(file, fields, onProgress) {
+    const storageKey = uploadStorageKey(file, fields);
+    const session = await resumeOrStartUpload(file, fields, storageKey);
+    let offset = session.offset;
+    let failures = 0;
+    if (onProgress) onProgress(offset / file.size);
+    while (offset < file.size) {
+        try {
+            const chunk = file.slice(offset, offset + session.chunk_size);
+            const { data } = await documentsAPI.putChunk(session.id, offset, chunk, await chunkChecksum(chunk));
+            offset = data.offset;
+            failures = 0;
+            if (onProgress) onProgress(offset / file.size);
+        } catch (error) {
+            failures += 1;
+            if (failures > 3) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            // Reprendre là où le serveur s'est arrêté
+            const { data } = await documentsAPI.getUpload(session.id);
+            offset = data.offset;
+        }
+    }
+    const response = await documentsAPI.completeUpload(session.id);
+    localStorage.removeItem(storageKey);
+    return response;
+}